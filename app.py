@@ -1,15 +1,40 @@
+import arranque
+arranque.marcar("inicio_import")   # antes que flask: el import entero cuenta
+
 import os
-import random
+import re
+import hashlib
+import hmac
 import json
 import logging
+import atexit
 import tempfile
-import yt_dlp
+import threading
 import subprocess
-from urllib.parse import urlparse
-from flask import Flask, render_template, request, jsonify
-from groq import Groq
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
+from werkzeug.exceptions import HTTPException
+import time
 import uuid
 
+from cache import CacheEnCapas, CacheMemoria, CacheSQLite
+from coalescencia import EsperaAgotada, Vuelos
+from compresion import ColaFfmpegLlena, admite_paso_directo, ejecutor_desde_entorno, perfil_desde_entorno
+from descargas import PoolOcupado, PoolYoutubeDL
+from ingesta import ErrorIngesta, comprimir_desde_url, recibir_subida
+from jobs import ColaLlena, ESTADO_COMPLETADO, ESTADO_EN_COLA, ESTADO_ERROR, crear_cola_desde_entorno
+from json_incremental import ParserJSONIncremental
+from lotes import LimitesEtapas, procesar_lote
+from metricas import (LATENCIA_POT, PRIMER_CONTENIDO_PACK, REGISTRO, Coleccion, Medidor, medir_etapa,
+                      registrar_compresion, uso_directorio)
+from pool_keys import PoolKeys
+from progreso import informar_limitado, sin_progreso
+from reintentos import (CircuitBreaker, CircuitoAbierto, LimitadorConcurrencia, LimitadorSaturado,
+                        PoliticaReintentos, RATE_LIMIT, ReintentosAgotados)
+from resumenes import condensar, estimar_tokens
+from troceo import duracion_audio, transcribir_troceado
+
 # ---------------------------------------------------------------------------
 # CONFIGURACIÓN DE LOGGING
 # Sustituye todos los print() por logging estructurado con niveles y timestamps.
@@ -21,6 +46,11 @@ logging.basicConfig(
 )
 log = logging.getLogger(__name__)
 
+# groq y yt_dlp se importan en su primer uso o en el calentamiento (ver
+# arranque.py y calentar()): `/` y las cachés responden sin esperarlos
+groq = arranque.ModuloDiferido("groq")
+yt_dlp = arranque.ModuloDiferido("yt_dlp")
+
 # ---------------------------------------------------------------------------
 # APP
 # ---------------------------------------------------------------------------
@@ -37,6 +67,12 @@ DOMINIOS_YOUTUBE = {
     "youtu.be", "m.youtube.com",
     "music.youtube.com"
 }
+
+# Los IDs de vídeo de YouTube son siempre 11 caracteres de este alfabeto
+PATRON_VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+# Fichero SQLite compartido por las cachés persistentes
+CACHE_DB_PATH = os.environ.get("CACHE_DB_PATH", "/tmp/cache.sqlite3")
 # ---------------------------------------------------------------------------
 # FUNCIONES DE VALIDACIÓN
 # ---------------------------------------------------------------------------
@@ -59,101 +95,256 @@ def es_url_youtube_valida(url: str) -> bool:
         return False
 
 
+def extraer_video_id(url: str) -> str | None:
+    """
+    Obtiene el ID de vídeo de una URL de YouTube ya validada. Cubre
+    watch?v=, youtu.be/, /shorts/, /embed/, /live/ y /v/. Devuelve None
+    si no se reconoce (p. ej. una playlist sin vídeo concreto).
+    """
+    parsed = urlparse(url)
+    candidato = None
+
+    if parsed.netloc == "youtu.be":
+        candidato = parsed.path.lstrip("/").split("/")[0]
+    else:
+        partes = [p for p in parsed.path.split("/") if p]
+        if partes[:1] == ["watch"]:
+            candidato = parse_qs(parsed.query).get("v", [None])[0]
+        elif len(partes) >= 2 and partes[0] in ("shorts", "embed", "live", "v"):
+            candidato = partes[1]
+
+    if candidato and PATRON_VIDEO_ID.match(candidato):
+        return candidato
+    return None
+
+
 # ---------------------------------------------------------------------------
-# GESTIÓN DE API KEYS (sin cambios de lógica, solo logging mejorado)
+# GESTIÓN DE API KEYS
+# Todas las llamadas a Groq pasan por pool_groq (ver pool_keys.py): un cliente
+# por key, cuentas de RPM/TPM por modelo, cooldown tras un 429 y elección de
+# la key con más margen. GROQ_KEYS_LIST admite varias keys separadas por
+# comas; si no está, se usa GROQ_API_KEY por compatibilidad.
 # ---------------------------------------------------------------------------
 
-def get_groq_client_with_fallback(intento: int = 0) -> Groq:
-    """
-    Rota entre las keys disponibles. En el primer intento elige una al azar
-    para distribuir carga; en reintentos avanza linealmente por la lista.
-    """
-    keys_string = os.environ.get("GROQ_KEYS_LIST")
+def obtener_lista_keys() -> list[str]:
+    keys_string = os.environ.get("GROQ_KEYS_LIST", "")
+    return [k.strip() for k in keys_string.split(',') if k.strip()]
+
 
-    if not keys_string:
-        # Fallback a la key única por compatibilidad
-        return Groq(api_key=os.environ.get("GROQ_API_KEY"))
+pool_groq = PoolKeys(
+    obtener_lista_keys() or [os.environ.get("GROQ_API_KEY")],
+    # Sin reintentos internos del SDK: ante un 429 preferimos cambiar de key
+    lambda api_key: groq.Groq(api_key=api_key, max_retries=0),
+    rpm=int(os.environ.get("GROQ_RPM_POR_KEY", 30)),
+    tpm=int(os.environ.get("GROQ_TPM_POR_KEY", 12000)),
+    # Mismas keys para el modo ASGI (ver asgi.py)
+    fabrica_cliente_async=lambda api_key: groq.AsyncGroq(api_key=api_key, max_retries=0),
+)
+
+# Reintentos (ver reintentos.py): un limitador de concurrencia común a todas
+# las llamadas del worker y un circuit breaker por tipo de llamada, para que
+# una caída de Whisper no bloquee los packs ni al revés.
+limitador_groq = LimitadorConcurrencia(
+    int(os.environ.get("GROQ_MAX_CONCURRENCIA", 8)),
+    timeout=float(os.environ.get("GROQ_ESPERA_HUECO", 120)),
+)
 
-    lista_keys = [k.strip() for k in keys_string.split(',') if k.strip()]
-    if not lista_keys:
-        raise ValueError("GROQ_KEYS_LIST está definida pero vacía.")
 
-    indice = (random.randint(0, len(lista_keys) - 1) + intento) % len(lista_keys)
-    api_key_actual = lista_keys[indice]
-    log.info("Usando API KEY nº %d (termina en ...%s)", indice + 1, api_key_actual[-4:])
-    return Groq(api_key=api_key_actual)
+def _crear_politica(nombre: str) -> PoliticaReintentos:
+    return PoliticaReintentos(
+        nombre, limitador_groq,
+        CircuitBreaker(
+            nombre,
+            umbral=int(os.environ.get("GROQ_BREAKER_UMBRAL", 5)),
+            enfriamiento=float(os.environ.get("GROQ_BREAKER_ENFRIAMIENTO", 30)),
+        ),
+        # Por defecto, al menos un intento por key antes de rendirse
+        max_intentos=int(os.environ.get("GROQ_MAX_INTENTOS", max(4, len(pool_groq) + 1))),
+        base=float(os.environ.get("GROQ_BACKOFF_BASE", 0.5)),
+        tope=float(os.environ.get("GROQ_BACKOFF_TOPE", 20)),
+        plazo_total=float(os.environ.get("GROQ_PLAZO_REINTENTOS", 120)),
+    )
+
+
+politica_whisper = _crear_politica("whisper")
+politica_pack    = _crear_politica("pack")
+
+# Límites por etapa (ver lotes.py) para que un lote no sature la máquina:
+# Whisper escala con las keys. Las descargas ya las limita el tamaño del
+# pool de YoutubeDL y ffmpeg el ejecutor de compresion.py.
+limites_etapas = LimitesEtapas({
+    "transcripcion": int(os.environ.get("LIMITE_TRANSCRIPCIONES", 2 * len(pool_groq))),
+})
 
 
 # ---------------------------------------------------------------------------
 # COMPRESIÓN DE AUDIO
 # ---------------------------------------------------------------------------
 
-def comprimir_audio(ruta_original: str) -> str:
+# Perfil de compresión (ver compresion.py): mono 16 kHz, por defecto MP3
+# 32 kbps; suficiente para Whisper y muy por debajo del límite de tamaño de
+# Groq. Compartido con la ingesta en streaming de /subir y de YouTube.
+PERFIL_COMPRESION = perfil_desde_entorno()
+# Todos los ffmpeg de compresión del worker pasan por el mismo ejecutor
+ejecutor_ffmpeg = ejecutor_desde_entorno()
+
+
+def comprimir_audio(ruta_original: str, informar=None) -> str:
     """
-    Convierte el audio a mono 16 kHz 32 kbps para reducir el tamaño
-    antes de enviarlo a Groq. Devuelve la ruta del archivo comprimido,
-    o la ruta original si la compresión falla.
+    Convierte el audio según PERFIL_COMPRESION para reducir el tamaño (y
+    los segundos facturados) antes de enviarlo a Groq. Devuelve la ruta del
+    archivo comprimido, o la ruta original si ya es compacto o si la
+    compresión falla. Con `informar`, publica los segundos procesados que va
+    reportando ffmpeg con -progress; si `informar` lanza una excepción (job
+    cancelado), ffmpeg se mata y la excepción sigue su curso.
     """
+    if admite_paso_directo(ruta_original):
+        log.info("Audio ya compacto; se envía sin recodificar: %s", ruta_original)
+        return ruta_original
+
     # Guardamos el comprimido en el mismo directorio que el original
     directorio = os.path.dirname(ruta_original)
-    nombre_comprimido = os.path.join(directorio, f"{uuid.uuid4()}_lite.mp3")
+    nombre_comprimido = os.path.join(directorio, f"{uuid.uuid4()}_lite.{PERFIL_COMPRESION.extension}")
+
+    log.info("Comprimiendo (%s): %s → %s", PERFIL_COMPRESION.nombre, ruta_original, nombre_comprimido)
 
-    log.info("Comprimiendo: %s → %s", ruta_original, nombre_comprimido)
+    comando = [
+        "ffmpeg", "-y", "-nostats", "-progress", "pipe:1", "-i", ruta_original,
+        *PERFIL_COMPRESION.argumentos(),
+        *ejecutor_ffmpeg.argumentos_hilos(),
+        nombre_comprimido
+    ]
+    duracion = None
+
+    def al_linea(linea: str) -> None:
+        # -progress escribe bloques clave=valor; out_time_us son microsegundos
+        clave, _, valor = linea.strip().partition("=")
+        if informar and clave == "out_time_us" and valor.isdigit():
+            informar("compresion", segundos_procesados=round(int(valor) / 1e6, 1),
+                     segundos_totales=duracion)
 
     try:
-        comando = [
-            "ffmpeg", "-y", "-i", ruta_original,
-            "-vn", "-ar", "16000", "-ac", "1", "-b:a", "32k",
-            nombre_comprimido
-        ]
-        subprocess.run(
-            comando,
-            check=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
+        if informar:
+            duracion = duracion_audio(ruta_original, ejecutor_ffmpeg)
+        with medir_etapa("compresion"):
+            ejecutor_ffmpeg.ejecutar(comando, al_linea)
+        registrar_compresion(os.path.getsize(ruta_original), os.path.getsize(nombre_comprimido))
         return nombre_comprimido
+    except ColaFfmpegLlena as e:
+        log.warning("Compresión rechazada, ffmpeg saturado: %s", e)
+        raise ErrorPipeline("Servidor ocupado. Inténtalo en unos minutos.", 503) from e
+    except subprocess.TimeoutExpired as e:
+        log.error("ffmpeg superó el tiempo máximo (%.0f s); se usa el original.", e.timeout)
+        limpiar_archivos(nombre_comprimido)
+        return ruta_original
     except subprocess.CalledProcessError as e:
         log.error("Error en compresión (ffmpeg): %s", e)
+        limpiar_archivos(nombre_comprimido)
         return ruta_original
     except FileNotFoundError:
         log.error("ffmpeg no está instalado o no está en el PATH.")
         return ruta_original
+    except BaseException:
+        limpiar_archivos(nombre_comprimido)
+        raise
 
 
 # ---------------------------------------------------------------------------
 # TRANSCRIPCIÓN CON GROQ
 # ---------------------------------------------------------------------------
 
-def procesar_con_groq(ruta_audio: str) -> str:
+MODELO_WHISPER = "whisper-large-v3"
+
+
+def procesar_con_groq(ruta_audio: str, formato: str = "text"):
     """
-    Envía el audio a Whisper a través de la API de Groq.
-    Rota entre keys si recibe error 429.
+    Envía el audio a Whisper a través de la API de Groq con politica_whisper:
+    ante un 429 cambia de key, ante fallos de red o 5xx reintenta con backoff.
+    Con formato="verbose_json" devuelve la respuesta completa (con segmentos
+    y timestamps) en lugar del texto.
     """
-    MAX_REINTENTOS = 3
+    def llamar(intento: int):
+        with pool_groq.usar(MODELO_WHISPER) as uso, open(ruta_audio, "rb") as f:
+            respuesta = uso.cliente.audio.transcriptions.with_raw_response.create(
+                file=(os.path.basename(ruta_audio), f.read()),
+                model=MODELO_WHISPER,
+                response_format=formato,
+            )
+            uso.registrar(respuesta.headers)
+        log.info("Transcripción completada (intento %d).", intento + 1)
+        return respuesta.parse()
+
+    try:
+        with medir_etapa("transcripcion"):
+            return politica_whisper.ejecutar(llamar)
+    except Exception as e:
+        return error_whisper(e)
+
+
+def error_whisper(e: Exception) -> str:
+    """Texto de error que sustituye a la transcripción cuando Whisper falla."""
+    if isinstance(e, ReintentosAgotados):
+        if e.clase == RATE_LIMIT:
+            return "Error: Todas las API Keys están agotadas. Vuelve en unos minutos."
+        log.error("Groq sigue fallando tras los reintentos: %s", e.ultimo)
+        return f"Error en Groq: {e.ultimo}"
+
+    if isinstance(e, (CircuitoAbierto, LimitadorSaturado)):
+        log.warning("Transcripción rechazada sin llamar a Groq: %s", e)
+        return "Error: Groq no está disponible ahora mismo. Vuelve en unos minutos."
+
+    log.error("Error inesperado en Groq: %s", e)
+    return f"Error en Groq: {e}"
+
+
+# Modo troceado para audios largos: "auto" solo trocea por encima de los
+# umbrales, "1" siempre, "0" nunca.
+TROCEO_MODO            = os.environ.get("TROCEO_MODO", "auto").lower()
+TROCEO_UMBRAL_SEGUNDOS = float(os.environ.get("TROCEO_UMBRAL_SEGUNDOS", 900))
+TROCEO_UMBRAL_MB       = float(os.environ.get("TROCEO_UMBRAL_MB", 20))
+TROCEO_DURACION_TROZO  = float(os.environ.get("TROCEO_DURACION_TROZO", 600))
+TROCEO_SOLAPE          = float(os.environ.get("TROCEO_SOLAPE", 3))
 
-    for i in range(MAX_REINTENTOS):
-        try:
-            client = get_groq_client_with_fallback(intento=i)
-            with open(ruta_audio, "rb") as f:
-                transcripcion = client.audio.transcriptions.create(
-                    file=(os.path.basename(ruta_audio), f.read()),
-                    model="whisper-large-v3",
-                    response_format="text",
-                )
-            log.info("Transcripción completada (intento %d).", i + 1)
-            return transcripcion
-
-        except Exception as e:
-            error_msg = str(e)
-            if "429" in error_msg or "Rate limit" in error_msg:
-                log.warning("Key agotada (429). Cambiando... (intento %d/%d)", i + 1, MAX_REINTENTOS)
-                continue
-            else:
-                log.error("Error inesperado en Groq: %s", error_msg)
-                return f"Error en Groq: {error_msg}"
 
-    return "Error: Todas las API Keys están agotadas. Vuelve en unos minutos."
+def duracion_si_trocear(ruta_audio: str) -> float | None:
+    """Duración del audio si hay que transcribirlo por trozos; None si basta una petición."""
+    if TROCEO_MODO == "0":
+        return None
+
+    duracion = duracion_audio(ruta_audio, ejecutor_ffmpeg)
+    if duracion is None:
+        return None
+
+    tamano_mb = os.path.getsize(ruta_audio) / (1024 * 1024)
+    if TROCEO_MODO != "1" and duracion <= TROCEO_UMBRAL_SEGUNDOS and tamano_mb <= TROCEO_UMBRAL_MB:
+        return None
+    return duracion
+
+
+def transcribir_audio(ruta_audio: str) -> str:
+    """
+    Punto de entrada de la transcripción: una sola petición a Whisper o,
+    para audios largos, trozos solapados transcritos en paralelo repartidos
+    entre las keys de GROQ_KEYS_LIST.
+    """
+    try:
+        duracion = duracion_si_trocear(ruta_audio)
+        if duracion is None:
+            return procesar_con_groq(ruta_audio)
+
+        # El pool reparte los trozos concurrentes entre las keys con más margen
+        return transcribir_troceado(
+            ruta_audio,
+            lambda ruta_trozo, indice: procesar_con_groq(ruta_trozo, formato="verbose_json"),
+            duracion,
+            ejecutor_ffmpeg,
+            duracion_trozo=TROCEO_DURACION_TROZO,
+            solape=TROCEO_SOLAPE,
+            max_paralelo=int(os.environ.get("TROCEO_MAX_PARALELO", min(len(pool_groq), 8))),
+        )
+    except ColaFfmpegLlena as e:
+        log.warning("Transcripción rechazada, ffmpeg saturado: %s", e)
+        raise ErrorPipeline("Servidor ocupado. Inténtalo en unos minutos.", 503) from e
 
 
 # ---------------------------------------------------------------------------
@@ -180,72 +371,481 @@ ESTRUCTURA JSON OBLIGATORIA:
 }
 """
 
-# Longitud máxima del texto que enviamos al LLM.
-# Nota: el contenido se trunca silenciosamente; en el futuro sería
-# buena idea avisar al usuario si su vídeo supera este límite.
-MAX_CHARS_LLM = 22_000
+# Fase map para transcripciones largas (ver resumenes.py): cada trozo se
+# resume conservando lo que luego necesita el pack.
+PROMPT_RESUMEN_TROZO = """
+Vas a recibir un fragmento de la transcripción de un vídeo. Resúmelo en
+español para que un editor pueda escribir después contenido viral del vídeo
+completo sin leer la transcripción.
+
+REGLAS:
+1. Conserva todas las ideas principales en el orden en que aparecen.
+2. Copia literalmente las frases más potentes, los datos, cifras y nombres.
+3. Señala los momentos con gancho (polémica, sorpresa, humor, consejos).
+4. Responde solo con el resumen, en texto plano, sin introducciones.
+"""
+
+MODELO_PACK      = "llama-3.3-70b-versatile"
+TEMPERATURA_PACK = 0.5
+MAX_TOKENS_PACK  = 2048
+
+# "unico": el pack completo en una llamada; "secciones": una llamada por
+# plataforma (ver PACK POR SECCIONES), también cuando el cliente no elige.
+PACK_MODO = os.environ.get("PACK_MODO", "unico").lower()
+
+# Hasta PACK_MAX_TOKENS_ENTRADA (~22.000 caracteres, el antiguo recorte) la
+# transcripción va entera en una sola llamada. Por encima se resume por
+# trozos de PACK_TOKENS_TROZO en paralelo y el pack se genera sobre los
+# resúmenes: nada se queda fuera, solo condensado.
+PACK_MAX_TOKENS_ENTRADA = int(os.environ.get("PACK_MAX_TOKENS_ENTRADA", 5500))
+PACK_TOKENS_TROZO       = int(os.environ.get("PACK_TOKENS_TROZO", 3500))
+PACK_TOKENS_RESUMEN     = int(os.environ.get("PACK_TOKENS_RESUMEN", 600))
+MODELO_RESUMEN          = os.environ.get("PACK_MODELO_RESUMEN", MODELO_PACK)
+TEMPERATURA_RESUMEN     = 0.2
+
+# Memoización de packs: la misma transcripción con el mismo prompt y
+# parámetros del modelo devuelve el mismo pack sin gastar tokens de Groq.
+# CACHE_PACKS_DISCO=0 la deja solo en memoria (por worker).
+cache_packs = CacheEnCapas(
+    CacheMemoria(
+        "packs",
+        max_entradas=int(os.environ.get("CACHE_PACKS_MAX_ENTRADAS", 256)),
+        max_edad=float(os.environ.get("CACHE_PACKS_TTL_HORAS", 168)) * 3600,
+    ),
+    CacheSQLite(
+        CACHE_DB_PATH, "packs",
+        max_bytes=int(float(os.environ.get("CACHE_PACKS_MAX_MB", 50)) * 1024 * 1024),
+        max_edad=float(os.environ.get("CACHE_PACKS_TTL_HORAS", 168)) * 3600,
+    ) if os.environ.get("CACHE_PACKS_DISCO", "1") != "0" else None,
+)
 
 
-def generar_pack_viral(texto_transcrito: str) -> dict:
+def clave_pack(texto: str, prompt: str, modelo: str, temperatura: float, max_tokens: int,
+               *contexto) -> str:
     """
-    Genera un pack de contenido para redes sociales a partir de la transcripción.
-    Rota entre keys si recibe error 429. Normaliza las claves del JSON para
-    absorber variaciones de nombres que devuelva el modelo.
+    Hash de todo lo que determina la salida del LLM. `contexto` añade lo que
+    no va en la llamada pero decide su entrada (ver contexto_pack).
     """
-    MAX_REINTENTOS = 3
+    material = json.dumps([texto, prompt, modelo, temperatura, max_tokens, *contexto], ensure_ascii=False)
+    return "pack:" + hashlib.sha256(material.encode("utf-8")).hexdigest()
 
-    for i in range(MAX_REINTENTOS):
-        try:
-            client = get_groq_client_with_fallback(intento=i)
-
-            completion = client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": PROMPT_PACK_VIRAL},
-                    {"role": "user", "content": f"Transcripción:\n{texto_transcrito[:MAX_CHARS_LLM]}"}
-                ],
-                model="llama-3.3-70b-versatile",
-                temperature=0.5,
-                max_tokens=2048,
-                response_format={"type": "json_object"}
-            )
 
-            contenido_bruto = completion.choices[0].message.content
-            log.info("JSON recibido del LLM (intento %d): %.80s...", i + 1, contenido_bruto)
+def contexto_pack(modo: str) -> tuple:
+    """
+    Modo del pack ("unico" o "secciones") y parámetros del map-reduce: con
+    otro presupuesto o prompt de resumen, la misma transcripción llega al
+    LLM condensada de otra forma y el pack cacheado ya no vale.
+    """
+    return (modo, PACK_MAX_TOKENS_ENTRADA, PACK_TOKENS_TROZO, PACK_TOKENS_RESUMEN,
+            MODELO_RESUMEN, TEMPERATURA_RESUMEN, PROMPT_RESUMEN_TROZO)
 
-            data = json.loads(contenido_bruto)
 
-            # Normalización de claves para absorber variaciones del modelo
-            return {
-                "resumen":      data.get("resumen")       or data.get("summary")          or "Resumen no generado.",
-                "hilo_twitter": data.get("hilo_twitter")  or data.get("twitter_thread")   or [],
-                "linkedin":     data.get("linkedin")      or data.get("linkedin_post")    or data.get("post_linkedin") or "Texto no generado.",
-                "tiktok_script":data.get("tiktok_script") or data.get("tiktok")           or data.get("reels") or "Guion no generado."
-            }
+def clave_pack_unico(texto_transcrito: str) -> str:
+    """Clave del pack completo en una sola llamada."""
+    return clave_pack(texto_transcrito, PROMPT_PACK_VIRAL, MODELO_PACK, TEMPERATURA_PACK, MAX_TOKENS_PACK,
+                      *contexto_pack("unico"))
 
-        except Exception as e:
-            error_msg = str(e)
-            log.warning("Error en intento %d: %s", i + 1, error_msg)
 
-            if "429" in error_msg or "Rate limit" in error_msg:
-                log.info("Cambiando de API Key por rate limit...")
-                continue
+def resumir_trozo(trozo: str, indice: int, total: int) -> str:
+    """
+    Fase map: resume un trozo de la transcripción con politica_pack. Los
+    resúmenes también se memorizan en cache_packs, así que reintentar un pack
+    largo no vuelve a pagar los trozos que ya salieron bien.
+    """
+    clave = clave_pack(trozo, PROMPT_RESUMEN_TROZO, MODELO_RESUMEN, TEMPERATURA_RESUMEN, PACK_TOKENS_RESUMEN)
+    if (resumen := cache_packs.obtener(clave)) is not None:
+        return resumen
+
+    mensajes = [
+        {"role": "system", "content": PROMPT_RESUMEN_TROZO},
+        {"role": "user", "content": f"Fragmento {indice + 1} de {total}:\n{trozo}"}
+    ]
+    tokens_estimados = estimar_tokens(PROMPT_RESUMEN_TROZO + trozo) + PACK_TOKENS_RESUMEN
+
+    def llamar(intento: int) -> str:
+        with pool_groq.usar(MODELO_RESUMEN, tokens_estimados) as uso:
+            respuesta = uso.cliente.chat.completions.with_raw_response.create(
+                messages=mensajes,
+                model=MODELO_RESUMEN,
+                temperature=TEMPERATURA_RESUMEN,
+                max_tokens=PACK_TOKENS_RESUMEN,
+            )
+            completion = respuesta.parse()
+            uso.registrar(respuesta.headers, completion.usage.total_tokens if completion.usage else None)
+        return (completion.choices[0].message.content or "").strip()
+
+    with medir_etapa("resumen_trozo"):
+        resumen = politica_pack.ejecutar(llamar)
+    cache_packs.guardar(clave, resumen)
+    return resumen
+
+
+def contenido_para_pack(texto_transcrito: str) -> str:
+    """Mensaje de usuario del pack: la transcripción entera o sus resúmenes por partes."""
+    if estimar_tokens(texto_transcrito) <= PACK_MAX_TOKENS_ENTRADA:
+        return f"Transcripción:\n{texto_transcrito}"
+
+    resumenes = condensar(
+        texto_transcrito, resumir_trozo,
+        max_tokens_entrada=PACK_MAX_TOKENS_ENTRADA,
+        max_tokens_trozo=PACK_TOKENS_TROZO,
+        max_paralelo=int(os.environ.get("PACK_MAX_PARALELO", min(len(pool_groq), 8))),
+    )
+    log.info("Transcripción de ~%d tokens condensada en %d resúmenes.",
+             estimar_tokens(texto_transcrito), len(resumenes))
+    partes = "\n\n".join(f"[Parte {i + 1}/{len(resumenes)}]\n{r}" for i, r in enumerate(resumenes))
+    return ("La transcripción es demasiado larga y se ha resumido por partes, en orden. "
+            "Trata el conjunto como la transcripción completa del vídeo.\n\n" + partes)
+
+
+# Respuestas de reserva con el mismo formato que un pack, para que el
+# frontend siempre tenga algo que pintar
+PACK_SATURADO = {
+    "resumen":       "Servicio saturado. Todas las keys agotadas.",
+    "hilo_twitter":  [],
+    "linkedin":      "Vuelve en unos minutos.",
+    "tiktok_script": ""
+}
 
-            # Error no recuperable (JSON malformado, etc.)
-            return {
-                "resumen":       "Error técnico generando contenido.",
-                "hilo_twitter":  ["Error"],
-                "linkedin":      f"Error: {error_msg}",
-                "tiktok_script": "Error"
-            }
 
+def pack_con_error(error_msg: str) -> dict:
     return {
-        "resumen":       "Servicio saturado. Todas las keys agotadas.",
-        "hilo_twitter":  [],
-        "linkedin":      "Vuelve en unos minutos.",
-        "tiktok_script": ""
+        "resumen":       "Error técnico generando contenido.",
+        "hilo_twitter":  ["Error"],
+        "linkedin":      f"Error: {error_msg}",
+        "tiktok_script": "Error"
     }
 
 
+# Nombres alternativos con los que el modelo devuelve a veces cada sección,
+# y valor por defecto si no la incluye
+ALIAS_SECCIONES = {
+    "resumen":       (("resumen", "summary"), "Resumen no generado."),
+    "hilo_twitter":  (("hilo_twitter", "twitter_thread"), []),
+    "linkedin":      (("linkedin", "linkedin_post", "post_linkedin"), "Texto no generado."),
+    "tiktok_script": (("tiktok_script", "tiktok", "reels"), "Guion no generado."),
+}
+
+
+def _valor_seccion(data: dict, seccion: str):
+    alias, _ = ALIAS_SECCIONES[seccion]
+    return next((data[a] for a in alias if data.get(a)), None)
+
+
+def normalizar_pack(data: dict) -> dict:
+    """Normalización de claves para absorber variaciones del modelo."""
+    return {seccion: _valor_seccion(data, seccion) or defecto
+            for seccion, (_, defecto) in ALIAS_SECCIONES.items()}
+
+
+# Con PACK_STREAMING=1 las completions del pack se piden en streaming y el
+# JSON se parsea según llega (ver json_incremental.py): cada campo, y cada
+# tweet del hilo, se publica en cuanto se cierra en lugar de esperar a la
+# respuesta entera. El modo JSON de Groq no admite streaming, así que en
+# este modo el formato lo impone solo el prompt.
+PACK_STREAMING = os.environ.get("PACK_STREAMING", "0") != "0"
+
+
+def _completion_json(uso, mensajes: list[dict], max_tokens: int, al_campo=None) -> dict:
+    """
+    Pide a MODELO_PACK una respuesta JSON con la key reservada en `uso` y la
+    devuelve parseada (ValueError si no es JSON válido). En streaming,
+    `al_campo(ruta, valor)` recibe cada valor completo según llega.
+    """
+    parametros = dict(messages=mensajes, model=MODELO_PACK,
+                      temperature=TEMPERATURA_PACK, max_tokens=max_tokens)
+    if not PACK_STREAMING:
+        respuesta = uso.cliente.chat.completions.with_raw_response.create(
+            **parametros, response_format={"type": "json_object"})
+        completion = respuesta.parse()
+        uso.registrar(respuesta.headers, completion.usage.total_tokens if completion.usage else None)
+        return json.loads(completion.choices[0].message.content)
+
+    respuesta = uso.cliente.chat.completions.with_raw_response.create(**parametros, stream=True)
+    parser = ParserJSONIncremental()
+    tokens = None
+    for trozo in respuesta.parse():
+        if trozo.choices and (delta := trozo.choices[0].delta.content):
+            for ruta, valor in parser.alimentar(delta):
+                if al_campo:
+                    al_campo(ruta, valor)
+        # Groq manda el uso de tokens en el último trozo, dentro de x_groq
+        if (x_groq := getattr(trozo, "x_groq", None)) is not None and getattr(x_groq, "usage", None):
+            tokens = x_groq.usage.total_tokens
+    uso.registrar(respuesta.headers, tokens)
+    return parser.finalizar()
+
+
+def _avance_por_secciones(al_avanzar_seccion):
+    """
+    Traduce los campos del parser incremental a secciones del pack para
+    `al_avanzar_seccion(seccion, valor)`: los campos de primer nivel tal
+    cual y las listas (el hilo de Twitter) elemento a elemento.
+    """
+    secciones_por_alias = {alias: seccion for seccion, (nombres, _) in ALIAS_SECCIONES.items()
+                           for alias in nombres}
+    listas: dict[str, list] = {}
+
+    def al_campo(ruta: tuple, valor) -> None:
+        seccion = secciones_por_alias.get(ruta[0])
+        if seccion is None or al_avanzar_seccion is None:
+            return
+        if len(ruta) == 1:
+            listas.pop(seccion, None)
+            al_avanzar_seccion(seccion, valor)
+        elif isinstance(ruta[1], int):
+            lista = listas.setdefault(seccion, [])
+            # Tras un reintento la lista vuelve a empezar desde el índice 0
+            del lista[ruta[1]:]
+            lista.append(valor)
+            al_avanzar_seccion(seccion, list(lista))
+
+    return al_campo
+
+
+def mensajes_pack(contenido: str) -> tuple[list[dict], int]:
+    """Mensajes de la llamada del pack completo y los tokens que se le estiman."""
+    mensajes = [
+        {"role": "system", "content": PROMPT_PACK_VIRAL},
+        {"role": "user", "content": contenido}
+    ]
+    return mensajes, estimar_tokens(PROMPT_PACK_VIRAL + contenido) + MAX_TOKENS_PACK
+
+
+def generar_pack_viral(texto_transcrito: str, plataformas: list[str] | None = None,
+                       al_avanzar_seccion=None) -> dict:
+    """
+    Genera un pack de contenido para redes sociales a partir de la transcripción.
+    Con `plataformas` (o PACK_MODO=secciones) cada sección va en su propia
+    llamada (ver generar_pack_por_secciones). En streaming, las secciones se
+    adelantan a `al_avanzar_seccion(seccion, valor)` según se completan. Las
+    transcripciones largas se condensan antes con map-reduce (ver
+    contenido_para_pack). Los reintentos los gestiona politica_pack. Los
+    packs correctos se memorizan en cache_packs.
+    """
+    if plataformas is not None or PACK_MODO == "secciones":
+        return generar_pack_por_secciones(texto_transcrito, plataformas or list(SECCIONES_PACK),
+                                          al_avanzar_seccion)
+
+    clave = clave_pack_unico(texto_transcrito)
+    if (pack_cacheado := cache_packs.obtener(clave)) is not None:
+        log.info("Pack viral servido desde caché (%s).", clave[:16])
+        return json.loads(pack_cacheado)
+
+    al_campo = _avance_por_secciones(al_avanzar_seccion)
+
+    def llamar(intento: int) -> dict:
+        with pool_groq.usar(MODELO_PACK, tokens_estimados) as uso:
+            # Un JSON malformado es un error fatal para la política: no se reintenta
+            data = _completion_json(uso, mensajes, MAX_TOKENS_PACK, al_campo)
+
+        log.info("JSON recibido del LLM (intento %d): %.80s...",
+                 intento + 1, json.dumps(data, ensure_ascii=False))
+        return data
+
+    try:
+        mensajes, tokens_estimados = mensajes_pack(contenido_para_pack(texto_transcrito))
+
+        with medir_etapa("pack_viral"):
+            data = politica_pack.ejecutar(llamar)
+    except Exception as e:
+        return pack_fallido(e)
+
+    pack = normalizar_pack(data)
+    cache_packs.guardar(clave, json.dumps(pack, ensure_ascii=False))
+    return pack
+
+
+def pack_fallido(e: Exception) -> dict:
+    """Pack de reserva según el motivo del fallo de la llamada al LLM."""
+    if isinstance(e, ReintentosAgotados):
+        if e.clase == RATE_LIMIT:
+            return dict(PACK_SATURADO)
+        error_msg = str(e.ultimo)
+        log.warning("Pack viral fallido tras los reintentos: %s", error_msg)
+        return pack_con_error(error_msg)
+
+    if isinstance(e, (CircuitoAbierto, LimitadorSaturado)):
+        log.warning("Pack viral rechazado sin llamar a Groq: %s", e)
+        return dict(PACK_SATURADO)
+
+    # Error no recuperable (JSON malformado, petición inválida, etc.)
+    error_msg = str(e)
+    log.warning("Error no recuperable generando el pack: %s", error_msg)
+    return pack_con_error(error_msg)
+
+
+# ---------------------------------------------------------------------------
+# PACK POR SECCIONES
+# Una llamada por plataforma, todas a la vez y con un max_tokens a medida:
+# el pack completo tarda lo que la sección más lenta y no la suma, un JSON
+# malformado solo obliga a repetir su sección y el cliente puede pedir solo
+# las plataformas que necesita (`plataformas=linkedin,tiktok_script`).
+# Con PACK_MODO=secciones se usa también cuando el cliente no elige.
+# ---------------------------------------------------------------------------
+PACK_REINTENTOS_JSON = int(os.environ.get("PACK_REINTENTOS_JSON", 1))
+
+PROMPT_SECCION = """
+Eres un Editor Jefe experto en viralidad y en la juventud de hoy en día.
+Tu objetivo es REEMPAQUETAR la transcripción para una sola red social, de
+forma que esté completamente lista para publicar.
+
+REGLAS CRÍTICAS:
+1. Responde SOLO con un JSON válido.
+2. NO expliques nada antes ni después.
+
+ESTRUCTURA JSON OBLIGATORIA:
+{
+    __CAMPO__
+}
+"""
+
+SECCIONES_PACK = {
+    "resumen": {
+        "campo": '"resumen": "Empieza con 3 frases impactantes y directas si la transcripción es corta. A medida que vaya siendo más larga, añade más frases para cubrir todos los temas principales."',
+        "max_tokens": 512,
+    },
+    "hilo_twitter": {
+        "campo": '"hilo_twitter": ["Tweet 1 (Gancho)", "Tweet 2", "Tweet 3", "Tweet 4 (Cierre)"]',
+        "max_tokens": 768,
+    },
+    "linkedin": {
+        "campo": '"linkedin": "Texto profesional con negritas (**texto**) y emojis. Estructura: Gancho → Problema → Solución. Alarga según la extensión de la transcripción."',
+        "max_tokens": 1024,
+    },
+    "tiktok_script": {
+        "campo": '"tiktok_script": "Guion estructurado. Usa [VISUAL] y [AUDIO]. Gradúa el detalle según la transcripción."',
+        "max_tokens": 1024,
+    },
+}
+for _conf in SECCIONES_PACK.values():
+    _conf["prompt"] = PROMPT_SECCION.replace("__CAMPO__", _conf["campo"])
+
+
+def validar_plataformas(valor) -> list[str] | None:
+    """
+    Normaliza `plataformas` (lista o texto separado por comas) a secciones
+    del pack sin repetir. None si no viene; ValueError si alguna no existe.
+    """
+    if not valor:
+        return None
+    if isinstance(valor, str):
+        valor = valor.split(",")
+    plataformas = [p.strip().lower() for p in valor if isinstance(p, str) and p.strip()]
+    desconocidas = [p for p in plataformas if p not in SECCIONES_PACK]
+    if desconocidas or not plataformas:
+        raise ValueError(f"Plataformas no válidas: {', '.join(desconocidas) or valor}. "
+                         f"Disponibles: {', '.join(SECCIONES_PACK)}")
+    return list(dict.fromkeys(plataformas))
+
+
+def _clave_seccion(texto_transcrito: str, seccion: str) -> str:
+    conf = SECCIONES_PACK[seccion]
+    return clave_pack(texto_transcrito, conf["prompt"], MODELO_PACK, TEMPERATURA_PACK, conf["max_tokens"],
+                      *contexto_pack("secciones"))
+
+
+def generar_seccion(seccion: str, texto_transcrito: str, contenido: str, al_campo=None):
+    """
+    Genera una sección del pack con politica_pack. Un JSON malformado o sin
+    la sección se repite hasta PACK_REINTENTOS_JSON veces más; el resto de
+    errores se propagan. `al_campo` recibe los campos en streaming.
+    """
+    conf = SECCIONES_PACK[seccion]
+    mensajes = [
+        {"role": "system", "content": conf["prompt"]},
+        {"role": "user", "content": contenido}
+    ]
+    tokens_estimados = estimar_tokens(conf["prompt"] + contenido) + conf["max_tokens"]
+
+    def llamar(intento: int):
+        with pool_groq.usar(MODELO_PACK, tokens_estimados) as uso:
+            data = _completion_json(uso, mensajes, conf["max_tokens"], al_campo)
+
+        valor = _valor_seccion(data, seccion)
+        if valor is None:
+            raise ValueError(f"El JSON no incluye la sección {seccion}")
+        return valor
+
+    for intento_json in range(PACK_REINTENTOS_JSON + 1):
+        try:
+            valor = politica_pack.ejecutar(llamar)
+            break
+        except ValueError as e:
+            if intento_json == PACK_REINTENTOS_JSON:
+                raise
+            log.warning("Sección %s con JSON inválido (%s); se repite solo esta sección.", seccion, e)
+
+    cache_packs.guardar(_clave_seccion(texto_transcrito, seccion), json.dumps(valor, ensure_ascii=False))
+    return valor
+
+
+def _seccion_fallida(seccion: str, e: Exception) -> tuple:
+    """Valor de reserva y mensaje de error para una sección que no se pudo generar."""
+    if isinstance(e, (CircuitoAbierto, LimitadorSaturado)) or \
+            (isinstance(e, ReintentosAgotados) and e.clase == RATE_LIMIT):
+        return PACK_SATURADO[seccion], "Servicio saturado. Todas las keys agotadas."
+    error_msg = str(e.ultimo if isinstance(e, ReintentosAgotados) else e)
+    return pack_con_error(error_msg)[seccion], error_msg
+
+
+def generar_pack_por_secciones(texto_transcrito: str, plataformas: list[str],
+                               al_avanzar_seccion=None) -> dict:
+    """
+    Genera las secciones pedidas en paralelo. `al_avanzar_seccion(seccion,
+    valor)` se llama en cuanto cada una termina (y antes, en streaming, con
+    el hilo de Twitter a medias). Las que fallan llevan su
+    valor de reserva y el motivo en `errores`.
+    """
+    pack: dict = {}
+    errores: dict = {}
+    lock = threading.Lock()
+
+    def avanzar(seccion: str, valor) -> None:
+        with lock:
+            if al_avanzar_seccion and seccion not in pack:
+                al_avanzar_seccion(seccion, valor)
+
+    def terminar(seccion: str, valor=None, error: Exception | None = None) -> None:
+        if error is not None:
+            log.warning("Sección %s fallida: %s", seccion, error)
+            valor, errores[seccion] = _seccion_fallida(seccion, error)
+        with lock:
+            pack[seccion] = valor
+            if al_avanzar_seccion:
+                al_avanzar_seccion(seccion, valor)
+
+    pendientes = []
+    for seccion in plataformas:
+        if (cacheado := cache_packs.obtener(_clave_seccion(texto_transcrito, seccion))) is not None:
+            terminar(seccion, json.loads(cacheado))
+        else:
+            pendientes.append(seccion)
+
+    if pendientes:
+        with medir_etapa("pack_viral"):
+            try:
+                contenido = contenido_para_pack(texto_transcrito)
+            except Exception as e:
+                for seccion in pendientes:
+                    terminar(seccion, error=e)
+            else:
+                def ejecutar(seccion: str) -> None:
+                    try:
+                        al_campo = _avance_por_secciones(avanzar)
+                        terminar(seccion, generar_seccion(seccion, texto_transcrito, contenido, al_campo))
+                    except Exception as e:
+                        terminar(seccion, error=e)
+
+                with ThreadPoolExecutor(max_workers=len(pendientes), thread_name_prefix="seccion") as executor:
+                    list(executor.map(ejecutar, pendientes))
+
+    resultado = {seccion: pack[seccion] for seccion in plataformas}
+    if errores:
+        resultado["errores"] = errores
+    return resultado
+
+
 # ---------------------------------------------------------------------------
 # HELPERS DE LIMPIEZA
 # ---------------------------------------------------------------------------
@@ -261,6 +861,515 @@ def limpiar_archivos(*rutas: str) -> None:
                 log.warning("No se pudo eliminar %s: %s", ruta, e)
 
 
+# ---------------------------------------------------------------------------
+# CACHÉ DE TRANSCRIPCIONES
+# Claves: "youtube:<video_id>" para /transformar y "sha256:<hash>" de los
+# bytes subidos para /subir. Un acierto evita descarga, ffmpeg y Whisper.
+# ---------------------------------------------------------------------------
+cache_transcripciones = CacheSQLite(
+    CACHE_DB_PATH, "transcripciones",
+    max_bytes=int(float(os.environ.get("CACHE_TRANSCRIPCIONES_MAX_MB", 200)) * 1024 * 1024),
+    max_edad=float(os.environ.get("CACHE_TRANSCRIPCIONES_MAX_DIAS", 30)) * 86400,
+)
+
+# Registro de cachés inspeccionables desde /admin/cache
+CACHES = {
+    "transcripciones": cache_transcripciones,
+    "packs":           cache_packs,
+}
+
+
+def clave_youtube(url: str) -> str | None:
+    video_id = extraer_video_id(url)
+    return f"youtube:{video_id}" if video_id else None
+
+
+def guardar_subida_con_hash(archivo, ruta_destino: str, tam_bloque: int = 1024 * 1024) -> str:
+    """
+    Escribe el archivo subido en disco calculando su SHA-256 en la misma
+    pasada, para no tener que releerlo. Devuelve la clave de caché.
+    """
+    sha = hashlib.sha256()
+    with open(ruta_destino, "wb") as destino:
+        while bloque := archivo.stream.read(tam_bloque):
+            sha.update(bloque)
+            destino.write(bloque)
+    return f"sha256:{sha.hexdigest()}"
+
+
+# ---------------------------------------------------------------------------
+# PIPELINES
+# Cada pipeline recibe la entrada ya validada, ejecuta todas las etapas y
+# devuelve el dict de respuesta. Se usan tanto desde las rutas síncronas
+# como desde la cola de jobs. `informar(etapa, **datos)` publica progreso.
+# ---------------------------------------------------------------------------
+
+class ErrorPipeline(Exception):
+    """Error controlado del pipeline: mensaje para el usuario y código HTTP."""
+
+    def __init__(self, mensaje: str, status: int = 500):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.status = status
+
+
+def _transcribir(ruta_audio: str, clave_cache: str | None, informar,
+                 comprimido: bool = False) -> str:
+    """Compresión → transcripción. Guarda en caché las transcripciones correctas."""
+    ruta_comprimida = None
+    try:
+        if comprimido:
+            ruta_comprimida = ruta_audio
+        else:
+            informar("compresion")
+            ruta_comprimida = comprimir_audio(ruta_audio, informar)
+
+        informar("transcripcion")
+        with limites_etapas.hueco("transcripcion"):
+            texto = transcribir_audio(ruta_comprimida)
+
+        if clave_cache and isinstance(texto, str) and not texto.startswith("Error"):
+            cache_transcripciones.guardar(clave_cache, texto)
+        return texto
+    finally:
+        # ruta_comprimida puede ser igual a ruta_audio si la compresión falló;
+        # la limpieza del original la hace quien lo creó
+        if ruta_comprimida != ruta_audio:
+            limpiar_archivos(ruta_comprimida)
+
+
+def transcripcion_cacheada(clave_cache: str | None, informar) -> str | None:
+    """Transcripción guardada para `clave_cache`, o None. También la usa asgi.py."""
+    if not clave_cache:
+        return None
+    texto = cache_transcripciones.obtener(clave_cache)
+    if texto is not None:
+        informar("transcripcion", cache=True)
+    return texto
+
+
+def _generar_resultado(texto: str, origen: str, informar,
+                       plataformas: list[str] | None = None) -> dict:
+    """Última etapa: pack viral (o solo las `plataformas` pedidas) a partir de la transcripción."""
+    if isinstance(texto, str) and texto.startswith("Error"):
+        return {"transcripcion": texto, "pack_viral": None}
+
+    log.info("Generando pack viral para %s...", origen)
+    # La transcripción se adelanta al cliente sin esperar al pack, y en modo
+    # por secciones o en streaming también cada sección según se completa
+    informar("pack_viral", parcial={"transcripcion": texto})
+    secciones: dict = {}
+    inicio = time.monotonic()
+
+    def al_avanzar_seccion(seccion: str, valor) -> None:
+        if not secciones:
+            PRIMER_CONTENIDO_PACK.observar(time.monotonic() - inicio, streaming=int(PACK_STREAMING))
+        secciones[seccion] = valor
+        informar("pack_viral", parcial={"pack_viral": dict(secciones)})
+
+    pack_social = generar_pack_viral(texto, plataformas, al_avanzar_seccion)
+    if not secciones:
+        PRIMER_CONTENIDO_PACK.observar(time.monotonic() - inicio, streaming=int(PACK_STREAMING))
+
+    return {
+        "transcripcion": texto,
+        "pack_viral":    pack_social
+    }
+
+
+# Peticiones idénticas simultáneas (mismo vídeo o mismos bytes subidos, y
+# mismas plataformas) comparten un único pipeline; ver coalescencia.py
+COALESCENCIA = os.environ.get("COALESCENCIA", "1") != "0"
+vuelos = Vuelos(espera_max=float(os.environ.get("COALESCENCIA_ESPERA_MAX", 1800)))
+
+
+def clave_vuelo(clave_cache: str | None, plataformas: list[str] | None) -> str | None:
+    """
+    Clave del vuelo en `vuelos`; None si no hay coalescencia. asgi.py usa la
+    misma, así que un job con hilos y una petición ASGI nativa del mismo
+    vídeo comparten un único pipeline.
+    """
+    if not COALESCENCIA or not clave_cache:
+        return None
+    return f"{clave_cache}|{','.join(sorted(plataformas or []))}"
+
+
+def pipeline_archivo(ruta_original: str, clave_cache: str | None = None,
+                     comprimido: bool = False, plataformas: list[str] | None = None,
+                     informar=sin_progreso) -> dict:
+    """
+    Procesa un archivo ya guardado en disco. Siempre lo elimina al terminar.
+    `comprimido` indica que ya viene comprimido de la ingesta en streaming.
+    Si ya se está procesando el mismo contenido, espera a ese resultado.
+    """
+    try:
+        return vuelos.ejecutar(clave_vuelo(clave_cache, plataformas), _procesar_archivo,
+                               ruta_original, clave_cache, comprimido, plataformas, informar=informar)
+    finally:
+        # Quien se engancha a otro vuelo no llega a usar su copia
+        limpiar_archivos(ruta_original)
+
+
+def _procesar_archivo(ruta_original: str, clave_cache: str | None, comprimido: bool,
+                      plataformas: list[str] | None, informar=sin_progreso) -> dict:
+    informar = informar_limitado(informar)
+    try:
+        texto = transcripcion_cacheada(clave_cache, informar)
+        if texto is None:
+            log.info("Procesando archivo subido: %s", ruta_original)
+            texto = _transcribir(ruta_original, clave_cache, informar, comprimido)
+    finally:
+        limpiar_archivos(ruta_original)
+
+    return _generar_resultado(texto, "archivo subido", informar, plataformas)
+
+
+def pipeline_youtube(url: str, plataformas: list[str] | None = None, informar=sin_progreso) -> dict:
+    """
+    Descarga el audio de una URL de YouTube ya validada y lo procesa. Las
+    peticiones simultáneas del mismo vídeo se enganchan a la primera.
+    """
+    return vuelos.ejecutar(clave_vuelo(clave_youtube(url), plataformas), _procesar_youtube,
+                           url, plataformas, informar=informar)
+
+
+def _procesar_youtube(url: str, plataformas: list[str] | None, informar=sin_progreso) -> dict:
+    informar = informar_limitado(informar)
+    clave_cache = clave_youtube(url)
+    texto = transcripcion_cacheada(clave_cache, informar)
+    if texto is None:
+        texto = _descargar_y_transcribir(url, clave_cache, informar)
+
+    resultado = _generar_resultado(texto, "vídeo de YouTube", informar, plataformas)
+    if resultado["pack_viral"] is not None:
+        resultado = {"status": "success", **resultado}
+    return resultado
+
+
+# Con DESCARGA_STREAMING=1 (por defecto) el audio va de YouTube a ffmpeg sin
+# pasar por disco. Como se baja a 32 kbps, basta el audio más ligero decente:
+# opus/webm ≤70 kbps (decodificable desde un pipe) antes que el mejor.
+DESCARGA_STREAMING = os.environ.get("DESCARGA_STREAMING", "1") != "0"
+FORMATO_AUDIO = "bestaudio[abr<=70][ext=webm]/bestaudio[abr<=70]/worstaudio[abr>=32]/bestaudio/best"
+
+
+def _descargar_comprimiendo(ydl, url: str, informar) -> str | None:
+    """
+    Resuelve el formato con yt-dlp y lo comprime en streaming. Devuelve la
+    ruta comprimida, o None si el formato no admite streaming o falla la red
+    o la decodificación (entonces se usa la descarga clásica a disco). Las
+    cancelaciones y la saturación de ffmpeg se propagan: repetir la descarga
+    entera no las arreglaría.
+    """
+    info = ydl.extract_info(url, download=False)
+    if info.get("requested_formats") or info.get("protocol") not in ("http", "https") or not info.get("url"):
+        log.info("Formato %s no apto para streaming (%s); descarga clásica.",
+                 info.get("format_id"), info.get("protocol"))
+        return None
+
+    log.info("Descargando en streaming el formato %s (%s, %s kbps).",
+             info.get("format_id"), info.get("ext"), info.get("abr"))
+    try:
+        return comprimir_desde_url(
+            lambda u, cabeceras: ydl.urlopen(yt_dlp.networking.Request(u, headers=cabeceras)),
+            info["url"],
+            info.get("http_headers") or {},
+            PERFIL_COMPRESION,
+            tam_rango=(info.get("downloader_options") or {}).get("http_chunk_size"),
+            informar=informar,
+            ejecutor=ejecutor_ffmpeg,
+        )
+    except ColaFfmpegLlena as e:
+        log.warning("Descarga rechazada, ffmpeg saturado: %s", e)
+        raise ErrorPipeline("Servidor ocupado. Inténtalo en unos minutos.", 503) from e
+    except (yt_dlp.networking.exceptions.RequestError, OSError, ErrorIngesta) as e:
+        # ErrorIngesta: ffmpeg no pudo decodificar lo recibido por el pipe
+        log.warning("La descarga en streaming falló (%s); se reintenta a disco.", e)
+        return None
+
+
+def _progreso_ytdlp(d: dict, informar) -> None:
+    """Traduce los progress_hooks de yt-dlp (descarga clásica) a eventos de etapa."""
+    if d.get("status") == "downloading":
+        informar("descarga",
+                 bytes_descargados=d.get("downloaded_bytes"),
+                 bytes_totales=d.get("total_bytes") or d.get("total_bytes_estimate"),
+                 velocidad=d.get("speed"), eta=d.get("eta"))
+
+
+# Pool de YoutubeDL reutilizables (ver descargas.py). Las cookies de
+# YT_COOKIES se escriben una vez por proceso y todas las instancias comparten
+# el jar. YTDLP_VERBOSE=0 silencia yt-dlp en producción.
+YTDLP_VERBOSE = os.environ.get("YTDLP_VERBOSE", "1") != "0"
+
+
+def _escribir_cookies() -> str | None:
+    cookies_content = os.environ.get("YT_COOKIES")
+    if not cookies_content:
+        return None
+    fd, ruta_cookies = tempfile.mkstemp(suffix=".txt", prefix="yt_cookies_", dir="/tmp")
+    with os.fdopen(fd, 'w') as f:
+        f.write(cookies_content)
+    atexit.register(limpiar_archivos, ruta_cookies)
+    log.info("Cookies escritas en archivo temporal: %s", ruta_cookies)
+    return ruta_cookies
+
+
+def _observar_latencia_pot(segundos: float, proveedor: str, resultado: str) -> None:
+    LATENCIA_POT.observar(segundos, proveedor=proveedor, resultado=resultado)
+
+
+OPCIONES_YTDLP = {
+    'verbose':            YTDLP_VERBOSE,   # Activo por defecto para poder depurar problemas de YouTube
+    'quiet':              not YTDLP_VERBOSE,
+    'no_warnings':        not YTDLP_VERBOSE,
+    'noprogress':         not YTDLP_VERBOSE,
+    'format':             FORMATO_AUDIO,
+    'force_ipv4': True,
+    'source_address': '0.0.0.0',
+    'nocheckcertificate': True,
+    'cookiefile':         _escribir_cookies(),
+    # Caché en disco de yt-dlp (funciones de firma y n-challenge ya resueltas),
+    # compartida por todos los workers
+    'cachedir':           os.environ.get("YTDLP_CACHE_DIR", "/tmp/yt-dlp-cache"),
+    'socket_timeout':     30,
+    'retries':            20,
+    'fragment_retries':   20,
+    'extractor_args': {
+        'youtube': {
+            'player_client': ['tv'],
+            'player_skip':   ['web', 'web_music', 'android', 'ios']
+        }
+    },
+    # js_runtimes es necesario para que yt-dlp use Node.js al resolver
+    # el n-challenge de YouTube. Sin esto el solver no se invoca y
+    # YouTube bloquea la descarga con "format not available".
+    'js_runtimes': {'node': {}},
+    # Parámetro propio, no de yt-dlp: los plugins de PO tokens lo leen con
+    # get_param para medir la generación sin importar nada de la app
+    'observar_latencia_pot': _observar_latencia_pot,
+}
+
+pool_ydl = PoolYoutubeDL(
+    OPCIONES_YTDLP,
+    tamano=int(os.environ.get("YTDLP_POOL", 4)),
+    max_usos=int(os.environ.get("YTDLP_POOL_MAX_USOS", 200)),
+    timeout=float(os.environ.get("YTDLP_POOL_ESPERA_MAX", 600)),
+)
+atexit.register(pool_ydl.cerrar)
+
+
+def calentar() -> None:
+    """
+    Importa groq y yt_dlp y crea las instancias del pool de YoutubeDL
+    (extractores y plugins cargados), que si no pagaría la primera
+    petición que los use. YTDLP_PRECALENTAR=0 deja el pool sin crear.
+    """
+    inicio = time.perf_counter()
+    try:
+        groq.cargar()
+        yt_dlp.cargar()
+        if os.environ.get("YTDLP_PRECALENTAR", "1") != "0":
+            pool_ydl.calentar()
+    except Exception as e:
+        log.warning("Calentamiento incompleto, se cargará en el primer uso: %s", e)
+        return
+    arranque.marcar("calentado")
+    log.info("Calentamiento terminado en %.2f s.", time.perf_counter() - inicio)
+
+
+def calentar_en_segundo_plano() -> None:
+    threading.Thread(target=calentar, daemon=True, name="calentar").start()
+
+
+def descargar_audio(url: str, informar) -> tuple[str, bool]:
+    """
+    Descarga el audio con yt-dlp. Devuelve (ruta, comprimido): en streaming
+    el audio sale ya comprimido. El archivo pasa a ser de quien llama.
+    """
+    ruta_audio     = os.path.join("/tmp", f"{uuid.uuid4()}.m4a")
+    ruta_comprimida = None
+
+    try:
+        informar("descarga")
+        try:
+            # En streaming la etapa incluye la compresión, que va solapada
+            with medir_etapa("descarga"), \
+                    pool_ydl.prestar(ruta_audio, lambda d: _progreso_ytdlp(d, informar)) as ydl:
+                if DESCARGA_STREAMING:
+                    ruta_comprimida = _descargar_comprimiendo(ydl, url, informar)
+                if ruta_comprimida is None:
+                    ydl.download([url])
+        except yt_dlp.utils.DownloadError as e:
+            log.error("yt-dlp DownloadError: %s", e)
+            raise ErrorPipeline(f"No se pudo descargar el vídeo: {str(e)}", 500) from e
+        except PoolOcupado as e:
+            log.warning("Descarga rechazada: %s", e)
+            raise ErrorPipeline("Servidor ocupado. Inténtalo en unos minutos.", 503) from e
+
+        if ruta_comprimida is not None:
+            limpiar_archivos(ruta_audio)
+            return ruta_comprimida, True
+
+        if not os.path.exists(ruta_audio):
+            raise ErrorPipeline("La descarga falló o el archivo no se generó.", 500)
+        return ruta_audio, False
+
+    except BaseException:
+        limpiar_archivos(*({ruta_audio, ruta_comprimida} - {None}))
+        raise
+
+
+def _descargar_y_transcribir(url: str, clave_cache: str | None, informar) -> str:
+    """Descarga el audio con yt-dlp y lo transcribe. Limpia los temporales."""
+    ruta, comprimido = descargar_audio(url, informar)
+    try:
+        return _transcribir(ruta, clave_cache, informar, comprimido)
+    finally:
+        limpiar_archivos(ruta)
+
+
+# ---------------------------------------------------------------------------
+# LOTES
+# /lote acepta playlists, canales o listas de URLs. Las playlists se expanden
+# sin resolver cada vídeo (extract_info con process=False: solo id y título,
+# como extract_flat) y cada vídeo sigue el pipeline normal, con varios ítems
+# en vuelo a la vez (ver lotes.py).
+# ---------------------------------------------------------------------------
+LOTE_MAX_URLS     = int(os.environ.get("LOTE_MAX_URLS", 50))
+LOTE_MAX_ITEMS    = int(os.environ.get("LOTE_MAX_ITEMS", 50))
+# Por defecto caben a la vez tantas descargas como instancias de YoutubeDL
+# y tantos ítems más como transcripciones simultáneas
+LOTE_MAX_PARALELO = int(os.environ.get("LOTE_MAX_PARALELO",
+                                       pool_ydl.tamano + limites_etapas.limites["transcripcion"]))
+
+
+def _entradas_playlist(url: str, limite: int) -> list[dict]:
+    """Vídeos de una playlist o canal (como mucho `limite`), sin descargar nada."""
+    with pool_ydl.prestar() as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        # Un canal redirige primero a su pestaña de vídeos
+        for _ in range(3):
+            if info.get("_type") != "url":
+                break
+            info = ydl.extract_info(info["url"], download=False, process=False)
+
+        if info.get("_type") not in ("playlist", "multi_video"):
+            video_id = info.get("id")
+            return [{"id": video_id, "titulo": info.get("title")}] if video_id else []
+
+        entradas = []
+        for entrada in info.get("entries") or []:
+            if len(entradas) >= limite:
+                break
+            video_id = (entrada or {}).get("id")
+            # Las pestañas de un canal pueden traer playlists anidadas: se omiten
+            if video_id and PATRON_VIDEO_ID.match(video_id):
+                entradas.append({"id": video_id, "titulo": entrada.get("title")})
+        return entradas
+
+
+def expandir_urls(urls: list[str]) -> list[dict]:
+    """
+    Convierte las URLs del lote en vídeos únicos ({"url", "titulo"}). Una URL
+    que no se puede expandir queda como entrada con "error".
+    """
+    entradas: list[dict] = []
+    vistos: set[str] = set()
+    for url in urls:
+        if len(vistos) >= LOTE_MAX_ITEMS:
+            break
+        video_id = extraer_video_id(url)
+        if video_id:
+            videos = [{"id": video_id, "titulo": None}]
+        else:
+            try:
+                videos = _entradas_playlist(url, LOTE_MAX_ITEMS - len(vistos))
+            except yt_dlp.utils.DownloadError as e:
+                log.error("No se pudo expandir %s: %s", url, e)
+                entradas.append({"url": url, "error": f"No se pudo leer la playlist: {e}"})
+                continue
+        for video in videos:
+            if video["id"] in vistos or len(vistos) >= LOTE_MAX_ITEMS:
+                continue
+            vistos.add(video["id"])
+            entradas.append({"url": f"https://www.youtube.com/watch?v={video['id']}",
+                             "titulo": video["titulo"]})
+    return entradas
+
+
+def _pipeline_item_lote(url: str, plataformas: list[str] | None = None, informar=sin_progreso) -> dict:
+    resultado = pipeline_youtube(url, plataformas, informar=informar)
+    if resultado.get("status") != "success":
+        # Transcripción fallida: para el lote es un ítem con error, no un resultado
+        raise ErrorPipeline(resultado.get("transcripcion") or "Error procesando el vídeo.", 502)
+    return resultado
+
+
+def pipeline_lote(urls: list[str], plataformas: list[str] | None = None, informar=sin_progreso) -> dict:
+    informar("expansion")
+    entradas = expandir_urls(urls)
+    if not entradas:
+        raise ErrorPipeline("No se encontraron vídeos en las URLs del lote.", 404)
+    log.info("Lote con %d vídeos (paralelo %d).", len(entradas), LOTE_MAX_PARALELO)
+    return procesar_lote(entradas,
+                         lambda url, informar: _pipeline_item_lote(url, plataformas, informar),
+                         informar, max_paralelo=LOTE_MAX_PARALELO)
+
+
+# ---------------------------------------------------------------------------
+# COLA DE JOBS
+# Con `async=1` en la petición, /subir y /transformar encolan el trabajo y
+# devuelven un job_id al instante; el cliente consulta /jobs/<id>.
+# ---------------------------------------------------------------------------
+cola_jobs = crear_cola_desde_entorno()
+
+
+def es_si(valor: str | None) -> bool:
+    return (valor or "").lower() in ("1", "true", "si", "sí")
+
+
+def _quiere_async(campos: dict | None = None) -> bool:
+    """
+    Lee `async` de la query string o del formulario. La subida en streaming
+    pasa sus propios campos: tocar request.form consumiría el cuerpo.
+    """
+    return es_si(request.args.get("async") or (request.form if campos is None else campos).get("async", ""))
+
+
+def _plataformas_pedidas(campos: dict | None = None) -> list[str] | None:
+    """`plataformas` de la query string o del formulario; ValueError si no son válidas."""
+    return validar_plataformas(
+        request.args.get("plataformas") or (request.form if campos is None else campos).get("plataformas"))
+
+
+def _responder_job(tipo: str, funcion, *args):
+    try:
+        job_id = cola_jobs.encolar(tipo, funcion, *args)
+    except ColaLlena as e:
+        log.warning("Cola de jobs llena: %s", e)
+        return jsonify({"error": "Servidor ocupado. Inténtalo en unos minutos."}), 503
+    except Exception as e:
+        log.error("No se pudo encolar el job %s: %s", tipo, e, exc_info=True)
+        return jsonify({"error": "Error interno del servidor."}), 500
+    return jsonify({
+        "job_id":    job_id,
+        "estado":    ESTADO_EN_COLA,
+        "status_url": f"/jobs/{job_id}",
+        "resultado_url": f"/jobs/{job_id}/resultado"
+    }), 202
+
+
+def _ejecutar_sincrono(nombre_ruta: str, funcion, *args):
+    try:
+        return jsonify(funcion(*args))
+    except (ErrorPipeline, EsperaAgotada) as e:
+        return jsonify({"error": e.mensaje}), e.status
+    except Exception as e:
+        log.error("Error inesperado en %s: %s", nombre_ruta, e, exc_info=True)
+        return jsonify({"error": "Error interno del servidor."}), 500
+
+
 # ---------------------------------------------------------------------------
 # RUTAS
 # ---------------------------------------------------------------------------
@@ -270,8 +1379,47 @@ def index():
     return render_template('index.html')
 
 
+# Con SUBIDA_STREAMING=1 (por defecto) /subir comprime mientras recibe
+SUBIDA_STREAMING = os.environ.get("SUBIDA_STREAMING", "1") != "0"
+
+
+def _subir_en_streaming():
+    boundary = request.mimetype_params.get("boundary")
+    if not boundary:
+        return jsonify({"error": "Petición multipart sin boundary."}), 400
+
+    try:
+        subida = recibir_subida(request.stream, boundary.encode(), 'file',
+                                ALLOWED_EXTENSIONS, PERFIL_COMPRESION, ejecutor=ejecutor_ffmpeg)
+    except ErrorIngesta as e:
+        return jsonify({"error": e.mensaje}), e.status
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("Error recibiendo la subida: %s", e, exc_info=True)
+        return jsonify({"error": "Error interno del servidor."}), 500
+
+    try:
+        plataformas = _plataformas_pedidas(subida.campos)
+    except ValueError as e:
+        limpiar_archivos(subida.ruta)
+        return jsonify({"error": str(e)}), 400
+
+    args = (subida.ruta, subida.clave_cache, subida.comprimido, plataformas)
+    if _quiere_async(subida.campos):
+        respuesta = _responder_job("subir", pipeline_archivo, *args)
+        if respuesta[1] != 202:
+            limpiar_archivos(subida.ruta)
+        return respuesta
+
+    return _ejecutar_sincrono("/subir", pipeline_archivo, *args)
+
+
 @app.route('/subir', methods=['POST'])
 def subir_archivo():
+    if SUBIDA_STREAMING and request.mimetype == "multipart/form-data":
+        return _subir_en_streaming()
+
     if 'file' not in request.files:
         return jsonify({"error": "No hay archivo en la petición."}), 400
 
@@ -283,124 +1431,420 @@ def subir_archivo():
     if not allowed_file(archivo.filename):
         return jsonify({"error": f"Tipo de archivo no permitido. Formatos válidos: {', '.join(ALLOWED_EXTENSIONS)}"}), 400
 
+    try:
+        plataformas = _plataformas_pedidas()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     ext = archivo.filename.rsplit('.', 1)[1].lower()
     ruta_original = os.path.join("/tmp", f"{uuid.uuid4()}.{ext}")
-    ruta_comprimida = None
 
+    # El archivo se guarda siempre dentro de la petición: el stream de subida
+    # deja de existir en cuanto respondemos, también en modo async.
     try:
-        archivo.save(ruta_original)
-        log.info("Archivo guardado en: %s", ruta_original)
+        clave_cache = guardar_subida_con_hash(archivo, ruta_original)
+        log.info("Archivo guardado en: %s (%s)", ruta_original, clave_cache)
+    except Exception as e:
+        log.error("No se pudo guardar el archivo subido: %s", e, exc_info=True)
+        limpiar_archivos(ruta_original)
+        return jsonify({"error": "Error interno del servidor."}), 500
 
-        ruta_comprimida = comprimir_audio(ruta_original)
-        texto = procesar_con_groq(ruta_comprimida)
+    args = (ruta_original, clave_cache, False, plataformas)
+    if _quiere_async():
+        respuesta = _responder_job("subir", pipeline_archivo, *args)
+        if respuesta[1] != 202:
+            limpiar_archivos(ruta_original)
+        return respuesta
 
-        if isinstance(texto, str) and texto.startswith("Error"):
-            return jsonify({"transcripcion": texto, "pack_viral": None})
+    return _ejecutar_sincrono("/subir", pipeline_archivo, *args)
 
-        log.info("Generando pack viral para archivo subido...")
-        pack_social = generar_pack_viral(texto)
 
-        return jsonify({
-            "transcripcion": texto,
-            "pack_viral":    pack_social
-        })
+def validar_transformar(args, form) -> tuple[str, list[str] | None]:
+    """`url` y `plataformas` de /transformar; ValueError con el mensaje para el 400."""
+    url = form.get('url', '').strip()
 
-    except Exception as e:
-        log.error("Error inesperado en /subir: %s", e, exc_info=True)
-        return jsonify({"error": "Error interno del servidor."}), 500
+    if not url:
+        raise ValueError("No se proporcionó ninguna URL.")
 
-    finally:
-        # ruta_comprimida puede ser igual a ruta_original si la compresión falló;
-        # limpiar_archivos deduplica automáticamente gracias al set
-        archivos_a_limpiar = {ruta_original, ruta_comprimida} - {None}
-        limpiar_archivos(*archivos_a_limpiar)
+    # VALIDACIÓN DE URL — previene SSRF y uso indebido del endpoint
+    if not es_url_youtube_valida(url):
+        raise ValueError("URL no válida. Solo se aceptan enlaces de YouTube.")
+
+    return url, validar_plataformas(args.get("plataformas") or form.get("plataformas"))
 
 
 @app.route('/transformar', methods=['POST'])
 def transformar():
-    url = request.form.get('url', '').strip()
+    try:
+        url, plataformas = validar_transformar(request.args, request.form)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    if not url:
-        return jsonify({"error": "No se proporcionó ninguna URL."}), 400
+    if _quiere_async():
+        return _responder_job("transformar", pipeline_youtube, url, plataformas)
 
-    # VALIDACIÓN DE URL — previene SSRF y uso indebido del endpoint
-    if not es_url_youtube_valida(url):
-        return jsonify({"error": "URL no válida. Solo se aceptan enlaces de YouTube."}), 400
+    return _ejecutar_sincrono("/transformar", pipeline_youtube, url, plataformas)
 
-    ruta_audio     = os.path.join("/tmp", f"{uuid.uuid4()}.m4a")
-    ruta_comprimida = None
-    ruta_cookies   = None
 
-    # Gestión de cookies: archivo temporal por petición para evitar colisiones
-    # entre peticiones concurrentes que compartan el mismo /tmp/cookies.txt
-    cookies_content = os.environ.get("YT_COOKIES")
-    if cookies_content:
-        fd, ruta_cookies = tempfile.mkstemp(suffix=".txt", prefix="yt_cookies_", dir="/tmp")
-        with os.fdopen(fd, 'w') as f:
-            f.write(cookies_content)
-        log.info("Cookies escritas en archivo temporal: %s", ruta_cookies)
-
-    ydl_opts = {
-        'verbose':            True,    # Mantener en True para poder depurar problemas de YouTube
-        'format':             'bestaudio/best',
-        'outtmpl':            ruta_audio,
-        'force_ipv4': True,
-        'source_address': '0.0.0.0',
-        'nocheckcertificate': True,
-        'cookiefile':         ruta_cookies,
-        'socket_timeout':     30,
-        'retries':            20,
-        'fragment_retries':   20,
-        'extractor_args': {
-            'youtube': {
-                'player_client': ['tv'],
-                'player_skip':   ['web', 'web_music', 'android', 'ios']
-            }
-        },
-        # js_runtimes es necesario para que yt-dlp use Node.js al resolver
-        # el n-challenge de YouTube. Sin esto el solver no se invoca y
-        # YouTube bloquea la descarga con "format not available".
-        'js_runtimes': {'node': {}},
-    }
+@app.route('/lote', methods=['POST'])
+def lote():
+    """
+    Lote de vídeos: `urls` (lista JSON o una URL por línea en el formulario)
+    y/o `url` (playlist o canal), y opcionalmente `plataformas`. Siempre
+    asíncrono: cada ítem aparece en /jobs/<id> (parcial.items) y en
+    /jobs/<id>/eventos (evento `item`) en cuanto termina.
+    """
+    datos = request.get_json(silent=True) if request.is_json else None
+    if isinstance(datos, dict):
+        urls = datos.get("urls") or []
+        if isinstance(urls, str):
+            urls = urls.splitlines()
+        urls = [*urls, datos.get("url") or ""]
+        plataformas = datos.get("plataformas")
+    else:
+        urls = [*request.form.get("urls", "").splitlines(), request.form.get("url", "")]
+        plataformas = request.form.get("plataformas")
+    urls = [u.strip() for u in urls if isinstance(u, str) and u.strip()]
+
+    if not urls:
+        return jsonify({"error": "No se proporcionó ninguna URL."}), 400
+    if len(urls) > LOTE_MAX_URLS:
+        return jsonify({"error": f"Demasiadas URLs: el máximo por lote es {LOTE_MAX_URLS}."}), 400
+
+    # VALIDACIÓN DE URL — igual que en /transformar, para todas las del lote
+    no_validas = [u for u in urls if not es_url_youtube_valida(u)]
+    if no_validas:
+        return jsonify({"error": "URL no válida. Solo se aceptan enlaces de YouTube.",
+                        "urls_no_validas": no_validas}), 400
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+        plataformas = validar_plataformas(request.args.get("plataformas") or plataformas)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        if not os.path.exists(ruta_audio):
-            return jsonify({"error": "La descarga falló o el archivo no se generó."}), 500
+    return _responder_job("lote", pipeline_lote, urls, plataformas)
 
-        ruta_comprimida = comprimir_audio(ruta_audio)
-        texto = procesar_con_groq(ruta_comprimida)
 
-        if isinstance(texto, str) and texto.startswith("Error"):
-            return jsonify({"transcripcion": texto, "pack_viral": None})
+@app.route('/jobs/<job_id>')
+def estado_job(job_id: str):
+    job = cola_jobs.obtener(job_id)
+    if job is None:
+        return jsonify({"error": "Job no encontrado."}), 404
+    cola_jobs.mantener(job_id)
+    return jsonify(job.a_dict())
 
-        log.info("Generando pack viral para vídeo de YouTube...")
-        pack_social = generar_pack_viral(texto)
 
-        return jsonify({
-            "status":        "success",
-            "transcripcion": texto,
-            "pack_viral":    pack_social
-        })
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancelar_job(job_id: str):
+    """Cancela un job en curso de este worker: se corta en su próxima etapa o actualización de progreso."""
+    job = cola_jobs.obtener(job_id)
+    if job is None:
+        return jsonify({"error": "Job no encontrado."}), 404
+    if job.estado in (ESTADO_COMPLETADO, ESTADO_ERROR) or not cola_jobs.cancelar(job_id):
+        return jsonify({"error": "El job ya ha terminado o no se ejecuta en este worker."}), 409
+    return jsonify({"job_id": job_id, "estado": "cancelando"}), 202
 
-    except yt_dlp.utils.DownloadError as e:
-        log.error("yt-dlp DownloadError: %s", e)
-        return jsonify({"error": f"No se pudo descargar el vídeo: {str(e)}"}), 500
 
-    except Exception as e:
-        log.error("Error inesperado en /transformar: %s", e, exc_info=True)
-        return jsonify({"error": "Error interno del servidor."}), 500
+# Con ?cancelar=1 en /jobs/<id>/eventos, si el cliente se desconecta el job se
+# cancela tras JOBS_GRACIA_DESCONEXION segundos, salvo que vuelva a consultarlo
+# (reconexión o polling) antes
+JOBS_GRACIA_DESCONEXION = float(os.environ.get("JOBS_GRACIA_DESCONEXION", 20))
+CABECERAS_SSE = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
-    finally:
-        archivos_a_limpiar = {ruta_audio, ruta_comprimida, ruta_cookies} - {None}
-        limpiar_archivos(*archivos_a_limpiar)
+
+class SeguimientoJob:
+    """
+    Estado de un cliente SSE de /jobs/<id>/eventos: qué se le ha enviado ya.
+    Quien lo sirve (un hilo aquí, una corrutina en asgi.py) llama a
+    pendientes() cada INTERVALO segundos hasta que `terminado`.
+    """
+
+    INTERVALO = 0.5
+    # Comentario SSE como keep-alive para proxies con timeout de inactividad
+    KEEP_ALIVE = 15
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.terminado = False
+        self._ultimo_estado = None
+        self._transcripcion_enviada = False
+        self._secciones_enviadas: dict = {}
+        self._items_enviados: set[int] = set()
+        self._ultimo_envio = time.monotonic()
+
+    @staticmethod
+    def evento(nombre: str, datos: dict) -> str:
+        return f"event: {nombre}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+    def pendientes(self) -> list[str]:
+        """Eventos nuevos desde la última llamada, según el estado actual del job."""
+        job = cola_jobs.obtener(self.job_id)
+        if job is None:
+            self.terminado = True
+            return [self.evento("error", {"error": "Job no encontrado.", "status": 404})]
+
+        eventos = []
+        estado = (job.estado, job.etapa, json.dumps(job.progreso, sort_keys=True))
+        if estado != self._ultimo_estado:
+            self._ultimo_estado = estado
+            eventos.append(self.evento("etapa", {"estado": job.estado, "etapa": job.etapa, "progreso": job.progreso}))
+
+        if not self._transcripcion_enviada and "transcripcion" in job.parcial:
+            self._transcripcion_enviada = True
+            eventos.append(self.evento("transcripcion", {"transcripcion": job.parcial["transcripcion"]}))
+
+        for seccion, valor in job.parcial.get("pack_viral", {}).items():
+            # En streaming una sección (el hilo) llega varias veces, más completa
+            if self._secciones_enviadas.get(seccion) != valor:
+                self._secciones_enviadas[seccion] = valor
+                eventos.append(self.evento("seccion", {"seccion": seccion, "valor": valor}))
+
+        for item in job.parcial.get("items", []):
+            if item["indice"] not in self._items_enviados and item["estado"] in (ESTADO_COMPLETADO, ESTADO_ERROR):
+                self._items_enviados.add(item["indice"])
+                eventos.append(self.evento("item", item))
+
+        if job.estado == ESTADO_COMPLETADO:
+            self.terminado = True
+            eventos.append(self.evento("resultado", job.resultado))
+        elif job.estado == ESTADO_ERROR:
+            self.terminado = True
+            eventos.append(self.evento("error", {"error": job.error, "status": job.status_error or 500}))
+        elif not eventos and time.monotonic() - self._ultimo_envio > self.KEEP_ALIVE:
+            eventos.append(": keep-alive\n\n")
+
+        if eventos:
+            self._ultimo_envio = time.monotonic()
+        return eventos
+
+
+@app.route('/jobs/<job_id>/eventos')
+def eventos_job(job_id: str):
+    """
+    Server-Sent Events con el avance del job (ver ?cancelar=1 más arriba):
+    `etapa` (etapa y progreso), `transcripcion` (en cuanto está lista),
+    `seccion` (cada sección del pack según se completa, en modo por secciones
+    o en streaming), `item` (cada ítem terminado de un lote), `resultado` o
+    `error` al terminar. Consulta el backend, así que funciona aunque el job
+    se ejecute en otro worker.
+    """
+    if cola_jobs.obtener(job_id) is None:
+        return jsonify({"error": "Job no encontrado."}), 404
+    cola_jobs.mantener(job_id)
+    cancelar_al_cerrar = es_si(request.args.get("cancelar"))
+    seguimiento = SeguimientoJob(job_id)
+
+    def generar():
+        try:
+            while True:
+                yield from seguimiento.pendientes()
+                if seguimiento.terminado:
+                    return
+                time.sleep(SeguimientoJob.INTERVALO)
+        finally:
+            # GeneratorExit al escribir en un socket cerrado: el cliente se fue
+            if cancelar_al_cerrar and not seguimiento.terminado:
+                cola_jobs.cancelar(job_id, gracia=JOBS_GRACIA_DESCONEXION)
+
+    return Response(stream_with_context(generar()), mimetype="text/event-stream",
+                    headers=CABECERAS_SSE)
+
+
+@app.route('/jobs/<job_id>/resultado')
+def resultado_job(job_id: str):
+    job = cola_jobs.obtener(job_id)
+    if job is None:
+        return jsonify({"error": "Job no encontrado."}), 404
+    if job.estado == ESTADO_ERROR:
+        return jsonify({"error": job.error}), job.status_error or 500
+    if job.estado != ESTADO_COMPLETADO:
+        return jsonify(job.a_dict()), 202
+    return jsonify(job.resultado)
+
+
+# ---------------------------------------------------------------------------
+# MÉTRICAS
+# /metrics expone en formato Prometheus las métricas de metricas.py más el
+# estado del pool de keys, los reintentos, la cola y /tmp, leídos al vuelo.
+# Si METRICAS_TOKEN está definida, se exige "Authorization: Bearer <token>".
+# ---------------------------------------------------------------------------
+PETICIONES_EN_CURSO = Medidor(
+    "http_peticiones_en_curso", "Peticiones HTTP en curso por endpoint.", ["endpoint"])
+
+
+@app.before_request
+def _contar_peticion():
+    g.endpoint_metricas = request.endpoint or "desconocido"
+    PETICIONES_EN_CURSO.inc(endpoint=g.endpoint_metricas)
+    arranque.marcar("primera_peticion")
+
+
+@app.teardown_request
+def _descontar_peticion(exc=None):
+    # Con respuestas en streaming (SSE) el teardown llega al cerrar el stream
+    if (endpoint := g.pop("endpoint_metricas", None)) is not None:
+        PETICIONES_EN_CURSO.dec(endpoint=endpoint)
+
+
+def _metricas_keys(campo: str):
+    for estado in pool_groq.estadisticas():
+        for modelo, datos in estado["modelos"].items():
+            yield (estado["key"], modelo), datos[campo]
+
+
+def _metricas_politicas():
+    for politica in (politica_whisper, politica_pack):
+        for nombre, valor in politica.estadisticas()["contadores"].items():
+            if nombre != "segundos_backoff":
+                yield (politica.nombre, nombre), valor
+
+
+Coleccion("groq_llamadas_total", "Llamadas a Groq por key y modelo.", "counter",
+          ["key", "modelo"], lambda: _metricas_keys("llamadas"))
+Coleccion("groq_limitadas_total", "Respuestas 429 de Groq por key y modelo.", "counter",
+          ["key", "modelo"], lambda: _metricas_keys("limitadas"))
+Coleccion("groq_en_vuelo", "Llamadas a Groq en curso por key y modelo.", "gauge",
+          ["key", "modelo"], lambda: _metricas_keys("en_vuelo"))
+Coleccion("groq_reintentos_eventos_total", "Intentos, reintentos y fallos por clase de cada política.",
+          "counter", ["politica", "evento"], _metricas_politicas)
+Coleccion("groq_backoff_segundos_total", "Segundos esperados en backoff por política.", "counter",
+          ["politica"], lambda: [((p.nombre,), p.estadisticas()["contadores"]["segundos_backoff"])
+                                 for p in (politica_whisper, politica_pack)])
+Coleccion("groq_circuito_abierto", "1 si el circuit breaker de la política no está cerrado.", "gauge",
+          ["politica"], lambda: [((p.nombre,), int(p.breaker.estado != "cerrado"))
+                                 for p in (politica_whisper, politica_pack)])
+Coleccion("groq_limitador", "Estado del limitador de concurrencia de Groq.", "gauge",
+          ["dato"], lambda: [((k,), v) for k, v in limitador_groq.estadisticas().items()])
+Coleccion("ytdlp_pool", "Instancias de YoutubeDL del pool (creadas, libres) y préstamos/esperas acumulados.",
+          "gauge", ["dato"], lambda: [((k,), v) for k, v in pool_ydl.estadisticas().items()])
+Coleccion("ffmpeg", "Ejecutor de ffmpeg: huecos, cola, rechazos, resultados y segundos acumulados.",
+          "gauge", ["dato"], lambda: [((k,), v) for k, v in ejecutor_ffmpeg.estadisticas().items()])
+Coleccion("coalescencia", "Pipelines en vuelo, peticiones enganchadas a uno ajeno, esperas agotadas y soltadas.",
+          "gauge", ["dato"], lambda: [((k,), v) for k, v in vuelos.estadisticas().items()])
+Coleccion("limites_etapa", "Límite, ocupación y espera de cada etapa limitada (transcripción).",
+          "gauge", ["etapa", "dato"],
+          lambda: [((etapa, k), v) for etapa, datos in limites_etapas.estadisticas().items()
+                   for k, v in datos.items()])
+Coleccion("jobs_activos", "Jobs de este worker en cola o en ejecución.", "gauge",
+          [], lambda: [((), cola_jobs.activos)])
+Coleccion("tmp_bytes", "Bytes ocupados en el primer nivel de /tmp.", "gauge",
+          [], lambda: [((), uso_directorio("/tmp")[0])])
+Coleccion("tmp_archivos", "Archivos en el primer nivel de /tmp.", "gauge",
+          [], lambda: [((), uso_directorio("/tmp")[1])])
+
+
+@app.route('/metrics')
+def metricas():
+    token = os.environ.get("METRICAS_TOKEN")
+    if token and not hmac.compare_digest(f"Bearer {token}", request.headers.get("Authorization", "")):
+        return jsonify({"error": "No autorizado."}), 401
+    return Response(REGISTRO.exponer(), mimetype="text/plain; version=0.0.4")
+
+
+# ---------------------------------------------------------------------------
+# ADMINISTRACIÓN
+# Protegido con la cabecera X-Admin-Token. Si ADMIN_TOKEN no está definida,
+# los endpoints de administración no existen (404).
+# ---------------------------------------------------------------------------
+
+def _admin_autorizado() -> bool:
+    token = os.environ.get("ADMIN_TOKEN")
+    recibido = request.headers.get("X-Admin-Token", "")
+    return bool(token) and hmac.compare_digest(token, recibido)
+
+
+def _denegar_admin():
+    if not os.environ.get("ADMIN_TOKEN"):
+        return jsonify({"error": "No encontrado."}), 404
+    return jsonify({"error": "No autorizado."}), 401
+
+
+@app.route('/admin/cache')
+def admin_caches():
+    if not _admin_autorizado():
+        return _denegar_admin()
+    return jsonify({nombre: cache.estadisticas() for nombre, cache in CACHES.items()})
+
+
+@app.route('/admin/keys')
+def admin_keys():
+    """Uso, cupo restante y cooldown de cada key de Groq en este worker."""
+    if not _admin_autorizado():
+        return _denegar_admin()
+    return jsonify(pool_groq.estadisticas())
+
+
+@app.route('/admin/reintentos')
+def admin_reintentos():
+    """Contadores de reintentos, estado de los circuit breakers y del limitador de Groq."""
+    if not _admin_autorizado():
+        return _denegar_admin()
+    return jsonify({
+        "limitador": limitador_groq.estadisticas(),
+        "politicas": {p.nombre: p.estadisticas() for p in (politica_whisper, politica_pack)},
+    })
+
+
+@app.route('/admin/arranque')
+def admin_arranque():
+    """
+    Fases del arranque de este worker (import, primera petición,
+    calentamiento) y coste de los imports diferidos. Con ?importtime=1
+    mide además `import app` en un intérprete nuevo (tarda un segundo o dos).
+    """
+    if not _admin_autorizado():
+        return _denegar_admin()
+    datos = arranque.resumen()
+    if es_si(request.args.get("importtime")):
+        try:
+            datos["importtime"] = arranque.resumen_importtime(
+                "app", limite=request.args.get("limite", 15, type=int),
+                directorio=os.path.dirname(os.path.abspath(__file__)))
+        except (OSError, subprocess.SubprocessError) as e:
+            datos["importtime"] = {"error": str(e)}
+    return jsonify(datos)
+
+
+@app.route('/admin/cache/<nombre>', methods=['GET', 'DELETE'])
+def admin_cache(nombre: str):
+    """
+    GET: estadísticas y metadatos de las entradas (?limite=N).
+    DELETE: purga la caché entera, o solo ?clave=... si se indica. El disco es
+    común a todos los workers; la capa en memoria de los packs se vacía en
+    este al momento y en los demás en unos segundos. Con CACHE_PACKS_DISCO=0
+    no hay nada compartido y solo se limpia la memoria de este worker.
+    """
+    if not _admin_autorizado():
+        return _denegar_admin()
+
+    cache = CACHES.get(nombre)
+    if cache is None:
+        return jsonify({"error": f"Caché desconocida: {nombre}"}), 404
+
+    if request.method == 'DELETE':
+        clave = request.args.get("clave")
+        if clave:
+            return jsonify({"eliminadas": int(cache.eliminar(clave))})
+        return jsonify({"eliminadas": cache.purgar()})
+
+    limite = request.args.get("limite", 100, type=int)
+    return jsonify({
+        "estadisticas": cache.estadisticas(),
+        "entradas":     cache.entradas(limite),
+    })
 
 
 # ---------------------------------------------------------------------------
 # ARRANQUE
+# El import termina sin groq ni yt_dlp; calentar() los carga en un hilo
+# mientras el servidor ya acepta conexiones. Con gunicorn (ver
+# gunicorn.conf.py) lo lanza cada worker en post_fork, porque los hilos
+# del máster no sobreviven al fork: CALENTAMIENTO_EXTERNO=1 lo salta aquí.
 # ---------------------------------------------------------------------------
+arranque.marcar("fin_import")
+if os.environ.get("CALENTAMIENTO_EXTERNO", "0") == "0":
+    calentar_en_segundo_plano()
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,150 @@
+import importlib
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# ARRANQUE EN FRÍO
+# groq y yt_dlp (con su registro de extractores) son más de dos tercios del
+# import de app.py, y `/` no usa ninguno. ModuloDiferido los importa en el
+# primer acceso a un atributo, y el calentamiento (app.calentar) los carga
+# en segundo plano con el puerto ya abierto. Aquí queda también lo que mide
+# /admin/arranque: cuánto tardó cada fase y qué importó cada módulo.
+# ---------------------------------------------------------------------------
+
+_lock = threading.Lock()
+# nombre → {"segundos", "hilo", "momento"} de cada importación diferida ya hecha
+IMPORTACIONES: dict[str, dict] = {}
+# Marcas de tiempo (time.time()) de las fases del arranque del proceso
+MARCAS: dict[str, float] = {}
+# Módulos declarados como diferidos, se hayan cargado o no
+DECLARADOS: set[str] = set()
+
+
+def marcar(fase: str) -> None:
+    """Anota la primera vez que el proceso llega a `fase`."""
+    MARCAS.setdefault(fase, time.time())
+
+
+class ModuloDiferido:
+    """Sustituto de un módulo que lo importa en el primer acceso a un atributo."""
+
+    def __init__(self, nombre: str):
+        self._nombre = nombre
+        self._modulo = None
+        DECLARADOS.add(nombre)
+
+    @property
+    def cargado(self) -> bool:
+        return self._modulo is not None
+
+    def cargar(self):
+        if self._modulo is None:
+            with _lock:
+                if self._modulo is None:
+                    ya_importado = self._nombre in sys.modules
+                    inicio = time.perf_counter()
+                    modulo = importlib.import_module(self._nombre)
+                    segundos = time.perf_counter() - inicio
+                    if ya_importado:
+                        # Otro ModuloDiferido (u otro import) ya pagó la carga
+                        self._modulo = modulo
+                        return modulo
+                    IMPORTACIONES[self._nombre] = {
+                        "segundos": round(segundos, 3),
+                        "hilo":     threading.current_thread().name,
+                        "momento":  time.time(),
+                    }
+                    log.info("Módulo %s importado en %.0f ms.", self._nombre, segundos * 1000)
+                    self._modulo = modulo
+        return self._modulo
+
+    def __getattr__(self, atributo: str):
+        return getattr(self.cargar(), atributo)
+
+    def __repr__(self) -> str:
+        return f"<ModuloDiferido {self._nombre} ({'cargado' if self.cargado else 'pendiente'})>"
+
+
+def inicio_proceso() -> Optional[float]:
+    """Momento (time.time()) en que arrancó el proceso según /proc; None fuera de Linux."""
+    try:
+        with open("/proc/self/stat") as f:
+            # El nombre del ejecutable va entre paréntesis y puede tener espacios
+            campos = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + int(campos[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def resumen() -> dict:
+    """
+    Fases del arranque en segundos desde el inicio del proceso (o desde el
+    import de app si no se sabe). En un worker de gunicorn con preload las
+    fases del import son del máster y salen negativas.
+    """
+    inicio = inicio_proceso()
+    base = inicio or MARCAS.get("inicio_import") or time.time()
+    return {
+        "pid":            os.getpid(),
+        "inicio_proceso": inicio,
+        "fases_s":        {fase: round(momento - base, 3)
+                           for fase, momento in sorted(MARCAS.items(), key=lambda m: m[1])},
+        "diferidos": {
+            nombre: ({**IMPORTACIONES[nombre], "momento": round(IMPORTACIONES[nombre]["momento"] - base, 3)}
+                     if nombre in IMPORTACIONES
+                     else {"cargado": nombre in sys.modules})
+            for nombre in sorted(DECLARADOS)
+        },
+    }
+
+
+def resumen_importtime(modulo: str = "app", limite: int = 15, timeout: float = 60.0,
+                       directorio: Optional[str] = None) -> dict:
+    """
+    Importa `modulo` en un intérprete nuevo con `-X importtime` y resume la
+    salida: tiempo total y los imports directos que más pesan. El proceso
+    hijo no calienta nada (CALENTAMIENTO_EXTERNO=1): mide solo el import.
+    """
+    entorno = {**os.environ, "CALENTAMIENTO_EXTERNO": "1", "YTDLP_PRECALENTAR": "0"}
+    salida = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                            cwd=directorio, env=entorno, capture_output=True, text=True,
+                            timeout=timeout)
+    filas = []
+    for linea in salida.stderr.splitlines():
+        if not linea.startswith("import time:") or "|" not in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|", 2)
+        if not propio.strip().isdigit():
+            continue   # cabecera
+        filas.append((len(nombre) - len(nombre.lstrip()), nombre.strip(), int(propio), int(acumulado)))
+
+    # Cada import se imprime al terminar, después de los suyos y con un
+    # nivel más de sangría: los hijos directos de `modulo` son las filas de
+    # profundidad +1 entre su fila y la anterior de su mismo nivel o menos
+    raiz = next((i for i, f in enumerate(filas) if f[1] == modulo), None)
+    if raiz is None:
+        return {"error": (salida.stderr.strip().splitlines() or ["Sin salida"])[-1]}
+    profundidad = filas[raiz][0]
+    hijos = []
+    for fila in reversed(filas[:raiz]):
+        if fila[0] <= profundidad:
+            break
+        if fila[0] == profundidad + 2:
+            hijos.append(fila)
+    hijos.sort(key=lambda f: f[3], reverse=True)
+    return {
+        "modulo":   modulo,
+        "total_ms": round(filas[raiz][3] / 1000, 1),
+        "propio_ms": round(filas[raiz][2] / 1000, 1),
+        "imports":  [{"modulo": nombre, "acumulado_ms": round(acumulado / 1000, 1)}
+                     for _, nombre, _, acumulado in hijos[:limite]],
+    }
@@ -0,0 +1,385 @@
+import asyncio
+import functools
+import io
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.datastructures import MultiDict
+from werkzeug.formparser import parse_form_data
+
+from app import (JOBS_GRACIA_DESCONEXION, MAX_TOKENS_PACK, MODELO_PACK, MODELO_WHISPER, PACK_MAX_TOKENS_ENTRADA,
+                 PACK_MODO, PACK_STREAMING, PETICIONES_EN_CURSO, PRIMER_CONTENIDO_PACK, TEMPERATURA_PACK,
+                 ErrorPipeline, SeguimientoJob, app as app_flask, cache_packs, cache_transcripciones,
+                 clave_pack_unico, clave_vuelo, clave_youtube, cola_jobs, comprimir_audio, contenido_para_pack,
+                 descargar_audio, duracion_si_trocear, error_whisper, es_si, generar_pack_viral, limites_etapas,
+                 limpiar_archivos, mensajes_pack, normalizar_pack, pack_fallido, politica_pack, politica_whisper,
+                 pool_groq, pool_ydl, transcribir_audio, transcripcion_cacheada, validar_transformar, vuelos)
+from coalescencia import EsperaAgotada
+from jobs import JobCancelado
+from metricas import medir_etapa
+from progreso import informar_limitado, sin_progreso
+from resumenes import estimar_tokens
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# MODO ASGI
+# `uvicorn asgi:app` (o `python asgi.py`) sirve la misma aplicación sobre
+# asyncio. Las rutas que más tiempo retienen una petición son nativas:
+#   - POST /transformar síncrono: Whisper y el pack van por el cliente
+#     asíncrono de Groq, y yt-dlp y ffmpeg, que bloquean, a un pool de hilos
+#     acotado. Mientras esperan a la red no ocupan ningún hilo.
+#   - GET /jobs/<id>/eventos: cada cliente SSE es una corrutina, no un hilo.
+# Todo lo demás (subidas, lotes, jobs con async=1, admin, métricas) lo sigue
+# atendiendo Flask a través de un puente WSGI con su propio pool de hilos.
+# Las rutas y las respuestas JSON son las mismas en los dos modos.
+# ---------------------------------------------------------------------------
+
+# Hilos para el trabajo bloqueante de los pipelines asíncronos (yt-dlp,
+# ffmpeg, ffprobe). Por defecto, lo que caben a la vez en el pool de
+# YoutubeDL y en el ejecutor de ffmpeg, con margen
+ASGI_HILOS_BLOQUEANTES = int(os.environ.get("ASGI_HILOS_BLOQUEANTES", 2 * pool_ydl.tamano + 8))
+# Hilos del puente WSGI: peticiones de Flask atendidas a la vez
+ASGI_HILOS_WSGI = int(os.environ.get("ASGI_HILOS_WSGI", 16))
+ASGI_MAX_CUERPO_FORMULARIO = 64 * 1024
+
+ejecutor_bloqueante = ThreadPoolExecutor(max_workers=ASGI_HILOS_BLOQUEANTES, thread_name_prefix="asgi-bloqueante")
+app_wsgi = WSGIMiddleware(app_flask, workers=ASGI_HILOS_WSGI)
+
+RUTA_EVENTOS = re.compile(r"^/jobs/([^/]+)/eventos$")
+
+
+async def en_ejecutor(funcion, *args, **kwargs):
+    """Ejecuta trabajo bloqueante largo (descargas, ffmpeg) en ejecutor_bloqueante."""
+    bucle = asyncio.get_running_loop()
+    return await bucle.run_in_executor(ejecutor_bloqueante, functools.partial(funcion, *args, **kwargs))
+
+
+# ---------------------------------------------------------------------------
+# GROQ ASÍNCRONO
+# Mismo pool de keys, mismas políticas de reintento y mismo limitador que
+# el modo con hilos: el cliente asíncrono de cada key comparte presupuestos,
+# cooldowns y circuit breakers con el síncrono.
+# ---------------------------------------------------------------------------
+
+async def procesar_con_groq_async(ruta_audio: str) -> str:
+    """Versión asíncrona de procesar_con_groq (formato texto)."""
+    contenido = await asyncio.to_thread(_leer_bytes, ruta_audio)
+
+    async def llamar(intento: int) -> str:
+        with pool_groq.usar(MODELO_WHISPER) as uso:
+            respuesta = await uso.cliente_async.audio.transcriptions.with_raw_response.create(
+                file=(os.path.basename(ruta_audio), contenido),
+                model=MODELO_WHISPER,
+                response_format="text",
+            )
+            uso.registrar(respuesta.headers)
+        log.info("Transcripción completada (intento %d).", intento + 1)
+        return await respuesta.parse()
+
+    try:
+        with medir_etapa("transcripcion"):
+            return await politica_whisper.ejecutar_async(llamar)
+    except Exception as e:
+        return error_whisper(e)
+
+
+def _leer_bytes(ruta: str) -> bytes:
+    with open(ruta, "rb") as f:
+        return f.read()
+
+
+async def transcribir_audio_async(ruta_audio: str) -> str:
+    duracion = await en_ejecutor(duracion_si_trocear, ruta_audio)
+    if duracion is None:
+        return await procesar_con_groq_async(ruta_audio)
+    # Los audios largos se trocean con ffmpeg y se transcriben en paralelo:
+    # se quedan en la versión con hilos
+    return await en_ejecutor(transcribir_audio, ruta_audio)
+
+
+async def generar_pack_viral_async(texto_transcrito: str, plataformas: list[str] | None = None,
+                                   al_avanzar_seccion=None) -> dict:
+    """
+    Versión asíncrona de generar_pack_viral para el pack en una sola llamada.
+    Los packs por secciones y las transcripciones que necesitan map-reduce
+    coordinan varias llamadas y usan la versión con hilos, que es la única
+    que adelanta secciones a `al_avanzar_seccion`.
+    """
+    if (plataformas is not None or PACK_MODO == "secciones"
+            or estimar_tokens(texto_transcrito) > PACK_MAX_TOKENS_ENTRADA):
+        return await en_ejecutor(generar_pack_viral, texto_transcrito, plataformas, al_avanzar_seccion)
+
+    clave = clave_pack_unico(texto_transcrito)
+    if (pack_cacheado := await asyncio.to_thread(cache_packs.obtener, clave)) is not None:
+        log.info("Pack viral servido desde caché (%s).", clave[:16])
+        return json.loads(pack_cacheado)
+
+    mensajes, tokens_estimados = mensajes_pack(contenido_para_pack(texto_transcrito))
+
+    async def llamar(intento: int) -> dict:
+        with pool_groq.usar(MODELO_PACK, tokens_estimados) as uso:
+            respuesta = await uso.cliente_async.chat.completions.with_raw_response.create(
+                messages=mensajes, model=MODELO_PACK, temperature=TEMPERATURA_PACK,
+                max_tokens=MAX_TOKENS_PACK, response_format={"type": "json_object"})
+            completion = await respuesta.parse()
+            uso.registrar(respuesta.headers, completion.usage.total_tokens if completion.usage else None)
+        data = json.loads(completion.choices[0].message.content)
+        log.info("JSON recibido del LLM (intento %d): %.80s...",
+                 intento + 1, json.dumps(data, ensure_ascii=False))
+        return data
+
+    try:
+        with medir_etapa("pack_viral"):
+            data = await politica_pack.ejecutar_async(llamar)
+    except Exception as e:
+        return pack_fallido(e)
+
+    pack = normalizar_pack(data)
+    await asyncio.to_thread(cache_packs.guardar, clave, json.dumps(pack, ensure_ascii=False))
+    return pack
+
+
+# ---------------------------------------------------------------------------
+# PIPELINE ASÍNCRONO DE YOUTUBE
+# ---------------------------------------------------------------------------
+
+async def _transcribir_async(ruta_audio: str, clave_cache: str | None, informar, comprimido: bool) -> str:
+    """Como _transcribir en app.py: compresión (en hilo) → Whisper (asíncrono) → caché."""
+    ruta_comprimida = ruta_audio
+    try:
+        if not comprimido:
+            informar("compresion")
+            ruta_comprimida = await en_ejecutor(comprimir_audio, ruta_audio, informar)
+
+        informar("transcripcion")
+        async with limites_etapas.hueco_async("transcripcion"):
+            texto = await transcribir_audio_async(ruta_comprimida)
+
+        if clave_cache and isinstance(texto, str) and not texto.startswith("Error"):
+            await asyncio.to_thread(cache_transcripciones.guardar, clave_cache, texto)
+        return texto
+    finally:
+        if ruta_comprimida != ruta_audio:
+            limpiar_archivos(ruta_comprimida)
+
+
+async def pipeline_youtube_async(url: str, plataformas: list[str] | None = None, informar=sin_progreso) -> dict:
+    """
+    Mismo resultado que pipeline_youtube, sin retener un hilo durante la E/S.
+    Comparte `vuelos` con la versión con hilos: un job y una petición ASGI
+    del mismo vídeo se enganchan al mismo pipeline.
+    """
+    return await vuelos.ejecutar_async(clave_vuelo(clave_youtube(url), plataformas), _procesar_youtube_async,
+                                       url, plataformas, informar=informar)
+
+
+async def _procesar_youtube_async(url: str, plataformas: list[str] | None, informar=sin_progreso) -> dict:
+    informar = informar_limitado(informar)
+    clave_cache = clave_youtube(url)
+    texto = await asyncio.to_thread(transcripcion_cacheada, clave_cache, informar)
+    if texto is None:
+        ruta, comprimido = await en_ejecutor(descargar_audio, url, informar)
+        try:
+            texto = await _transcribir_async(ruta, clave_cache, informar, comprimido)
+        finally:
+            limpiar_archivos(ruta)
+
+    if isinstance(texto, str) and texto.startswith("Error"):
+        return {"transcripcion": texto, "pack_viral": None}
+
+    log.info("Generando pack viral para vídeo de YouTube...")
+    # Como _generar_resultado en app.py: la transcripción y las secciones se
+    # adelantan a quien siga el vuelo desde un job
+    informar("pack_viral", parcial={"transcripcion": texto})
+    secciones: dict = {}
+    inicio = time.monotonic()
+
+    def al_avanzar_seccion(seccion: str, valor) -> None:
+        if not secciones:
+            PRIMER_CONTENIDO_PACK.observar(time.monotonic() - inicio, streaming=int(PACK_STREAMING))
+        secciones[seccion] = valor
+        informar("pack_viral", parcial={"pack_viral": dict(secciones)})
+
+    pack_social = await generar_pack_viral_async(texto, plataformas, al_avanzar_seccion)
+    if not secciones:
+        PRIMER_CONTENIDO_PACK.observar(time.monotonic() - inicio, streaming=0)
+    return {"status": "success", "transcripcion": texto, "pack_viral": pack_social}
+
+
+# ---------------------------------------------------------------------------
+# RUTAS NATIVAS
+# ---------------------------------------------------------------------------
+
+async def _leer_cuerpo(receive, limite: int) -> bytes | None:
+    """Cuerpo completo de la petición; None si supera `limite` o el cliente se fue."""
+    partes, total = [], 0
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "http.disconnect":
+            return None
+        partes.append(mensaje.get("body", b""))
+        total += len(partes[-1])
+        if total > limite:
+            return None
+        if not mensaje.get("more_body"):
+            return b"".join(partes)
+
+
+def _repetir_cuerpo(cuerpo: bytes):
+    """`receive` que vuelve a entregar un cuerpo ya leído, para delegar en Flask."""
+    entregado = False
+
+    async def receive():
+        nonlocal entregado
+        if not entregado:
+            entregado = True
+            return {"type": "http.request", "body": cuerpo, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    return receive
+
+
+def _query(scope) -> MultiDict:
+    return MultiDict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+
+
+def _formulario(scope, cuerpo: bytes) -> MultiDict:
+    """Campos del formulario (urlencoded o multipart), con el mismo parser que Flask."""
+    cabeceras = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+    _, form, _ = parse_form_data({
+        "REQUEST_METHOD": "POST",
+        "CONTENT_TYPE":   cabeceras.get("content-type", ""),
+        "CONTENT_LENGTH": str(len(cuerpo)),
+        "wsgi.input":     io.BytesIO(cuerpo),
+    })
+    return form
+
+
+async def _responder_json(send, datos: dict, status: int = 200) -> None:
+    # El proveedor JSON de Flask: mismo formato que jsonify
+    cuerpo = f"{app_flask.json.dumps(datos)}\n".encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(cuerpo)).encode())]})
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+async def transformar(scope, receive, send) -> None:
+    cuerpo = await _leer_cuerpo(receive, ASGI_MAX_CUERPO_FORMULARIO)
+    if cuerpo is None:
+        return await _responder_json(send, {"error": "Petición demasiado grande."}, 413)
+    args, form = _query(scope), _formulario(scope, cuerpo)
+
+    # Con async=1 el job lo ejecuta la cola de app.py, como en el modo WSGI
+    if es_si(args.get("async") or form.get("async")):
+        return await app_wsgi(scope, _repetir_cuerpo(cuerpo), send)
+
+    with PETICIONES_EN_CURSO.en_curso(endpoint="transformar"):
+        try:
+            url, plataformas = validar_transformar(args, form)
+        except ValueError as e:
+            return await _responder_json(send, {"error": str(e)}, 400)
+
+        # Si el cliente se va, su `informar` lanza JobCancelado: se suelta del
+        # vuelo y, si nadie más lo espera, el pipeline se corta en la
+        # siguiente etapa o actualización de progreso
+        desconectado = asyncio.Event()
+
+        async def vigilar_desconexion() -> None:
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            desconectado.set()
+
+        def informar(etapa: str, **datos) -> None:
+            if desconectado.is_set():
+                raise JobCancelado()
+
+        vigia = asyncio.create_task(vigilar_desconexion())
+        try:
+            resultado = await pipeline_youtube_async(url, plataformas, informar)
+        except JobCancelado:
+            log.info("Cliente desconectado; /transformar abandonado.")
+            return
+        except (ErrorPipeline, EsperaAgotada) as e:
+            return await _responder_json(send, {"error": e.mensaje}, e.status)
+        except Exception as e:
+            log.error("Error inesperado en /transformar: %s", e, exc_info=True)
+            return await _responder_json(send, {"error": "Error interno del servidor."}, 500)
+        finally:
+            vigia.cancel()
+        await _responder_json(send, resultado)
+
+
+async def eventos_job(scope, receive, send, job_id: str) -> None:
+    """Como eventos_job en app.py, con una corrutina por cliente en vez de un hilo."""
+    if await asyncio.to_thread(cola_jobs.obtener, job_id) is None:
+        return await _responder_json(send, {"error": "Job no encontrado."}, 404)
+    cola_jobs.mantener(job_id)
+    cancelar_al_cerrar = es_si(_query(scope).get("cancelar"))
+    seguimiento = SeguimientoJob(job_id)
+
+    desconectado = asyncio.Event()
+
+    async def vigilar_desconexion() -> None:
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        desconectado.set()
+
+    vigia = asyncio.create_task(vigilar_desconexion())
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"text/event-stream; charset=utf-8"),
+                            (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]})
+    try:
+        with PETICIONES_EN_CURSO.en_curso(endpoint="eventos_job"):
+            while not desconectado.is_set():
+                for evento in await asyncio.to_thread(seguimiento.pendientes):
+                    await send({"type": "http.response.body", "body": evento.encode("utf-8"), "more_body": True})
+                if seguimiento.terminado:
+                    break
+                try:
+                    await asyncio.wait_for(desconectado.wait(), SeguimientoJob.INTERVALO)
+                except asyncio.TimeoutError:
+                    pass
+            if not desconectado.is_set():
+                await send({"type": "http.response.body", "body": b""})
+    finally:
+        vigia.cancel()
+        if cancelar_al_cerrar and not seguimiento.terminado:
+            cola_jobs.cancelar(job_id, gracia=JOBS_GRACIA_DESCONEXION)
+
+
+async def _ciclo_de_vida(receive, send) -> None:
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif mensaje["type"] == "lifespan.shutdown":
+            ejecutor_bloqueante.shutdown(wait=False, cancel_futures=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        return await _ciclo_de_vida(receive, send)
+    if scope["type"] == "http":
+        metodo, ruta = scope["method"], scope["path"]
+        if metodo == "POST" and ruta == "/transformar":
+            return await transformar(scope, receive, send)
+        if metodo == "GET" and (coincidencia := RUTA_EVENTOS.match(ruta)):
+            return await eventos_job(scope, receive, send, coincidencia.group(1))
+    await app_wsgi(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run("asgi:app", host='0.0.0.0', port=int(os.environ.get("PORT", 5000)),
+                timeout_keep_alive=int(os.environ.get("ASGI_KEEP_ALIVE", 5)))
@@ -0,0 +1,93 @@
+"""
+Tiempo hasta el primer byte tras un arranque en frío: se lanza el servidor
+y se mide desde el Popen hasta la primera respuesta 200 de `/`, repitiendo
+con procesos nuevos. Es lo que paga la primera visita al escalar desde cero.
+
+    python benchmarks/arranque.py                       # dev y gunicorn, 5 veces
+    python benchmarks/arranque.py --modos gunicorn --repeticiones 10 --json
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from servidor import RAIZ, _entorno, _puerto_libre
+
+
+def primer_byte(modo: str, entorno: dict, limite: float = 60.0) -> float:
+    """Segundos desde lanzar el servidor hasta el primer 200 de `/`."""
+    puerto = _puerto_libre()
+    if modo == "dev":
+        comando = [sys.executable, "app.py"]
+        entorno = {**entorno, "PORT": str(puerto)}
+    else:
+        comando = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"]
+        entorno = {**entorno, "GUNICORN_BIND": f"127.0.0.1:{puerto}",
+                   "GUNICORN_ASGI": "1" if modo == "gunicorn-asgi" else "0"}
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(comando, cwd=RAIZ, env=entorno,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - inicio < limite:
+            try:
+                conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=limite)
+                conexion.request("GET", "/")
+                respuesta = conexion.getresponse()
+                respuesta.read(1)
+                if respuesta.status == 200:
+                    return time.perf_counter() - inicio
+            except OSError:
+                pass
+            time.sleep(0.005)
+        raise RuntimeError(f"El servidor {modo} no respondió en {limite:.0f} s")
+    finally:
+        proceso.send_signal(signal.SIGTERM)
+        try:
+            proceso.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modos", nargs="+", default=["dev", "gunicorn"],
+                        choices=["dev", "gunicorn", "gunicorn-asgi"])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Salida legible por máquina")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="bench-arranque-")
+    # Con el calentamiento normal: es lo que pasa en producción, y va en
+    # segundo plano, así que no debe retrasar el primer byte
+    entorno = {**_entorno(directorio), "YTDLP_PRECALENTAR": "1"}
+    resultados = []
+    try:
+        for modo in args.modos:
+            tiempos = sorted(primer_byte(modo, entorno) for _ in range(args.repeticiones))
+            resultados.append({
+                "modo":         modo,
+                "repeticiones": len(tiempos),
+                "min_ms":       round(1000 * tiempos[0], 1),
+                "mediana_ms":   round(1000 * statistics.median(tiempos), 1),
+                "max_ms":       round(1000 * tiempos[-1], 1),
+            })
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({"cpus": os.cpu_count(), "resultados": resultados}, indent=2))
+        return
+    print(f"{'modo':<14} {'min ms':>8} {'mediana ms':>11} {'max ms':>8}")
+    for r in resultados:
+        print(f"{r['modo']:<14} {r['min_ms']:>8} {r['mediana_ms']:>11} {r['max_ms']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Dobles locales de Groq y de YouTube para benchmarks/pipeline.py, en un solo
+servidor HTTP:
+
+    /openai/v1/audio/transcriptions     Whisper: texto aleatorio, tanto más largo cuanto más audio
+    /openai/v1/chat/completions         packs JSON (también en streaming) y resúmenes de trozos
+    /media/<id>/info, /media/<id>/audio fuente de medios para el plugin de yt-dlp de
+                                        benchmarks/plugins; id[1] elige el audio
+    /estadisticas                       llamadas, 429 servidos y bytes enviados
+
+La latencia es simulada (base + parte proporcional al tamaño, ±20 %) y una
+fracción de las llamadas a Groq responde 429 con retry-after. El texto es
+aleatorio en cada llamada: ni la caché de transcripciones ni la de packs
+aciertan entre peticiones distintas.
+
+    python benchmarks/dobles.py --puerto 8800 --medios 30=/tmp/a.webm 300=/tmp/b.webm
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Sin "error": una transcripción que empieza por "Error" es un fallo para la app
+PALABRAS = ("vídeo", "idea", "clave", "dinero", "tiempo", "equipo", "cliente", "producto", "fallo",
+            "consejo", "historia", "dato", "mercado", "semana", "proyecto", "gente", "problema",
+            "solución", "ejemplo", "momento", "crecer", "aprender", "vender", "probar", "medir",
+            "importante", "rápido", "nuevo", "mejor", "primero", "siempre", "nunca", "hoy")
+SECCIONES = ("resumen", "hilo_twitter", "linkedin", "tiktok_script")
+EXTENSIONES = {".webm": "opus", ".m4a": "aac", ".mp3": "mp3", ".ogg": "vorbis", ".wav": "pcm_s16le"}
+
+
+def texto_aleatorio(palabras: int) -> str:
+    frases, actual = [], []
+    for _ in range(max(1, palabras)):
+        actual.append(random.choice(PALABRAS))
+        if len(actual) >= random.randint(6, 16):
+            frases.append(" ".join(actual).capitalize() + ".")
+            actual = []
+    if actual:
+        frases.append(" ".join(actual).capitalize() + ".")
+    return " ".join(frases)
+
+
+class Dobles:
+    """Configuración y contadores compartidos por todos los hilos del servidor."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.medios = []
+        for medio in args.medios:
+            segundos, ruta = medio.split("=", 1)
+            self.medios.append({"ruta": ruta, "duracion": float(segundos), "tamano": os.path.getsize(ruta)})
+        self._lock = threading.Lock()
+        self.contadores = {"whisper": 0, "chat": 0, "chat_streaming": 0, "rate_limit_429": 0,
+                           "media_info": 0, "media_bytes": 0}
+
+    def contar(self, nombre: str, n: int = 1) -> None:
+        with self._lock:
+            self.contadores[nombre] += n
+
+    def latencia(self, base: float, variable: float) -> float:
+        return (base + variable) * random.uniform(0.8, 1.2)
+
+    def medio(self, video_id: str) -> dict:
+        return self.medios[int(video_id[1], 36) % len(self.medios)]
+
+
+class Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    dobles: Dobles
+
+    def log_message(self, *args) -> None:
+        pass
+
+    # -- respuestas ----------------------------------------------------------
+
+    def _responder(self, status: int, cuerpo: bytes, tipo: str = "application/json",
+                   cabeceras: dict | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _json(self, datos, status: int = 200, cabeceras: dict | None = None) -> None:
+        self._responder(status, json.dumps(datos, ensure_ascii=False).encode(), cabeceras=cabeceras)
+
+    def _limitado(self) -> bool:
+        """Responde 429 a una fracción de las llamadas a Groq."""
+        if random.random() >= self.dobles.args.prob_429:
+            return False
+        self.dobles.contar("rate_limit_429")
+        self._json({"error": {"message": "Rate limit reached (doble local)", "type": "requests",
+                              "code": "rate_limit_exceeded"}},
+                   429, {"retry-after": str(self.dobles.args.retry_after)})
+        return True
+
+    # -- rutas ---------------------------------------------------------------
+
+    def do_GET(self) -> None:
+        if self.path == "/estadisticas":
+            with self.dobles._lock:
+                return self._json(dict(self.dobles.contadores))
+        if m := re.fullmatch(r"/media/([\w-]{11})/info", self.path):
+            self.dobles.contar("media_info")
+            medio = self.dobles.medio(m.group(1))
+            extension = os.path.splitext(medio["ruta"])[1]
+            time.sleep(self.dobles.latencia(self.dobles.args.latencia_media, 0))
+            return self._json({"ext": extension.lstrip("."), "acodec": EXTENSIONES.get(extension, "unknown"),
+                               "abr": round(medio["tamano"] * 8 / 1000 / medio["duracion"], 1),
+                               "tamano": medio["tamano"], "duracion": medio["duracion"]})
+        if m := re.fullmatch(r"/media/([\w-]{11})/audio", self.path):
+            return self._servir_medio(self.dobles.medio(m.group(1)))
+        self._json({"error": "No encontrado"}, 404)
+
+    def do_POST(self) -> None:
+        cuerpo = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.endswith("/audio/transcriptions"):
+            return self._transcripcion(cuerpo)
+        if self.path.endswith("/chat/completions"):
+            return self._chat(json.loads(cuerpo))
+        self._json({"error": "No encontrado"}, 404)
+
+    def _servir_medio(self, medio: dict) -> None:
+        inicio, fin = 0, medio["tamano"] - 1
+        status = 200
+        if m := re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", "")):
+            inicio, fin, status = int(m.group(1)), int(m.group(2) or fin), 206
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(fin - inicio + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {inicio}-{fin}/{medio['tamano']}")
+        self.end_headers()
+
+        bloque = 64 * 1024
+        ancho_banda = self.dobles.args.ancho_banda
+        with open(medio["ruta"], "rb") as f:
+            f.seek(inicio)
+            pendiente = fin - inicio + 1
+            while pendiente > 0:
+                datos = f.read(min(bloque, pendiente))
+                if not datos:
+                    break
+                self.wfile.write(datos)
+                pendiente -= len(datos)
+                self.dobles.contar("media_bytes", len(datos))
+                if ancho_banda:
+                    time.sleep(len(datos) / ancho_banda)
+
+    def _transcripcion(self, cuerpo: bytes) -> None:
+        self.dobles.contar("whisper")
+        if self._limitado():
+            return
+        args = self.dobles.args
+        m = re.search(rb'name="response_format"\r\n\r\n([\w]+)\r\n', cuerpo)
+        formato = m.group(1).decode() if m else "json"
+        # El multipart es casi todo audio: su tamaño da una duración aproximada
+        segundos = len(cuerpo) / args.bytes_por_segundo
+        time.sleep(self.dobles.latencia(args.latencia_whisper, args.whisper_por_mb * len(cuerpo) / 2 ** 20))
+
+        texto = texto_aleatorio(int(segundos * 2.5))   # ~150 palabras por minuto
+        if formato == "text":
+            return self._responder(200, texto.encode(), "text/plain; charset=utf-8")
+        if formato == "verbose_json":
+            palabras = texto.split()
+            por_segmento = max(1, int(len(palabras) / max(1.0, segundos / 5)))
+            segmentos = []
+            for i in range(0, len(palabras), por_segmento):
+                inicio = i / max(1, len(palabras)) * segundos
+                fin = min(segundos, (i + por_segmento) / max(1, len(palabras)) * segundos)
+                segmentos.append({"id": len(segmentos), "start": round(inicio, 2), "end": round(fin, 2),
+                                  "text": " " + " ".join(palabras[i:i + por_segmento])})
+            return self._json({"task": "transcribe", "language": "es", "duration": round(segundos, 2),
+                               "text": texto, "segments": segmentos})
+        self._json({"text": texto})
+
+    def _chat(self, peticion: dict) -> None:
+        streaming = bool(peticion.get("stream"))
+        self.dobles.contar("chat_streaming" if streaming else "chat")
+        if self._limitado():
+            return
+        args = self.dobles.args
+        mensajes = peticion.get("messages") or []
+        sistema = next((m["content"] for m in mensajes if m.get("role") == "system"), "")
+        tokens_entrada = sum(len(m.get("content") or "") for m in mensajes) // 4
+        tokens_salida = int((peticion.get("max_tokens") or 1024) * random.uniform(0.4, 0.7))
+
+        if "JSON" in sistema:
+            secciones = [s for s in SECCIONES if f'"{s}"' in sistema] or list(SECCIONES)
+            palabras = int(tokens_salida * 0.75 / len(secciones))
+            contenido = json.dumps({
+                s: ([texto_aleatorio(palabras // 4) for _ in range(4)] if s == "hilo_twitter"
+                    else texto_aleatorio(palabras))
+                for s in secciones
+            }, ensure_ascii=False)
+        else:
+            contenido = texto_aleatorio(int(tokens_salida * 0.75))
+
+        uso = {"prompt_tokens": tokens_entrada, "completion_tokens": tokens_salida,
+               "total_tokens": tokens_entrada + tokens_salida}
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()),
+                "model": peticion.get("model"), "system_fingerprint": "fp_doble"}
+        primer_token = self.dobles.latencia(args.latencia_chat, 0)
+        generacion = self.dobles.latencia(0, args.chat_por_token * tokens_salida)
+
+        if not streaming:
+            time.sleep(primer_token + generacion)
+            return self._json({**base, "object": "chat.completion", "usage": uso, "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": contenido}, "finish_reason": "stop"}]})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def evento(delta: dict, final: bool = False) -> None:
+            trozo = {**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": delta, "finish_reason": "stop" if final else None}]}
+            if final:
+                trozo["x_groq"] = {"id": base["id"], "usage": uso}
+            self.wfile.write(f"data: {json.dumps(trozo, ensure_ascii=False)}\n\n".encode())
+            self.wfile.flush()
+
+        time.sleep(primer_token)
+        piezas = [contenido[i:i + 24] for i in range(0, len(contenido), 24)]
+        for pieza in piezas:
+            evento({"content": pieza})
+            time.sleep(generacion / len(piezas))
+        evento({}, final=True)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def argumentos(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--puerto", type=int, required=True)
+    parser.add_argument("--medios", nargs="+", required=True, metavar="SEGUNDOS=RUTA",
+                        help="Audios que sirve /media; id[1] del vídeo elige cuál")
+    parser.add_argument("--latencia-whisper", type=float, default=0.3, help="Segundos fijos por llamada")
+    parser.add_argument("--whisper-por-mb", type=float, default=0.15, help="Segundos extra por MB de audio")
+    parser.add_argument("--latencia-chat", type=float, default=0.2, help="Segundos hasta el primer token")
+    parser.add_argument("--chat-por-token", type=float, default=0.002, help="Segundos por token generado")
+    parser.add_argument("--latencia-media", type=float, default=0.05, help="Segundos de /media/<id>/info")
+    parser.add_argument("--ancho-banda", type=float, default=0, help="Bytes/s por descarga (0: sin límite)")
+    parser.add_argument("--prob-429", type=float, default=0.05, help="Fracción de llamadas a Groq con 429")
+    parser.add_argument("--retry-after", type=float, default=1)
+    parser.add_argument("--bytes-por-segundo", type=float, default=4000,
+                        help="Bytes por segundo del audio que llega a Whisper (MP3 32 kbps del perfil "
+                             "clasico), para estimar su duración")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = argumentos(argv)
+    Manejador.dobles = Dobles(args)
+    servidor = ThreadingHTTPServer(("127.0.0.1", args.puerto), Manejador)
+    servidor.daemon_threads = True
+    print(f"Dobles escuchando en http://127.0.0.1:{args.puerto}", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
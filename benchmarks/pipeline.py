@@ -0,0 +1,490 @@
+"""
+Rendimiento del pipeline completo (/subir y /transformar) sin red. Groq y
+YouTube se sustituyen por los dobles locales de benchmarks/dobles.py, y el
+audio son fixtures sintéticos de varias duraciones generados al empezar.
+Cada petición usa un vídeo o unos bytes distintos, así que ninguna acierta
+en las cachés ni se coalesce con otra.
+
+Por escenario da:
+  - peticiones correctas por segundo y errores por motivo;
+  - latencia p50/p95/p99 global y por duración de audio;
+  - latencia p50/p95/p99 por etapa del pipeline, interpolada en los
+    histogramas de /metrics (con más buckets de lo normal);
+  - pico de RSS del servidor (con sus ffmpeg y workers) y pico de uso de /tmp.
+--salida guarda el JSON para comparar entre versiones.
+
+    python benchmarks/pipeline.py
+    python benchmarks/pipeline.py --escenarios transformar --concurrencia 8 --peticiones 40 \\
+        --duraciones 30 900 --entorno PACK_STREAMING=1 --prob-429 0.2 --salida resultados.json
+
+Las opciones que no son de este script (--prob-429, --latencia-whisper,
+--ancho-banda...) se pasan tal cual a dobles.py. Con gunicorn se usa un solo
+worker por defecto: las métricas son por proceso (ver metricas.py).
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import signal
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import wave
+from array import array
+from urllib.parse import urlencode
+
+from servidor import RAIZ, _entorno, _puerto_libre, arrancar
+
+sys.path.insert(0, RAIZ)
+from metricas import PREFIJO, uso_directorio   # noqa: E402
+
+# Buckets finos (5 ms … ~20 min, ×1.25) para los percentiles por etapa
+BUCKETS_FINOS = ",".join(f"{0.005 * 1.25 ** n:.4g}" for n in range(56))
+HISTOGRAMAS = {"etapa_segundos": "etapa", "ffmpeg_espera_segundos": None}
+ALFABETO_ID = string.ascii_letters + string.digits
+
+
+# ---------------------------------------------------------------------------
+# FIXTURES
+# ---------------------------------------------------------------------------
+
+def generar_wav(ruta: str, segundos: int, frecuencia: int = 16000) -> None:
+    """
+    Voz sintética: mono 16 kHz, tono con modulación de amplitud y ruido.
+    Se escriben bloques de un segundo elegidos al azar entre unos pocos
+    precalculados, para que generar audios largos no tarde.
+    """
+    rng = random.Random(segundos)
+    bloques = []
+    for _ in range(8):
+        f0, silaba = rng.uniform(100, 250), rng.uniform(3, 6)
+        bloques.append(array("h", (
+            int(8000 * math.sin(2 * math.pi * f0 * t / frecuencia)
+                * (0.55 + 0.45 * math.sin(2 * math.pi * silaba * t / frecuencia))
+                + rng.gauss(0, 1200))
+            for t in range(frecuencia)
+        )).tobytes())
+    with wave.open(ruta, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(frecuencia)
+        for _ in range(segundos):
+            w.writeframes(rng.choice(bloques))
+
+
+def preparar_fixtures(directorio: str, duraciones: list[int]) -> list[dict]:
+    """
+    Un WAV por duración (lo que se sube a /subir) y su versión para la
+    fuente de medios: Opus en WebM como el audio de YouTube si hay ffmpeg;
+    si no, el mismo WAV.
+    """
+    fixtures = []
+    for segundos in duraciones:
+        wav = os.path.join(directorio, f"audio-{segundos}s.wav")
+        generar_wav(wav, segundos)
+        medio = wav
+        if shutil.which("ffmpeg"):
+            medio = os.path.join(directorio, f"audio-{segundos}s.webm")
+            subprocess.run(["ffmpeg", "-y", "-v", "error", "-i", wav, "-c:a", "libopus", "-b:a", "48k",
+                            "-ac", "1", medio], check=True)
+        fixtures.append({"segundos": segundos, "wav": wav, "medio": medio,
+                         "bytes_wav": os.path.getsize(wav), "bytes_medio": os.path.getsize(medio)})
+    return fixtures
+
+
+# ---------------------------------------------------------------------------
+# PETICIONES
+# ---------------------------------------------------------------------------
+
+def _peticion_transformar(indice_fixture: int, fixture: dict) -> tuple:
+    # id[1] elige el audio en la fuente de medios; el resto, un vídeo nuevo
+    video_id = "b" + ALFABETO_ID[indice_fixture] + "".join(random.choices(ALFABETO_ID, k=9))
+    cuerpo = urlencode({"url": f"https://www.youtube.com/watch?v={video_id}"})
+    return "/transformar", cuerpo.encode(), "application/x-www-form-urlencoded"
+
+
+def _peticion_subir(indice_fixture: int, fixture: dict) -> tuple:
+    with open(fixture["wav"], "rb") as f:
+        audio = bytearray(f.read())
+    # Las últimas muestras al azar: la caché por hash de la subida no acierta
+    audio[-64:] = os.urandom(64)
+    frontera = uuid.uuid4().hex
+    cuerpo = b"".join((
+        f"--{frontera}\r\n".encode(),
+        f'Content-Disposition: form-data; name="file"; filename="audio-{fixture["segundos"]}s.wav"\r\n'.encode(),
+        b"Content-Type: audio/wav\r\n\r\n",
+        bytes(audio),
+        f"\r\n--{frontera}--\r\n".encode(),
+    ))
+    return "/subir", cuerpo, f"multipart/form-data; boundary={frontera}"
+
+
+ESCENARIOS = {"subir": _peticion_subir, "transformar": _peticion_transformar}
+
+
+def _motivo_error(status: int, cuerpo: bytes) -> str | None:
+    """None si la respuesta es un pack completo; si no, el motivo con el mensaje de la app."""
+    try:
+        datos = json.loads(cuerpo)
+    except ValueError:
+        return f"http_{status}" if status != 200 else "json_invalido"
+    if status != 200:
+        return f"http_{status}: {datos.get('error', '')}"[:120]
+    if str(datos.get("transcripcion", "")).startswith("Error"):
+        return f"transcripcion: {datos['transcripcion']}"[:120]
+    if not datos.get("pack_viral") or "error" in datos["pack_viral"]:
+        return f"pack: {(datos.get('pack_viral') or {}).get('error', 'vacío')}"[:120]
+    return None
+
+
+def cargar(puerto: int, escenario: str, fixtures: list[dict], concurrencia: int, peticiones: int) -> list[dict]:
+    """`concurrencia` hilos con conexión keep-alive propia hasta completar `peticiones`."""
+    construir = ESCENARIOS[escenario]
+    pendientes = iter(range(peticiones))
+    lock = threading.Lock()
+    resultados: list[dict] = []
+
+    def cliente() -> None:
+        conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=900)
+        while True:
+            with lock:
+                n = next(pendientes, None)
+            if n is None:
+                break
+            indice = n % len(fixtures)
+            ruta, cuerpo, tipo = construir(indice, fixtures[indice])
+            inicio = time.perf_counter()
+            try:
+                conexion.request("POST", ruta, body=cuerpo, headers={"Content-Type": tipo})
+                respuesta = conexion.getresponse()
+                datos = respuesta.read()
+                motivo = _motivo_error(respuesta.status, datos)
+                if respuesta.will_close:
+                    conexion.close()
+            except (OSError, http.client.HTTPException) as e:
+                motivo = type(e).__name__
+                conexion.close()
+            with lock:
+                resultados.append({"segundos_audio": fixtures[indice]["segundos"],
+                                   "latencia": time.perf_counter() - inicio, "error": motivo})
+        conexion.close()
+
+    hilos = [threading.Thread(target=cliente) for _ in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resultados
+
+
+# ---------------------------------------------------------------------------
+# MEDICIONES
+# ---------------------------------------------------------------------------
+
+def percentiles(valores: list[float]) -> dict:
+    if not valores:
+        return {}
+    ordenados = sorted(valores)
+
+    def p(q: float) -> float:
+        return round(1000 * ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))], 1)
+
+    return {"n": len(ordenados), "p50_ms": p(0.50), "p95_ms": p(0.95), "p99_ms": p(0.99),
+            "media_ms": round(1000 * statistics.fmean(ordenados), 1), "max_ms": round(1000 * ordenados[-1], 1)}
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            return next((int(linea.split()[1]) for linea in f if linea.startswith("VmRSS:")), 0)
+    except OSError:
+        return 0
+
+
+def _descendientes(pid: int) -> list[int]:
+    hijos = []
+    try:
+        for tarea in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tarea}/children") as f:
+                hijos.extend(int(h) for h in f.read().split())
+    except OSError:
+        return []
+    return hijos + [n for h in hijos for n in _descendientes(h)]
+
+
+class Muestreo:
+    """Picos de RSS del árbol del servidor y de uso de /tmp, muestreados cada 100 ms."""
+
+    def __init__(self, pid: int, intervalo: float = 0.1):
+        self.pid = pid
+        self.intervalo = intervalo
+        self.tmp_base = uso_directorio("/tmp")[0]
+        self.reiniciar()
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, daemon=True)
+        self._hilo.start()
+
+    def reiniciar(self) -> None:
+        self.rss_servidor_kb = self.rss_total_kb = self.tmp_bytes = 0
+
+    def _bucle(self) -> None:
+        while not self._parar.wait(self.intervalo):
+            servidor = _rss_kb(self.pid)
+            total = servidor + sum(_rss_kb(h) for h in _descendientes(self.pid))
+            self.rss_servidor_kb = max(self.rss_servidor_kb, servidor)
+            self.rss_total_kb = max(self.rss_total_kb, total)
+            self.tmp_bytes = max(self.tmp_bytes, uso_directorio("/tmp")[0] - self.tmp_base)
+
+    def parar(self) -> None:
+        self._parar.set()
+        self._hilo.join()
+
+    def resumen(self) -> dict:
+        return {"rss_pico_servidor_mb": round(self.rss_servidor_kb / 1024, 1),
+                "rss_pico_total_mb":    round(self.rss_total_kb / 1024, 1),
+                "tmp_pico_mb":          round(self.tmp_bytes / 2 ** 20, 1)}
+
+
+def _get_json(puerto: int, ruta: str):
+    conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=30)
+    try:
+        conexion.request("GET", ruta)
+        return conexion.getresponse().read()
+    finally:
+        conexion.close()
+
+
+def leer_histogramas(puerto: int) -> dict:
+    """{serie: {"buckets": {le: acumulado}, "suma": s, "total": n}} de los HISTOGRAMAS de /metrics."""
+    series: dict = {}
+    patron = re.compile(rf"^{PREFIJO}(\w+?)_(bucket|sum|count)(?:\{{(.*)\}})? (\S+)$")
+    for linea in _get_json(puerto, "/metrics").decode().splitlines():
+        if not (m := patron.match(linea)) or m.group(1) not in HISTOGRAMAS:
+            continue
+        nombre, tipo, etiquetas, valor = m.groups()
+        etiquetas = dict(re.findall(r'(\w+)="([^"]*)"', etiquetas or ""))
+        clave = etiquetas.get(HISTOGRAMAS[nombre]) if HISTOGRAMAS[nombre] else nombre.removesuffix("_segundos")
+        serie = series.setdefault(clave, {"buckets": {}, "suma": 0.0, "total": 0})
+        if tipo == "bucket":
+            serie["buckets"][float(etiquetas["le"])] = float(valor)
+        elif tipo == "sum":
+            serie["suma"] = float(valor)
+        else:
+            serie["total"] = int(float(valor))
+    return series
+
+
+def _cuantil_histograma(buckets: list[tuple[float, float]], q: float) -> float:
+    """Como histogram_quantile de Prometheus: interpolación lineal dentro del bucket."""
+    total = buckets[-1][1]
+    objetivo = q * total
+    anterior_limite, anterior_n = 0.0, 0.0
+    for limite, n in buckets:
+        if n >= objetivo:
+            if limite == math.inf:
+                return anterior_limite
+            if n == anterior_n:
+                return limite
+            return anterior_limite + (limite - anterior_limite) * (objetivo - anterior_n) / (n - anterior_n)
+        anterior_limite, anterior_n = limite, n
+    return anterior_limite
+
+
+def etapas(antes: dict, despues: dict) -> dict:
+    """Percentiles por etapa de lo observado entre dos lecturas de /metrics."""
+    resultado = {}
+    for clave, serie in sorted(despues.items()):
+        previa = antes.get(clave, {"buckets": {}, "suma": 0.0, "total": 0})
+        total = serie["total"] - previa["total"]
+        if total <= 0:
+            continue
+        buckets = sorted((le, n - previa["buckets"].get(le, 0)) for le, n in serie["buckets"].items())
+        resultado[clave] = {
+            "n":        total,
+            "p50_ms":   round(1000 * _cuantil_histograma(buckets, 0.50), 1),
+            "p95_ms":   round(1000 * _cuantil_histograma(buckets, 0.95), 1),
+            "p99_ms":   round(1000 * _cuantil_histograma(buckets, 0.99), 1),
+            "media_ms": round(1000 * (serie["suma"] - previa["suma"]) / total, 1),
+        }
+    return resultado
+
+
+# ---------------------------------------------------------------------------
+# EJECUCIÓN
+# ---------------------------------------------------------------------------
+
+def arrancar_dobles(puerto: int, fixtures: list[dict], extra: list[str]) -> subprocess.Popen:
+    comando = [sys.executable, os.path.join(RAIZ, "benchmarks", "dobles.py"), "--puerto", str(puerto),
+               "--medios", *(f"{f['segundos']}={f['medio']}" for f in fixtures), *extra]
+    proceso = subprocess.Popen(comando, stdout=subprocess.DEVNULL)
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError("dobles.py terminó al arrancar (¿opciones no válidas?)")
+        try:
+            _get_json(puerto, "/estadisticas")
+            return proceso
+        except OSError:
+            time.sleep(0.1)
+    proceso.kill()
+    raise RuntimeError("dobles.py no arrancó")
+
+
+def _parar(proceso: subprocess.Popen) -> None:
+    proceso.send_signal(signal.SIGTERM)
+    try:
+        proceso.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proceso.kill()
+
+
+def entorno_servidor(args: argparse.Namespace, directorio: str, puerto_dobles: int) -> dict:
+    base = f"http://127.0.0.1:{puerto_dobles}"
+    entorno = {
+        **_entorno(directorio),
+        "GROQ_BASE_URL":             base,
+        "GROQ_KEYS_LIST":            ",".join(f"bench-{i}" for i in range(args.keys)),
+        "GROQ_RPM_POR_KEY":          str(args.rpm),
+        "GROQ_TPM_POR_KEY":          str(args.tpm),
+        "BENCH_MEDIA_URL":           base,
+        "PYTHONPATH":                os.pathsep.join(filter(None, [os.path.join(RAIZ, "benchmarks", "plugins"),
+                                                               os.environ.get("PYTHONPATH")])),
+        "METRICAS_BUCKETS_SEGUNDOS": BUCKETS_FINOS,
+        "YTDLP_VERBOSE":             "0",
+        "YTDLP_PRECALENTAR":         "1",
+        "GUNICORN_WORKERS":          str(args.workers),
+    }
+    for asignacion in args.entorno:
+        nombre, _, valor = asignacion.partition("=")
+        entorno[nombre] = valor
+    return entorno
+
+
+def escenario(puerto: int, proceso: subprocess.Popen, puerto_dobles: int, nombre: str,
+              fixtures: list[dict], args: argparse.Namespace) -> dict:
+    # Una petición por audio sin medir: carga perezosa, pool de YoutubeDL...
+    cargar(puerto, nombre, fixtures, 1, len(fixtures))
+    muestreo = Muestreo(proceso.pid)
+    metricas_antes = leer_histogramas(puerto)
+    dobles_antes = json.loads(_get_json(puerto_dobles, "/estadisticas"))
+    inicio = time.monotonic()
+    try:
+        resultados = cargar(puerto, nombre, fixtures, args.concurrencia, args.peticiones)
+    finally:
+        duracion = time.monotonic() - inicio
+        muestreo.parar()
+    dobles_despues = json.loads(_get_json(puerto_dobles, "/estadisticas"))
+
+    correctas = [r for r in resultados if r["error"] is None]
+    errores: dict[str, int] = {}
+    for r in resultados:
+        if r["error"] is not None:
+            errores[r["error"]] = errores.get(r["error"], 0) + 1
+    return {
+        "escenario":    nombre,
+        "concurrencia": args.concurrencia,
+        "peticiones":   len(resultados),
+        "errores":      sum(errores.values()),
+        "errores_por_motivo": errores,
+        "duracion_s":   round(duracion, 2),
+        "rps":          round(len(correctas) / duracion, 3) if duracion else 0.0,
+        "latencia":     percentiles([r["latencia"] for r in correctas]),
+        "latencia_por_audio": {
+            f"{f['segundos']}s": percentiles([r["latencia"] for r in correctas if r["segundos_audio"] == f["segundos"]])
+            for f in fixtures
+        },
+        "etapas":       etapas(metricas_antes, leer_histogramas(puerto)),
+        **muestreo.resumen(),
+        "dobles":       {k: dobles_despues[k] - dobles_antes.get(k, 0) for k in dobles_despues},
+    }
+
+
+def imprimir(informe: dict) -> None:
+    for r in informe["resultados"]:
+        latencia = r["latencia"] or {"p50_ms": "-", "p95_ms": "-", "p99_ms": "-"}
+        print(f"\n== {r['modo']} · {r['escenario']} · {r['peticiones']} peticiones, concurrencia {r['concurrencia']}")
+        print(f"   {r['rps']} req/s   errores {r['errores']} {r['errores_por_motivo'] or ''}")
+        print(f"   RSS pico {r['rss_pico_servidor_mb']} MB servidor / {r['rss_pico_total_mb']} MB con hijos"
+              f"   /tmp pico {r['tmp_pico_mb']} MB   429 servidos {r['dobles'].get('rate_limit_429', 0)}")
+        print(f"   {'':<22} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        print(f"   {'total':<22} {latencia.get('n', 0):>5} {latencia['p50_ms']:>9} "
+              f"{latencia['p95_ms']:>9} {latencia['p99_ms']:>9}")
+        for audio, p in r["latencia_por_audio"].items():
+            if p:
+                print(f"   {'audio ' + audio:<22} {p['n']:>5} {p['p50_ms']:>9} {p['p95_ms']:>9} {p['p99_ms']:>9}")
+        for etapa, p in r["etapas"].items():
+            print(f"   {'etapa ' + etapa:<22} {p['n']:>5} {p['p50_ms']:>9} {p['p95_ms']:>9} {p['p99_ms']:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modos", nargs="+", default=["dev"], choices=["dev", "gunicorn", "gunicorn-asgi"])
+    parser.add_argument("--escenarios", nargs="+", default=list(ESCENARIOS), choices=list(ESCENARIOS))
+    parser.add_argument("--concurrencia", type=int, default=4)
+    parser.add_argument("--peticiones", type=int, default=20, help="Peticiones medidas por escenario")
+    parser.add_argument("--duraciones", nargs="+", type=int, default=[30, 120, 600],
+                        help="Segundos de cada audio sintético; las peticiones se reparten entre ellos")
+    parser.add_argument("--keys", type=int, default=4, help="Keys de Groq (falsas) del pool")
+    # Por defecto el cupo del pool no limita: se mide el servicio, no la cuenta de Groq
+    parser.add_argument("--rpm", type=int, default=1000, help="GROQ_RPM_POR_KEY")
+    parser.add_argument("--tpm", type=int, default=1_000_000, help="GROQ_TPM_POR_KEY")
+    parser.add_argument("--workers", type=int, default=1, help="Workers de gunicorn")
+    parser.add_argument("--entorno", nargs="*", default=[], metavar="VARIABLE=VALOR",
+                        help="Variables de entorno extra para el servidor (PACK_STREAMING=1...)")
+    parser.add_argument("--json", action="store_true", help="Salida legible por máquina")
+    parser.add_argument("--salida", help="Guarda además el JSON en este fichero")
+    args, extra = parser.parse_known_args()
+    if len(args.duraciones) > len(ALFABETO_ID):
+        parser.error(f"Como mucho {len(ALFABETO_ID)} duraciones")
+
+    directorio = tempfile.mkdtemp(prefix="bench-pipeline-")
+    resultados = []
+    try:
+        fixtures = preparar_fixtures(directorio, args.duraciones)
+        puerto_dobles = _puerto_libre()
+        dobles = arrancar_dobles(puerto_dobles, fixtures, extra)
+        try:
+            entorno = entorno_servidor(args, directorio, puerto_dobles)
+            for modo in args.modos:
+                puerto = _puerto_libre()
+                proceso = arrancar(modo, puerto, entorno)
+                try:
+                    for nombre in args.escenarios:
+                        resultados.append({"modo": modo, **escenario(puerto, proceso, puerto_dobles, nombre,
+                                                                     fixtures, args)})
+                finally:
+                    _parar(proceso)
+        finally:
+            _parar(dobles)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    informe = {
+        "fecha":      time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "maquina":    {"cpus": os.cpu_count(), "python": platform.python_version(),
+                       "plataforma": platform.platform(), "ffmpeg": bool(shutil.which("ffmpeg"))},
+        "parametros": {**{k: v for k, v in vars(args).items() if k not in ("json", "salida")}, "dobles": extra},
+        "fixtures":   [{k: f[k] for k in ("segundos", "bytes_wav", "bytes_medio")} for f in fixtures],
+        "resultados": resultados,
+    }
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+    if args.json:
+        print(json.dumps(informe, indent=2, ensure_ascii=False))
+    else:
+        imprimir(informe)
+
+
+if __name__ == "__main__":
+    main()
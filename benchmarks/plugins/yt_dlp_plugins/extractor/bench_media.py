@@ -0,0 +1,36 @@
+import os
+
+from yt_dlp.extractor.common import InfoExtractor
+
+# ---------------------------------------------------------------------------
+# FUENTE DE MEDIOS DEL BENCHMARK
+# Solo se carga cuando benchmarks/plugins está en PYTHONPATH, que es lo que
+# hace benchmarks/pipeline.py al arrancar el servidor. Los extractores de
+# plugins van antes que los de yt-dlp, así que las URLs de YouTube se
+# resuelven contra la fuente local de benchmarks/dobles.py (BENCH_MEDIA_URL)
+# y la descarga sigue el camino normal de yt-dlp, sin red.
+# ---------------------------------------------------------------------------
+
+
+class BenchMediaIE(InfoExtractor):
+    IE_NAME = "bench:media"
+    _VALID_URL = r"https?://(?:(?:www|m|music)\.)?(?:youtube\.com/watch\?v=|youtu\.be/)(?P<id>[0-9A-Za-z_-]{11})"
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        base = os.environ["BENCH_MEDIA_URL"].rstrip("/")
+        info = self._download_json(f"{base}/media/{video_id}/info", video_id, note="Consultando la fuente local")
+        return {
+            "id":       video_id,
+            "title":    f"Benchmark {video_id}",
+            "duration": info["duracion"],
+            "formats":  [{
+                "format_id": "audio",
+                "url":       f"{base}/media/{video_id}/audio",
+                "ext":       info["ext"],
+                "acodec":    info["acodec"],
+                "vcodec":    "none",
+                "abr":       info["abr"],
+                "filesize":  info["tamano"],
+            }],
+        }
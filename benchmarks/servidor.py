@@ -0,0 +1,193 @@
+"""
+Peticiones por segundo del servidor de desarrollo (`python app.py`) frente
+a gunicorn con gunicorn.conf.py, sin red: /transformar se sirve entero
+desde las cachés, que se siembran antes de arrancar el servidor.
+
+    python benchmarks/servidor.py                       # los dos modos
+    python benchmarks/servidor.py --modos gunicorn --clientes 64 --json
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VIDEO_ID = "dQw4w9WgXcQ"
+
+ESCENARIOS = {
+    # Ruta completa con dos lecturas de caché (transcripción y pack)
+    "transformar_cacheado": ("POST", "/transformar",
+                             urlencode({"url": f"https://www.youtube.com/watch?v={VIDEO_ID}"})),
+    "index":                ("GET", "/", None),
+    "job_inexistente":      ("GET", "/jobs/no-existe", None),
+}
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _entorno(directorio: str) -> dict:
+    return {
+        **os.environ,
+        "CACHE_DB_PATH":      os.path.join(directorio, "cache.sqlite3"),
+        "JOBS_DB_PATH":       os.path.join(directorio, "jobs.sqlite3"),
+        "YTDLP_PRECALENTAR":  "0",
+        "GROQ_API_KEY":       os.environ.get("GROQ_API_KEY", "bench"),
+        "PYTHONUNBUFFERED":   "1",
+    }
+
+
+def sembrar_caches(entorno: dict) -> None:
+    """Guarda una transcripción y su pack para VIDEO_ID en la caché en disco."""
+    codigo = f"""
+import app
+texto = "Esto es una transcripción de prueba. " * 200
+app.cache_transcripciones.guardar("youtube:{VIDEO_ID}", texto)
+clave = app.clave_pack_unico(texto)
+app.cache_packs.guardar(clave, '{{"resumen": "r", "hilo_twitter": ["t"], "linkedin": "l", "tiktok_script": "s"}}')
+"""
+    subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, env=entorno, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def arrancar(modo: str, puerto: int, entorno: dict) -> subprocess.Popen:
+    if modo == "dev":
+        comando = [sys.executable, "app.py"]
+        entorno = {**entorno, "PORT": str(puerto)}
+    else:
+        if modo == "gunicorn-asgi" and importlib.util.find_spec("uvicorn_worker") is None:
+            raise RuntimeError("El modo gunicorn-asgi necesita el paquete uvicorn-worker "
+                               "(pip install -r requirements.txt)")
+        comando = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"]
+        entorno = {**entorno, "GUNICORN_BIND": f"127.0.0.1:{puerto}",
+                   "GUNICORN_ASGI": "1" if modo == "gunicorn-asgi" else "0"}
+    proceso = subprocess.Popen(comando, cwd=RAIZ, env=entorno,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El servidor {modo} terminó al arrancar (código {proceso.returncode})")
+        try:
+            conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=2)
+            conexion.request("GET", "/jobs/calentamiento")
+            conexion.getresponse().read()
+            return proceso
+        except OSError:
+            time.sleep(0.2)
+    proceso.kill()
+    raise RuntimeError(f"El servidor {modo} no arrancó")
+
+
+def cargar(puerto: int, escenario: str, clientes: int, segundos: float) -> dict:
+    """`clientes` hilos con conexión keep-alive propia haciendo peticiones sin pausa."""
+    metodo, ruta, cuerpo = ESCENARIOS[escenario]
+    cabeceras = {"Content-Type": "application/x-www-form-urlencoded"} if cuerpo else {}
+    latencias: list[float] = []
+    errores = [0]
+    lock = threading.Lock()
+    fin = time.monotonic() + segundos
+
+    def cliente() -> None:
+        propias, fallos = [], 0
+        conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=30)
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            try:
+                conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+                respuesta = conexion.getresponse()
+                respuesta.read()
+                if respuesta.status >= 500 or (escenario != "job_inexistente" and respuesta.status != 200):
+                    fallos += 1
+                if respuesta.will_close:
+                    conexion.close()
+                    conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=30)
+            except (OSError, http.client.HTTPException):
+                fallos += 1
+                conexion.close()
+                conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=30)
+                continue
+            propias.append(time.perf_counter() - inicio)
+        conexion.close()
+        with lock:
+            latencias.extend(propias)
+            errores[0] += fallos
+
+    hilos = [threading.Thread(target=cliente) for _ in range(clientes)]
+    inicio = time.monotonic()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.monotonic() - inicio
+
+    latencias.sort()
+
+    def percentil(p: float) -> float:
+        return round(1000 * latencias[min(len(latencias) - 1, int(p * len(latencias)))], 1) if latencias else 0.0
+
+    return {
+        "peticiones":  len(latencias),
+        "errores":     errores[0],
+        "rps":         round(len(latencias) / duracion, 1),
+        "p50_ms":      percentil(0.50),
+        "p99_ms":      percentil(0.99),
+        "media_ms":    round(1000 * statistics.fmean(latencias), 1) if latencias else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modos", nargs="+", default=["dev", "gunicorn"],
+                        choices=["dev", "gunicorn", "gunicorn-asgi"])
+    parser.add_argument("--escenarios", nargs="+", default=list(ESCENARIOS), choices=list(ESCENARIOS))
+    parser.add_argument("--clientes", type=int, default=32)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--json", action="store_true", help="Salida legible por máquina")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="bench-servidor-")
+    entorno = _entorno(directorio)
+    resultados = []
+    try:
+        sembrar_caches(entorno)
+        for modo in args.modos:
+            puerto = _puerto_libre()
+            proceso = arrancar(modo, puerto, entorno)
+            try:
+                for escenario in args.escenarios:
+                    cargar(puerto, escenario, args.clientes, min(2.0, args.segundos))   # calentamiento
+                    resultados.append({"modo": modo, "escenario": escenario, "clientes": args.clientes,
+                                       **cargar(puerto, escenario, args.clientes, args.segundos)})
+            finally:
+                proceso.send_signal(signal.SIGTERM)
+                try:
+                    proceso.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    proceso.kill()
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({"cpus": os.cpu_count(), "resultados": resultados}, indent=2))
+        return
+    print(f"{'modo':<14} {'escenario':<22} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} {'errores':>8}")
+    for r in resultados:
+        print(f"{r['modo']:<14} {r['escenario']:<22} {r['rps']:>8} {r['p50_ms']:>8} {r['p99_ms']:>8} {r['errores']:>8}")
+
+
+if __name__ == "__main__":
+    main()
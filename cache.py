@@ -0,0 +1,430 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------
+# CACHÉ PERSISTENTE EN SQLITE
+# Un fichero SQLite puede alojar varias cachés (una tabla por nombre).
+# Los contadores de aciertos/fallos también viven en el fichero para que
+# todos los workers de gunicorn vean las mismas cifras.
+#
+# Un acierto solo lee: la hora de último acceso, el número de accesos y los
+# contadores se acumulan en memoria y se escriben en una sola transacción
+# cada `lote_accesos` consultas o `intervalo_accesos` segundos, y siempre
+# antes de expulsar o de enseñar estadísticas. Si el proceso muere se
+# pierden los pendientes, que solo afectan al orden LRU y a las cifras.
+# ---------------------------------------------------------------------------
+
+class CacheSQLite:
+    """
+    Caché clave → texto con expulsión LRU por tamaño total y por antigüedad.
+    `max_bytes` limita la suma de los valores almacenados; `max_edad` (segundos)
+    caduca las entradas por fecha de creación. Cualquiera de los dos a 0 o None
+    desactiva ese límite.
+    """
+
+    # Segundos que se guarda el registro de cada eliminar() para las capas
+    # de memoria de otros workers (ver CacheEnCapas)
+    RETENCION_BORRADOS = 3600.0
+
+    def __init__(self, ruta: str, nombre: str, max_bytes: Optional[int] = None,
+                 max_edad: Optional[float] = None, lote_accesos: int = 64,
+                 intervalo_accesos: float = 10.0):
+        if not nombre.isidentifier():
+            raise ValueError(f"Nombre de caché no válido: {nombre}")
+        self.ruta = ruta
+        self.nombre = nombre
+        self.max_bytes = max_bytes or None
+        self.max_edad = max_edad or None
+        self._tabla = f"cache_{nombre}"
+        # Serializa escrituras dentro del proceso; entre procesos ya lo hace SQLite
+        self._lock = threading.Lock()
+        self.lote_accesos = lote_accesos
+        self.intervalo_accesos = intervalo_accesos
+        # clave → (último acceso, accesos) aún sin escribir
+        self._accesos: dict[str, tuple[float, int]] = {}
+        self._contadores = {"aciertos": 0, "fallos": 0}
+        self._ultimo_volcado = time.monotonic()
+
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self._tabla} (
+                    clave          TEXT PRIMARY KEY,
+                    valor          TEXT NOT NULL,
+                    tamano         INTEGER NOT NULL,
+                    creado         REAL NOT NULL,
+                    ultimo_acceso  REAL NOT NULL,
+                    accesos        INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self._tabla}_acceso ON {self._tabla} (ultimo_acceso)")
+            # Una fila por eliminar(); los ids son consecutivos gracias a AUTOINCREMENT
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self._tabla}_borrados (
+                    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+                    clave   TEXT NOT NULL,
+                    momento REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_contadores (
+                    nombre     TEXT PRIMARY KEY,
+                    aciertos   INTEGER NOT NULL DEFAULT 0,
+                    fallos     INTEGER NOT NULL DEFAULT 0,
+                    generacion INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            # Migración de ficheros creados antes de existir `generacion`
+            columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(cache_contadores)")}
+            if "generacion" not in columnas:
+                conn.execute("ALTER TABLE cache_contadores ADD COLUMN generacion INTEGER NOT NULL DEFAULT 0")
+            conn.execute("INSERT OR IGNORE INTO cache_contadores (nombre) VALUES (?)", (nombre,))
+
+    def _conectar(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.ruta, timeout=30)
+
+    def _caducada(self, creado: float) -> bool:
+        return self.max_edad is not None and creado + self.max_edad < time.time()
+
+    def _volcar(self, conn: sqlite3.Connection) -> None:
+        """Escribe los accesos y contadores pendientes. Requiere self._lock."""
+        if self._accesos:
+            conn.executemany(
+                f"UPDATE {self._tabla} SET ultimo_acceso = MAX(ultimo_acceso, ?), "
+                f"accesos = accesos + ? WHERE clave = ?",
+                [(ultimo, accesos, clave) for clave, (ultimo, accesos) in self._accesos.items()]
+            )
+            self._accesos.clear()
+        if any(self._contadores.values()):
+            conn.execute(
+                "UPDATE cache_contadores SET aciertos = aciertos + ?, fallos = fallos + ? WHERE nombre = ?",
+                (self._contadores["aciertos"], self._contadores["fallos"], self.nombre)
+            )
+            self._contadores = {"aciertos": 0, "fallos": 0}
+        self._ultimo_volcado = time.monotonic()
+
+    def _anotar(self, conn: sqlite3.Connection, contador: str, clave: Optional[str] = None) -> None:
+        """Acumula un acierto (con su clave) o un fallo y vuelca si toca. Requiere self._lock."""
+        self._contadores[contador] += 1
+        if clave is not None:
+            _, accesos = self._accesos.get(clave, (0.0, 0))
+            self._accesos[clave] = (time.time(), accesos + 1)
+        pendientes = self._contadores["aciertos"] + self._contadores["fallos"]
+        if (pendientes >= self.lote_accesos
+                or time.monotonic() - self._ultimo_volcado >= self.intervalo_accesos):
+            self._volcar(conn)
+
+    def volcar(self) -> None:
+        """Escribe ya los accesos pendientes (p. ej. antes de inspeccionar el fichero)."""
+        with self._lock, self._conectar() as conn:
+            self._volcar(conn)
+
+    def obtener(self, clave: str) -> Optional[str]:
+        with self._lock, self._conectar() as conn:
+            fila = conn.execute(
+                f"SELECT valor, creado FROM {self._tabla} WHERE clave = ?", (clave,)
+            ).fetchone()
+
+            if fila is not None and self._caducada(fila[1]):
+                conn.execute(f"DELETE FROM {self._tabla} WHERE clave = ?", (clave,))
+                self._accesos.pop(clave, None)
+                fila = None
+
+            if fila is None:
+                self._anotar(conn, "fallos")
+                log.info("Caché %s: fallo para %s", self.nombre, clave)
+                return None
+
+            self._anotar(conn, "aciertos", clave)
+            log.info("Caché %s: acierto para %s", self.nombre, clave)
+            return fila[0]
+
+    def guardar(self, clave: str, valor: str) -> None:
+        ahora = time.time()
+        with self._lock, self._conectar() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self._tabla} (clave, valor, tamano, creado, ultimo_acceso) "
+                f"VALUES (?, ?, ?, ?, ?)",
+                (clave, valor, len(valor.encode("utf-8")), ahora, ahora)
+            )
+            # Los accesos pendientes de la clave eran de la entrada anterior
+            self._accesos.pop(clave, None)
+            self._volcar(conn)
+            self._expulsar(conn)
+
+    def _expulsar(self, conn: sqlite3.Connection) -> None:
+        """Elimina entradas caducadas y, si sobra tamaño, las menos usadas recientemente."""
+        if self.max_edad is not None:
+            conn.execute(f"DELETE FROM {self._tabla} WHERE creado < ?", (time.time() - self.max_edad,))
+
+        if self.max_bytes is None:
+            return
+
+        total = conn.execute(f"SELECT COALESCE(SUM(tamano), 0) FROM {self._tabla}").fetchone()[0]
+        exceso = total - self.max_bytes
+        if exceso <= 0:
+            return
+
+        a_borrar = []
+        for clave, tamano in conn.execute(
+            f"SELECT clave, tamano FROM {self._tabla} ORDER BY ultimo_acceso ASC"
+        ):
+            a_borrar.append((clave,))
+            exceso -= tamano
+            if exceso <= 0:
+                break
+        conn.executemany(f"DELETE FROM {self._tabla} WHERE clave = ?", a_borrar)
+        log.info("Caché %s: %d entradas expulsadas por tamaño.", self.nombre, len(a_borrar))
+
+    def _nueva_generacion(self, conn: sqlite3.Connection) -> None:
+        conn.execute("UPDATE cache_contadores SET generacion = generacion + 1 WHERE nombre = ?", (self.nombre,))
+
+    def estado(self) -> tuple[int, int]:
+        """
+        (generación, último borrado): la generación sube con cada purgar() y
+        el último borrado es el id del último eliminar(), de cualquier proceso
+        (ver CacheEnCapas).
+        """
+        with self._conectar() as conn:
+            generacion = conn.execute(
+                "SELECT generacion FROM cache_contadores WHERE nombre = ?", (self.nombre,)
+            ).fetchone()[0]
+            fila = conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = ?", (f"{self._tabla}_borrados",)
+            ).fetchone()
+        return generacion, fila[0] if fila else 0
+
+    def borrados(self, desde: int, hasta: int) -> Optional[list[str]]:
+        """
+        Claves eliminadas con id en (desde, hasta], o None si parte de ese
+        registro ya se ha descartado por RETENCION_BORRADOS.
+        """
+        with self._conectar() as conn:
+            filas = conn.execute(
+                f"SELECT clave FROM {self._tabla}_borrados WHERE id > ? AND id <= ?", (desde, hasta)
+            ).fetchall()
+        if len(filas) != hasta - desde:
+            return None
+        return [fila[0] for fila in filas]
+
+    def eliminar(self, clave: str) -> bool:
+        ahora = time.time()
+        with self._lock, self._conectar() as conn:
+            self._accesos.pop(clave, None)
+            borrada = conn.execute(f"DELETE FROM {self._tabla} WHERE clave = ?", (clave,)).rowcount > 0
+            conn.execute(f"INSERT INTO {self._tabla}_borrados (clave, momento) VALUES (?, ?)", (clave, ahora))
+            conn.execute(f"DELETE FROM {self._tabla}_borrados WHERE momento < ?",
+                         (ahora - self.RETENCION_BORRADOS,))
+            return borrada
+
+    def purgar(self) -> int:
+        """Vacía la caché y reinicia sus contadores. Devuelve las entradas eliminadas."""
+        with self._lock, self._conectar() as conn:
+            self._accesos.clear()
+            self._contadores = {"aciertos": 0, "fallos": 0}
+            borradas = conn.execute(f"DELETE FROM {self._tabla}").rowcount
+            conn.execute(
+                "UPDATE cache_contadores SET aciertos = 0, fallos = 0 WHERE nombre = ?", (self.nombre,)
+            )
+            self._nueva_generacion(conn)
+            return borradas
+
+    def entradas(self, limite: int = 100) -> list[dict]:
+        """Metadatos de las entradas, de la más a la menos reciente (sin el valor)."""
+        self.volcar()
+        with self._conectar() as conn:
+            filas = conn.execute(
+                f"SELECT clave, tamano, creado, ultimo_acceso, accesos FROM {self._tabla} "
+                f"ORDER BY ultimo_acceso DESC LIMIT ?", (limite,)
+            ).fetchall()
+        return [
+            {"clave": c, "bytes": t, "creado": cr, "ultimo_acceso": ua, "accesos": ac}
+            for c, t, cr, ua, ac in filas
+        ]
+
+    def estadisticas(self) -> dict:
+        self.volcar()
+        with self._conectar() as conn:
+            num, total = conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM {self._tabla}"
+            ).fetchone()
+            aciertos, fallos = conn.execute(
+                "SELECT aciertos, fallos FROM cache_contadores WHERE nombre = ?", (self.nombre,)
+            ).fetchone()
+        consultas = aciertos + fallos
+        return {
+            "entradas":   num,
+            "bytes":      total,
+            "max_bytes":  self.max_bytes,
+            "max_edad":   self.max_edad,
+            "aciertos":   aciertos,
+            "fallos":     fallos,
+            "ratio_aciertos": round(aciertos / consultas, 4) if consultas else None,
+        }
+
+
+# ---------------------------------------------------------------------------
+# CACHÉ EN MEMORIA
+# Misma interfaz que CacheSQLite, pero por proceso y acotada en número de
+# entradas. Sirve como primera capa delante de la caché en disco.
+# ---------------------------------------------------------------------------
+
+class CacheMemoria:
+    """Caché LRU clave → texto con límite de entradas y TTL opcional."""
+
+    def __init__(self, nombre: str, max_entradas: int = 256, max_edad: Optional[float] = None):
+        self.nombre = nombre
+        self.max_entradas = max_entradas
+        self.max_edad = max_edad or None
+        # clave → (valor, creado, accesos); el orden es el de uso reciente
+        self._datos: OrderedDict[str, tuple[str, float, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._aciertos = 0
+        self._fallos = 0
+
+    def obtener(self, clave: str) -> Optional[str]:
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and self.max_edad is not None and entrada[1] + self.max_edad < time.time():
+                del self._datos[clave]
+                entrada = None
+
+            if entrada is None:
+                self._fallos += 1
+                return None
+
+            valor, creado, accesos = entrada
+            self._datos[clave] = (valor, creado, accesos + 1)
+            self._datos.move_to_end(clave)
+            self._aciertos += 1
+            return valor
+
+    def guardar(self, clave: str, valor: str) -> None:
+        with self._lock:
+            self._datos[clave] = (valor, time.time(), 0)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def eliminar(self, clave: str) -> bool:
+        with self._lock:
+            return self._datos.pop(clave, None) is not None
+
+    def purgar(self) -> int:
+        with self._lock:
+            borradas = len(self._datos)
+            self._datos.clear()
+            self._aciertos = self._fallos = 0
+            return borradas
+
+    def entradas(self, limite: int = 100) -> list[dict]:
+        with self._lock:
+            recientes = list(reversed(self._datos.items()))[:limite]
+        return [
+            {"clave": clave, "bytes": len(valor.encode("utf-8")), "creado": creado, "accesos": accesos}
+            for clave, (valor, creado, accesos) in recientes
+        ]
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            consultas = self._aciertos + self._fallos
+            return {
+                "entradas":     len(self._datos),
+                "max_entradas": self.max_entradas,
+                "max_edad":     self.max_edad,
+                "aciertos":     self._aciertos,
+                "fallos":       self._fallos,
+                "ratio_aciertos": round(self._aciertos / consultas, 4) if consultas else None,
+            }
+
+
+class CacheEnCapas:
+    """
+    Memoria delante de un disco opcional. Los aciertos en disco se copian a
+    memoria; las escrituras van a ambas capas.
+
+    La memoria es de cada worker. Para que eliminar() o purgar() en uno (p. ej.
+    DELETE /admin/cache) llegue a los demás, cada capa de memoria mira el
+    estado del disco como mucho cada `intervalo_sincronizacion` segundos:
+    tras un purgar() se vacía entera y tras un eliminar() solo quita esa
+    clave (o se vacía si el registro de borrados ya no llega tan atrás).
+    Sin disco no hay nada compartido y solo se limpia la memoria del worker
+    que atiende la petición.
+    """
+
+    def __init__(self, memoria: CacheMemoria, disco: Optional[CacheSQLite] = None,
+                 intervalo_sincronizacion: float = 2.0):
+        self.memoria = memoria
+        self.disco = disco
+        self.intervalo_sincronizacion = intervalo_sincronizacion
+        self._generacion, self._ultimo_borrado = disco.estado() if disco is not None else (0, 0)
+        self._ultima_sincronizacion = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _sincronizar(self, forzar: bool = False) -> None:
+        if self.disco is None:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            if not forzar and ahora - self._ultima_sincronizacion < self.intervalo_sincronizacion:
+                return
+            self._ultima_sincronizacion = ahora
+            generacion, ultimo_borrado = self.disco.estado()
+            if (generacion, ultimo_borrado) == (self._generacion, self._ultimo_borrado):
+                return
+            claves = None
+            if generacion == self._generacion:
+                claves = self.disco.borrados(self._ultimo_borrado, ultimo_borrado)
+            self._generacion, self._ultimo_borrado = generacion, ultimo_borrado
+
+        if claves is not None:
+            for clave in claves:
+                self.memoria.eliminar(clave)
+            return
+        borradas = self.memoria.purgar()
+        log.info("Caché %s: hubo borrados en disco; %d entradas en memoria descartadas.",
+                 self.memoria.nombre, borradas)
+
+    def obtener(self, clave: str) -> Optional[str]:
+        self._sincronizar()
+        valor = self.memoria.obtener(clave)
+        if valor is None and self.disco is not None:
+            valor = self.disco.obtener(clave)
+            if valor is not None:
+                self.memoria.guardar(clave, valor)
+        return valor
+
+    def guardar(self, clave: str, valor: str) -> None:
+        self.memoria.guardar(clave, valor)
+        if self.disco is not None:
+            self.disco.guardar(clave, valor)
+
+    def eliminar(self, clave: str) -> bool:
+        en_memoria = self.memoria.eliminar(clave)
+        en_disco = self.disco.eliminar(clave) if self.disco is not None else False
+        self._sincronizar(forzar=True)
+        return en_memoria or en_disco
+
+    def purgar(self) -> int:
+        borradas = self.memoria.purgar()
+        if self.disco is not None:
+            borradas = max(borradas, self.disco.purgar())
+            self._sincronizar(forzar=True)
+        return borradas
+
+    def entradas(self, limite: int = 100) -> list[dict]:
+        capa = self.disco if self.disco is not None else self.memoria
+        return capa.entradas(limite)
+
+    def estadisticas(self) -> dict:
+        return {
+            "memoria": self.memoria.estadisticas(),
+            "disco":   self.disco.estadisticas() if self.disco is not None else None,
+        }
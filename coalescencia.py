@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Optional
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# COALESCENCIA DE PETICIONES (SINGLE-FLIGHT)
+# Cuando varias peticiones idénticas llegan a la vez (un vídeo viral pedido
+# por muchos usuarios), solo la primera ejecuta el pipeline; las demás se
+# enganchan a ese "vuelo" y reciben su mismo resultado o su misma excepción.
+# El progreso se reparte a todos los enganchados. Si uno se cancela (su
+# `informar` lanza), se suelta del vuelo sin pararlo; el trabajo solo se
+# aborta cuando ya no queda nadie esperándolo. Es por proceso: dos workers
+# de gunicorn pueden seguir ejecutando el mismo vídeo a la vez.
+#
+# ejecutar_async es la entrada para corrutinas (asgi.py). Los vuelos son los
+# mismos: una corrutina puede engancharse al vuelo de un hilo y al revés, y
+# quien espera en el bucle de asyncio no ocupa ningún hilo.
+# ---------------------------------------------------------------------------
+
+class EsperaAgotada(Exception):
+    """Quien esperaba un vuelo ajeno superó el tiempo máximo de espera."""
+
+    def __init__(self, segundos: float):
+        super().__init__(f"Espera agotada tras {segundos:.0f} s")
+        self.mensaje = "El procesamiento de este contenido está tardando demasiado. Inténtalo más tarde."
+        self.status = 504
+
+
+class _Suscriptor:
+
+    def __init__(self, informar: Callable[..., None]):
+        self.informar = informar
+        self.error: Optional[BaseException] = None
+        self.soltado = threading.Event()
+
+
+class _Vuelo:
+
+    def __init__(self):
+        self.terminado = threading.Event()
+        self.resultado: Any = None
+        self.error: Optional[BaseException] = None
+        self.suscriptores: list[_Suscriptor] = []
+        # Se llaman (desde el hilo que aterriza) al terminar; para despertar
+        # a las corrutinas enganchadas
+        self.avisos: list[Callable[[], None]] = []
+
+
+class Vuelos:
+
+    def __init__(self, espera_max: Optional[float] = None):
+        self.espera_max = espera_max or None
+        self._lock = threading.Lock()
+        self._vuelos: dict[str, _Vuelo] = {}
+        self._contadores = {"lideres": 0, "enganchados": 0, "agotados": 0, "soltados": 0}
+
+    def _soltar(self, vuelo: _Vuelo, suscriptor: _Suscriptor) -> None:
+        with self._lock:
+            if suscriptor in vuelo.suscriptores:
+                vuelo.suscriptores.remove(suscriptor)
+                self._contadores["soltados"] += 1
+
+    def _repartir(self, vuelo: _Vuelo, etapa: str, **datos: Any) -> None:
+        """`informar` que recibe la función: reenvía el progreso a todos los enganchados."""
+        with self._lock:
+            suscriptores = list(vuelo.suscriptores)
+        for suscriptor in suscriptores:
+            try:
+                suscriptor.informar(etapa, **dict(datos))
+            except Exception as e:
+                self._soltar(vuelo, suscriptor)
+                suscriptor.error = e
+                suscriptor.soltado.set()
+                with self._lock:
+                    quedan = bool(vuelo.suscriptores)
+                if not quedan:
+                    raise
+
+    def _subir(self, clave: str, informar: Callable[..., None]) -> tuple[_Vuelo, _Suscriptor, bool]:
+        """Se suma al vuelo de `clave` o lo crea. Devuelve (vuelo, suscriptor, es_lider)."""
+        suscriptor = _Suscriptor(informar)
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[clave] = _Vuelo()
+                self._contadores["lideres"] += 1
+            else:
+                self._contadores["enganchados"] += 1
+            vuelo.suscriptores.append(suscriptor)
+        return vuelo, suscriptor, lider
+
+    def _engancharse(self, clave: str, vuelo: _Vuelo, suscriptor: _Suscriptor) -> None:
+        log.info("Petición enganchada al procesamiento en curso de %s.", clave)
+        try:
+            suscriptor.informar("esperando", coalescido=True)
+        except BaseException:
+            self._soltar(vuelo, suscriptor)
+            raise
+
+    def _aterrizar(self, clave: str, vuelo: _Vuelo) -> None:
+        with self._lock:
+            del self._vuelos[clave]
+            vuelo.terminado.set()
+            avisos = list(vuelo.avisos)
+        for aviso in avisos:
+            aviso()
+
+    @staticmethod
+    def _desenlace(vuelo: _Vuelo, suscriptor: _Suscriptor) -> Any:
+        # El líder también puede haberse soltado (cancelado) mientras el
+        # trabajo seguía para los demás
+        if suscriptor.error is not None:
+            raise suscriptor.error
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.resultado
+
+    def _agotar(self, vuelo: _Vuelo, suscriptor: _Suscriptor) -> EsperaAgotada:
+        self._soltar(vuelo, suscriptor)
+        with self._lock:
+            self._contadores["agotados"] += 1
+        return EsperaAgotada(self.espera_max)
+
+    def ejecutar(self, clave: Optional[str], funcion: Callable[..., Any], *args: Any,
+                 informar: Callable[..., None]) -> Any:
+        """
+        Ejecuta `funcion(*args, informar=...)` o se engancha al vuelo en curso
+        con la misma `clave`. Sin clave no hay coalescencia. Quien se engancha
+        espera como mucho `espera_max` segundos (EsperaAgotada).
+        """
+        if clave is None:
+            return funcion(*args, informar=informar)
+
+        vuelo, suscriptor, lider = self._subir(clave, informar)
+        if lider:
+            return self._pilotar(clave, vuelo, suscriptor, funcion, args)
+        self._engancharse(clave, vuelo, suscriptor)
+        return self._esperar(vuelo, suscriptor)
+
+    def _pilotar(self, clave: str, vuelo: _Vuelo, suscriptor: _Suscriptor,
+                 funcion: Callable[..., Any], args: tuple) -> Any:
+        try:
+            vuelo.resultado = funcion(*args, informar=lambda etapa, **datos: self._repartir(vuelo, etapa, **datos))
+        except BaseException as e:
+            vuelo.error = e
+        finally:
+            self._aterrizar(clave, vuelo)
+        return self._desenlace(vuelo, suscriptor)
+
+    def _esperar(self, vuelo: _Vuelo, suscriptor: _Suscriptor) -> Any:
+        limite = time.monotonic() + self.espera_max if self.espera_max else None
+        while not vuelo.terminado.is_set():
+            if suscriptor.soltado.is_set():
+                raise suscriptor.error
+            restante = None if limite is None else limite - time.monotonic()
+            if restante is not None and restante <= 0:
+                raise self._agotar(vuelo, suscriptor)
+            # Despierta a menudo para notar que se ha soltado (cancelación)
+            vuelo.terminado.wait(1.0 if restante is None else min(1.0, restante))
+        return self._desenlace(vuelo, suscriptor)
+
+    async def ejecutar_async(self, clave: Optional[str], funcion: Callable[..., Any], *args: Any,
+                             informar: Callable[..., None]) -> Any:
+        """
+        Como ejecutar, con `funcion` asíncrona. `informar` sigue siendo
+        síncrono: el progreso de un vuelo con hilos llega desde esos hilos.
+        """
+        if clave is None:
+            return await funcion(*args, informar=informar)
+
+        vuelo, suscriptor, lider = self._subir(clave, informar)
+        if lider:
+            try:
+                vuelo.resultado = await funcion(
+                    *args, informar=lambda etapa, **datos: self._repartir(vuelo, etapa, **datos))
+            except BaseException as e:
+                vuelo.error = e
+            finally:
+                self._aterrizar(clave, vuelo)
+            return self._desenlace(vuelo, suscriptor)
+        self._engancharse(clave, vuelo, suscriptor)
+        return await self._esperar_async(vuelo, suscriptor)
+
+    async def _esperar_async(self, vuelo: _Vuelo, suscriptor: _Suscriptor) -> Any:
+        bucle = asyncio.get_running_loop()
+        terminado = asyncio.Event()
+
+        def avisar() -> None:
+            try:
+                bucle.call_soon_threadsafe(terminado.set)
+            except RuntimeError:
+                pass   # el bucle ya se cerró: no queda nadie a quien despertar
+
+        with self._lock:
+            if vuelo.terminado.is_set():
+                terminado.set()
+            else:
+                vuelo.avisos.append(avisar)
+
+        limite = time.monotonic() + self.espera_max if self.espera_max else None
+        try:
+            while not terminado.is_set():
+                if suscriptor.soltado.is_set():
+                    raise suscriptor.error
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    raise self._agotar(vuelo, suscriptor)
+                try:
+                    await asyncio.wait_for(terminado.wait(), 1.0 if restante is None else min(1.0, restante))
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            self._soltar(vuelo, suscriptor)
+            raise
+        return self._desenlace(vuelo, suscriptor)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "en_vuelo":    len(self._vuelos),
+                "esperando":   sum(max(0, len(v.suscriptores) - 1) for v in self._vuelos.values()),
+                **self._contadores,
+            }
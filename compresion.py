@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from metricas import DURACION_FFMPEG, ESPERA_FFMPEG
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# PERFILES DE COMPRESIÓN
+# Todos los perfiles bajan a mono 16 kHz, que es lo que Whisper usa
+# internamente. Además pueden:
+#   - quitar los silencios largos (silenceremove), que Groq factura como
+#     segundos de audio igual que la voz;
+#   - acelerar el audio (atempo), que reduce los segundos facturados a
+#     costa de algo de precisión en voces rápidas;
+#   - codificar en Opus/OGG, que a 16 kbps suena como el MP3 a 32 kbps.
+# COMPRESION_PERFIL elige el perfil (clasico por defecto: MP3 32 kbps sin
+# filtros, como siempre). Los silencios y el tempo solo cambian la línea de
+# tiempo del audio comprimido, que es el mismo que se trocea y transcribe.
+# ---------------------------------------------------------------------------
+
+SILENCIO_DB       = float(os.environ.get("COMPRESION_SILENCIO_DB", -40))
+SILENCIO_MINIMO   = float(os.environ.get("COMPRESION_SILENCIO_MIN", 1.0))
+# Lo que se deja de cada silencio recortado, para no pegar frases entre sí
+SILENCIO_CONSERVA = float(os.environ.get("COMPRESION_SILENCIO_CONSERVA", 0.3))
+
+_ARGS_MP3  = ("-c:a", "libmp3lame", "-b:a", "32k")
+_ARGS_OPUS = ("-c:a", "libopus", "-b:a", "16k", "-application", "voip")
+
+
+@dataclass(frozen=True)
+class PerfilCompresion:
+    nombre: str
+    extension: str
+    args_codec: tuple
+    quitar_silencios: bool = False
+    tempo: float = 1.0
+
+    def filtros(self) -> list[str]:
+        filtros = []
+        if self.quitar_silencios:
+            filtros.append(
+                f"silenceremove=start_periods=1:start_threshold={SILENCIO_DB}dB"
+                f":stop_periods=-1:stop_duration={SILENCIO_MINIMO}"
+                f":stop_threshold={SILENCIO_DB}dB:stop_silence={SILENCIO_CONSERVA}")
+        if self.tempo != 1.0:
+            filtros.append(f"atempo={self.tempo}")
+        return filtros
+
+    def argumentos(self) -> list[str]:
+        """Argumentos de salida de ffmpeg (entre la entrada y el archivo de salida)."""
+        filtros = self.filtros()
+        return ["-vn", "-ar", "16000", "-ac", "1",
+                *(["-af", ",".join(filtros)] if filtros else []),
+                *self.args_codec]
+
+
+PERFILES = {
+    "clasico":   PerfilCompresion("clasico", "mp3", _ARGS_MP3),
+    "silencios": PerfilCompresion("silencios", "mp3", _ARGS_MP3, quitar_silencios=True),
+    "opus":      PerfilCompresion("opus", "ogg", _ARGS_OPUS, quitar_silencios=True),
+    "rapido":    PerfilCompresion("rapido", "ogg", _ARGS_OPUS, quitar_silencios=True,
+                                  tempo=float(os.environ.get("COMPRESION_TEMPO", 1.25))),
+}
+
+
+def perfil_desde_entorno() -> PerfilCompresion:
+    nombre = os.environ.get("COMPRESION_PERFIL", "clasico").lower()
+    if nombre not in PERFILES:
+        raise ValueError(f"COMPRESION_PERFIL desconocido: {nombre}. Disponibles: {', '.join(PERFILES)}")
+    return PERFILES[nombre]
+
+
+# ---------------------------------------------------------------------------
+# PASO DIRECTO
+# Un audio que ya es mono, de 16 kHz como mucho y de bitrate bajo, en un
+# códec y contenedor que Groq acepta, se envía tal cual: recodificarlo
+# gastaría CPU para ganar poco o nada de tamaño.
+# ---------------------------------------------------------------------------
+
+PASO_DIRECTO_MAX_KBPS = float(os.environ.get("COMPRESION_PASO_DIRECTO_KBPS", 48))
+# Códec de audio → nombres de contenedor de ffprobe con los que Groq lo acepta
+_CODECS_DIRECTOS = {"mp3": {"mp3"}, "opus": {"ogg", "webm"}, "vorbis": {"ogg", "webm"}, "flac": {"flac"}}
+
+
+def sondear_audio(ruta: str) -> Optional[dict]:
+    """Streams y formato según ffprobe, o None si no se puede leer."""
+    try:
+        salida = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries",
+             "stream=codec_type,codec_name,channels,sample_rate,bit_rate:format=format_name,bit_rate",
+             "-of", "json", ruta],
+            check=True, capture_output=True, text=True, timeout=60
+        ).stdout
+        return json.loads(salida)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired,
+            FileNotFoundError, ValueError) as e:
+        log.warning("No se pudo sondear %s: %s", ruta, e)
+        return None
+
+
+def admite_paso_directo(ruta: str) -> bool:
+    """True si el audio ya es compacto y se puede enviar a Whisper sin pasar por ffmpeg."""
+    if PASO_DIRECTO_MAX_KBPS <= 0:
+        return False
+    info = sondear_audio(ruta)
+    if not info:
+        return False
+    streams = info.get("streams") or []
+    audio = [s for s in streams if s.get("codec_type") == "audio"]
+    if len(audio) != 1 or len(streams) != 1:
+        return False   # vídeo, carátulas o varias pistas: se recodifica
+
+    pista, formato = audio[0], info.get("format") or {}
+    contenedores = set((formato.get("format_name") or "").split(","))
+    # Groq se fía de la extensión: tiene que coincidir con el contenedor real
+    # (yt-dlp puede dejar un webm con nombre .m4a)
+    extension = os.path.splitext(ruta)[1].lstrip(".").lower()
+    contenedores &= {extension}
+    bitrate = pista.get("bit_rate") or formato.get("bit_rate")
+    try:
+        return (
+            bool(contenedores & _CODECS_DIRECTOS.get(pista.get("codec_name"), set()))
+            and int(pista.get("channels") or 0) == 1
+            # ffprobe informa siempre 48 kHz para Opus (su frecuencia de
+            # decodificación), así que ahí solo cuenta el bitrate
+            and (pista.get("codec_name") == "opus" or 0 < int(pista.get("sample_rate") or 0) <= 16000)
+            and bitrate is not None and int(bitrate) <= PASO_DIRECTO_MAX_KBPS * 1000
+        )
+    except ValueError:
+        return False
+
+
+# ---------------------------------------------------------------------------
+# EJECUTOR DE FFMPEG
+# Todos los ffmpeg de compresión pasan por aquí: como mucho max_paralelo a
+# la vez (por defecto uno por núcleo, con -threads repartiendo los núcleos
+# entre ellos) y hasta max_cola esperando hueco. Si la cola está llena, o no
+# hay hueco en espera_max segundos, se rechaza con ColaFfmpegLlena en vez de
+# amontonar procesos que se pelean por la CPU. Un ffmpeg que supera
+# `timeout` se mata. Si el callback de progreso lanza una excepción (p. ej.
+# porque el job se ha cancelado), también se mata el proceso.
+# ---------------------------------------------------------------------------
+
+class ColaFfmpegLlena(Exception):
+    pass
+
+
+class EjecutorFfmpeg:
+
+    def __init__(self, max_paralelo: int, max_cola: int, espera_max: float = 120.0,
+                 timeout: Optional[float] = None, hilos: Optional[int] = None):
+        self.max_paralelo = max(1, max_paralelo)
+        self.max_cola = max_cola
+        self.espera_max = espera_max
+        self.timeout = timeout
+        self.hilos = hilos or max(1, (os.cpu_count() or 1) // self.max_paralelo)
+        self._huecos = threading.BoundedSemaphore(self.max_paralelo)
+        self._lock = threading.Lock()
+        self.en_curso = 0
+        self.en_cola = 0
+        self.resultados = {"ok": 0, "error": 0, "timeout": 0, "cancelado": 0}
+        self.rechazados = 0
+        self.segundos_ffmpeg = 0.0
+        self.segundos_espera = 0.0
+
+    def argumentos_hilos(self) -> list[str]:
+        """Opción de salida para que cada ffmpeg use su parte de los núcleos."""
+        return ["-threads", str(self.hilos)]
+
+    def adquirir(self) -> float:
+        """Espera un hueco (o lanza ColaFfmpegLlena). Devuelve el instante de inicio para liberar()."""
+        inicio = time.monotonic()
+        if not self._huecos.acquire(blocking=False):
+            with self._lock:
+                if self.en_cola >= self.max_cola:
+                    self.rechazados += 1
+                    raise ColaFfmpegLlena(f"hay {self.en_cola} transcodificaciones esperando")
+                self.en_cola += 1
+            try:
+                conseguido = self._huecos.acquire(timeout=self.espera_max)
+            finally:
+                with self._lock:
+                    self.en_cola -= 1
+            if not conseguido:
+                with self._lock:
+                    self.rechazados += 1
+                raise ColaFfmpegLlena(f"sin hueco para ffmpeg en {self.espera_max:.0f} s")
+
+        espera = time.monotonic() - inicio
+        ESPERA_FFMPEG.observar(espera)
+        with self._lock:
+            self.en_curso += 1
+            self.segundos_espera += espera
+        return time.monotonic()
+
+    def liberar(self, inicio: float, resultado: str) -> None:
+        duracion = time.monotonic() - inicio
+        DURACION_FFMPEG.observar(duracion, resultado=resultado)
+        with self._lock:
+            self.en_curso -= 1
+            self.resultados[resultado] += 1
+            self.segundos_ffmpeg += duracion
+        self._huecos.release()
+
+    def ejecutar(self, comando: list[str], al_linea: Optional[Callable[[str], None]] = None,
+                 timeout: Optional[float] = None) -> None:
+        """
+        Ejecuta ffmpeg en cuanto haya hueco; `al_linea` recibe cada línea de
+        stdout (-progress pipe:1). Lanza CalledProcessError si ffmpeg falla y
+        TimeoutExpired si se pasa de `timeout` (o del timeout del ejecutor).
+        """
+        timeout = timeout or self.timeout
+        inicio = self.adquirir()
+        resultado = "error"
+        proceso = None
+        vencido = threading.Event()
+        try:
+            proceso = subprocess.Popen(comando, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            temporizador = None
+            if timeout:
+                def vencer() -> None:
+                    vencido.set()
+                    proceso.kill()
+                temporizador = threading.Timer(timeout, vencer)
+                temporizador.daemon = True
+                temporizador.start()
+            try:
+                for linea in proceso.stdout:
+                    if al_linea:
+                        al_linea(linea)
+                codigo = proceso.wait()
+            finally:
+                if temporizador:
+                    temporizador.cancel()
+
+            if vencido.is_set():
+                resultado = "timeout"
+                raise subprocess.TimeoutExpired(comando, timeout)
+            if codigo != 0:
+                raise subprocess.CalledProcessError(codigo, comando)
+            resultado = "ok"
+        except BaseException:
+            if proceso is not None and proceso.poll() is None:
+                # El callback ha cortado la transcodificación: no se deja el proceso huérfano
+                proceso.kill()
+                proceso.wait()
+                resultado = "cancelado"
+            raise
+        finally:
+            self.liberar(inicio, resultado)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "max_paralelo":    self.max_paralelo,
+                "max_cola":        self.max_cola,
+                "hilos":           self.hilos,
+                "en_curso":        self.en_curso,
+                "en_cola":         self.en_cola,
+                "rechazados":      self.rechazados,
+                **self.resultados,
+                "segundos_ffmpeg": round(self.segundos_ffmpeg, 3),
+                "segundos_espera": round(self.segundos_espera, 3),
+            }
+
+
+def ejecutor_desde_entorno() -> EjecutorFfmpeg:
+    """FFMPEG_MAX_PARALELO, FFMPEG_MAX_COLA, FFMPEG_ESPERA_MAX, FFMPEG_TIMEOUT y FFMPEG_HILOS."""
+    max_paralelo = int(os.environ.get("FFMPEG_MAX_PARALELO", os.cpu_count() or 2))
+    return EjecutorFfmpeg(
+        max_paralelo,
+        max_cola=int(os.environ.get("FFMPEG_MAX_COLA", 4 * max_paralelo)),
+        espera_max=float(os.environ.get("FFMPEG_ESPERA_MAX", 120)),
+        timeout=float(os.environ.get("FFMPEG_TIMEOUT", 1800)) or None,
+        hilos=int(os.environ.get("FFMPEG_HILOS", 0)) or None,
+    )
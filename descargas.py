@@ -0,0 +1,215 @@
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from arranque import ModuloDiferido
+
+# Se importa al crear la primera instancia (ver arranque.py)
+yt_dlp = ModuloDiferido("yt_dlp")
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# POOL DE INSTANCIAS DE YOUTUBEDL
+# Crear un YoutubeDL por petición repite la carga de extractores, el banner
+# de depuración, la lectura de cookies y, sobre todo, la descarga y el
+# análisis del player JS de YouTube para el n-challenge, que el extractor
+# solo guarda en memoria de su propia instancia. Aquí cada instancia se
+# presta a un único hilo a la vez y se devuelve al terminar, así que el
+# extractor de YouTube conserva sus cachés entre descargas. Además:
+#   - todas las instancias comparten el mismo cookie jar (thread-safe);
+#   - las cachés de player JS del extractor se comparten entre instancias;
+#   - el tamaño del pool limita las descargas simultáneas del proceso.
+# outtmpl y el hook de progreso se fijan en cada préstamo.
+#
+# Una instancia retirada deja un hueco (_HUECO) en la cola de libres: quien
+# estaba esperando lo recoge y crea la sustituta, así nadie se queda
+# esperando a una instancia que ya no va a volver.
+# ---------------------------------------------------------------------------
+
+_HUECO = object()
+
+
+class PoolOcupado(Exception):
+    """No se liberó ninguna instancia en `timeout` segundos."""
+
+
+class PoolYoutubeDL:
+
+    def __init__(self, opciones: dict, tamano: int = 4, max_usos: int = 200,
+                 timeout: Optional[float] = 600.0):
+        self.opciones = opciones
+        self.tamano = tamano
+        self.max_usos = max_usos
+        self.timeout = timeout
+        self._libres: queue.LifoQueue = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._creadas = 0
+        self._usos: dict[int, int] = {}
+        self._progreso: dict[int, Optional[Callable[[dict], None]]] = {}
+        self._cookiejar = None
+        # Compartidas por los extractores de YouTube de todas las instancias
+        self._cache_codigo: dict = {}
+        self._cache_player: dict = {}
+        self.prestamos = 0
+        self.esperas = 0
+
+    def _crear(self) -> "yt_dlp.YoutubeDL":
+        # Sin la cabecera de depuración: con verbose, imprimirla crea el
+        # request director, y sus handlers se quedarían con el jar propio
+        ydl = yt_dlp.YoutubeDL(dict(self.opciones), auto_init="no_verbose_header")
+        clave = id(ydl)
+        self._usos[clave] = 0
+        self._progreso[clave] = None
+        ydl.add_progress_hook(lambda d: (hook := self._progreso.get(clave)) and hook(d))
+
+        # cookiejar es un cached_property de YoutubeDL: sustituirlo antes del
+        # primer uso hace que todas las instancias usen el mismo jar
+        with self._lock:
+            if self._cookiejar is None:
+                self._cookiejar = ydl.cookiejar
+            else:
+                ydl.__dict__["cookiejar"] = self._cookiejar
+        # Por si algo del __init__ ya creó el director: se rehace con el jar compartido
+        if (director := ydl.__dict__.pop("_request_director", None)) is not None:
+            director.close()
+        ydl.print_debug_header()   # no hace nada sin verbose
+
+        ie = ydl.get_info_extractor("Youtube")
+        if hasattr(ie, "_code_cache") and hasattr(ie, "_player_cache"):
+            ie._code_cache = self._cache_codigo
+            ie._player_cache = self._cache_player
+        return ydl
+
+    def _descartar(self, ydl: "yt_dlp.YoutubeDL") -> None:
+        clave = id(ydl)
+        with self._lock:
+            self._creadas -= 1
+            self._usos.pop(clave, None)
+            self._progreso.pop(clave, None)
+        try:
+            ydl.close()
+        except Exception as e:
+            log.warning("Error cerrando una instancia de YoutubeDL: %s", e)
+
+    def _retirar(self, ydl: "yt_dlp.YoutubeDL") -> None:
+        self._descartar(ydl)
+        # Despierta a quien espere: creará la sustituta
+        self._libres.put(_HUECO)
+
+    def _reservar(self) -> bool:
+        with self._lock:
+            if self._creadas < self.tamano:
+                self._creadas += 1
+                return True
+        return False
+
+    def _crear_reservada(self) -> "yt_dlp.YoutubeDL":
+        try:
+            return self._crear()
+        except BaseException:
+            with self._lock:
+                self._creadas -= 1
+            # El hueco sigue libre para el siguiente
+            self._libres.put(_HUECO)
+            raise
+
+    def _obtener(self) -> "yt_dlp.YoutubeDL":
+        limite = None if self.timeout is None else time.monotonic() + self.timeout
+        espero = False
+        while True:
+            try:
+                ydl = self._libres.get_nowait()
+            except queue.Empty:
+                if self._reservar():
+                    return self._crear_reservada()
+                if not espero:
+                    espero = True
+                    with self._lock:
+                        self.esperas += 1
+                # Todas prestadas: se espera a que se libere una (o su hueco)
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    raise PoolOcupado(f"Ninguna instancia de YoutubeDL libre tras {self.timeout:.0f} s")
+                try:
+                    ydl = self._libres.get(timeout=restante)
+                except queue.Empty:
+                    continue
+            if ydl is not _HUECO:
+                return ydl
+            if self._reservar():
+                return self._crear_reservada()
+
+    @contextmanager
+    def prestar(self, outtmpl: Optional[str] = None,
+                progreso: Optional[Callable[[dict], None]] = None):
+        """
+        Presta una instancia con `outtmpl` y `progreso` (progress hook) para
+        esta descarga. Si sale una excepción que no sea DownloadError, la
+        instancia se descarta por si ha quedado en un estado inconsistente.
+        """
+        ydl = self._obtener()
+        clave = id(ydl)
+        if outtmpl is not None:
+            ydl.params["outtmpl"] = {"default": outtmpl}
+            ydl._parse_outtmpl()
+        self._progreso[clave] = progreso
+        descartar = False
+        try:
+            yield ydl
+        except yt_dlp.utils.DownloadError:
+            raise
+        except BaseException:
+            descartar = True
+            raise
+        finally:
+            self._progreso[clave] = None
+            with self._lock:
+                self.prestamos += 1
+                self._usos[clave] = self._usos.get(clave, 0) + 1
+                agotada = self._usos[clave] >= self.max_usos
+            if descartar or agotada:
+                self._retirar(ydl)
+            else:
+                self._libres.put(ydl)
+
+    def calentar(self) -> None:
+        """Crea todas las instancias por adelantado (extractores y plugins ya cargados)."""
+        nuevas = []
+        while True:
+            with self._lock:
+                if self._creadas >= self.tamano:
+                    break
+                self._creadas += 1
+            try:
+                nuevas.append(self._crear())
+            except Exception as e:
+                with self._lock:
+                    self._creadas -= 1
+                log.warning("No se pudo precalentar YoutubeDL: %s", e)
+                break
+        for ydl in nuevas:
+            self._libres.put(ydl)
+        log.info("Pool de YoutubeDL listo: %d instancias.", self._creadas)
+
+    def cerrar(self) -> None:
+        while True:
+            try:
+                ydl = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            if ydl is not _HUECO:
+                self._descartar(ydl)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "tamano":    self.tamano,
+                "creadas":   self._creadas,
+                "libres":    sum(1 for ydl in list(self._libres.queue) if ydl is not _HUECO),
+                "prestamos": self.prestamos,
+                "esperas":   self.esperas,
+            }
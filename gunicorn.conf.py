@@ -0,0 +1,99 @@
+import os
+
+# ---------------------------------------------------------------------------
+# GUNICORN (PRODUCCIÓN)
+# `gunicorn -c gunicorn.conf.py` (el CMD del Dockerfile). Workers y hilos
+# salen del número de CPUs disponibles; cada valor se puede forzar con su
+# variable GUNICORN_*. Por defecto cada worker importa la app al arrancar
+# y carga groq y yt_dlp en segundo plano (ver arranque.py), con el puerto ya
+# sirviendo, para que un arranque en frío (escalar desde cero) responda
+# cuanto antes. GUNICORN_CARGA_TEMPRANA=1 precarga la app en el máster y
+# le hace importar también groq, yt_dlp y los plugins de PO token: los
+# workers los heredan con el fork (copy-on-write), con menos memoria por
+# worker y el primer byte más tarde.
+# ---------------------------------------------------------------------------
+
+def _cpus() -> int:
+    # Respeta el cpuset del contenedor, que os.cpu_count() ignora
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+CPUS = _cpus()
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', 7860)}")
+
+# El pipeline espera casi siempre a la red (YouTube, Groq): pocos procesos
+# con muchos hilos. ffmpeg son procesos aparte y no cuentan aquí. Cada
+# worker lleva su pool de YoutubeDL y sus cachés en memoria, así que no se
+# pasa de 8 aunque haya más núcleos.
+workers = int(os.environ.get("GUNICORN_WORKERS", max(2, min(CPUS + 1, 8))))
+worker_class = "gthread"
+# Un cliente SSE (/jobs/<id>/eventos) o un /transformar síncrono ocupan un
+# hilo durante todo el pipeline
+threads = int(os.environ.get("GUNICORN_THREADS", min(32, max(8, 4 * CPUS))))
+
+# Con GUNICORN_ASGI=1 se sirve asgi.py con workers de uvicorn (ver asgi.py):
+# /transformar y los SSE no ocupan hilos mientras esperan. El worker está en
+# el paquete uvicorn-worker; uvicorn.workers está obsoleto
+if os.environ.get("GUNICORN_ASGI", "0") != "0":
+    wsgi_app = "asgi:app"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "app:app"
+
+# Sin carga temprana, precargar solo ahorra a cada worker importar flask y
+# la app, y a cambio el máster abre los backends (SQLite de jobs y cachés)
+# antes del fork y no los vuelve a abrir para el worker que sustituye a uno
+# caído. Por eso la precarga va con la carga temprana salvo que
+# GUNICORN_PRELOAD diga otra cosa.
+_carga_temprana = os.environ.get("GUNICORN_CARGA_TEMPRANA", "0") != "0"
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1" if _carga_temprana else "0") != "0"
+carga_temprana = preload_app and _carga_temprana
+
+# En gthread el latido lo da el hilo principal aunque una petición tarde
+# minutos, así que `timeout` solo mata workers colgados de verdad. Al
+# reiniciar o escalar, graceful_timeout deja terminar los pipelines en
+# curso (descarga + Whisper + pack de un vídeo largo).
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 600))
+# Detrás del proxy de la plataforma: conexiones reutilizadas algo más que
+# su timeout de inactividad
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 75))
+# Latido en memoria: /tmp del contenedor puede ser disco lento
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+accesslog = os.environ.get("GUNICORN_ACCESSLOG") or None
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOGLEVEL", "info")
+
+# Ajustes de la app que dependen de que haya varios workers. Se fijan antes
+# de importarla y solo si no vienen ya en el entorno:
+#  - Los jobs se consultan desde cualquier worker: backend compartido.
+#  - ffmpeg: los núcleos se reparten entre workers en lugar de que cada uno
+#    lance tantos procesos como CPUs.
+if workers > 1:
+    os.environ.setdefault("JOBS_BACKEND", "sqlite")
+os.environ.setdefault("FFMPEG_MAX_PARALELO", str(max(1, CPUS // workers)))
+# El calentamiento lo lanza post_fork en cada worker, no el import de app
+os.environ["CALENTAMIENTO_EXTERNO"] = "1"
+
+
+def when_ready(server):
+    # Aún en el máster, antes de crear los workers: los plugins de yt-dlp
+    # se cargan al crear el primer YoutubeDL; así lo heredan ya cargado
+    if carga_temprana:
+        import app
+        app.groq.cargar()
+        app.yt_dlp.cargar()
+        from yt_dlp.plugins import load_all_plugins
+        load_all_plugins()
+
+
+def post_fork(server, worker):
+    # Los hilos del máster no sobreviven al fork: cada worker calienta el
+    # suyo (con carga temprana, solo queda crear el pool de YoutubeDL)
+    from app import calentar_en_segundo_plano
+    calentar_en_segundo_plano()
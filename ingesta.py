@@ -0,0 +1,290 @@
+import hashlib
+import logging
+import os
+import subprocess
+import threading
+import uuid
+from dataclasses import dataclass, field
+from typing import IO, Optional
+
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+from compresion import ColaFfmpegLlena, EjecutorFfmpeg, PerfilCompresion
+from metricas import registrar_compresion
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# INGESTA EN STREAMING DE SUBIDAS
+# Lee el cuerpo multipart según llega y envía los bytes del archivo directamente
+# al stdin de ffmpeg, que escribe el audio comprimido en un único temporal.
+# Se ahorra guardar el original en /tmp y volver a leerlo, y la compresión
+# avanza a la vez que la subida. El SHA-256 para la caché se calcula en la
+# misma pasada.
+#
+# Los contenedores MP4/M4A suelen llevar el índice (moov) al final y ffmpeg
+# no puede decodificarlos desde un pipe; esos se escriben a disco como antes.
+# ---------------------------------------------------------------------------
+
+EXTENSIONES_NO_STREAMING = {'mp4', 'm4a'}
+
+
+class ErrorIngesta(Exception):
+    """Error de la subida con mensaje para el usuario y código HTTP."""
+
+    def __init__(self, mensaje: str, status: int = 400):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.status = status
+
+
+@dataclass
+class Subida:
+    campos: dict = field(default_factory=dict)
+    nombre_archivo: Optional[str] = None
+    ruta: Optional[str] = None
+    comprimido: bool = False      # True si `ruta` ya es la salida de ffmpeg
+    clave_cache: Optional[str] = None
+    bytes_recibidos: int = 0
+
+
+class _DestinoFfmpeg:
+    """
+    Escribe en el stdin de un proceso ffmpeg y recoge su stderr en un hilo.
+    Con `ejecutor`, el proceso ocupa uno de sus huecos hasta cerrar o abortar
+    (ColaFfmpegLlena si no lo consigue).
+    """
+
+    def __init__(self, perfil: PerfilCompresion, directorio: str,
+                 ejecutor: Optional[EjecutorFfmpeg] = None):
+        self.ruta = os.path.join(directorio, f"{uuid.uuid4()}_lite.{perfil.extension}")
+        self._ejecutor = ejecutor
+        self._inicio = ejecutor.adquirir() if ejecutor else None
+        try:
+            self._proceso = subprocess.Popen(
+                ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+                 *perfil.argumentos(), *(ejecutor.argumentos_hilos() if ejecutor else []), self.ruta],
+                stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            )
+        except BaseException:
+            self._liberar("error")
+            raise
+        self._stderr = b""
+        self._lector = threading.Thread(target=self._leer_stderr, daemon=True)
+        self._lector.start()
+
+    def _leer_stderr(self) -> None:
+        self._stderr = self._proceso.stderr.read()
+
+    def _liberar(self, resultado: str) -> None:
+        if self._ejecutor and self._inicio is not None:
+            self._ejecutor.liberar(self._inicio, resultado)
+            self._inicio = None
+
+    def write(self, datos: bytes) -> None:
+        try:
+            self._proceso.stdin.write(datos)
+        except BrokenPipeError:
+            # ffmpeg ha terminado antes de tiempo; el error se informa en cerrar()
+            pass
+
+    def cerrar(self) -> None:
+        try:
+            self._proceso.stdin.close()
+        except BrokenPipeError:
+            pass
+        codigo = self._proceso.wait()
+        self._lector.join()
+        self._liberar("ok" if codigo == 0 else "error")
+        if codigo != 0:
+            log.error("ffmpeg (streaming) terminó con código %d: %s",
+                      codigo, self._stderr.decode(errors="replace").strip())
+            raise ErrorIngesta("No se pudo procesar el audio subido.", 400)
+
+    def abortar(self) -> None:
+        self._proceso.kill()
+        self._proceso.wait()
+        self._liberar("cancelado")
+
+
+class _DestinoArchivo:
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._archivo: IO[bytes] = open(ruta, "wb")
+
+    def write(self, datos: bytes) -> None:
+        self._archivo.write(datos)
+
+    def cerrar(self) -> None:
+        self._archivo.close()
+
+    def abortar(self) -> None:
+        self._archivo.close()
+
+
+def recibir_subida(stream: IO[bytes], boundary: bytes, campo_archivo: str,
+                   extensiones_permitidas: set[str], perfil: PerfilCompresion,
+                   directorio: str = "/tmp", tam_bloque: int = 64 * 1024,
+                   max_campo: int = 64 * 1024, ejecutor: Optional[EjecutorFfmpeg] = None) -> Subida:
+    """
+    Consume el cuerpo multipart completo. Los campos de texto se devuelven en
+    `campos`; el archivo `campo_archivo` se comprime al vuelo con el
+    `perfil` de compresión (o se guarda tal cual si su formato no admite pipe).
+    Si algo falla, elimina lo que haya escrito y relanza.
+    """
+    subida = Subida()
+    # Werkzeug aplica el límite a todo su buffer, datos del archivo incluidos
+    # (lo que quedó del bloque anterior más el nuevo); el tamaño de los campos
+    # de texto ya se controla abajo con max_campo
+    decoder = MultipartDecoder(boundary, max_form_memory_size=tam_bloque + max_campo)
+    sha = hashlib.sha256()
+    destino = None
+    parte_actual = None
+    es_archivo = False
+    buffer_campo: list[bytes] = []
+
+    try:
+        while True:
+            bloque = stream.read(tam_bloque)
+            decoder.receive_data(bloque or None)
+            evento = decoder.next_event()
+
+            while not isinstance(evento, (Epilogue, NeedData)):
+                if isinstance(evento, File) and evento.name == campo_archivo and destino is None:
+                    parte_actual = evento
+                    es_archivo = True
+                    destino = _abrir_destino(evento.filename, extensiones_permitidas,
+                                             perfil, directorio, subida, ejecutor)
+                elif isinstance(evento, (Field, File)):
+                    # Campos de texto (o archivos extra, que se ignoran)
+                    parte_actual = evento
+                    es_archivo = False
+                    buffer_campo = []
+                elif isinstance(evento, Data):
+                    if es_archivo:
+                        sha.update(evento.data)
+                        subida.bytes_recibidos += len(evento.data)
+                        destino.write(evento.data)
+                    elif isinstance(parte_actual, Field) and not isinstance(parte_actual, File):
+                        buffer_campo.append(evento.data)
+                        if sum(map(len, buffer_campo)) > max_campo:
+                            raise ErrorIngesta(f"El campo {parte_actual.name} es demasiado grande.", 413)
+                        if not evento.more_data:
+                            subida.campos[parte_actual.name] = b"".join(buffer_campo).decode("utf-8", "replace")
+                evento = decoder.next_event()
+
+            if not bloque:
+                break
+
+        if destino is None:
+            raise ErrorIngesta("No hay archivo en la petición.", 400)
+
+        destino.cerrar()
+        subida.ruta = destino.ruta
+        subida.clave_cache = f"sha256:{sha.hexdigest()}"
+        if subida.comprimido:
+            registrar_compresion(subida.bytes_recibidos, os.path.getsize(destino.ruta))
+        log.info("Subida recibida: %s (%d bytes, %s) → %s",
+                 subida.nombre_archivo, subida.bytes_recibidos,
+                 "comprimida al vuelo" if subida.comprimido else "guardada", subida.ruta)
+        return subida
+
+    except BaseException:
+        if destino is not None:
+            destino.abortar()
+            if os.path.exists(destino.ruta):
+                os.remove(destino.ruta)
+        raise
+
+
+def _abrir_destino(nombre_archivo: Optional[str], extensiones_permitidas: set[str],
+                   perfil: PerfilCompresion, directorio: str, subida: Subida,
+                   ejecutor: Optional[EjecutorFfmpeg] = None):
+    if not nombre_archivo:
+        raise ErrorIngesta("Nombre de archivo vacío.", 400)
+
+    ext = nombre_archivo.rsplit('.', 1)[1].lower() if '.' in nombre_archivo else ''
+    if ext not in extensiones_permitidas:
+        raise ErrorIngesta(
+            f"Tipo de archivo no permitido. Formatos válidos: {', '.join(extensiones_permitidas)}", 400)
+
+    subida.nombre_archivo = nombre_archivo
+    if ext in EXTENSIONES_NO_STREAMING:
+        return _DestinoArchivo(os.path.join(directorio, f"{uuid.uuid4()}.{ext}"))
+
+    try:
+        destino = _DestinoFfmpeg(perfil, directorio, ejecutor)
+    except ColaFfmpegLlena as e:
+        log.warning("Subida rechazada, ffmpeg saturado: %s", e)
+        raise ErrorIngesta("Servidor ocupado. Inténtalo en unos minutos.", 503) from e
+    except FileNotFoundError:
+        # Igual que comprimir_audio: sin ffmpeg se trabaja con el original
+        log.error("ffmpeg no está instalado o no está en el PATH.")
+        return _DestinoArchivo(os.path.join(directorio, f"{uuid.uuid4()}.{ext}"))
+
+    subida.comprimido = True
+    return destino
+
+
+# ---------------------------------------------------------------------------
+# DESCARGA EN STREAMING HACIA EL COMPRESOR
+# Lee el formato de audio elegido por yt-dlp y lo envía a ffmpeg según llega,
+# así descarga y transcodificación se solapan y el original no toca disco.
+# `abrir(url, headers)` debe devolver una respuesta con .read(), .status y
+# .headers; en app.py es ydl.urlopen, que respeta cookies, proxy e IPv4.
+# ---------------------------------------------------------------------------
+
+def _total_content_range(cabecera: Optional[str]) -> Optional[int]:
+    """Extrae el tamaño total de 'bytes 0-999/12345'."""
+    if not cabecera or "/" not in cabecera:
+        return None
+    total = cabecera.rsplit("/", 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def comprimir_desde_url(abrir, url: str, headers: dict, perfil: PerfilCompresion,
+                        directorio: str = "/tmp", tam_rango: Optional[int] = None,
+                        informar=None, tam_bloque: int = 64 * 1024,
+                        ejecutor: Optional[EjecutorFfmpeg] = None) -> str:
+    """
+    Descarga `url` (por rangos de `tam_rango` bytes si se indica, como hace
+    yt-dlp con YouTube para evitar el throttling) y la comprime al vuelo.
+    Devuelve la ruta del audio comprimido. Si algo falla, no deja temporales.
+    """
+    destino = _DestinoFfmpeg(perfil, directorio, ejecutor)
+    inicio = 0
+    total = None
+
+    try:
+        while total is None or inicio < total:
+            cabeceras = dict(headers)
+            if tam_rango:
+                cabeceras["Range"] = f"bytes={inicio}-{inicio + tam_rango - 1}"
+            respuesta = abrir(url, cabeceras)
+
+            leidos = 0
+            while bloque := respuesta.read(tam_bloque):
+                destino.write(bloque)
+                leidos += len(bloque)
+                if informar:
+                    informar("descarga", bytes_descargados=inicio + leidos, bytes_totales=total)
+            inicio += leidos
+
+            # Sin rangos, o si el servidor los ignora (200), ya está todo
+            if not tam_rango or respuesta.status == 200 or leidos == 0:
+                break
+            total = total or _total_content_range(respuesta.headers.get("Content-Range"))
+            if total is None and leidos < tam_rango:
+                break
+
+        destino.cerrar()
+        registrar_compresion(inicio, os.path.getsize(destino.ruta))
+        log.info("Audio descargado y comprimido en streaming: %d bytes → %s", inicio, destino.ruta)
+        return destino.ruta
+
+    except BaseException:
+        destino.abortar()
+        if os.path.exists(destino.ruta):
+            os.remove(destino.ruta)
+        raise
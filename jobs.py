@@ -0,0 +1,465 @@
+import abc
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Optional
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# ESTADOS DE UN JOB
+# ---------------------------------------------------------------------------
+ESTADO_EN_COLA    = "en_cola"
+ESTADO_EN_PROCESO = "en_proceso"
+ESTADO_COMPLETADO = "completado"
+ESTADO_ERROR      = "error"
+
+ESTADOS_FINALES = {ESTADO_COMPLETADO, ESTADO_ERROR}
+
+MENSAJE_HUERFANO = "El proceso que ejecutaba el job se detuvo antes de terminarlo."
+
+
+class ColaLlena(Exception):
+    """Se lanza cuando la cola tiene demasiados jobs pendientes (backpressure)."""
+
+
+class JobCancelado(Exception):
+    """La lanza `informar` cuando el job se ha cancelado, para cortar el pipeline."""
+
+    def __init__(self):
+        super().__init__("Job cancelado por el cliente.")
+        self.mensaje = "Job cancelado por el cliente."
+        self.status = 499
+
+
+@dataclass
+class Job:
+    id: str
+    tipo: str
+    estado: str = ESTADO_EN_COLA
+    etapa: Optional[str] = None
+    progreso: dict = field(default_factory=dict)
+    parcial: dict = field(default_factory=dict)   # resultados adelantados (p. ej. la transcripción)
+    resultado: Optional[dict] = None
+    error: Optional[str] = None
+    status_error: Optional[int] = None
+    creado: float = field(default_factory=time.time)
+    actualizado: float = field(default_factory=time.time)
+    propietario: Optional[str] = None   # proceso que lo ejecuta (identidad_proceso)
+
+    def a_dict(self, incluir_resultado: bool = False) -> dict:
+        datos = asdict(self)
+        datos.pop("propietario")
+        if not incluir_resultado:
+            datos.pop("resultado")
+        datos["job_id"] = datos.pop("id")
+        return datos
+
+
+# ---------------------------------------------------------------------------
+# PROPIETARIO DE UN JOB
+# "host:pid:arranque", con el arranque del proceso en ticks según /proc para
+# no confundir un worker muerto con otro que haya heredado su PID. Fuera de
+# Linux queda "host:pid".
+# ---------------------------------------------------------------------------
+
+def _arranque_proceso(pid: int) -> Optional[str]:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # El nombre del ejecutable va entre paréntesis y puede tener espacios
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def identidad_proceso() -> str:
+    pid = os.getpid()
+    arranque = _arranque_proceso(pid)
+    return f"{socket.gethostname()}:{pid}" + (f":{arranque}" if arranque else "")
+
+
+def proceso_vivo(propietario: str) -> bool:
+    """
+    Si el proceso `propietario` sigue vivo. Los de otra máquina (SQLite en un
+    volumen compartido) no se pueden comprobar y se dan por vivos.
+    """
+    host, _, resto = propietario.partition(":")
+    pid, _, arranque = resto.partition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    if arranque:
+        return _arranque_proceso(int(pid)) == arranque
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# ---------------------------------------------------------------------------
+# BACKENDS DE ALMACENAMIENTO
+# El backend solo guarda el estado; la ejecución siempre ocurre en el pool
+# de hilos de ColaJobs. Con SQLite, cualquier worker de gunicorn puede
+# responder al polling de un job lanzado por otro worker.
+# ---------------------------------------------------------------------------
+
+class BackendJobs(abc.ABC):
+
+    @abc.abstractmethod
+    def guardar(self, job: Job) -> None:
+        ...
+
+    @abc.abstractmethod
+    def obtener(self, job_id: str) -> Optional[Job]:
+        ...
+
+    @abc.abstractmethod
+    def actualizar(self, job_id: str, **campos: Any) -> None:
+        ...
+
+    @abc.abstractmethod
+    def purgar(self, max_edad: float) -> int:
+        """Elimina jobs terminados más antiguos que max_edad segundos."""
+
+
+class BackendMemoria(BackendJobs):
+    """Backend en proceso. Rápido, pero el estado no se comparte entre workers."""
+
+    def __init__(self):
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def guardar(self, job: Job) -> None:
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def obtener(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            # Copia para que el llamante no vea mutaciones a medias
+            return Job(**asdict(job)) if job else None
+
+    def actualizar(self, job_id: str, **campos: Any) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            for nombre, valor in campos.items():
+                setattr(job, nombre, valor)
+            job.actualizado = time.time()
+
+    def purgar(self, max_edad: float) -> int:
+        limite = time.time() - max_edad
+        with self._lock:
+            viejos = [
+                job_id for job_id, job in self._jobs.items()
+                if job.estado in ESTADOS_FINALES and job.actualizado < limite
+            ]
+            for job_id in viejos:
+                del self._jobs[job_id]
+        return len(viejos)
+
+
+class BackendSQLite(BackendJobs):
+    """
+    Backend persistente en un fichero SQLite local. Los campos dict se
+    serializan como JSON. Se abre una conexión por operación para poder
+    usarlo desde cualquier hilo o proceso sin compartir conexiones.
+
+    Marca como error los jobs sin terminar cuyo proceso ya no existe (un
+    worker que murió o un reinicio del contenedor): si no, el cliente los
+    vería en cola o en proceso para siempre. Se revisan todos al abrirlo y
+    al purgar, y cada job al leerlo: con preload_app el backend se abre una
+    sola vez en el máster de gunicorn y un worker que lo sustituye no
+    vuelve a abrirlo.
+    """
+
+    _CAMPOS_JSON = {"progreso", "parcial", "resultado"}
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id           TEXT PRIMARY KEY,
+                    tipo         TEXT NOT NULL,
+                    estado       TEXT NOT NULL,
+                    etapa        TEXT,
+                    progreso     TEXT,
+                    parcial      TEXT,
+                    resultado    TEXT,
+                    error        TEXT,
+                    status_error INTEGER,
+                    creado       REAL NOT NULL,
+                    actualizado  REAL NOT NULL,
+                    propietario  TEXT
+                )
+            """)
+            # Migración de ficheros creados antes de existir estas columnas
+            columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(jobs)")}
+            for columna in ("parcial", "propietario"):
+                if columna not in columnas:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {columna} TEXT")
+        self.marcar_huerfanos()
+
+    def marcar_huerfanos(self) -> int:
+        """Pasa a error los jobs sin terminar de procesos muertos. Devuelve cuántos."""
+        with self._conectar() as conn:
+            pendientes = conn.execute(
+                "SELECT id, propietario FROM jobs WHERE estado IN (?, ?)",
+                (ESTADO_EN_COLA, ESTADO_EN_PROCESO)
+            ).fetchall()
+            huerfanos = [job_id for job_id, propietario in pendientes if self._huerfano(propietario)]
+            self._marcar(conn, huerfanos)
+        if huerfanos:
+            log.warning("%d jobs huérfanos marcados como error.", len(huerfanos))
+        return len(huerfanos)
+
+    @staticmethod
+    def _huerfano(propietario: Optional[str]) -> bool:
+        # Los de antes de existir `propietario` no pueden seguir en marcha
+        return not propietario or not proceso_vivo(propietario)
+
+    @staticmethod
+    def _marcar(conn: sqlite3.Connection, huerfanos: list[str]) -> None:
+        # Solo si siguen sin terminar: el job pudo acabar entre la lectura y esto
+        conn.executemany(
+            "UPDATE jobs SET estado = ?, error = ?, status_error = ?, actualizado = ? "
+            "WHERE id = ? AND estado IN (?, ?)",
+            [(ESTADO_ERROR, MENSAJE_HUERFANO, 500, time.time(), job_id, ESTADO_EN_COLA, ESTADO_EN_PROCESO)
+             for job_id in huerfanos]
+        )
+
+    def _conectar(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.ruta, timeout=30)
+
+    def _serializar(self, nombre: str, valor: Any) -> Any:
+        return json.dumps(valor) if nombre in self._CAMPOS_JSON else valor
+
+    def guardar(self, job: Job) -> None:
+        datos = asdict(job)
+        columnas = ", ".join(datos)
+        huecos = ", ".join("?" for _ in datos)
+        valores = [self._serializar(k, v) for k, v in datos.items()]
+        with self._conectar() as conn:
+            conn.execute(f"INSERT OR REPLACE INTO jobs ({columnas}) VALUES ({huecos})", valores)
+
+    def obtener(self, job_id: str) -> Optional[Job]:
+        with self._conectar() as conn:
+            conn.row_factory = sqlite3.Row
+            fila = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if fila is None:
+            return None
+        datos = dict(fila)
+        for nombre in self._CAMPOS_JSON:
+            datos[nombre] = json.loads(datos[nombre]) if datos[nombre] is not None else None
+        datos["progreso"] = datos["progreso"] or {}
+        datos["parcial"] = datos["parcial"] or {}
+        job = Job(**datos)
+        if job.estado in (ESTADO_EN_COLA, ESTADO_EN_PROCESO) and self._huerfano(job.propietario):
+            with self._conectar() as conn:
+                self._marcar(conn, [job.id])
+            log.warning("Job %s huérfano (%s) marcado como error.", job.id, job.propietario)
+            return self.obtener(job_id)
+        return job
+
+    def actualizar(self, job_id: str, **campos: Any) -> None:
+        campos["actualizado"] = time.time()
+        asignaciones = ", ".join(f"{nombre} = ?" for nombre in campos)
+        valores = [self._serializar(k, v) for k, v in campos.items()]
+        with self._conectar() as conn:
+            conn.execute(f"UPDATE jobs SET {asignaciones} WHERE id = ?", [*valores, job_id])
+
+    def purgar(self, max_edad: float) -> int:
+        self.marcar_huerfanos()
+        limite = time.time() - max_edad
+        with self._conectar() as conn:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE estado IN (?, ?) AND actualizado < ?",
+                (ESTADO_COMPLETADO, ESTADO_ERROR, limite)
+            )
+            return cursor.rowcount
+
+
+# ---------------------------------------------------------------------------
+# COLA Y POOL DE WORKERS
+# ---------------------------------------------------------------------------
+
+class ColaJobs:
+    """
+    Encola funciones del pipeline y las ejecuta en un pool acotado de hilos.
+    La función recibe un callback `informar(etapa, **datos)` como argumento
+    con nombre para publicar el progreso; `parcial={...}` entre los datos se
+    guarda aparte como resultado adelantado. Si devuelve un dict, se guarda como
+    resultado; si lanza una excepción con atributos `mensaje` y `status`
+    (como ErrorPipeline en app.py), se guardan tal cual para el cliente.
+
+    Un job de este proceso se puede cancelar: la siguiente llamada a
+    `informar` lanza JobCancelado, y quien tenga un subproceso en marcha
+    (ffmpeg) lo mata al ver pasar la excepción.
+    """
+
+    def __init__(self, backend: BackendJobs, max_workers: int = 2,
+                 max_pendientes: int = 20, ttl_jobs: float = 3600):
+        self.backend = backend
+        self.max_workers = max_workers
+        self.max_pendientes = max_pendientes
+        self.ttl_jobs = ttl_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._activos = 0
+        self._cancelaciones: dict[str, threading.Event] = {}
+        self._cancelaciones_diferidas: dict[str, threading.Timer] = {}
+
+    @property
+    def activos(self) -> int:
+        """Jobs de este proceso en cola o en ejecución."""
+        return self._activos
+
+    def encolar(self, tipo: str, funcion: Callable[..., dict], *args: Any) -> str:
+        with self._lock:
+            if self._activos >= self.max_workers + self.max_pendientes:
+                raise ColaLlena(f"Hay {self._activos} jobs pendientes; inténtalo más tarde.")
+            self._activos += 1
+
+        try:
+            self.backend.purgar(self.ttl_jobs)
+        except Exception as e:
+            log.warning("No se pudieron purgar jobs antiguos: %s", e)
+
+        job = Job(id=uuid.uuid4().hex, tipo=tipo, propietario=identidad_proceso())
+        guardado = False
+        try:
+            self.backend.guardar(job)
+            guardado = True
+            with self._lock:
+                self._cancelaciones[job.id] = threading.Event()
+            self._executor.submit(self._ejecutar, job.id, funcion, args)
+        except BaseException:
+            # El hueco reservado arriba se devuelve: el job no llegó a arrancar
+            with self._lock:
+                self._activos -= 1
+                self._cancelaciones.pop(job.id, None)
+            if guardado:
+                try:
+                    self.backend.actualizar(job.id, estado=ESTADO_ERROR,
+                                            error="Error interno del servidor.", status_error=500)
+                except Exception as e:
+                    log.warning("No se pudo marcar el job %s como fallido: %s", job.id, e)
+            raise
+        log.info("Job %s (%s) encolado. Activos: %d", job.id, tipo, self._activos)
+        return job.id
+
+    def obtener(self, job_id: str) -> Optional[Job]:
+        return self.backend.obtener(job_id)
+
+    def cancelar(self, job_id: str, gracia: float = 0.0) -> bool:
+        """
+        Cancela un job de este proceso que no haya terminado. Con `gracia`, la
+        cancelación espera ese tiempo y se anula si alguien llama a mantener()
+        (el cliente vuelve a consultar el job). Devuelve False si el job no
+        está en este proceso o ya ha terminado.
+        """
+        with self._lock:
+            evento = self._cancelaciones.get(job_id)
+            if evento is None:
+                return False
+            if gracia <= 0:
+                evento.set()
+                return True
+            if job_id not in self._cancelaciones_diferidas:
+                temporizador = threading.Timer(gracia, self._cancelar_diferido, (job_id,))
+                temporizador.daemon = True
+                self._cancelaciones_diferidas[job_id] = temporizador
+                temporizador.start()
+            return True
+
+    def _cancelar_diferido(self, job_id: str) -> None:
+        with self._lock:
+            if self._cancelaciones_diferidas.pop(job_id, None) is None:
+                return
+            if evento := self._cancelaciones.get(job_id):
+                log.info("Job %s cancelado: el cliente se desconectó.", job_id)
+                evento.set()
+
+    def mantener(self, job_id: str) -> None:
+        """Anula una cancelación diferida pendiente del job."""
+        with self._lock:
+            if temporizador := self._cancelaciones_diferidas.pop(job_id, None):
+                temporizador.cancel()
+
+    def _ejecutar(self, job_id: str, funcion: Callable[..., dict], args: tuple) -> None:
+        progreso: dict = {}
+        parcial: dict = {}
+        etapa_actual = [None]
+        cancelado = self._cancelaciones[job_id]
+
+        def informar(etapa: str, **datos: Any) -> None:
+            if cancelado.is_set():
+                raise JobCancelado()
+            campos: dict = {"etapa": etapa}
+            if nuevos_parciales := datos.pop("parcial", None):
+                parcial.update(nuevos_parciales)
+                campos["parcial"] = dict(parcial)
+            # El progreso es por etapa: al cambiar de etapa se empieza de cero
+            if etapa != etapa_actual[0]:
+                progreso.clear()
+                etapa_actual[0] = etapa
+            progreso.update(datos)
+            campos["progreso"] = dict(progreso)
+            self.backend.actualizar(job_id, **campos)
+
+        try:
+            if cancelado.is_set():
+                raise JobCancelado()
+            self.backend.actualizar(job_id, estado=ESTADO_EN_PROCESO)
+            resultado = funcion(*args, informar=informar)
+            # Un lote atrapa los errores de sus ítems: la cancelación se comprueba aquí
+            if cancelado.is_set():
+                raise JobCancelado()
+            self.backend.actualizar(job_id, estado=ESTADO_COMPLETADO, resultado=resultado)
+            log.info("Job %s completado.", job_id)
+        except Exception as e:
+            mensaje = getattr(e, "mensaje", None) or "Error interno del servidor."
+            status = getattr(e, "status", None) or 500
+            if not hasattr(e, "mensaje"):
+                log.error("Error inesperado en job %s: %s", job_id, e, exc_info=True)
+            self.backend.actualizar(job_id, estado=ESTADO_ERROR, error=mensaje, status_error=status)
+        finally:
+            with self._lock:
+                self._activos -= 1
+                self._cancelaciones.pop(job_id, None)
+                if temporizador := self._cancelaciones_diferidas.pop(job_id, None):
+                    temporizador.cancel()
+
+
+def crear_cola_desde_entorno() -> ColaJobs:
+    """
+    Construye la cola según variables de entorno:
+    JOBS_BACKEND (memoria | sqlite), JOBS_DB_PATH, JOBS_MAX_WORKERS,
+    JOBS_MAX_PENDIENTES y JOBS_TTL (segundos que se conservan los terminados).
+    """
+    tipo_backend = os.environ.get("JOBS_BACKEND", "memoria").lower()
+    if tipo_backend == "sqlite":
+        backend: BackendJobs = BackendSQLite(os.environ.get("JOBS_DB_PATH", "/tmp/jobs.sqlite3"))
+    elif tipo_backend == "memoria":
+        backend = BackendMemoria()
+    else:
+        raise ValueError(f"JOBS_BACKEND desconocido: {tipo_backend}")
+
+    return ColaJobs(
+        backend,
+        max_workers=int(os.environ.get("JOBS_MAX_WORKERS", 2)),
+        max_pendientes=int(os.environ.get("JOBS_MAX_PENDIENTES", 20)),
+        ttl_jobs=float(os.environ.get("JOBS_TTL", 3600)),
+    )
@@ -0,0 +1,118 @@
+import json
+from typing import Any, Optional
+
+# ---------------------------------------------------------------------------
+# PARSER JSON INCREMENTAL
+# Recibe el JSON a trozos (p. ej. los deltas de una completion en streaming)
+# y devuelve cada valor en cuanto se cierra, con su ruta: ("resumen",) para
+# un campo del objeto raíz, ("hilo_twitter", 0) para el primer elemento de
+# una lista. Solo se informa de los valores hasta `max_profundidad`; los más
+# profundos llegan dentro de su contenedor. Lo que haya antes del primer
+# `{` o `[` (texto, ```json) y después del cierre de la raíz se ignora.
+# ---------------------------------------------------------------------------
+
+_FIN_ESCALAR = set(",}] \t\r\n")
+
+
+class ParserJSONIncremental:
+
+    def __init__(self, max_profundidad: int = 2):
+        self.max_profundidad = max_profundidad
+        self._texto = ""
+        self._pila: list[dict] = []
+        self._en_cadena = False
+        self._escape = False
+        self._inicio_escalar: Optional[int] = None
+        self._inicio_raiz: Optional[int] = None
+        self.terminado = False
+        self.valor: Any = None
+
+    def _ruta(self) -> tuple:
+        return tuple(m["clave"] if m["tipo"] == "obj" else m["indice"] for m in self._pila)
+
+    def _empezar_valor(self, i: int) -> None:
+        if self._pila:
+            self._pila[-1]["inicio"] = i
+        else:
+            self._inicio_raiz = i
+
+    def _cerrar_valor(self, fin: int, eventos: list) -> None:
+        self._inicio_escalar = None
+        if not self._pila:
+            self.valor = json.loads(self._texto[self._inicio_raiz:fin])
+            self.terminado = True
+            return
+        marco = self._pila[-1]
+        ruta = self._ruta()
+        if len(ruta) <= self.max_profundidad:
+            eventos.append((ruta, json.loads(self._texto[marco["inicio"]:fin])))
+
+    def alimentar(self, fragmento: str) -> list[tuple[tuple, Any]]:
+        """Añade texto y devuelve los valores (ruta, valor) que ha cerrado. Lanza ValueError si el JSON es inválido."""
+        eventos: list = []
+        base = len(self._texto)
+        self._texto += fragmento
+        for i in range(base, len(self._texto)):
+            if self.terminado:
+                break
+            c = self._texto[i]
+
+            if self._en_cadena:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._en_cadena = False
+                    marco = self._pila[-1] if self._pila else None
+                    if marco and marco["tipo"] == "obj" and marco["espera"] == "clave":
+                        marco["clave"] = json.loads(self._texto[marco["inicio_clave"]:i + 1])
+                        marco["espera"] = "dos_puntos"
+                    else:
+                        self._cerrar_valor(i + 1, eventos)
+                continue
+
+            if self._inicio_escalar is not None and c in _FIN_ESCALAR:
+                self._cerrar_valor(i, eventos)
+                if self.terminado:
+                    break
+
+            if self._inicio_raiz is None and c not in "{[":
+                continue   # texto previo al JSON
+
+            if c == '"':
+                self._en_cadena = True
+                marco = self._pila[-1] if self._pila else None
+                if marco and marco["tipo"] == "obj" and marco["espera"] == "clave":
+                    marco["inicio_clave"] = i
+                else:
+                    self._empezar_valor(i)
+            elif c in "{[":
+                self._empezar_valor(i)
+                self._pila.append({"tipo": "obj" if c == "{" else "arr", "clave": None, "indice": 0,
+                                   "espera": "clave" if c == "{" else "valor", "inicio": None})
+            elif c in "}]":
+                if not self._pila:
+                    raise ValueError(f"Cierre inesperado en la posición {i}")
+                self._pila.pop()
+                self._cerrar_valor(i + 1, eventos)
+            elif c == ":":
+                if self._pila:
+                    self._pila[-1]["espera"] = "valor"
+            elif c == ",":
+                if self._pila:
+                    marco = self._pila[-1]
+                    if marco["tipo"] == "obj":
+                        marco["espera"] = "clave"
+                    else:
+                        marco["indice"] += 1
+            elif not c.isspace() and self._inicio_escalar is None:
+                self._empezar_valor(i)
+                self._inicio_escalar = i
+        return eventos
+
+    def finalizar(self) -> Any:
+        """Valor completo de la raíz; ValueError si el JSON quedó a medias."""
+        if not self.terminado:
+            raise ValueError("JSON incompleto: la respuesta terminó antes de cerrar la raíz")
+        return self.valor
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable
+
+from jobs import ESTADO_COMPLETADO, ESTADO_EN_COLA, ESTADO_EN_PROCESO, ESTADO_ERROR
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# LÍMITES POR ETAPA
+# Semáforos con nombre para las etapas caras del pipeline. A diferencia del
+# limitador de Groq, aquí no hay timeout: quien no tiene hueco espera su
+# turno. Así un lote de decenas de vídeos puede tener muchos ítems en vuelo
+# (unos descargando, otros comprimiendo, otros en Whisper) sin que ninguna
+# etapa supere su límite.
+# ---------------------------------------------------------------------------
+
+class LimitesEtapas:
+
+    def __init__(self, limites: dict[str, int]):
+        self.limites = dict(limites)
+        self._semaforos = {etapa: threading.BoundedSemaphore(max(1, n)) for etapa, n in limites.items()}
+        self._lock = threading.Lock()
+        self._en_curso = {etapa: 0 for etapa in limites}
+        self._esperando = {etapa: 0 for etapa in limites}
+
+    @contextmanager
+    def hueco(self, etapa: str):
+        semaforo = self._semaforos.get(etapa)
+        if semaforo is None:
+            yield
+            return
+        with self._lock:
+            self._esperando[etapa] += 1
+        semaforo.acquire()
+        with self._lock:
+            self._esperando[etapa] -= 1
+            self._en_curso[etapa] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._en_curso[etapa] -= 1
+            semaforo.release()
+
+    @asynccontextmanager
+    async def hueco_async(self, etapa: str, intervalo: float = 0.05):
+        """Como hueco(), para corrutinas: sondea el mismo semáforo sin bloquear el bucle."""
+        semaforo = self._semaforos.get(etapa)
+        if semaforo is None:
+            yield
+            return
+        with self._lock:
+            self._esperando[etapa] += 1
+        try:
+            while not semaforo.acquire(blocking=False):
+                await asyncio.sleep(intervalo)
+        finally:
+            with self._lock:
+                self._esperando[etapa] -= 1
+        with self._lock:
+            self._en_curso[etapa] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._en_curso[etapa] -= 1
+            semaforo.release()
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                etapa: {
+                    "limite":    self.limites[etapa],
+                    "en_curso":  self._en_curso[etapa],
+                    "esperando": self._esperando[etapa],
+                }
+                for etapa in self.limites
+            }
+
+
+# ---------------------------------------------------------------------------
+# LOTES
+# Un lote es un único job cuyo resultado es la lista de ítems. Los ítems se
+# procesan en paralelo (hasta max_paralelo) y cada uno se publica en
+# `parcial["items"]` en cuanto termina, con su resultado o su error, para
+# que el cliente no tenga que esperar al último vídeo.
+# ---------------------------------------------------------------------------
+
+def _nuevo_item(indice: int, entrada: dict) -> dict:
+    return {
+        "indice":    indice,
+        "url":       entrada["url"],
+        "titulo":    entrada.get("titulo"),
+        "estado":    ESTADO_ERROR if entrada.get("error") else ESTADO_EN_COLA,
+        "etapa":     None,
+        "resultado": None,
+        "error":     entrada.get("error"),
+    }
+
+
+def procesar_lote(entradas: list[dict], procesar: Callable[..., dict], informar,
+                  max_paralelo: int = 4) -> dict:
+    """
+    Ejecuta `procesar(url, informar=...)` para cada entrada ({"url", "titulo"},
+    o con "error" si ya falló al expandirse). Un fallo en un ítem no para el
+    lote: se guarda su mensaje (atributo `mensaje` si lo tiene) y se sigue.
+    """
+    items = [_nuevo_item(i, entrada) for i, entrada in enumerate(entradas)]
+    lock = threading.Lock()
+    inicio = time.monotonic()
+
+    def publicar() -> None:
+        # Llamar con el lock tomado: el callback de la cola no es thread-safe
+        terminados = [i for i in items if i["estado"] in (ESTADO_COMPLETADO, ESTADO_ERROR)]
+        informar("lote",
+                 total=len(items),
+                 terminados=len(terminados),
+                 fallidos=sum(1 for i in terminados if i["estado"] == ESTADO_ERROR),
+                 en_proceso=sum(1 for i in items if i["estado"] == ESTADO_EN_PROCESO),
+                 parcial={"items": [dict(i) for i in items]})
+
+    def procesar_item(item: dict) -> None:
+        def informar_item(etapa: str, **datos: Any) -> None:
+            # Solo los cambios de etapa: el progreso fino de cada ítem
+            # multiplicaría las escrituras en el backend de jobs
+            with lock:
+                if item["etapa"] != etapa:
+                    item["etapa"] = etapa
+                    publicar()
+
+        with lock:
+            item["estado"] = ESTADO_EN_PROCESO
+            publicar()
+        try:
+            resultado = procesar(item["url"], informar=informar_item)
+            campos = {"estado": ESTADO_COMPLETADO, "resultado": resultado}
+        except Exception as e:
+            if not hasattr(e, "mensaje"):
+                log.error("Error inesperado en el ítem %s del lote: %s", item["url"], e, exc_info=True)
+            campos = {"estado": ESTADO_ERROR, "error": getattr(e, "mensaje", None) or "Error interno del servidor."}
+        with lock:
+            item.update(campos, etapa=None)
+            publicar()
+
+    with lock:
+        publicar()
+    pendientes = [i for i in items if i["estado"] == ESTADO_EN_COLA]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_paralelo, len(pendientes) or 1)),
+                            thread_name_prefix="lote") as executor:
+        list(executor.map(procesar_item, pendientes))
+
+    fallidos = sum(1 for i in items if i["estado"] == ESTADO_ERROR)
+    log.info("Lote de %d ítems terminado en %.1f s (%d con error).",
+             len(items), time.monotonic() - inicio, fallidos)
+    return {
+        "status":      "success",
+        "total":       len(items),
+        "completados": len(items) - fallidos,
+        "fallidos":    fallidos,
+        "items":       items,
+    }
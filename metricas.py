@@ -0,0 +1,255 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+
+# ---------------------------------------------------------------------------
+# MÉTRICAS EN FORMATO PROMETHEUS
+# Contadores, medidores e histogramas mínimos con el formato de texto de
+# exposición 0.0.4, sin dependencias. Los valores son por proceso: con varios
+# workers de gunicorn cada scrape ve uno solo, así que conviene agregarlos
+# en Prometheus (sum/rate por instancia) o usar un único worker con hilos.
+# Las métricas que ya existen en otros objetos (pool de keys, limitador,
+# /tmp...) se leen en el momento del scrape con una Coleccion.
+# ---------------------------------------------------------------------------
+
+PREFIJO = "reporpousing_"
+
+# Segundos: desde respuestas de caché hasta descargas y transcripciones largas.
+# METRICAS_BUCKETS_SEGUNDOS ("0.01,0.02,...") los sustituye; benchmarks/pipeline.py
+# pide más resolución para sacar percentiles por etapa de los histogramas.
+BUCKETS_SEGUNDOS = tuple(
+    float(b) for b in os.environ.get("METRICAS_BUCKETS_SEGUNDOS", "").split(",") if b.strip()
+) or (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1200)
+BUCKETS_BYTES = tuple(2 ** n for n in range(16, 31, 2))   # 64 KiB … 1 GiB
+BUCKETS_RATIO = (0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5)
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatear_etiquetas(nombres: tuple, valores: tuple, extra: Optional[tuple] = None) -> str:
+    pares = list(zip(nombres, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{n}="{_escapar(v)}"' for n, v in pares) + "}"
+
+
+def _formatear_numero(valor: float) -> str:
+    if valor == math.inf:
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = ()):
+        self.nombre = PREFIJO + nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+        REGISTRO.registrar(self)
+
+    def _clave(self, etiquetas: dict) -> tuple:
+        if set(etiquetas) != set(self.etiquetas):
+            raise ValueError(f"{self.nombre} espera las etiquetas {self.etiquetas}, no {tuple(etiquetas)}")
+        return tuple(str(etiquetas[n]) for n in self.etiquetas)
+
+    def cabecera(self) -> list[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valores: dict[tuple, float] = {}
+
+    def inc(self, cantidad: float = 1, **etiquetas) -> None:
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def exponer(self) -> list[str]:
+        with self._lock:
+            valores = dict(self._valores)
+        return [f"{self.nombre}{_formatear_etiquetas(self.etiquetas, k)} {_formatear_numero(v)}"
+                for k, v in sorted(valores.items())]
+
+
+class Medidor(Contador):
+    tipo = "gauge"
+
+    def dec(self, cantidad: float = 1, **etiquetas) -> None:
+        self.inc(-cantidad, **etiquetas)
+
+    def fijar(self, valor: float, **etiquetas) -> None:
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = valor
+
+    @contextmanager
+    def en_curso(self, **etiquetas):
+        self.inc(**etiquetas)
+        try:
+            yield
+        finally:
+            self.dec(**etiquetas)
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Iterable[str] = (),
+                 buckets: tuple = BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # clave → (conteos por bucket, suma, total)
+        self._series: dict[tuple, list] = {}
+
+    def observar(self, valor: float, **etiquetas) -> None:
+        clave = self._clave(etiquetas)
+        with self._lock:
+            serie = self._series.setdefault(clave, [[0] * len(self.buckets), 0.0, 0])
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def medir(self, **etiquetas):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def exponer(self) -> list[str]:
+        with self._lock:
+            series = {k: ([*s[0]], s[1], s[2]) for k, s in self._series.items()}
+        lineas = []
+        for clave, (conteos, suma, total) in sorted(series.items()):
+            acumulado = 0
+            for limite, n in zip(self.buckets, conteos):
+                acumulado += n
+                etiquetas = _formatear_etiquetas(self.etiquetas, clave, ("le", _formatear_numero(limite)))
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+            etiquetas = _formatear_etiquetas(self.etiquetas, clave)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {_formatear_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {total}")
+        return lineas
+
+
+class Coleccion(_Metrica):
+    """
+    Métrica calculada al exponer: `funcion()` devuelve pares
+    (valores de etiquetas, valor). Para estado que ya vive en otro objeto.
+    """
+
+    def __init__(self, nombre: str, ayuda: str, tipo: str, etiquetas: Iterable[str],
+                 funcion: Callable[[], Iterable[tuple[tuple, float]]]):
+        self.tipo = tipo
+        self._funcion = funcion
+        super().__init__(nombre, ayuda, etiquetas)
+
+    def exponer(self) -> list[str]:
+        return [f"{self.nombre}{_formatear_etiquetas(self.etiquetas, tuple(k))} {_formatear_numero(v)}"
+                for k, v in self._funcion()]
+
+
+class Registro:
+
+    def __init__(self):
+        self._metricas: dict[str, _Metrica] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, metrica: _Metrica) -> None:
+        with self._lock:
+            if metrica.nombre in self._metricas:
+                raise ValueError(f"Métrica duplicada: {metrica.nombre}")
+            self._metricas[metrica.nombre] = metrica
+
+    def exponer(self) -> str:
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            try:
+                cuerpo = metrica.exponer()
+            except Exception:
+                # Una colección rota no debe tumbar el scrape entero
+                continue
+            lineas += metrica.cabecera() + cuerpo
+        return "\n".join(lineas) + "\n"
+
+
+REGISTRO = Registro()
+
+
+# ---------------------------------------------------------------------------
+# MÉTRICAS COMUNES
+# Definidas aquí para que cualquier módulo pueda importarlas sin depender de
+# app.py. Los plugins de yt-dlp no las importan: LATENCIA_POT les llega como
+# callback en las opciones de YoutubeDL (observar_latencia_pot).
+# ---------------------------------------------------------------------------
+
+DURACION_ETAPA = Histograma(
+    "etapa_segundos", "Duración de cada etapa del pipeline.", ["etapa"])
+ETAPAS_EN_CURSO = Medidor(
+    "etapas_en_curso", "Etapas del pipeline ejecutándose ahora mismo.", ["etapa"])
+BYTES_AUDIO = Histograma(
+    "audio_bytes", "Tamaño del audio antes (entrada) y después (salida) de comprimir.",
+    ["tipo"], buckets=BUCKETS_BYTES)
+RATIO_COMPRESION = Histograma(
+    "compresion_ratio", "Bytes de salida / bytes de entrada de ffmpeg.", buckets=BUCKETS_RATIO)
+PRIMER_CONTENIDO_PACK = Histograma(
+    "pack_primer_contenido_segundos",
+    "Tiempo desde que empieza el pack hasta que el cliente recibe la primera sección.",
+    ["streaming"])
+ESPERA_FFMPEG = Histograma(
+    "ffmpeg_espera_segundos", "Tiempo en cola hasta conseguir hueco para un proceso ffmpeg.")
+DURACION_FFMPEG = Histograma(
+    "ffmpeg_segundos", "Duración de cada proceso ffmpeg gestionado por el ejecutor.", ["resultado"])
+LATENCIA_POT = Histograma(
+    "po_token_segundos", "Latencia de generación de PO tokens por proveedor bgutil.",
+    ["proveedor", "resultado"])
+
+
+@contextmanager
+def medir_etapa(etapa: str):
+    """Mide la duración de `etapa` y la cuenta como en curso mientras dura."""
+    with ETAPAS_EN_CURSO.en_curso(etapa=etapa), DURACION_ETAPA.medir(etapa=etapa):
+        yield
+
+
+def registrar_compresion(bytes_entrada: int, bytes_salida: int) -> None:
+    BYTES_AUDIO.observar(bytes_entrada, tipo="entrada")
+    BYTES_AUDIO.observar(bytes_salida, tipo="salida")
+    if bytes_entrada:
+        RATIO_COMPRESION.observar(bytes_salida / bytes_entrada)
+
+
+def uso_directorio(ruta: str) -> tuple[int, int]:
+    """(bytes, archivos) del primer nivel de `ruta`; los temporales viven ahí."""
+    total = archivos = 0
+    with os.scandir(ruta) as entradas:
+        for entrada in entradas:
+            try:
+                if entrada.is_file(follow_symlinks=False):
+                    total += entrada.stat(follow_symlinks=False).st_size
+                    archivos += 1
+            except OSError:
+                # Temporales que desaparecen mientras se recorre el directorio
+                continue
+    return total, archivos
@@ -0,0 +1,290 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Optional
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# POOL DE API KEYS DE GROQ
+# Un cliente por key, reutilizado entre peticiones. Para cada (key, modelo)
+# se lleva la cuenta de peticiones y tokens del último minuto, se leen las
+# cabeceras x-ratelimit-* de Groq y, ante un 429, la key entra en cooldown
+# el tiempo que indique retry-after. Cada llamada va a la key con más margen.
+# Los límites son por modelo (Whisper y Llama no comparten cupo).
+# ---------------------------------------------------------------------------
+
+VENTANA = 60.0  # segundos de la ventana de RPM/TPM
+
+
+class SinKeysDisponibles(Exception):
+    """Todas las keys están en cooldown para ese modelo."""
+
+    def __init__(self, modelo: str, espera: float):
+        super().__init__(f"Todas las keys en cooldown para {modelo} (≈{espera:.0f} s)")
+        self.modelo = modelo
+        self.espera = espera
+
+
+_PATRON_DURACION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parsear_duracion(valor: Optional[str]) -> Optional[float]:
+    """Convierte '7.66s', '2m59.56s', '1h2m' o '500ms' (formato de Groq) a segundos."""
+    if not valor:
+        return None
+    valor = valor.strip()
+    try:
+        return float(valor)
+    except ValueError:
+        pass
+    factores = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    partes = _PATRON_DURACION.findall(valor)
+    if not partes:
+        return None
+    return sum(float(n) * factores[u] for n, u in partes)
+
+
+def _entero(valor: Optional[str]) -> Optional[int]:
+    try:
+        return int(float(valor)) if valor is not None else None
+    except ValueError:
+        return None
+
+
+class Presupuesto:
+    """Uso y cupo de una key para un modelo concreto."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.peticiones: deque[float] = deque()
+        self.tokens: deque[tuple[float, int]] = deque()
+        self.en_vuelo = 0
+        self.cooldown_hasta = 0.0
+        # Últimos valores anunciados por Groq y cuándo caducan
+        self.restantes_peticiones: Optional[int] = None
+        self.restantes_tokens: Optional[int] = None
+        self.reset_peticiones = 0.0
+        self.reset_tokens = 0.0
+        self.llamadas = 0
+        self.limitadas = 0
+
+    def _limpiar(self, ahora: float) -> None:
+        while self.peticiones and self.peticiones[0] < ahora - VENTANA:
+            self.peticiones.popleft()
+        while self.tokens and self.tokens[0][0] < ahora - VENTANA:
+            self.tokens.popleft()
+
+    def margen(self, ahora: float, tokens_estimados: int) -> float:
+        """Fracción de cupo libre (0..1) teniendo en cuenta lo que hay en vuelo."""
+        self._limpiar(ahora)
+        libres_pet = self.rpm - len(self.peticiones) - self.en_vuelo
+        if self.restantes_peticiones is not None and ahora < self.reset_peticiones:
+            libres_pet = min(libres_pet, self.restantes_peticiones - self.en_vuelo)
+        margen = libres_pet / self.rpm if self.rpm else 1.0
+
+        if tokens_estimados and self.tpm:
+            libres_tok = self.tpm - sum(n for _, n in self.tokens)
+            if self.restantes_tokens is not None and ahora < self.reset_tokens:
+                libres_tok = min(libres_tok, self.restantes_tokens)
+            margen = min(margen, (libres_tok - tokens_estimados) / self.tpm)
+        return margen
+
+    def a_dict(self, ahora: float) -> dict:
+        self._limpiar(ahora)
+        return {
+            "peticiones_ultimo_minuto": len(self.peticiones),
+            "tokens_ultimo_minuto":     sum(n for _, n in self.tokens),
+            "en_vuelo":                 self.en_vuelo,
+            "cooldown_restante":        round(max(0.0, self.cooldown_hasta - ahora), 1),
+            "restantes_peticiones":     self.restantes_peticiones,
+            "restantes_tokens":         self.restantes_tokens,
+            "llamadas":                 self.llamadas,
+            "limitadas":                self.limitadas,
+        }
+
+
+class EstadoKey:
+
+    def __init__(self, indice: int, api_key: Optional[str], fabrica_cliente: Callable[[Optional[str]], Any],
+                 fabrica_cliente_async: Optional[Callable[[Optional[str]], Any]] = None):
+        self.indice = indice
+        self.api_key = api_key
+        self._fabrica = fabrica_cliente
+        self._fabrica_async = fabrica_cliente_async
+        self._cliente = None
+        self._cliente_async = None
+        self.presupuestos: dict[str, Presupuesto] = {}
+
+    @property
+    def sufijo(self) -> str:
+        return (self.api_key or "")[-4:]
+
+    @property
+    def cliente(self):
+        # Se crea en el primer uso: sin keys configuradas la app debe arrancar igual
+        if self._cliente is None:
+            self._cliente = self._fabrica(self.api_key)
+        return self._cliente
+
+    @property
+    def cliente_async(self):
+        """Cliente asíncrono de la misma key (modo ASGI); comparte presupuestos y cooldowns."""
+        if self._fabrica_async is None:
+            raise RuntimeError("El pool no tiene fábrica de clientes asíncronos.")
+        if self._cliente_async is None:
+            self._cliente_async = self._fabrica_async(self.api_key)
+        return self._cliente_async
+
+
+class UsoKey:
+    """Préstamo de una key para una llamada. Se obtiene con PoolKeys.usar()."""
+
+    def __init__(self, pool: "PoolKeys", estado: EstadoKey, modelo: str, tokens_estimados: int):
+        self._pool = pool
+        self.estado = estado
+        self.modelo = modelo
+        self.tokens_estimados = tokens_estimados
+        self.tokens_reales: Optional[int] = None
+
+    @property
+    def cliente(self):
+        return self.estado.cliente
+
+    @property
+    def cliente_async(self):
+        return self.estado.cliente_async
+
+    @property
+    def indice(self) -> int:
+        return self.estado.indice
+
+    def registrar(self, cabeceras: Any = None, tokens: Optional[int] = None) -> None:
+        """Anota las cabeceras x-ratelimit-* y los tokens consumidos de una respuesta correcta."""
+        self.tokens_reales = tokens
+        if cabeceras is not None:
+            self._pool._leer_cabeceras(self.estado, self.modelo, cabeceras)
+
+    def __enter__(self) -> "UsoKey":
+        return self
+
+    def __exit__(self, tipo, exc, tb) -> bool:
+        self._pool._devolver(self, exc)
+        return False
+
+
+def es_rate_limit(e: BaseException) -> bool:
+    # groq.RateLimitError y cualquier APIStatusError llevan status_code
+    return getattr(e, "status_code", None) == 429
+
+
+def retry_after(e: BaseException) -> Optional[float]:
+    """Segundos de espera que pide el servidor en un 429, si los indica."""
+    respuesta = getattr(e, "response", None)
+    cabeceras = getattr(respuesta, "headers", None)
+    if not cabeceras:
+        return None
+    return (parsear_duracion(cabeceras.get("retry-after"))
+            or parsear_duracion(cabeceras.get("x-ratelimit-reset-requests"))
+            or parsear_duracion(cabeceras.get("x-ratelimit-reset-tokens")))
+
+
+class PoolKeys:
+
+    def __init__(self, api_keys: list[Optional[str]], fabrica_cliente: Callable[[Optional[str]], Any],
+                 rpm: int = 30, tpm: int = 12000, cooldown_por_defecto: float = 60.0,
+                 fabrica_cliente_async: Optional[Callable[[Optional[str]], Any]] = None):
+        if not api_keys:
+            raise ValueError("El pool necesita al menos una key.")
+        self.keys = [EstadoKey(i, k, fabrica_cliente, fabrica_cliente_async) for i, k in enumerate(api_keys)]
+        self.rpm = rpm
+        self.tpm = tpm
+        self.cooldown_por_defecto = cooldown_por_defecto
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _presupuesto(self, estado: EstadoKey, modelo: str) -> Presupuesto:
+        if modelo not in estado.presupuestos:
+            estado.presupuestos[modelo] = Presupuesto(self.rpm, self.tpm)
+        return estado.presupuestos[modelo]
+
+    def usar(self, modelo: str, tokens_estimados: int = 0, excluir: Optional[set[int]] = None) -> UsoKey:
+        """
+        Reserva la key con más margen para `modelo`, saltando las que estén en
+        cooldown o en `excluir` (índices). Lanza SinKeysDisponibles si no queda
+        ninguna. Úsese como context manager para devolverla siempre.
+        """
+        ahora = time.time()
+        with self._lock:
+            candidatas = []
+            espera_min = float("inf")
+            for estado in self.keys:
+                p = self._presupuesto(estado, modelo)
+                if p.cooldown_hasta > ahora:
+                    espera_min = min(espera_min, p.cooldown_hasta - ahora)
+                    continue
+                if excluir and estado.indice in excluir:
+                    continue
+                # A igual margen: menos en vuelo y, después, menos uso reciente
+                candidatas.append(((p.margen(ahora, tokens_estimados), -p.en_vuelo, -len(p.peticiones)), estado))
+
+            if not candidatas:
+                raise SinKeysDisponibles(modelo, 0.0 if espera_min == float("inf") else espera_min)
+
+            _, elegida = max(candidatas, key=lambda c: c[0])
+            p = self._presupuesto(elegida, modelo)
+            p.en_vuelo += 1
+            p.llamadas += 1
+            p.peticiones.append(ahora)
+
+        log.info("Usando API KEY nº %d (termina en ...%s) para %s", elegida.indice + 1, elegida.sufijo, modelo)
+        return UsoKey(self, elegida, modelo, tokens_estimados)
+
+    def _devolver(self, uso: UsoKey, exc: Optional[BaseException]) -> None:
+        ahora = time.time()
+        with self._lock:
+            p = self._presupuesto(uso.estado, uso.modelo)
+            p.en_vuelo -= 1
+            tokens = uso.tokens_reales if uso.tokens_reales is not None else uso.tokens_estimados
+            if tokens:
+                p.tokens.append((ahora, tokens))
+
+            if exc is not None and es_rate_limit(exc):
+                espera = retry_after(exc) or self.cooldown_por_defecto
+                p.cooldown_hasta = max(p.cooldown_hasta, ahora + espera)
+                p.limitadas += 1
+                log.warning("Key nº %d agotada para %s (429). Cooldown de %.0f s.",
+                            uso.indice + 1, uso.modelo, espera)
+
+    def _leer_cabeceras(self, estado: EstadoKey, modelo: str, cabeceras: Any) -> None:
+        ahora = time.time()
+        with self._lock:
+            p = self._presupuesto(estado, modelo)
+            restantes_pet = _entero(cabeceras.get("x-ratelimit-remaining-requests"))
+            restantes_tok = _entero(cabeceras.get("x-ratelimit-remaining-tokens"))
+            if restantes_pet is not None:
+                p.restantes_peticiones = restantes_pet
+                p.reset_peticiones = ahora + (parsear_duracion(cabeceras.get("x-ratelimit-reset-requests")) or VENTANA)
+            if restantes_tok is not None:
+                p.restantes_tokens = restantes_tok
+                p.reset_tokens = ahora + (parsear_duracion(cabeceras.get("x-ratelimit-reset-tokens")) or VENTANA)
+            # Si Groq dice que no queda nada, enfriamos antes de provocar un 429
+            if restantes_pet == 0:
+                p.cooldown_hasta = max(p.cooldown_hasta, p.reset_peticiones)
+
+    def estadisticas(self) -> list[dict]:
+        ahora = time.time()
+        with self._lock:
+            return [
+                {
+                    "key":     estado.indice + 1,
+                    "sufijo":  estado.sufijo,
+                    "modelos": {m: p.a_dict(ahora) for m, p in estado.presupuestos.items()},
+                }
+                for estado in self.keys
+            ]
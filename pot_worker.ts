@@ -0,0 +1,66 @@
+// Worker persistente de PO tokens para el proveedor bgutil:worker
+// (yt_dlp_plugins/extractor/getpot_bgutil_worker.py).
+//
+// Protocolo por líneas JSON: cada línea de stdin es una petición con "id" y
+// cada línea de stdout es la respuesta con el mismo "id". {"ping": true}
+// responde {"pong": true, "version"} y sirve de health check. El
+// SessionManager (y el minter de BotGuard que guarda) vive mientras viva el
+// proceso, así que solo el primer token paga la inicialización de jsdom/canvas.
+//
+// Se compila junto a generate_once.ts desde bgutil-engine/server/src (ver
+// Dockerfile), por eso importa sus módulos con rutas relativas.
+import * as readline from "readline";
+import { SessionManager } from "./session_manager";
+import { VERSION } from "./utils";
+
+// stdout es exclusivo del protocolo: cualquier log de la librería va a stderr
+const escribirRespuesta = process.stdout.write.bind(process.stdout);
+console.log = (...args: unknown[]) => console.error(...args);
+
+const sessionManager = new SessionManager(false);
+
+function responder(respuesta: Record<string, unknown>): void {
+    escribirRespuesta(JSON.stringify(respuesta) + "\n");
+}
+
+async function atender(linea: string): Promise<void> {
+    let peticion: any;
+    try {
+        peticion = JSON.parse(linea);
+    } catch (e) {
+        responder({ id: null, error: `JSON inválido: ${e}` });
+        return;
+    }
+
+    const id = peticion.id ?? null;
+    if (peticion.ping) {
+        responder({ id, pong: true, version: VERSION });
+        return;
+    }
+
+    try {
+        const datos = await sessionManager.generatePoToken(
+            peticion.content_binding,
+            peticion.proxy || "",
+            Boolean(peticion.bypass_cache),
+            peticion.source_address || undefined,
+            Boolean(peticion.disable_tls_verification),
+            peticion.challenge || undefined,
+            Boolean(peticion.disable_innertube),
+            peticion.innertube_context || undefined,
+        );
+        responder({ id, ...datos });
+    } catch (e) {
+        responder({ id, error: e instanceof Error ? e.message : String(e) });
+    }
+}
+
+readline
+    .createInterface({ input: process.stdin, terminal: false })
+    .on("line", (linea) => {
+        if (linea.trim()) {
+            void atender(linea);
+        }
+    })
+    // Python cierra stdin para pedir una salida limpia
+    .on("close", () => process.exit(0));
@@ -0,0 +1,31 @@
+import time
+
+# ---------------------------------------------------------------------------
+# CALLBACKS DE PROGRESO
+# Los pipelines publican su avance con `informar(etapa, **datos)`: la cola
+# de jobs lo guarda para /jobs/<id>, la coalescencia lo reparte entre las
+# peticiones enganchadas y las rutas síncronas no lo usan. Lo comparten
+# app.py y asgi.py.
+# ---------------------------------------------------------------------------
+
+
+def sin_progreso(etapa: str, **datos) -> None:
+    pass
+
+
+def informar_limitado(informar, intervalo: float = 0.5):
+    """
+    Envuelve `informar` para que las actualizaciones de una misma etapa
+    (progreso de descarga, de ffmpeg...) no se publiquen más de una vez por
+    intervalo. Los cambios de etapa y los parciales pasan siempre.
+    """
+    ultimo = {"etapa": None, "momento": 0.0}
+
+    def envoltorio(etapa: str, **datos) -> None:
+        ahora = time.monotonic()
+        if etapa == ultimo["etapa"] and "parcial" not in datos and ahora - ultimo["momento"] < intervalo:
+            return
+        ultimo["etapa"], ultimo["momento"] = etapa, ahora
+        informar(etapa, **datos)
+
+    return envoltorio
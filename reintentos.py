@@ -0,0 +1,336 @@
+import asyncio
+import logging
+import random
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, TypeVar
+
+from pool_keys import SinKeysDisponibles, es_rate_limit, retry_after
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# ---------------------------------------------------------------------------
+# POLÍTICA DE REINTENTOS PARA GROQ
+# Clasifica cada fallo por tipo de excepción y código HTTP:
+#   - rate_limit: 429. El pool ya ha enfriado esa key; se reintenta al
+#     momento con otra. Si no queda ninguna, se espera lo que falte de cooldown.
+#   - transitorio: red, timeouts y 5xx. Backoff exponencial con jitter
+#     completo, respetando retry-after si el servidor lo manda. Cuentan para
+#     el circuit breaker.
+#   - fatal: el resto (400, 401, JSON inválido...). No se reintenta.
+# Todos los intentos pasan por un limitador global de concurrencia.
+# ---------------------------------------------------------------------------
+
+RATE_LIMIT  = "rate_limit"
+TRANSITORIO = "transitorio"
+FATAL       = "fatal"
+
+_STATUS_TRANSITORIOS = {408, 409, 425, 500, 502, 503, 504}
+
+
+class CircuitoAbierto(Exception):
+    """El circuit breaker está abierto: no se llama a Groq hasta que se enfríe."""
+
+
+class LimitadorSaturado(Exception):
+    """No se consiguió hueco en el limitador de concurrencia a tiempo."""
+
+
+class ReintentosAgotados(Exception):
+    """Se acabaron los intentos o el plazo. `ultimo` es el último error."""
+
+    def __init__(self, ultimo: BaseException, clase: str):
+        super().__init__(str(ultimo))
+        self.ultimo = ultimo
+        self.clase = clase
+
+
+def clasificar(e: BaseException) -> str:
+    if isinstance(e, SinKeysDisponibles) or es_rate_limit(e):
+        return RATE_LIMIT
+    if getattr(e, "status_code", None) in _STATUS_TRANSITORIOS:
+        return TRANSITORIO
+    # groq se importa en diferido (ver arranque.py): si aún no está cargado,
+    # `e` no puede ser una de sus excepciones
+    groq = sys.modules.get("groq")
+    if groq is not None and isinstance(e, (groq.APIConnectionError,    # incluye APITimeoutError
+                                           groq.InternalServerError)):
+        return TRANSITORIO
+    return FATAL
+
+
+class LimitadorConcurrencia:
+    """Semáforo con métricas: cuántas llamadas hay dentro, cuántas esperando y cuánto esperan."""
+
+    def __init__(self, maximo: int, timeout: float = 60.0):
+        self.maximo = maximo
+        self.timeout = timeout
+        self._semaforo = threading.BoundedSemaphore(maximo)
+        self._lock = threading.Lock()
+        self.en_uso = 0
+        self.esperando = 0
+        self.adquisiciones = 0
+        self.rechazos = 0
+        self.segundos_espera = 0.0
+
+    def _anotar_espera(self, inicio: float, conseguido: bool) -> None:
+        with self._lock:
+            self.esperando -= 1
+            self.segundos_espera += time.monotonic() - inicio
+            if not conseguido:
+                self.rechazos += 1
+            else:
+                self.en_uso += 1
+                self.adquisiciones += 1
+        if not conseguido:
+            raise LimitadorSaturado(f"Más de {self.maximo} llamadas a Groq en curso.")
+
+    def _liberar(self) -> None:
+        with self._lock:
+            self.en_uso -= 1
+        self._semaforo.release()
+
+    @contextmanager
+    def hueco(self):
+        inicio = time.monotonic()
+        with self._lock:
+            self.esperando += 1
+        self._anotar_espera(inicio, self._semaforo.acquire(timeout=self.timeout))
+        try:
+            yield
+        finally:
+            self._liberar()
+
+    @asynccontextmanager
+    async def hueco_async(self, intervalo: float = 0.02):
+        """
+        Como hueco(), sin bloquear el bucle de eventos: sondea el mismo
+        semáforo, así que los hilos y las corrutinas comparten el límite.
+        """
+        inicio = time.monotonic()
+        with self._lock:
+            self.esperando += 1
+        conseguido = self._semaforo.acquire(blocking=False)
+        try:
+            while not conseguido and time.monotonic() - inicio < self.timeout:
+                await asyncio.sleep(intervalo)
+                conseguido = self._semaforo.acquire(blocking=False)
+        except BaseException:
+            # Cancelada mientras esperaba: no se queda con un hueco ajeno
+            if conseguido:
+                self._semaforo.release()
+            with self._lock:
+                self.esperando -= 1
+            raise
+        self._anotar_espera(inicio, conseguido)
+        try:
+            yield
+        finally:
+            self._liberar()
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "maximo":          self.maximo,
+                "en_uso":          self.en_uso,
+                "esperando":       self.esperando,
+                "adquisiciones":   self.adquisiciones,
+                "rechazos":        self.rechazos,
+                "segundos_espera": round(self.segundos_espera, 3),
+            }
+
+
+class CircuitBreaker:
+    """
+    Cerrado → abierto tras `umbral` fallos transitorios seguidos. Abierto
+    durante `enfriamiento` segundos; después deja pasar una única llamada de
+    prueba (semiabierto): si sale bien se cierra y si falla vuelve a abrirse.
+    """
+
+    CERRADO, ABIERTO, SEMIABIERTO = "cerrado", "abierto", "semiabierto"
+
+    def __init__(self, nombre: str, umbral: int = 5, enfriamiento: float = 30.0):
+        self.nombre = nombre
+        self.umbral = umbral
+        self.enfriamiento = enfriamiento
+        self._lock = threading.Lock()
+        self.estado = self.CERRADO
+        self.fallos_seguidos = 0
+        self.abierto_desde = 0.0
+        self.aperturas = 0
+        self._prueba_en_curso = False
+
+    def permitir(self) -> None:
+        with self._lock:
+            if self.estado == self.ABIERTO:
+                if time.monotonic() - self.abierto_desde < self.enfriamiento:
+                    raise CircuitoAbierto(f"Circuito {self.nombre} abierto.")
+                self.estado = self.SEMIABIERTO
+                self._prueba_en_curso = False
+            if self.estado == self.SEMIABIERTO:
+                if self._prueba_en_curso:
+                    raise CircuitoAbierto(f"Circuito {self.nombre} en prueba.")
+                self._prueba_en_curso = True
+
+    def exito(self) -> None:
+        with self._lock:
+            if self.estado != self.CERRADO:
+                log.info("Circuito %s cerrado de nuevo.", self.nombre)
+            self.estado = self.CERRADO
+            self.fallos_seguidos = 0
+            self._prueba_en_curso = False
+
+    def fallo(self) -> None:
+        with self._lock:
+            self.fallos_seguidos += 1
+            self._prueba_en_curso = False
+            if self.estado == self.SEMIABIERTO or self.fallos_seguidos >= self.umbral:
+                if self.estado != self.ABIERTO:
+                    self.aperturas += 1
+                    log.warning("Circuito %s abierto tras %d fallos seguidos.", self.nombre, self.fallos_seguidos)
+                self.estado = self.ABIERTO
+                self.abierto_desde = time.monotonic()
+
+    def neutro(self) -> None:
+        """Resultado que no dice nada de la salud del servicio (429, error fatal)."""
+        with self._lock:
+            self._prueba_en_curso = False
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "estado":          self.estado,
+                "fallos_seguidos": self.fallos_seguidos,
+                "aperturas":       self.aperturas,
+            }
+
+
+class PoliticaReintentos:
+    """
+    Ejecuta `funcion(intento)` con reintentos según la clase del error.
+    Lanza CircuitoAbierto, LimitadorSaturado, ReintentosAgotados o el error
+    fatal original; el llamante decide cómo presentarlo al usuario.
+    """
+
+    def __init__(self, nombre: str, limitador: LimitadorConcurrencia, breaker: CircuitBreaker,
+                 max_intentos: int = 4, base: float = 0.5, tope: float = 20.0,
+                 plazo_total: float = 120.0):
+        self.nombre = nombre
+        self.limitador = limitador
+        self.breaker = breaker
+        self.max_intentos = max_intentos
+        self.base = base
+        self.tope = tope
+        self.plazo_total = plazo_total
+        self._lock = threading.Lock()
+        self.contadores = {
+            "llamadas": 0, "intentos": 0, "reintentos": 0, "exitos": 0,
+            RATE_LIMIT: 0, TRANSITORIO: 0, FATAL: 0,
+            "agotados": 0, "circuito_abierto": 0, "segundos_backoff": 0.0,
+        }
+
+    def _contar(self, nombre: str, cantidad: float = 1) -> None:
+        with self._lock:
+            self.contadores[nombre] += cantidad
+
+    def _espera_backoff(self, intento: int, e: BaseException) -> float:
+        # Jitter completo (AWS): uniforme en [0, min(tope, base·2^intento)]
+        espera = random.uniform(0, min(self.tope, self.base * 2 ** intento))
+        pedida = retry_after(e)
+        return max(espera, pedida) if pedida else espera
+
+    def _antes_de_intento(self, intento: int) -> None:
+        try:
+            self.breaker.permitir()
+        except CircuitoAbierto:
+            self._contar("circuito_abierto")
+            raise
+        self._contar("intentos")
+        if intento:
+            self._contar("reintentos")
+
+    def _tras_fallo(self, intento: int, e: Exception, limite: float) -> float:
+        """Clasifica el fallo y devuelve cuánto esperar antes de reintentar, o relanza."""
+        clase = clasificar(e)
+        self._contar(clase)
+
+        if clase == FATAL:
+            self.breaker.neutro()
+            raise e
+        if clase == TRANSITORIO:
+            self.breaker.fallo()
+            espera = self._espera_backoff(intento, e)
+        else:
+            self.breaker.neutro()
+            # Tras un 429 el pool ya elige otra key: solo se espera si no queda ninguna
+            espera = e.espera + random.uniform(0, self.base) if isinstance(e, SinKeysDisponibles) else 0.0
+
+        ultimo_intento = intento == self.max_intentos - 1
+        if ultimo_intento or time.monotonic() + espera > limite:
+            self._contar("agotados")
+            raise ReintentosAgotados(e, clase) from e
+
+        log.warning("%s: fallo %s en intento %d/%d (%s). Reintento en %.1f s.",
+                    self.nombre, clase, intento + 1, self.max_intentos, e, espera)
+        if espera:
+            self._contar("segundos_backoff", espera)
+        return espera
+
+    def _exito(self) -> None:
+        self.breaker.exito()
+        self._contar("exitos")
+
+    def ejecutar(self, funcion: Callable[[int], T]) -> T:
+        self._contar("llamadas")
+        limite = time.monotonic() + self.plazo_total
+
+        for intento in range(self.max_intentos):
+            self._antes_de_intento(intento)
+            try:
+                with self.limitador.hueco():
+                    resultado = funcion(intento)
+            except LimitadorSaturado:
+                self.breaker.neutro()
+                raise
+            except Exception as e:
+                if espera := self._tras_fallo(intento, e, limite):
+                    time.sleep(espera)
+                continue
+
+            self._exito()
+            return resultado
+
+        raise AssertionError("inalcanzable")
+
+    async def ejecutar_async(self, funcion: Callable[[int], Awaitable[T]]) -> T:
+        """Como ejecutar(), para corrutinas: mismos contadores, breaker y limitador."""
+        self._contar("llamadas")
+        limite = time.monotonic() + self.plazo_total
+
+        for intento in range(self.max_intentos):
+            self._antes_de_intento(intento)
+            try:
+                async with self.limitador.hueco_async():
+                    resultado = await funcion(intento)
+            except LimitadorSaturado:
+                self.breaker.neutro()
+                raise
+            except Exception as e:
+                if espera := self._tras_fallo(intento, e, limite):
+                    await asyncio.sleep(espera)
+                continue
+
+            self._exito()
+            return resultado
+
+        raise AssertionError("inalcanzable")
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            contadores = dict(self.contadores)
+        contadores["segundos_backoff"] = round(contadores["segundos_backoff"], 3)
+        return {"contadores": contadores, "circuito": self.breaker.estadisticas()}
@@ -0,0 +1,105 @@
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# MAP-REDUCE DE TRANSCRIPCIONES LARGAS
+# Una transcripción que no cabe en el presupuesto de entrada del LLM se
+# divide en trozos por frases, cada trozo se resume en paralelo (fase map)
+# y los resúmenes, en orden, sustituyen a la transcripción en la llamada
+# final (fase reduce). Si los resúmenes juntos siguen sin caber, se vuelven
+# a agrupar y resumir: la latencia crece con el número de niveles, que es
+# logarítmico, y no con la longitud del vídeo.
+# ---------------------------------------------------------------------------
+
+_FIN_DE_FRASE = re.compile(r"(?<=[.!?…])\s+")
+
+
+class TranscripcionDemasiadoLarga(Exception):
+    """Los resúmenes no caben en el presupuesto ni tras `niveles` rondas de map-reduce."""
+
+    def __init__(self, niveles: int, tokens: int, max_tokens: int):
+        super().__init__(f"La transcripción es demasiado larga: tras {niveles} niveles de resumen "
+                         f"sigue ocupando ~{tokens} tokens (máximo {max_tokens}).")
+        self.niveles = niveles
+        self.tokens = tokens
+
+
+def estimar_tokens(texto: str) -> int:
+    """Aproximación barata (~4 caracteres por token) para el presupuesto TPM."""
+    return len(texto) // 4
+
+
+def _partir_largo(texto: str, max_tokens: int) -> list[str]:
+    """Parte una frase que por sí sola excede el presupuesto, por palabras."""
+    max_chars = max(1, max_tokens * 4)
+    piezas, actual = [], ""
+    for palabra in texto.split():
+        if actual and len(actual) + 1 + len(palabra) > max_chars:
+            piezas.append(actual)
+            actual = ""
+        # Una "palabra" gigante (sin espacios) se corta a cuchillo
+        while len(palabra) > max_chars:
+            piezas.append(palabra[:max_chars])
+            palabra = palabra[max_chars:]
+        actual = f"{actual} {palabra}" if actual else palabra
+    if actual:
+        piezas.append(actual)
+    return piezas
+
+
+def trocear_texto(texto: str, max_tokens: int) -> list[str]:
+    """
+    Divide el texto en trozos de como mucho `max_tokens` (estimados),
+    cortando entre frases siempre que se pueda.
+    """
+    trozos, actual = [], ""
+    for frase in _FIN_DE_FRASE.split(texto.strip()):
+        if not frase:
+            continue
+        if estimar_tokens(frase) > max_tokens:
+            piezas = _partir_largo(frase, max_tokens)
+        else:
+            piezas = [frase]
+        for pieza in piezas:
+            candidato = f"{actual} {pieza}" if actual else pieza
+            if actual and estimar_tokens(candidato) > max_tokens:
+                trozos.append(actual)
+                candidato = pieza
+            actual = candidato
+    if actual:
+        trozos.append(actual)
+    return trozos
+
+
+def condensar(texto: str, resumir: Callable[[str, int, int], str], max_tokens_entrada: int,
+              max_tokens_trozo: int, max_paralelo: int = 4, max_niveles: int = 3) -> list[str]:
+    """
+    Reduce `texto` a una lista ordenada de resúmenes que, juntos, caben en
+    `max_tokens_entrada`. `resumir(trozo, indice, total)` resume un trozo;
+    sus excepciones se propagan. Si el texto ya cabe, se devuelve tal cual.
+    Lanza TranscripcionDemasiadoLarga si tras `max_niveles` sigue sin caber
+    o si un nivel no reduce el total (los resúmenes no convergerían).
+    """
+    partes = [texto]
+    nivel = 0
+    tokens = estimar_tokens(texto)
+    while tokens > max_tokens_entrada:
+        if nivel >= max_niveles:
+            raise TranscripcionDemasiadoLarga(nivel, tokens, max_tokens_entrada)
+
+        trozos = trocear_texto("\n\n".join(partes), max_tokens_trozo)
+        nivel += 1
+        log.info("Map-reduce nivel %d: %d trozos (~%d tokens).",
+                 nivel, len(trozos), sum(estimar_tokens(t) for t in trozos))
+        with ThreadPoolExecutor(max_workers=max(1, min(max_paralelo, len(trozos))),
+                                thread_name_prefix="resumen") as executor:
+            partes = list(executor.map(lambda i: resumir(trozos[i], i, len(trozos)), range(len(trozos))))
+
+        anterior, tokens = tokens, sum(estimar_tokens(p) for p in partes)
+        if tokens >= anterior and tokens > max_tokens_entrada:
+            raise TranscripcionDemasiadoLarga(nivel, tokens, max_tokens_entrada)
+    return partes
@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# app.py se configura al importarse: todo lo que escribe en disco va a un
+# directorio temporal y no se precalienta nada ni se llama a Groq.
+_TMP = tempfile.mkdtemp(prefix="reporpousing-tests-")
+os.environ.update(
+    GROQ_API_KEY="test",
+    CACHE_DB_PATH=os.path.join(_TMP, "cache.sqlite3"),
+    JOBS_DB_PATH=os.path.join(_TMP, "jobs.sqlite3"),
+    POT_CACHE_PATH=os.path.join(_TMP, "pot_cache.sqlite3"),
+    CACHE_PACKS_DISCO="0",
+    CALENTAMIENTO_EXTERNO="1",
+    YTDLP_PRECALENTAR="0",
+    YTDLP_CACHE_DIR=os.path.join(_TMP, "yt-dlp"),
+)
+
+
+class RelojFalso:
+    """Sustituye a time.time/time.monotonic; `avanzar` mueve el tiempo sin dormir."""
+
+    def __init__(self, inicio: float = 1000.0):
+        self.ahora = inicio
+        self.esperas: list[float] = []
+
+    def __call__(self) -> float:
+        return self.ahora
+
+    def avanzar(self, segundos: float) -> None:
+        self.ahora += segundos
+
+    def dormir(self, segundos: float) -> None:
+        self.esperas.append(segundos)
+        self.avanzar(segundos)
+
+
+@pytest.fixture
+def reloj():
+    return RelojFalso()
+
+
+@pytest.fixture(scope="session")
+def aplicacion():
+    import app
+    return app
+
+
+@pytest.fixture
+def cliente(aplicacion):
+    return aplicacion.app.test_client()
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("a2wsgi")
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+@pytest.fixture
+def asgi(aplicacion):
+    import asgi
+    return asgi
+
+
+def test_una_peticion_asgi_se_engancha_al_job_del_mismo_video(aplicacion, asgi, monkeypatch):
+    liberar = threading.Event()
+    resultado = {"status": "success", "transcripcion": "hola", "pack_viral": {}}
+
+    def procesar(url, plataformas, informar):
+        informar("descarga")
+        liberar.wait(5)
+        return resultado
+
+    async def procesar_async(url, plataformas, informar):
+        raise AssertionError("debería engancharse al job, no procesar otra vez")
+
+    monkeypatch.setattr(aplicacion, "_procesar_youtube", procesar)
+    monkeypatch.setattr(asgi, "_procesar_youtube_async", procesar_async)
+
+    job = {}
+    hilo = threading.Thread(target=lambda: job.update(r=aplicacion.pipeline_youtube(URL)))
+    hilo.start()
+    while aplicacion.vuelos.estadisticas()["en_vuelo"] < 1:
+        assert hilo.is_alive()
+        time.sleep(0.005)
+
+    async def peticion():
+        recibidos = []
+        tarea = asyncio.create_task(
+            asgi.pipeline_youtube_async(URL, informar=lambda etapa, **datos: recibidos.append(etapa)))
+        for _ in range(1000):
+            if "esperando" in recibidos:
+                break
+            await asyncio.sleep(0.005)
+        liberar.set()
+        return await asyncio.wait_for(tarea, 5)
+
+    assert asyncio.run(peticion()) is resultado
+    hilo.join(5)
+    assert job["r"] is resultado
+
+
+def _llamar_transformar(asgi, desconectar_tras=None):
+    """POST /transformar contra la app ASGI; devuelve los mensajes enviados."""
+    enviados = []
+
+    async def llamar():
+        mensajes = asyncio.Queue()
+        await mensajes.put({"type": "http.request", "body": f"url={URL}".encode(), "more_body": False})
+        if desconectar_tras is not None:
+            asyncio.get_running_loop().call_later(
+                desconectar_tras, mensajes.put_nowait, {"type": "http.disconnect"})
+
+        async def send(mensaje):
+            enviados.append(mensaje)
+
+        scope = {"type": "http", "method": "POST", "path": "/transformar", "query_string": b"",
+                 "headers": [(b"content-type", b"application/x-www-form-urlencoded")]}
+        await asyncio.wait_for(asgi.app(scope, mensajes.get, send), 5)
+
+    asyncio.run(llamar())
+    return enviados
+
+
+def test_transformar_responde_con_el_resultado_del_pipeline(asgi, monkeypatch):
+    async def procesar_async(url, plataformas, informar):
+        informar("descarga")
+        return {"status": "success", "transcripcion": "hola", "pack_viral": {}}
+
+    monkeypatch.setattr(asgi, "_procesar_youtube_async", procesar_async)
+    enviados = _llamar_transformar(asgi)
+
+    assert enviados[0]["status"] == 200
+    assert json.loads(enviados[1]["body"])["transcripcion"] == "hola"
+
+
+def test_si_el_cliente_se_va_el_pipeline_se_corta(asgi, monkeypatch):
+    pasos = []
+
+    async def procesar_async(url, plataformas, informar):
+        while True:
+            informar("descarga", pasos=len(pasos))
+            pasos.append(1)
+            await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(asgi, "_procesar_youtube_async", procesar_async)
+    enviados = _llamar_transformar(asgi, desconectar_tras=0.05)
+
+    assert enviados == []
+    assert 0 < len(pasos) < 100
+    assert asgi.vuelos.estadisticas()["en_vuelo"] == 0
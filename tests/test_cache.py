@@ -0,0 +1,138 @@
+import sqlite3
+import time
+
+from cache import CacheEnCapas, CacheMemoria, CacheSQLite
+
+
+def _fila(ruta, tabla, clave):
+    with sqlite3.connect(ruta) as conn:
+        return conn.execute(f"SELECT ultimo_acceso, accesos FROM {tabla} WHERE clave = ?", (clave,)).fetchone()
+
+
+def test_sqlite_expulsa_la_menos_usada_por_tamano(tmp_path):
+    cache = CacheSQLite(str(tmp_path / "c.sqlite3"), "prueba", max_bytes=30)
+    cache.guardar("a", "x" * 10)
+    cache.guardar("b", "x" * 10)
+    cache.guardar("c", "x" * 10)
+    # El acierto en "a" (aún sin volcar) se escribe antes de expulsar
+    assert cache.obtener("a") == "x" * 10
+    cache.guardar("d", "x" * 10)
+
+    assert cache.obtener("b") is None
+    assert [cache.obtener(c) for c in "acd"] == ["x" * 10] * 3
+    assert cache.estadisticas()["bytes"] == 30
+
+
+def test_sqlite_caduca_por_antiguedad(tmp_path):
+    cache = CacheSQLite(str(tmp_path / "c.sqlite3"), "prueba", max_edad=0.05)
+    cache.guardar("a", "valor")
+    assert cache.obtener("a") == "valor"
+    time.sleep(0.1)
+    assert cache.obtener("a") is None
+    assert cache.estadisticas()["entradas"] == 0
+
+
+def test_sqlite_acumula_los_accesos_y_los_vuelca_por_lotes(tmp_path):
+    ruta = str(tmp_path / "c.sqlite3")
+    cache = CacheSQLite(ruta, "prueba", lote_accesos=3, intervalo_accesos=3600)
+    cache.guardar("a", "valor")
+    creado = _fila(ruta, "cache_prueba", "a")
+
+    cache.obtener("a")
+    cache.obtener("a")
+    assert _fila(ruta, "cache_prueba", "a") == creado
+
+    cache.obtener("no-existe")
+    ultimo, accesos = _fila(ruta, "cache_prueba", "a")
+    assert accesos == 2 and ultimo >= creado[0]
+    estadisticas = cache.estadisticas()
+    assert (estadisticas["aciertos"], estadisticas["fallos"]) == (2, 1)
+
+
+def test_sqlite_estadisticas_incluyen_lo_pendiente(tmp_path):
+    cache = CacheSQLite(str(tmp_path / "c.sqlite3"), "prueba", lote_accesos=100, intervalo_accesos=3600)
+    cache.guardar("a", "valor")
+    cache.obtener("a")
+    assert cache.estadisticas()["aciertos"] == 1
+    assert cache.entradas()[0]["accesos"] == 1
+
+
+def test_memoria_expulsa_la_menos_reciente():
+    cache = CacheMemoria("prueba", max_entradas=2)
+    cache.guardar("a", "1")
+    cache.guardar("b", "2")
+    cache.obtener("a")
+    cache.guardar("c", "3")
+    assert cache.obtener("b") is None
+    assert (cache.obtener("a"), cache.obtener("c")) == ("1", "3")
+
+
+def test_memoria_caduca_por_antiguedad():
+    cache = CacheMemoria("prueba", max_edad=0.05)
+    cache.guardar("a", "1")
+    time.sleep(0.1)
+    assert cache.obtener("a") is None
+
+
+def test_purga_en_un_worker_llega_a_la_memoria_de_otro(tmp_path):
+    ruta = str(tmp_path / "c.sqlite3")
+
+    def worker():
+        return CacheEnCapas(CacheMemoria("packs"), CacheSQLite(ruta, "packs"), intervalo_sincronizacion=0)
+
+    uno, otro = worker(), worker()
+    uno.guardar("k", "pack")
+    assert otro.obtener("k") == "pack"          # ahora también en la memoria de `otro`
+
+    uno.purgar()
+    assert otro.obtener("k") is None
+
+    uno.guardar("k", "pack")
+    assert otro.obtener("k") == "pack"
+    uno.eliminar("k")
+    assert otro.obtener("k") is None
+
+
+def test_eliminar_una_clave_no_vacia_la_memoria_de_otros_workers(tmp_path):
+    ruta = str(tmp_path / "c.sqlite3")
+
+    def worker():
+        return CacheEnCapas(CacheMemoria("packs"), CacheSQLite(ruta, "packs"), intervalo_sincronizacion=0)
+
+    uno, otro = worker(), worker()
+    for clave in ("a", "b"):
+        uno.guardar(clave, f"pack {clave}")
+        otro.obtener(clave)
+
+    assert uno.eliminar("a")
+    assert otro.obtener("a") is None
+    # "b" sigue en la memoria de `otro`: no hace falta volver al disco
+    assert otro.memoria.obtener("b") == "pack b"
+    assert not uno.eliminar("a")
+
+
+def test_si_el_registro_de_borrados_no_llega_se_vacia_la_memoria(tmp_path):
+    ruta = str(tmp_path / "c.sqlite3")
+    uno = CacheEnCapas(CacheMemoria("packs"), CacheSQLite(ruta, "packs"), intervalo_sincronizacion=0)
+    otro = CacheEnCapas(CacheMemoria("packs"), CacheSQLite(ruta, "packs"), intervalo_sincronizacion=3600)
+    for clave in ("a", "b", "c"):
+        uno.guardar(clave, clave)
+        otro.obtener(clave)
+
+    # `otro` no mira el disco mientras `uno` borra dos claves y se descarta
+    # el registro del primer borrado
+    uno.disco.RETENCION_BORRADOS = 0
+    uno.eliminar("a")
+    time.sleep(0.01)
+    uno.eliminar("b")
+
+    otro._sincronizar(forzar=True)
+    assert otro.memoria.estadisticas()["entradas"] == 0
+    assert otro.obtener("c") == "c"
+
+
+def test_sin_disco_la_purga_es_local():
+    cache = CacheEnCapas(CacheMemoria("packs"))
+    cache.guardar("k", "pack")
+    assert cache.purgar() == 1
+    assert cache.obtener("k") is None
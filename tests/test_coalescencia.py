@@ -0,0 +1,254 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from coalescencia import EsperaAgotada, Vuelos
+
+
+class Cancelado(Exception):
+    pass
+
+
+def _sin_progreso(etapa, **datos):
+    pass
+
+
+def _esperar_a(condicion, limite=5.0):
+    fin = time.monotonic() + limite
+    while not condicion():
+        assert time.monotonic() < fin, "la condición no se cumplió a tiempo"
+        time.sleep(0.005)
+
+
+async def _esperar_a_async(condicion, limite=5.0):
+    fin = time.monotonic() + limite
+    while not condicion():
+        assert time.monotonic() < fin, "la condición no se cumplió a tiempo"
+        await asyncio.sleep(0.005)
+
+
+class Hilo(threading.Thread):
+    """Ejecuta vuelos.ejecutar en segundo plano y guarda su resultado o su excepción."""
+
+    def __init__(self, vuelos, clave, funcion, informar=_sin_progreso):
+        super().__init__(daemon=True)
+        self._llamada = lambda: vuelos.ejecutar(clave, funcion, informar=informar)
+        self.resultado = self.error = None
+
+    def run(self):
+        try:
+            self.resultado = self._llamada()
+        except Exception as e:
+            self.error = e
+
+    def terminar(self):
+        self.join(5)
+        assert not self.is_alive()
+        return self
+
+
+def _arrancar(vuelos, funcion, enganchados=2, **kwargs):
+    """Lanza el líder y `enganchados` peticiones con la misma clave, ya todas en el vuelo."""
+    lider = Hilo(vuelos, "video", funcion, **kwargs)
+    lider.start()
+    _esperar_a(lambda: vuelos.estadisticas()["en_vuelo"] == 1)
+    otros = [Hilo(vuelos, "video", funcion) for _ in range(enganchados)]
+    for hilo in otros:
+        hilo.start()
+    _esperar_a(lambda: vuelos.estadisticas()["esperando"] == enganchados)
+    return lider, otros
+
+
+def test_lider_y_enganchados_reciben_el_mismo_resultado():
+    vuelos = Vuelos()
+    liberar = threading.Event()
+    llamadas = []
+
+    def funcion(informar):
+        llamadas.append(1)
+        liberar.wait(5)
+        return {"texto": "hola"}
+
+    lider, otros = _arrancar(vuelos, funcion)
+    liberar.set()
+
+    resultados = [h.terminar().resultado for h in (lider, *otros)]
+    assert len(llamadas) == 1
+    assert all(r is resultados[0] for r in resultados)
+    assert vuelos.estadisticas() == {"en_vuelo": 0, "esperando": 0, "lideres": 1,
+                                     "enganchados": 2, "agotados": 0, "soltados": 0}
+
+
+def test_lider_y_enganchados_reciben_la_misma_excepcion():
+    vuelos = Vuelos()
+    liberar = threading.Event()
+    error = RuntimeError("falló la descarga")
+
+    def funcion(informar):
+        liberar.wait(5)
+        raise error
+
+    lider, otros = _arrancar(vuelos, funcion)
+    liberar.set()
+
+    assert all(h.terminar().error is error for h in (lider, *otros))
+    # El vuelo fallido no se queda colgado: la siguiente petición vuelve a ejecutar
+    assert vuelos.ejecutar("video", lambda informar: "otra vez", informar=_sin_progreso) == "otra vez"
+
+
+def test_el_progreso_llega_a_todos():
+    vuelos = Vuelos()
+    liberar = threading.Event()
+    recibidos = {"lider": [], "otro": []}
+
+    def funcion(informar):
+        liberar.wait(5)
+        informar("transcripcion", porcentaje=50)
+        return "ok"
+
+    lider = Hilo(vuelos, "video", funcion, informar=lambda e, **d: recibidos["lider"].append((e, d)))
+    lider.start()
+    _esperar_a(lambda: vuelos.estadisticas()["en_vuelo"] == 1)
+    otro = Hilo(vuelos, "video", funcion, informar=lambda e, **d: recibidos["otro"].append((e, d)))
+    otro.start()
+    _esperar_a(lambda: vuelos.estadisticas()["esperando"] == 1)
+    liberar.set()
+    lider.terminar()
+    otro.terminar()
+
+    assert recibidos["lider"] == [("transcripcion", {"porcentaje": 50})]
+    assert recibidos["otro"] == [("esperando", {"coalescido": True}), ("transcripcion", {"porcentaje": 50})]
+
+
+def test_el_enganchado_agota_su_espera_sin_parar_al_lider():
+    vuelos = Vuelos(espera_max=0.05)
+    liberar = threading.Event()
+
+    def funcion(informar):
+        liberar.wait(5)
+        return "ok"
+
+    lider = Hilo(vuelos, "video", funcion)
+    lider.start()
+    _esperar_a(lambda: vuelos.estadisticas()["en_vuelo"] == 1)
+
+    with pytest.raises(EsperaAgotada) as error:
+        vuelos.ejecutar("video", funcion, informar=_sin_progreso)
+    assert error.value.status == 504
+    assert vuelos.estadisticas()["agotados"] == 1
+
+    liberar.set()
+    assert lider.terminar().resultado == "ok"
+
+
+def test_el_trabajo_solo_se_aborta_cuando_se_suelta_el_ultimo():
+    vuelos = Vuelos()
+    cancelado = {"lider": threading.Event(), "otro": threading.Event()}
+    pasos = []
+    abortado = threading.Event()
+
+    def informar_de(quien):
+        def informar(etapa, **datos):
+            if cancelado[quien].is_set():
+                raise Cancelado(quien)
+        return informar
+
+    def funcion(informar):
+        try:
+            while True:
+                pasos.append(1)
+                informar("descarga", pasos=len(pasos))
+                time.sleep(0.005)
+        except Cancelado:
+            abortado.set()
+            raise
+
+    lider = Hilo(vuelos, "video", funcion, informar=informar_de("lider"))
+    lider.start()
+    _esperar_a(lambda: vuelos.estadisticas()["en_vuelo"] == 1)
+    otro = Hilo(vuelos, "video", funcion, informar=informar_de("otro"))
+    otro.start()
+    _esperar_a(lambda: vuelos.estadisticas()["esperando"] == 1)
+
+    # Se cancela el líder: el trabajo sigue para el otro
+    cancelado["lider"].set()
+    _esperar_a(lambda: vuelos.estadisticas()["soltados"] == 1)
+    hechos = len(pasos)
+    _esperar_a(lambda: len(pasos) > hechos + 5)
+    assert not abortado.is_set()
+    assert lider.is_alive() and otro.is_alive()
+
+    # Se cancela el último: ahora sí se aborta
+    cancelado["otro"].set()
+    _esperar_a(abortado.is_set)
+    assert str(lider.terminar().error) == "lider"
+    assert str(otro.terminar().error) == "otro"
+    assert vuelos.estadisticas()["en_vuelo"] == 0
+
+
+def test_una_corrutina_se_engancha_al_vuelo_de_un_hilo():
+    vuelos = Vuelos()
+    liberar = threading.Event()
+
+    def funcion(informar):
+        liberar.wait(5)
+        return {"texto": "hola"}
+
+    async def funcion_async(informar):
+        raise AssertionError("debería engancharse, no ejecutar")
+
+    lider = Hilo(vuelos, "video", funcion)
+    lider.start()
+    _esperar_a(lambda: vuelos.estadisticas()["en_vuelo"] == 1)
+
+    async def enganchado():
+        tarea = asyncio.create_task(vuelos.ejecutar_async("video", funcion_async, informar=_sin_progreso))
+        await _esperar_a_async(lambda: vuelos.estadisticas()["esperando"] == 1)
+        liberar.set()
+        # Lo despierta el aviso al aterrizar, sin esperar al sondeo de 1 s
+        return await asyncio.wait_for(tarea, 0.5)
+
+    assert asyncio.run(enganchado()) is lider.terminar().resultado
+
+
+def test_un_hilo_se_engancha_al_vuelo_de_una_corrutina():
+    vuelos = Vuelos()
+    recibidos = []
+
+    async def funcion_async(liberar, informar):
+        await asyncio.to_thread(liberar.wait, 5)
+        informar("transcripcion", porcentaje=50)
+        return {"texto": "hola"}
+
+    async def lider():
+        liberar = threading.Event()
+        tarea = asyncio.create_task(
+            vuelos.ejecutar_async("video", funcion_async, liberar, informar=_sin_progreso))
+        await _esperar_a_async(lambda: vuelos.estadisticas()["en_vuelo"] == 1)
+        otro = Hilo(vuelos, "video", lambda informar: "no", informar=lambda e, **d: recibidos.append(e))
+        otro.start()
+        await _esperar_a_async(lambda: vuelos.estadisticas()["esperando"] == 1)
+        liberar.set()
+        return await tarea, otro
+
+    resultado, otro = asyncio.run(lider())
+    assert otro.terminar().resultado is resultado
+    assert recibidos == ["esperando", "transcripcion"]
+
+
+def test_la_corrutina_enganchada_agota_su_espera():
+    vuelos = Vuelos(espera_max=0.05)
+    liberar = threading.Event()
+    lider = Hilo(vuelos, "video", lambda informar: liberar.wait(5) and "ok")
+    lider.start()
+    _esperar_a(lambda: vuelos.estadisticas()["en_vuelo"] == 1)
+
+    async def funcion_async(informar):
+        raise AssertionError("debería engancharse, no ejecutar")
+
+    with pytest.raises(EsperaAgotada):
+        asyncio.run(vuelos.ejecutar_async("video", funcion_async, informar=_sin_progreso))
+    liberar.set()
+    assert lider.terminar().resultado == "ok"
@@ -0,0 +1,179 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import compresion
+from compresion import ColaFfmpegLlena, EjecutorFfmpeg, admite_paso_directo
+
+# Escribe su pid y luego una línea cada 10 ms hasta que lo maten
+INCANSABLE = [sys.executable, "-u", "-c",
+              "import os, time\nprint(os.getpid())\nwhile True:\n    print('x')\n    time.sleep(0.01)"]
+MUDO = [sys.executable, "-u", "-c", "import os, time\nprint(os.getpid())\ntime.sleep(30)"]
+
+
+class Cancelado(Exception):
+    pass
+
+
+def _esperar_a(condicion, limite=5.0):
+    fin = time.monotonic() + limite
+    while not condicion():
+        assert time.monotonic() < fin, "la condición no se cumplió a tiempo"
+        time.sleep(0.005)
+
+
+def _sondeo(codec="mp3", contenedor="mp3", canales=1, frecuencia="16000", bitrate="32000", **extra):
+    """Salida de sondear_audio (ffprobe -of json) para un archivo de una sola pista."""
+    pista = {"codec_type": "audio", "codec_name": codec, "channels": canales,
+             "sample_rate": frecuencia, "bit_rate": bitrate}
+    return {"streams": [{**pista, **extra}], "format": {"format_name": contenedor, "bit_rate": bitrate}}
+
+
+def _muerto(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    return False
+
+
+# ---------------------------------------------------------------------------
+# PASO DIRECTO
+# ---------------------------------------------------------------------------
+
+@pytest.fixture(autouse=True)
+def umbral(monkeypatch):
+    monkeypatch.setattr(compresion, "PASO_DIRECTO_MAX_KBPS", 48)
+
+
+@pytest.mark.parametrize("ruta, sondeo", [
+    ("a.mp3", _sondeo()),
+    ("a.flac", _sondeo("flac", "flac", bitrate="48000")),
+    # ffprobe da 48 kHz para cualquier Opus: ahí solo cuentan canales y bitrate
+    ("a.ogg", _sondeo("opus", "ogg", frecuencia="48000", bitrate="24000")),
+    ("a.webm", _sondeo("opus", "matroska,webm", frecuencia="48000", bitrate="24000")),
+    ("A.WEBM", _sondeo("opus", "matroska,webm", frecuencia="48000", bitrate="24000")),
+    # Sin bitrate en la pista vale el del contenedor
+    ("a.mp3", {"streams": [{"codec_type": "audio", "codec_name": "mp3", "channels": 1, "sample_rate": "16000"}],
+               "format": {"format_name": "mp3", "bit_rate": "32000"}}),
+], ids=["mp3", "flac", "opus_ogg", "opus_webm", "extension_en_mayusculas", "bitrate_del_formato"])
+def test_pasa_directo(monkeypatch, ruta, sondeo):
+    monkeypatch.setattr(compresion, "sondear_audio", lambda r: sondeo)
+    assert admite_paso_directo(ruta)
+
+
+@pytest.mark.parametrize("ruta, sondeo", [
+    # yt-dlp puede dejar un webm con nombre .m4a: Groq se fiaría de la extensión
+    ("a.m4a", _sondeo("opus", "matroska,webm", frecuencia="48000", bitrate="24000")),
+    ("a.ogg", _sondeo("mp3", "mp3")),
+    ("a.mp3", _sondeo(canales=2)),
+    ("a.mp3", _sondeo(frecuencia="44100")),
+    ("a.mp3", _sondeo(frecuencia="48000")),
+    ("a.ogg", _sondeo("opus", "ogg", frecuencia="48000", bitrate="48001")),
+    ("a.ogg", _sondeo("opus", "ogg", canales=2, frecuencia="48000", bitrate="24000")),
+    ("a.mp3", _sondeo(bitrate=None)),
+    ("a.mp3", _sondeo(bitrate="N/A")),
+    ("a.m4a", _sondeo("aac", "mov,mp4,m4a,3gp,3g2,mj2")),
+    ("a.mp3", {**_sondeo(), "streams": [_sondeo()["streams"][0], {"codec_type": "video", "codec_name": "mjpeg"}]}),
+    ("a.mp3", None),
+], ids=["webm_llamado_m4a", "extension_distinta", "estereo", "44k", "48k_sin_opus", "bitrate_alto",
+        "opus_estereo", "sin_bitrate", "bitrate_ilegible", "aac", "caratula", "sin_sondeo"])
+def test_no_pasa_directo(monkeypatch, ruta, sondeo):
+    monkeypatch.setattr(compresion, "sondear_audio", lambda r: sondeo)
+    assert not admite_paso_directo(ruta)
+
+
+def test_el_umbral_de_bitrate_es_inclusivo_y_cero_lo_desactiva(monkeypatch):
+    monkeypatch.setattr(compresion, "sondear_audio", lambda r: _sondeo(bitrate="48000"))
+    assert admite_paso_directo("a.mp3")
+
+    monkeypatch.setattr(compresion, "PASO_DIRECTO_MAX_KBPS", 32)
+    assert not admite_paso_directo("a.mp3")
+
+    monkeypatch.setattr(compresion, "PASO_DIRECTO_MAX_KBPS", 0)
+    monkeypatch.setattr(compresion, "sondear_audio", lambda r: _sondeo())
+    assert not admite_paso_directo("a.mp3")
+
+
+# ---------------------------------------------------------------------------
+# EJECUTOR DE FFMPEG
+# ---------------------------------------------------------------------------
+
+def test_con_la_cola_llena_se_rechaza_sin_esperar():
+    ejecutor = EjecutorFfmpeg(max_paralelo=1, max_cola=1, espera_max=5)
+    inicio = ejecutor.adquirir()
+    esperando = threading.Thread(target=lambda: ejecutor.liberar(ejecutor.adquirir(), "ok"))
+    esperando.start()
+    _esperar_a(lambda: ejecutor.estadisticas()["en_cola"] == 1)
+
+    antes = time.monotonic()
+    with pytest.raises(ColaFfmpegLlena):
+        ejecutor.ejecutar([sys.executable, "-c", "pass"])
+    assert time.monotonic() - antes < 1
+
+    ejecutor.liberar(inicio, "ok")
+    esperando.join(5)
+    estadisticas = ejecutor.estadisticas()
+    assert estadisticas["rechazados"] == 1
+    assert estadisticas["ok"] == 2
+    assert (estadisticas["en_curso"], estadisticas["en_cola"]) == (0, 0)
+
+
+def test_sin_hueco_en_espera_max_se_rechaza():
+    ejecutor = EjecutorFfmpeg(max_paralelo=1, max_cola=4, espera_max=0.05)
+    inicio = ejecutor.adquirir()
+
+    with pytest.raises(ColaFfmpegLlena):
+        ejecutor.ejecutar([sys.executable, "-c", "pass"])
+    ejecutor.liberar(inicio, "ok")
+
+    assert ejecutor.estadisticas()["rechazados"] == 1
+    assert ejecutor.estadisticas()["en_cola"] == 0
+
+
+def test_el_timeout_mata_el_proceso():
+    ejecutor = EjecutorFfmpeg(max_paralelo=1, max_cola=0, timeout=0.3)
+    pids = []
+
+    antes = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        ejecutor.ejecutar(MUDO, lambda linea: pids.append(int(linea)))
+
+    assert time.monotonic() - antes < 5
+    assert _muerto(pids[0])
+    estadisticas = ejecutor.estadisticas()
+    assert estadisticas["timeout"] == 1
+    assert estadisticas["en_curso"] == 0
+
+
+def test_si_el_callback_lanza_se_mata_el_proceso_y_cuenta_como_cancelado():
+    ejecutor = EjecutorFfmpeg(max_paralelo=1, max_cola=0)
+    lineas = []
+
+    def al_linea(linea):
+        lineas.append(linea)
+        if len(lineas) == 3:
+            raise Cancelado
+
+    with pytest.raises(Cancelado):
+        ejecutor.ejecutar(INCANSABLE, al_linea)
+
+    assert _muerto(int(lineas[0]))
+    estadisticas = ejecutor.estadisticas()
+    assert estadisticas["cancelado"] == 1
+    assert estadisticas["en_curso"] == 0
+    # El hueco se ha devuelto
+    ejecutor.liberar(ejecutor.adquirir(), "ok")
+
+
+def test_un_codigo_de_salida_distinto_de_cero_lanza():
+    ejecutor = EjecutorFfmpeg(max_paralelo=1, max_cola=0)
+
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        ejecutor.ejecutar([sys.executable, "-c", "raise SystemExit(3)"])
+    assert error.value.returncode == 3
+    assert ejecutor.estadisticas()["error"] == 1
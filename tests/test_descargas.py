@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("yt_dlp")
+
+from yt_dlp.networking.exceptions import TransportError  # noqa: E402
+
+from compresion import ColaFfmpegLlena  # noqa: E402
+from descargas import PoolOcupado, PoolYoutubeDL  # noqa: E402
+from ingesta import ErrorIngesta  # noqa: E402
+from jobs import JobCancelado  # noqa: E402
+
+
+class LoggerMudo:
+
+    def debug(self, mensaje):
+        pass
+
+    info = warning = error = debug
+
+
+@pytest.mark.parametrize("verbose", [True, False])
+def test_las_instancias_y_sus_handlers_comparten_el_cookie_jar(verbose):
+    # Con verbose, YoutubeDL imprime la cabecera de depuración al construirse,
+    # y eso crea el request director con el jar de la instancia
+    pool = PoolYoutubeDL({"verbose": verbose, "quiet": not verbose, "logger": LoggerMudo()}, tamano=2)
+    with pool.prestar() as uno, pool.prestar() as otro:
+        assert uno is not otro
+        for ydl in (uno, otro):
+            assert ydl.cookiejar is pool._cookiejar
+            handlers = list(ydl._request_director.handlers.values())
+            assert handlers
+            assert all(rh.cookiejar is pool._cookiejar for rh in handlers)
+    pool.cerrar()
+
+
+def test_instancia_retirada_tras_max_usos():
+    pool = PoolYoutubeDL({"quiet": True, "logger": LoggerMudo()}, tamano=1, max_usos=2)
+    with pool.prestar() as primera:
+        pass
+    with pool.prestar() as segunda:
+        assert segunda is primera
+    with pool.prestar() as tercera:
+        assert tercera is not primera
+        assert tercera.cookiejar is pool._cookiejar
+    pool.cerrar()
+
+
+
+class Cancelado(Exception):
+    pass
+
+
+@pytest.mark.parametrize("max_usos,error", [(200, True), (1, False)])
+def test_retirar_una_instancia_despierta_a_quien_espera(max_usos, error):
+    # Se retira por la excepción del préstamo o por haber llegado a max_usos
+    pool = PoolYoutubeDL({"quiet": True, "logger": LoggerMudo()}, tamano=1, max_usos=max_usos, timeout=5)
+    obtenida = {}
+
+    def esperar():
+        with pool.prestar() as ydl:
+            obtenida["ydl"] = ydl
+
+    espera = threading.Thread(target=esperar)
+    try:
+        with pool.prestar() as primera:
+            espera.start()
+            while pool.estadisticas()["esperas"] < 1:
+                time.sleep(0.005)
+            if error:
+                raise Cancelado()
+    except Cancelado:
+        pass
+
+    espera.join(5)
+    assert not espera.is_alive()
+    assert obtenida["ydl"] is not primera
+    pool.cerrar()
+
+
+def test_la_espera_de_una_instancia_tiene_limite():
+    pool = PoolYoutubeDL({"quiet": True, "logger": LoggerMudo()}, tamano=1, timeout=0.05)
+    with pool.prestar():
+        with pytest.raises(PoolOcupado):
+            with pool.prestar():
+                pass
+    pool.cerrar()
+
+class YdlFalso:
+    """Solo lo que usa _descargar_comprimiendo: un formato HTTP apto para streaming."""
+
+    def extract_info(self, url, download=False):
+        return {"url": "https://media.example/audio", "protocol": "https", "format_id": "251"}
+
+    def urlopen(self, peticion):
+        raise AssertionError("comprimir_desde_url está sustituido")
+
+
+def _streaming_falla_con(aplicacion, monkeypatch, error):
+    def comprimir(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(aplicacion, "comprimir_desde_url", comprimir)
+    return aplicacion._descargar_comprimiendo(YdlFalso(), "https://youtu.be/xxxxxxxxxxx", lambda *a, **k: None)
+
+
+@pytest.mark.parametrize("error", [
+    OSError("conexión reiniciada"),
+    TransportError("timeout"),
+    ErrorIngesta("No se pudo procesar el audio subido."),
+])
+def test_errores_de_red_o_de_ffmpeg_vuelven_a_la_descarga_clasica(aplicacion, monkeypatch, error):
+    assert _streaming_falla_con(aplicacion, monkeypatch, error) is None
+
+
+@pytest.mark.parametrize("error", [JobCancelado(), KeyError("url")])
+def test_la_cancelacion_y_los_errores_inesperados_se_propagan(aplicacion, monkeypatch, error):
+    with pytest.raises(type(error)):
+        _streaming_falla_con(aplicacion, monkeypatch, error)
+
+
+def test_ffmpeg_saturado_es_un_503_y_no_descarga_a_disco(aplicacion, monkeypatch):
+    with pytest.raises(aplicacion.ErrorPipeline) as error:
+        _streaming_falla_con(aplicacion, monkeypatch, ColaFfmpegLlena("sin hueco"))
+    assert error.value.status == 503
@@ -0,0 +1,202 @@
+import base64
+import json
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("yt_dlp")
+
+from yt_dlp.extractor.youtube.pot._builtin.memory_cache import MemoryLRUPCP, memorylru_preference  # noqa: E402
+from yt_dlp.extractor.youtube.pot._builtin.webpo_cachespec import WebPoPCSP  # noqa: E402
+from yt_dlp.extractor.youtube.pot._director import PoTokenCache, PoTokenRequestDirector  # noqa: E402
+from yt_dlp.extractor.youtube.pot._provider import IEContentProviderLogger  # noqa: E402
+from yt_dlp.extractor.youtube.pot._registry import _pot_cache_providers  # noqa: E402
+from yt_dlp.extractor.youtube.pot.provider import (PoTokenContext, PoTokenProvider,  # noqa: E402
+                                                   PoTokenProviderRejectedRequest, PoTokenRequest,
+                                                   PoTokenResponse)
+
+from conftest import RAIZ  # noqa: E402
+from yt_dlp_plugins.extractor.getpot_bgutil import BgUtilPTPBase, BgUtilSQLitePCP  # noqa: E402
+
+
+class ProveedorFalso(BgUtilPTPBase):
+    PROVIDER_NAME = "falso"
+
+    def __init__(self, parametros, respuesta):
+        self.ie = SimpleNamespace(get_param=parametros.get)
+        self._respuesta = respuesta
+
+    def is_available(self):
+        return True
+
+    def _real_request_pot(self, request):
+        if isinstance(self._respuesta, Exception):
+            raise self._respuesta
+        return self._respuesta
+
+
+@pytest.fixture(autouse=True)
+def sin_validacion(monkeypatch):
+    monkeypatch.setattr(PoTokenProvider, "request_pot", lambda self, request: self._real_request_pot(request))
+
+
+def test_el_plugin_no_importa_la_app():
+    codigo = "import sys, yt_dlp_plugins.extractor.getpot_bgutil; print('metricas' in sys.modules)"
+    salida = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True, check=True)
+    assert salida.stdout.strip() == "False"
+
+
+def test_latencia_se_informa_al_observador_inyectado():
+    observaciones = []
+    parametros = {"observar_latencia_pot": lambda *datos: observaciones.append(datos)}
+
+    ProveedorFalso(parametros, PoTokenResponse("token")).request_pot(None)
+    with pytest.raises(PoTokenProviderRejectedRequest):
+        ProveedorFalso(parametros, PoTokenProviderRejectedRequest("no")).request_pot(None)
+
+    assert [(proveedor, resultado) for _, proveedor, resultado in observaciones] == [
+        ("falso", "ok"), ("falso", "rechazada")]
+    assert all(segundos >= 0 for segundos, _, _ in observaciones)
+
+
+def test_sin_observador_no_se_mide():
+    assert ProveedorFalso({}, PoTokenResponse("token")).request_pot(None).po_token == "token"
+
+
+# ---------------------------------------------------------------------------
+# CACHÉ COMPARTIDA
+# ---------------------------------------------------------------------------
+
+class RegistroMudo(IEContentProviderLogger):
+    log_level = IEContentProviderLogger.LogLevel.INFO
+
+    def trace(self, message):
+        pass
+
+    def debug(self, message, *, once=False):
+        pass
+
+    def info(self, message, *, once=False):
+        pass
+
+    def warning(self, message, *, once=False):
+        pass
+
+    def error(self, message, cause=None):
+        raise AssertionError(message)
+
+
+@pytest.fixture
+def ruta_cache(tmp_path, monkeypatch):
+    ruta = str(tmp_path / "pot_cache.sqlite3")
+    monkeypatch.setenv("POT_CACHE_PATH", ruta)
+    return ruta
+
+
+def _cache_sqlite():
+    return BgUtilSQLitePCP(SimpleNamespace(get_param={}.get), RegistroMudo(), {})
+
+
+def _director(proveedor):
+    """Lo que monta initialize_pot_director para un worker: caché en memoria propia y la SQLite común."""
+    ie = SimpleNamespace(get_param={}.get)
+    memoria = MemoryLRUPCP(ie, RegistroMudo(), {}, initialize_cache=lambda tamano: ({}, threading.Lock(), tamano))
+    cache = PoTokenCache(RegistroMudo(), [memoria, _cache_sqlite()], [WebPoPCSP(ie, RegistroMudo(), {})],
+                         [memorylru_preference])
+    director = PoTokenRequestDirector(RegistroMudo(), cache)
+    director.register_provider(proveedor)
+    return director
+
+
+def _claves(ruta):
+    with sqlite3.connect(ruta) as conn:
+        return [fila[0] for fila in conn.execute("SELECT clave FROM po_tokens")]
+
+
+def _token(n):
+    """yt-dlp solo acepta PO tokens en base64."""
+    return base64.urlsafe_b64encode(f"token-{n}".encode()).decode()
+
+
+def _peticion(**campos):
+    return PoTokenRequest(**{"context": PoTokenContext.GVS, "innertube_context": {"client": {"clientName": "WEB"}},
+                             "visitor_data": "visitante", **campos})
+
+
+class ContadorPTP(BgUtilPTPBase):
+    PROVIDER_NAME = "contador"
+
+    def __init__(self):
+        self.ie = SimpleNamespace(get_param={}.get)
+        self.llamadas = 0
+
+    def is_available(self):
+        return True
+
+    def _real_request_pot(self, request):
+        self.llamadas += 1
+        return PoTokenResponse(_token(self.llamadas))
+
+
+def test_la_cache_sqlite_esta_registrada_en_yt_dlp():
+    assert _pot_cache_providers.value[BgUtilSQLitePCP.PROVIDER_KEY] is BgUtilSQLitePCP
+
+
+def test_guarda_lee_y_borra(ruta_cache):
+    cache = _cache_sqlite()
+    assert cache.is_available()
+    assert cache.get("clave") is None
+
+    cache.store("clave", "valor", int(time.time()) + 3600)
+    assert _cache_sqlite().get("clave") == "valor"
+
+    cache.delete("clave")
+    assert cache.get("clave") is None
+
+
+def test_no_sirve_tokens_a_punto_de_caducar(ruta_cache):
+    cache = _cache_sqlite()
+    cache.store("casi", "valor", int(time.time()) + BgUtilSQLitePCP.MARGEN_CADUCIDAD - 1)
+    assert cache.get("casi") is None
+
+
+def test_la_caducidad_no_pasa_del_ttl(ruta_cache, monkeypatch):
+    monkeypatch.setenv("POT_CACHE_TTL", str(BgUtilSQLitePCP.MARGEN_CADUCIDAD))
+    cache = _cache_sqlite()
+    cache.store("lejana", "valor", int(time.time()) + 10 * 24 * 3600)
+    assert cache.get("lejana") is None
+
+
+def test_sin_ruta_esta_desactivada(monkeypatch):
+    monkeypatch.setenv("POT_CACHE_PATH", "")
+    assert not _cache_sqlite().is_available()
+
+
+def test_los_workers_comparten_tokens_con_las_claves_de_yt_dlp(ruta_cache):
+    primero, segundo = ContadorPTP(), ContadorPTP()
+
+    assert _director(primero).get_po_token(_peticion()) == _token(1)
+    # Otro worker (otra caché en memoria) reutiliza el token sin generar
+    assert _director(segundo).get_po_token(_peticion()) == _token(1)
+    assert segundo.llamadas == 0
+
+    # Otro content binding es otra clave: el segundo worker genera el suyo
+    _director(segundo).get_po_token(_peticion(visitor_data="otro"))
+    assert segundo.llamadas == 1
+
+    claves = _claves(ruta_cache)
+    assert len(claves) == 2
+    assert {json.loads(_cache_sqlite().get(clave))["po_token"] for clave in claves} == {_token(1)}
+
+
+def test_bypass_cache_genera_y_guarda_el_token_nuevo(ruta_cache):
+    contador = ContadorPTP()
+    _director(contador).get_po_token(_peticion())
+
+    assert _director(contador).get_po_token(_peticion(bypass_cache=True)) == _token(2)
+    assert _director(ContadorPTP()).get_po_token(_peticion()) == _token(2)
@@ -0,0 +1,128 @@
+import gc
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("yt_dlp")
+
+from yt_dlp import YoutubeDL  # noqa: E402
+from yt_dlp.networking.common import Response  # noqa: E402
+from yt_dlp.networking.exceptions import TransportError  # noqa: E402
+
+from yt_dlp_plugins.extractor.getpot_bgutil_http import EstadoServidor  # noqa: E402
+
+
+class RedFalsa:
+    """Hace de YoutubeDL: urlopen anota la petición y responde según `sano`."""
+
+    def __init__(self, sano: bool = False):
+        self.sano = sano
+        self.peticiones = []
+
+    def urlopen(self, peticion):
+        self.peticiones.append(peticion)
+        if not self.sano:
+            raise TransportError("Connection refused")
+        return Response(io.BytesIO(b'{"version": "1.2.2"}'), peticion.url, {}, status=200)
+
+
+def _estado_rapido() -> EstadoServidor:
+    estado = EstadoServidor("http://127.0.0.1:4416", timeout_ping=1)
+    estado.BACKOFF_INICIAL = 0.01
+    estado.BACKOFF_MAXIMO = 0.02
+    return estado
+
+
+def _esperar(condicion, timeout: float = 3.0) -> bool:
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if condicion():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_peticion_por_la_red_de_yt_dlp_sin_proxy():
+    red = RedFalsa(sano=True)
+    estado = EstadoServidor("http://127.0.0.1:4416/", timeout_ping=3)
+    assert estado.ping(red.urlopen)
+    assert (estado.disponible, estado.version) == (True, "1.2.2")
+    peticion = red.peticiones[0]
+    assert peticion.url == "http://127.0.0.1:4416/ping"
+    assert peticion.proxies == {"all": None}
+    assert peticion.extensions["timeout"] == 3
+
+
+def test_vigilante_termina_cuando_el_servidor_vuelve():
+    red = RedFalsa()
+    estado = _estado_rapido()
+    estado.usar_red(red.urlopen)
+    assert not estado.ping(red.urlopen)
+    assert estado._vigilante.is_alive()
+    assert _esperar(lambda: len(red.peticiones) >= 3)
+
+    red.sano = True
+    assert _esperar(lambda: not estado._vigilante.is_alive())
+    assert estado.disponible
+
+
+def test_vigilante_termina_sin_youtubedl_vivo():
+    red = RedFalsa()
+    estado = _estado_rapido()
+    estado.usar_red(red.urlopen)
+    estado.ping(red.urlopen)
+    del red
+    gc.collect()
+    assert _esperar(lambda: not estado._vigilante.is_alive())
+    assert estado.disponible is False
+
+
+def test_detener_para_el_vigilante():
+    red = RedFalsa()
+    estado = _estado_rapido()
+    estado.usar_red(red.urlopen)
+    estado.ping(red.urlopen)
+    estado.detener(timeout=2)
+    assert not estado._vigilante.is_alive()
+    # Ya detenido, un nuevo fallo no arranca otro hilo
+    estado.marcar_caido("sigue caído")
+    assert not estado._vigilante.is_alive()
+
+
+class ServidorViejo(BaseHTTPRequestHandler):
+    """Servidor bgutil sin /ping que sí genera tokens."""
+
+    def do_GET(self):
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        cuerpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        datos = json.dumps({"poToken": "token-" + cuerpo["content_binding"]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_con_youtubedl_real_y_servidor_sin_ping():
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ServidorViejo)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    try:
+        estado = EstadoServidor(f"http://127.0.0.1:{servidor.server_port}", timeout_ping=2)
+        with YoutubeDL({"quiet": True, "proxy": "http://127.0.0.1:9"}) as ydl:
+            # Un 404 en /ping es un servidor antiguo: disponible, sin versión
+            assert estado.ping(ydl.urlopen)
+            status, datos = estado.peticion(ydl.urlopen, "/get_pot", json.dumps({"content_binding": "abc"}).encode())
+        assert (status, json.loads(datos)) == (200, {"poToken": "token-abc"})
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
@@ -0,0 +1,42 @@
+import sys
+
+import pytest
+
+pytest.importorskip("yt_dlp")
+
+from yt_dlp_plugins.extractor import getpot_bgutil_worker  # noqa: E402
+from yt_dlp_plugins.extractor.getpot_bgutil_worker import ErrorWorker, PoolWorkersNode, WorkerNode  # noqa: E402
+
+# Un worker que nunca contesta al ping y otro que contesta sin `pong`
+MUDO = "import time; time.sleep(60)"
+SIN_PONG = "import json, sys; print(json.dumps({'id': json.loads(sys.stdin.readline())['id']}), flush=True)"
+
+
+@pytest.fixture
+def arrancados(monkeypatch):
+    workers = []
+
+    class WorkerRegistrado(WorkerNode):
+        def __init__(self, comando):
+            super().__init__(comando)
+            workers.append(self)
+
+    monkeypatch.setattr(getpot_bgutil_worker, "WorkerNode", WorkerRegistrado)
+    return workers
+
+
+@pytest.mark.parametrize("codigo", [MUDO, SIN_PONG], ids=["mudo", "sin_pong"])
+def test_un_arranque_fallido_no_deja_el_proceso_vivo(arrancados, codigo):
+    pool = PoolWorkersNode([sys.executable, "-c", codigo], tamano=1, timeout=0.5,
+                           intervalo_salud=3600, max_fallos_arranque=2)
+    try:
+        for _ in range(2):
+            with pytest.raises(ErrorWorker, match="no se pudo arrancar"):
+                pool.generar({"challenge": None})
+
+        assert len(arrancados) == 2
+        assert all(worker.proceso.poll() is not None for worker in arrancados)
+        # Tras max_fallos_arranque el pool descansa
+        assert not pool.disponible
+    finally:
+        pool.cerrar()
@@ -0,0 +1,57 @@
+import io
+import os
+import shutil
+import wave
+
+import pytest
+
+
+def _relleno(n: int) -> bytes:
+    # Cada bloque leído acaba en un \r\n que podría empezar el boundary, así
+    # que Werkzeug retiene esos bytes y los suma al bloque siguiente
+    return b"\r\n" * (n // 2)
+
+
+def _wav(segundos: float, frecuencia: int = 16000) -> bytes:
+    salida = io.BytesIO()
+    with wave.open(salida, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(frecuencia)
+        w.writeframes(_relleno(int(segundos * frecuencia) * 2))
+    return salida.getvalue()
+
+
+@pytest.fixture
+def recibidos(aplicacion, monkeypatch):
+    """Sustituye el pipeline: anota lo que llega de la ingesta y no llama a Groq."""
+    llamadas = []
+
+    def pipeline_falso(ruta, clave_cache, comprimido, plataformas, informar=None):
+        llamadas.append({"bytes": os.path.getsize(ruta), "clave": clave_cache, "comprimido": comprimido})
+        os.remove(ruta)
+        return {"transcripcion": "ok"}
+
+    monkeypatch.setattr(aplicacion, "pipeline_archivo", pipeline_falso)
+    return llamadas
+
+
+def test_subida_de_varios_bloques_sin_pipe(cliente, recibidos):
+    # m4a se guarda tal cual: comprueba el multipart sin depender de ffmpeg
+    contenido = _relleno(5 * 64 * 1024 + 124)
+    r = cliente.post("/subir", data={"file": (io.BytesIO(contenido), "audio.m4a")},
+                     content_type="multipart/form-data")
+    assert r.status_code == 200, r.get_json()
+    assert recibidos == [{"bytes": len(contenido), "clave": recibidos[0]["clave"], "comprimido": False}]
+    assert recibidos[0]["clave"].startswith("sha256:")
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="requiere ffmpeg")
+def test_subida_de_varios_bloques_comprimida_al_vuelo(cliente, recibidos):
+    contenido = _wav(8)
+    assert len(contenido) > 3 * 64 * 1024
+    r = cliente.post("/subir", data={"file": (io.BytesIO(contenido), "audio.wav"), "plataformas": "resumen"},
+                     content_type="multipart/form-data")
+    assert r.status_code == 200, r.get_json()
+    assert len(recibidos) == 1 and recibidos[0]["comprimido"]
+    assert 0 < recibidos[0]["bytes"] < len(contenido)
@@ -0,0 +1,97 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from jobs import (ESTADO_COMPLETADO, ESTADO_EN_COLA, ESTADO_EN_PROCESO, ESTADO_ERROR, MENSAJE_HUERFANO,
+                  BackendMemoria, BackendSQLite, ColaJobs, ColaLlena, Job, identidad_proceso, proceso_vivo)
+
+
+class BackendQueFalla(BackendMemoria):
+
+    def guardar(self, job):
+        raise OSError("disco lleno")
+
+
+def _pid_muerto() -> int:
+    proceso = subprocess.Popen([sys.executable, "-c", "pass"])
+    proceso.wait()
+    return proceso.pid
+
+
+def test_encolar_no_retiene_el_hueco_si_falla_el_guardado():
+    cola = ColaJobs(BackendQueFalla(), max_workers=1, max_pendientes=0)
+    for _ in range(3):
+        with pytest.raises(OSError):
+            cola.encolar("prueba", lambda informar: {})
+    assert cola.activos == 0
+    assert cola._cancelaciones == {}
+
+
+def test_encolar_respeta_el_limite_y_libera_al_terminar():
+    cola = ColaJobs(BackendMemoria(), max_workers=1, max_pendientes=0)
+    soltar = threading.Event()
+    job_id = cola.encolar("prueba", lambda informar: soltar.wait(5) and {"ok": True})
+    with pytest.raises(ColaLlena):
+        cola.encolar("prueba", lambda informar: {})
+    soltar.set()
+    cola._executor.shutdown(wait=True)
+    assert cola.activos == 0
+    assert cola.obtener(job_id).estado == ESTADO_COMPLETADO
+
+
+def test_proceso_vivo():
+    assert proceso_vivo(identidad_proceso())
+    host = identidad_proceso().split(":")[0]
+    assert not proceso_vivo(f"{host}:{_pid_muerto()}")
+    # Un PID vivo pero con otro arranque es otro proceso
+    assert not proceso_vivo(f"{host}:{os.getpid()}:1")
+    assert proceso_vivo(f"otra-maquina:{_pid_muerto()}")
+
+
+def test_sqlite_marca_huerfanos_al_abrir(tmp_path):
+    ruta = str(tmp_path / "jobs.sqlite3")
+    backend = BackendSQLite(ruta)
+    host = identidad_proceso().split(":")[0]
+    backend.guardar(Job(id="muerto", tipo="t", estado=ESTADO_EN_PROCESO, propietario=f"{host}:{_pid_muerto()}"))
+    backend.guardar(Job(id="en_cola", tipo="t", estado=ESTADO_EN_COLA, propietario=f"{host}:{_pid_muerto()}"))
+    backend.guardar(Job(id="antiguo", tipo="t", estado=ESTADO_EN_PROCESO))
+    backend.guardar(Job(id="vivo", tipo="t", estado=ESTADO_EN_PROCESO, propietario=identidad_proceso()))
+    backend.guardar(Job(id="hecho", tipo="t", estado=ESTADO_COMPLETADO, propietario=f"{host}:{_pid_muerto()}"))
+
+    BackendSQLite(ruta)
+
+    for job_id in ("muerto", "en_cola", "antiguo"):
+        job = backend.obtener(job_id)
+        assert (job.estado, job.error, job.status_error) == (ESTADO_ERROR, MENSAJE_HUERFANO, 500)
+    assert backend.obtener("vivo").estado == ESTADO_EN_PROCESO
+    assert backend.obtener("hecho").estado == ESTADO_COMPLETADO
+
+
+def test_sqlite_detecta_huerfanos_con_el_backend_ya_abierto(tmp_path):
+    # Como un worker de gunicorn que sustituye a otro con preload_app: el
+    # backend se abrió en el máster antes de que muriera el propietario
+    backend = BackendSQLite(str(tmp_path / "jobs.sqlite3"))
+    host = identidad_proceso().split(":")[0]
+    backend.guardar(Job(id="muerto", tipo="t", estado=ESTADO_EN_PROCESO, propietario=f"{host}:{_pid_muerto()}"))
+    backend.guardar(Job(id="vivo", tipo="t", estado=ESTADO_EN_PROCESO, propietario=identidad_proceso()))
+
+    job = backend.obtener("muerto")
+    assert (job.estado, job.error, job.status_error) == (ESTADO_ERROR, MENSAJE_HUERFANO, 500)
+    assert backend.obtener("vivo").estado == ESTADO_EN_PROCESO
+
+
+def test_sqlite_purgar_barre_los_huerfanos(tmp_path):
+    backend = BackendSQLite(str(tmp_path / "jobs.sqlite3"))
+    host = identidad_proceso().split(":")[0]
+    backend.guardar(Job(id="muerto", tipo="t", estado=ESTADO_EN_COLA, propietario=f"{host}:{_pid_muerto()}"))
+
+    assert backend.purgar(3600) == 0
+    assert backend.marcar_huerfanos() == 0   # ya los marcó purgar
+    assert backend.obtener("muerto").estado == ESTADO_ERROR
+
+
+def test_a_dict_no_expone_el_propietario():
+    assert "propietario" not in Job(id="x", tipo="t", propietario=identidad_proceso()).a_dict()
@@ -0,0 +1,68 @@
+import json
+import random
+
+import pytest
+
+from json_incremental import ParserJSONIncremental
+
+PACK = {
+    "resumen": "Primera frase \"entre comillas\".\nSegunda línea con tilde: ñandú, acción…\tY un tab.",
+    "hilo_twitter": [
+        "Tweet 1 (Gancho) 🚀🔥",
+        "Tweet 2 con barra \\ invertida y /barra/",
+        "Tweet 3: «comillas latinas» y 日本語",
+        "",
+    ],
+    "linkedin": "**Gancho** → Problema → Solución 💡\r\n fin",
+    "tiktok_script": "[VISUAL] Plano corto {llaves} y [corchetes]\n[AUDIO] \"¡Vamos!\"",
+    "extra": {"anidado": [[1, 2.5, -3e2], {"x": None, "y": True, "z": False}], "vacio": {}},
+}
+
+
+def _trocear(texto: str, generador: random.Random) -> list[str]:
+    cortes = sorted(generador.sample(range(1, len(texto)), generador.randint(0, min(40, len(texto) - 1))))
+    return [texto[a:b] for a, b in zip([0, *cortes], [*cortes, len(texto)])]
+
+
+def _esperados(valor, ruta=(), max_profundidad=2):
+    """(ruta, valor) de todos los valores hasta max_profundidad, en orden de cierre."""
+    eventos = []
+    hijos = valor.items() if isinstance(valor, dict) else enumerate(valor) if isinstance(valor, list) else ()
+    for clave, hijo in hijos:
+        eventos += _esperados(hijo, (*ruta, clave), max_profundidad)
+        if len(ruta) + 1 <= max_profundidad:
+            eventos.append(((*ruta, clave), hijo))
+    return eventos
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_troceos_aleatorios_dan_lo_mismo_que_json_loads(ensure_ascii, indent):
+    texto = "```json\n" + json.dumps(PACK, ensure_ascii=ensure_ascii, indent=indent) + "\n```"
+    esperado = json.loads(texto[len("```json\n"):-len("\n```")])
+    generador = random.Random(f"{ensure_ascii}-{indent}")
+
+    for _ in range(200):
+        parser = ParserJSONIncremental()
+        eventos = []
+        for trozo in _trocear(texto, generador):
+            eventos += parser.alimentar(trozo)
+
+        assert parser.finalizar() == esperado
+        assert eventos == _esperados(esperado)
+
+
+def test_caracter_a_caracter():
+    texto = json.dumps(PACK, ensure_ascii=False)
+    parser = ParserJSONIncremental(max_profundidad=1)
+    eventos = [e for c in texto for e in parser.alimentar(c)]
+
+    assert parser.finalizar() == PACK
+    assert eventos == [((clave,), valor) for clave, valor in PACK.items()]
+
+
+def test_json_a_medias_falla_al_finalizar():
+    parser = ParserJSONIncremental()
+    parser.alimentar(json.dumps(PACK)[:-5])
+    with pytest.raises(ValueError):
+        parser.finalizar()
@@ -0,0 +1,167 @@
+import asyncio
+import threading
+import time
+
+from jobs import ESTADO_COMPLETADO, ESTADO_EN_COLA, ESTADO_EN_PROCESO, ESTADO_ERROR
+from lotes import LimitesEtapas, procesar_lote
+
+
+class ErrorControlado(Exception):
+    def __init__(self, mensaje):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+
+
+def _entradas(*urls):
+    return [{"url": url, "titulo": url.upper()} for url in urls]
+
+
+class Contador:
+    """Cuenta cuántos hilos o corrutinas están dentro a la vez y el máximo alcanzado."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.dentro = self.maximo = 0
+
+    def entrar(self):
+        with self._lock:
+            self.dentro += 1
+            self.maximo = max(self.maximo, self.dentro)
+
+    def salir(self):
+        with self._lock:
+            self.dentro -= 1
+
+
+# ---------------------------------------------------------------------------
+# LOTES
+# ---------------------------------------------------------------------------
+
+def test_un_item_que_falla_no_para_a_los_demas():
+    def procesar(url, informar):
+        if url == "controlado":
+            raise ErrorControlado("Vídeo privado.")
+        if url == "inesperado":
+            raise RuntimeError("boom")
+        return {"transcripcion": url}
+
+    entradas = [*_entradas("a", "controlado", "b", "inesperado"),
+                {"url": "expandida", "error": "No se pudo expandir."}]
+    resultado = procesar_lote(entradas, procesar, lambda etapa, **datos: None, max_paralelo=3)
+
+    assert (resultado["total"], resultado["completados"], resultado["fallidos"]) == (5, 2, 3)
+    items = {i["url"]: i for i in resultado["items"]}
+    assert items["a"]["resultado"] == {"transcripcion": "a"}
+    assert items["b"]["estado"] == ESTADO_COMPLETADO
+    assert {items[u]["estado"] for u in ("controlado", "inesperado", "expandida")} == {ESTADO_ERROR}
+    assert items["controlado"]["error"] == "Vídeo privado."
+    assert items["inesperado"]["error"] == "Error interno del servidor."
+    assert items["expandida"]["error"] == "No se pudo expandir."
+    assert [i["indice"] for i in resultado["items"]] == [0, 1, 2, 3, 4]
+
+
+def test_el_parcial_se_actualiza_item_a_item():
+    publicados = []
+
+    def procesar(url, informar):
+        informar("descarga", porcentaje=10)
+        informar("descarga", porcentaje=90)   # misma etapa: no se publica otra vez
+        informar("transcripcion")
+        return {"transcripcion": url}
+
+    def informar(etapa, **datos):
+        assert etapa == "lote"
+        publicados.append(datos)
+
+    procesar_lote(_entradas("a", "b"), procesar, informar, max_paralelo=1)
+
+    estados = [tuple((i["estado"], i["etapa"]) for i in p["parcial"]["items"]) for p in publicados]
+    assert estados == [
+        ((ESTADO_EN_COLA, None), (ESTADO_EN_COLA, None)),
+        ((ESTADO_EN_PROCESO, None), (ESTADO_EN_COLA, None)),
+        ((ESTADO_EN_PROCESO, "descarga"), (ESTADO_EN_COLA, None)),
+        ((ESTADO_EN_PROCESO, "transcripcion"), (ESTADO_EN_COLA, None)),
+        ((ESTADO_COMPLETADO, None), (ESTADO_EN_COLA, None)),
+        ((ESTADO_COMPLETADO, None), (ESTADO_EN_PROCESO, None)),
+        ((ESTADO_COMPLETADO, None), (ESTADO_EN_PROCESO, "descarga")),
+        ((ESTADO_COMPLETADO, None), (ESTADO_EN_PROCESO, "transcripcion")),
+        ((ESTADO_COMPLETADO, None), (ESTADO_COMPLETADO, None)),
+    ]
+    # El primer ítem ya trae su resultado antes de que termine el lote
+    assert publicados[4]["parcial"]["items"][0]["resultado"] == {"transcripcion": "a"}
+    assert [p["terminados"] for p in publicados] == [0, 0, 0, 0, 1, 1, 1, 1, 2]
+    # Cada publicación es una copia: no cambia cuando el lote sigue avanzando
+    assert publicados[0]["parcial"]["items"][0]["estado"] == ESTADO_EN_COLA
+
+
+def test_las_etapas_del_lote_respetan_sus_limites():
+    limites = LimitesEtapas({"descarga": 2, "transcripcion": 1})
+    contadores = {"descarga": Contador(), "transcripcion": Contador()}
+
+    def procesar(url, informar):
+        for etapa in ("descarga", "transcripcion"):
+            with limites.hueco(etapa):
+                contadores[etapa].entrar()
+                time.sleep(0.01)
+                contadores[etapa].salir()
+        return {}
+
+    resultado = procesar_lote(_entradas(*"abcdefgh"), procesar, lambda etapa, **datos: None, max_paralelo=6)
+
+    assert resultado["completados"] == 8
+    assert contadores["descarga"].maximo == 2
+    assert contadores["transcripcion"].maximo == 1
+    assert limites.estadisticas() == {
+        "descarga":      {"limite": 2, "en_curso": 0, "esperando": 0},
+        "transcripcion": {"limite": 1, "en_curso": 0, "esperando": 0},
+    }
+
+
+# ---------------------------------------------------------------------------
+# LÍMITES POR ETAPA
+# ---------------------------------------------------------------------------
+
+def test_hueco_async_comparte_el_limite_con_los_hilos():
+    limites = LimitesEtapas({"transcripcion": 2})
+    contador = Contador()
+
+    def en_hilo():
+        with limites.hueco("transcripcion"):
+            contador.entrar()
+            time.sleep(0.02)
+            contador.salir()
+
+    async def en_corrutina():
+        async with limites.hueco_async("transcripcion", intervalo=0.001):
+            contador.entrar()
+            await asyncio.sleep(0.02)
+            contador.salir()
+
+    async def todos():
+        hilos = [asyncio.to_thread(en_hilo) for _ in range(3)]
+        await asyncio.gather(*hilos, *(en_corrutina() for _ in range(3)))
+
+    asyncio.run(todos())
+    assert contador.maximo == 2
+    assert limites.estadisticas()["transcripcion"] == {"limite": 2, "en_curso": 0, "esperando": 0}
+
+
+def test_una_corrutina_cancelada_mientras_espera_no_se_queda_en_la_cuenta():
+    limites = LimitesEtapas({"transcripcion": 1})
+
+    async def cancelar_en_espera():
+        async with limites.hueco_async("transcripcion"):
+            tarea = asyncio.create_task(limites.hueco_async("transcripcion").__aenter__())
+            await asyncio.sleep(0.01)
+            assert limites.estadisticas()["transcripcion"]["esperando"] == 1
+            tarea.cancel()
+            await asyncio.gather(tarea, return_exceptions=True)
+
+    asyncio.run(cancelar_en_espera())
+    assert limites.estadisticas()["transcripcion"] == {"limite": 1, "en_curso": 0, "esperando": 0}
+
+
+def test_una_etapa_sin_limite_no_espera():
+    limites = LimitesEtapas({"descarga": 1})
+    with limites.hueco("descarga"), limites.hueco("pack_viral"):
+        assert limites.estadisticas() == {"descarga": {"limite": 1, "en_curso": 1, "esperando": 0}}
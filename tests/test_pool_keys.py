@@ -0,0 +1,129 @@
+from types import SimpleNamespace
+
+import pytest
+
+import pool_keys
+from pool_keys import PoolKeys, SinKeysDisponibles, parsear_duracion, retry_after
+
+
+class Error429(Exception):
+    status_code = 429
+
+    def __init__(self, cabeceras=None):
+        super().__init__("rate limit")
+        self.response = SimpleNamespace(headers=cabeceras or {})
+
+
+@pytest.fixture
+def pool(reloj, monkeypatch):
+    monkeypatch.setattr(pool_keys, "time", SimpleNamespace(time=reloj))
+    return PoolKeys(["key-a", "key-b", "key-c"], fabrica_cliente=lambda key: f"cliente-{key}",
+                    rpm=10, tpm=1000, cooldown_por_defecto=60)
+
+
+@pytest.mark.parametrize("valor, segundos", [
+    ("2m59.56s", 179.56),
+    ("500ms", 0.5),
+    ("1h2m", 3720),
+    ("7.66s", 7.66),
+    ("12", 12),
+    (" 3s ", 3),
+    ("", None),
+    (None, None),
+    ("pronto", None),
+])
+def test_parsear_duracion(valor, segundos):
+    resultado = parsear_duracion(valor)
+    assert resultado == pytest.approx(segundos) if segundos is not None else resultado is None
+
+
+def test_usar_elige_la_key_con_mas_margen(pool):
+    with pool.usar("whisper") as primera:
+        # La ocupada tiene menos margen: las dos siguientes son las otras
+        with pool.usar("whisper") as segunda, pool.usar("whisper") as tercera:
+            assert {primera.indice, segunda.indice, tercera.indice} == {0, 1, 2}
+    # Ya libres, las tres tienen una petición en el último minuto; más uso en la 0
+    with pool.usar("whisper") as uso:
+        pass
+    with pool.usar("whisper") as otro:
+        assert otro.indice != uso.indice
+
+
+def test_usar_tiene_en_cuenta_los_tokens(pool):
+    with pool.usar("llama", tokens_estimados=900) as uso:
+        uso.registrar(tokens=900)
+    with pool.usar("llama", tokens_estimados=500) as siguiente:
+        assert siguiente.indice != uso.indice
+
+
+def test_usar_respeta_excluir(pool):
+    with pool.usar("whisper", excluir={0, 1}) as uso:
+        assert uso.indice == 2
+    with pytest.raises(SinKeysDisponibles) as error:
+        pool.usar("whisper", excluir={0, 1, 2})
+    assert error.value.espera == 0
+
+
+def test_429_con_retry_after_enfria_la_key(pool, reloj):
+    with pytest.raises(Error429):
+        with pool.usar("whisper", excluir={1, 2}):
+            raise Error429({"retry-after": "7"})
+
+    for _ in range(5):
+        with pool.usar("whisper") as uso:
+            assert uso.indice != 0
+    reloj.avanzar(7.1)
+    with pool.usar("whisper", excluir={1, 2}) as uso:
+        assert uso.indice == 0
+
+
+def test_429_sin_retry_after_usa_el_cooldown_por_defecto(pool, reloj):
+    with pytest.raises(Error429):
+        with pool.usar("whisper", excluir={1, 2}):
+            raise Error429()
+    reloj.avanzar(59)
+    with pytest.raises(SinKeysDisponibles):
+        pool.usar("whisper", excluir={1, 2})
+    reloj.avanzar(1.5)
+    pool.usar("whisper", excluir={1, 2}).__exit__(None, None, None)
+
+
+def test_cooldown_es_por_modelo(pool):
+    with pytest.raises(Error429):
+        with pool.usar("whisper", excluir={1, 2}):
+            raise Error429({"retry-after": "30"})
+    with pool.usar("llama", excluir={1, 2}) as uso:
+        assert uso.indice == 0
+
+
+def test_remaining_requests_cero_enfria_antes_del_429(pool, reloj):
+    with pool.usar("whisper", excluir={1, 2}) as uso:
+        uso.registrar({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2m0s"})
+    with pytest.raises(SinKeysDisponibles) as error:
+        pool.usar("whisper", excluir={1, 2})
+    assert error.value.espera == pytest.approx(120)
+    reloj.avanzar(119)
+    with pool.usar("whisper") as uso:
+        assert uso.indice != 0
+    reloj.avanzar(1.5)
+    with pool.usar("whisper", excluir={1, 2}) as uso:
+        assert uso.indice == 0
+
+
+def test_sin_keys_disponibles_indica_la_espera_minima(pool, reloj):
+    for indice, segundos in ((0, "30"), (1, "10"), (2, "20")):
+        otras = {0, 1, 2} - {indice}
+        with pytest.raises(Error429):
+            with pool.usar("whisper", excluir=otras):
+                raise Error429({"retry-after": segundos})
+    reloj.avanzar(4)
+    with pytest.raises(SinKeysDisponibles) as error:
+        pool.usar("whisper")
+    assert error.value.espera == pytest.approx(6)
+    assert error.value.modelo == "whisper"
+
+
+def test_retry_after_lee_las_cabeceras_de_groq():
+    assert retry_after(Error429({"retry-after": "3"})) == 3
+    assert retry_after(Error429({"x-ratelimit-reset-tokens": "1m30s"})) == 90
+    assert retry_after(Error429()) is None
@@ -0,0 +1,263 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import pool_keys
+import reintentos
+from pool_keys import PoolKeys
+from reintentos import (FATAL, RATE_LIMIT, TRANSITORIO, CircuitBreaker, CircuitoAbierto, LimitadorConcurrencia,
+                        PoliticaReintentos, ReintentosAgotados, clasificar)
+
+
+class ErrorHTTP(Exception):
+
+    def __init__(self, status_code, cabeceras=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=cabeceras or {})
+
+
+@pytest.fixture
+def tiempo(reloj, monkeypatch):
+    """Reloj falso para reintentos y pool_keys; el jitter siempre da el máximo."""
+    monkeypatch.setattr(reintentos, "time", SimpleNamespace(monotonic=reloj, sleep=reloj.dormir))
+    monkeypatch.setattr(reintentos, "random", SimpleNamespace(uniform=lambda a, b: b))
+    monkeypatch.setattr(pool_keys, "time", SimpleNamespace(time=reloj))
+    return reloj
+
+
+def _politica(umbral=5, enfriamiento=30.0, **kwargs):
+    return PoliticaReintentos("prueba", LimitadorConcurrencia(4, timeout=1),
+                              CircuitBreaker("prueba", umbral=umbral, enfriamiento=enfriamiento), **kwargs)
+
+
+def test_clasificar():
+    assert clasificar(ErrorHTTP(429)) == RATE_LIMIT
+    assert clasificar(pool_keys.SinKeysDisponibles("m", 3)) == RATE_LIMIT
+    assert clasificar(ErrorHTTP(503)) == TRANSITORIO
+    assert clasificar(ErrorHTTP(400)) == FATAL
+    assert clasificar(ValueError("json")) == FATAL
+
+
+def test_fatal_no_se_reintenta(tiempo):
+    politica = _politica()
+    intentos = []
+
+    def funcion(intento):
+        intentos.append(intento)
+        raise ErrorHTTP(401)
+
+    with pytest.raises(ErrorHTTP):
+        politica.ejecutar(funcion)
+    assert intentos == [0]
+    assert tiempo.esperas == []
+    assert politica.breaker.estado == CircuitBreaker.CERRADO
+    assert politica.contadores[FATAL] == 1
+
+
+def test_429_reintenta_con_otra_key_sin_esperar(tiempo):
+    pool = PoolKeys(["a", "b"], fabrica_cliente=lambda key: key)
+    politica = _politica()
+    usadas = []
+
+    def funcion(intento):
+        with pool.usar("whisper") as uso:
+            usadas.append(uso.indice)
+            if intento == 0:
+                raise ErrorHTTP(429, {"retry-after": "30"})
+            return "ok"
+
+    assert politica.ejecutar(funcion) == "ok"
+    assert len(set(usadas)) == 2
+    assert tiempo.esperas == []
+    assert politica.contadores[RATE_LIMIT] == 1
+
+
+def test_sin_keys_espera_lo_que_falta_de_cooldown(tiempo):
+    pool = PoolKeys(["a"], fabrica_cliente=lambda key: key)
+    politica = _politica(base=0.5)
+
+    def funcion(intento):
+        with pool.usar("whisper"):
+            if intento == 0:
+                raise ErrorHTTP(429, {"retry-after": "5"})
+            return "ok"
+
+    assert politica.ejecutar(funcion) == "ok"
+    # Intento 1: SinKeysDisponibles → espera del cooldown (5) + jitter (0.5)
+    assert tiempo.esperas == [pytest.approx(5.5)]
+
+
+def test_transitorio_hace_backoff_exponencial(tiempo):
+    politica = _politica(max_intentos=4, base=1, tope=100, plazo_total=1000)
+
+    def funcion(intento):
+        if intento < 3:
+            raise ErrorHTTP(503)
+        return "ok"
+
+    assert politica.ejecutar(funcion) == "ok"
+    assert tiempo.esperas == [1, 2, 4]
+
+
+def test_transitorio_respeta_retry_after(tiempo):
+    politica = _politica(base=1, tope=100)
+
+    def funcion(intento):
+        if intento == 0:
+            raise ErrorHTTP(503, {"retry-after": "12"})
+        return "ok"
+
+    politica.ejecutar(funcion)
+    assert tiempo.esperas == [12]
+
+
+def test_backoff_acotado_por_el_plazo_total(tiempo):
+    politica = _politica(max_intentos=10, base=1, tope=100, plazo_total=5)
+    intentos = []
+
+    def funcion(intento):
+        intentos.append(intento)
+        raise ErrorHTTP(503)
+
+    with pytest.raises(ReintentosAgotados) as error:
+        politica.ejecutar(funcion)
+    # 1 + 2 caben en 5 s; la siguiente espera (4) se pasaría del plazo
+    assert intentos == [0, 1, 2]
+    assert tiempo.esperas == [1, 2]
+    assert error.value.clase == TRANSITORIO
+    assert isinstance(error.value.ultimo, ErrorHTTP)
+
+
+def test_breaker_abierto_semiabierto_cerrado(tiempo):
+    breaker = CircuitBreaker("prueba", umbral=2, enfriamiento=30)
+    breaker.fallo()
+    assert breaker.estado == CircuitBreaker.CERRADO
+    breaker.fallo()
+    assert breaker.estado == CircuitBreaker.ABIERTO
+    with pytest.raises(CircuitoAbierto):
+        breaker.permitir()
+
+    tiempo.avanzar(30)
+    breaker.permitir()                       # la llamada de prueba
+    assert breaker.estado == CircuitBreaker.SEMIABIERTO
+    with pytest.raises(CircuitoAbierto):
+        breaker.permitir()                   # solo una prueba a la vez
+
+    breaker.exito()
+    assert breaker.estado == CircuitBreaker.CERRADO
+    breaker.permitir()
+    breaker.permitir()
+
+
+def test_breaker_vuelve_a_abrirse_si_falla_la_prueba(tiempo):
+    breaker = CircuitBreaker("prueba", umbral=1, enfriamiento=10)
+    breaker.fallo()
+    tiempo.avanzar(10)
+    breaker.permitir()
+    breaker.fallo()
+    assert breaker.estado == CircuitBreaker.ABIERTO
+    assert breaker.aperturas == 2
+    with pytest.raises(CircuitoAbierto):
+        breaker.permitir()
+
+
+def test_breaker_libera_la_prueba_tras_un_resultado_neutro(tiempo):
+    breaker = CircuitBreaker("prueba", umbral=1, enfriamiento=10)
+    breaker.fallo()
+    tiempo.avanzar(10)
+    breaker.permitir()
+    breaker.neutro()                         # p. ej. un 429: no dice nada del servicio
+    breaker.permitir()
+    assert breaker.estado == CircuitBreaker.SEMIABIERTO
+
+
+def test_politica_corta_con_el_circuito_abierto(tiempo):
+    politica = _politica(umbral=2, max_intentos=5, base=1, tope=1)
+    llamadas = []
+
+    def funcion(intento):
+        llamadas.append(intento)
+        raise ErrorHTTP(502)
+
+    with pytest.raises(CircuitoAbierto):
+        politica.ejecutar(funcion)
+    assert llamadas == [0, 1]
+    assert politica.contadores["circuito_abierto"] == 1
+
+
+def test_hueco_async_libera_si_se_cancela_dentro():
+    limitador = LimitadorConcurrencia(1, timeout=5)
+    dentro = asyncio.Event()
+
+    async def ocupar():
+        async with limitador.hueco_async():
+            dentro.set()
+            await asyncio.sleep(60)
+
+    async def principal():
+        tarea = asyncio.create_task(ocupar())
+        await dentro.wait()
+        assert limitador.en_uso == 1
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+
+    asyncio.run(principal())
+    assert (limitador.en_uso, limitador.esperando) == (0, 0)
+    with limitador.hueco():
+        pass
+
+
+def test_hueco_async_libera_si_se_cancela_esperando():
+    limitador = LimitadorConcurrencia(1, timeout=5)
+    soltar = threading.Event()
+    ocupado = threading.Event()
+
+    def ocupar_en_hilo():
+        with limitador.hueco():
+            ocupado.set()
+            soltar.wait(5)
+
+    hilo = threading.Thread(target=ocupar_en_hilo)
+    hilo.start()
+    ocupado.wait(5)
+
+    async def esperar():
+        async with limitador.hueco_async(intervalo=0.005):
+            raise AssertionError("no debería conseguir hueco")
+
+    async def principal():
+        tarea = asyncio.create_task(esperar())
+        await asyncio.sleep(0.05)
+        assert limitador.esperando == 1
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+
+    asyncio.run(principal())
+    soltar.set()
+    hilo.join()
+    assert (limitador.en_uso, limitador.esperando, limitador.rechazos) == (0, 0, 0)
+    with limitador.hueco():
+        pass
+
+
+def test_ejecutar_async_reintenta_como_ejecutar(tiempo, monkeypatch):
+    esperas = []
+
+    async def dormir(segundos):
+        esperas.append(segundos)
+
+    monkeypatch.setattr(reintentos.asyncio, "sleep", dormir)
+    politica = _politica(base=1, tope=100)
+
+    async def funcion(intento):
+        if intento < 2:
+            raise ErrorHTTP(503)
+        return "ok"
+
+    assert asyncio.run(politica.ejecutar_async(funcion)) == "ok"
+    assert esperas == [1, 2]
@@ -0,0 +1,61 @@
+import pytest
+
+from resumenes import TranscripcionDemasiadoLarga, condensar, estimar_tokens
+
+FRASE = "Esta es una frase de relleno para la transcripción. "
+
+
+def test_un_texto_que_cabe_no_se_resume():
+    def resumir(trozo, indice, total):
+        raise AssertionError("no debería resumir")
+
+    assert condensar("Hola. Adiós.", resumir, max_tokens_entrada=100, max_tokens_trozo=50) == ["Hola. Adiós."]
+
+
+def test_resume_por_niveles_hasta_caber_y_conserva_el_orden():
+    llamadas = []
+
+    def resumir(trozo, indice, total):
+        llamadas.append((indice, total))
+        return f"Resumen {indice}. " * 3
+
+    partes = condensar(FRASE * 200, resumir, max_tokens_entrada=40, max_tokens_trozo=300, max_niveles=5)
+
+    assert sum(estimar_tokens(p) for p in partes) <= 40
+    assert partes[0].startswith("Resumen 0.")
+    # Más de un nivel: los resúmenes del primero no cabían todavía
+    assert len({total for _, total in llamadas}) > 1
+
+
+def test_pasados_los_niveles_lanza_en_vez_de_recortar():
+    def resumir(trozo, indice, total):
+        return trozo[: len(trozo) // 2]
+
+    with pytest.raises(TranscripcionDemasiadoLarga) as error:
+        condensar(FRASE * 400, resumir, max_tokens_entrada=50, max_tokens_trozo=500, max_niveles=2)
+    assert error.value.niveles == 2
+    assert error.value.tokens > 50
+
+
+def test_si_un_nivel_no_reduce_el_texto_lanza_sin_seguir():
+    def resumir(trozo, indice, total):
+        return trozo + " Y poco más."
+
+    with pytest.raises(TranscripcionDemasiadoLarga) as error:
+        condensar(FRASE * 100, resumir, max_tokens_entrada=50, max_tokens_trozo=500, max_niveles=5)
+    assert error.value.niveles == 1
+
+
+def test_la_clave_del_pack_depende_del_modo_y_del_map_reduce(aplicacion, monkeypatch):
+    texto = FRASE * 10
+    unico = aplicacion.clave_pack_unico(texto)
+    seccion = aplicacion._clave_seccion(texto, "resumen")
+
+    assert unico == aplicacion.clave_pack_unico(texto)
+    assert unico != aplicacion.clave_pack(texto, aplicacion.PROMPT_PACK_VIRAL, aplicacion.MODELO_PACK,
+                                          aplicacion.TEMPERATURA_PACK, aplicacion.MAX_TOKENS_PACK,
+                                          *aplicacion.contexto_pack("secciones"))
+
+    monkeypatch.setattr(aplicacion, "PACK_TOKENS_TROZO", aplicacion.PACK_TOKENS_TROZO + 1)
+    assert aplicacion.clave_pack_unico(texto) != unico
+    assert aplicacion._clave_seccion(texto, "resumen") != seccion
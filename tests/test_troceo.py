@@ -0,0 +1,190 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from compresion import EjecutorFfmpeg
+from troceo import (Trozo, _unir_por_texto, detectar_silencios, duracion_audio, extraer_trozo, planificar_trozos,
+                    transcribir_troceado, unir_transcripciones)
+
+con_ffmpeg = pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg no está instalado")
+
+
+def _cortes(trozos):
+    return [(t.inicio_nominal, t.fin_nominal) for t in trozos]
+
+
+# ---------------------------------------------------------------------------
+# PLANIFICACIÓN
+# ---------------------------------------------------------------------------
+
+def test_sin_silencios_corta_en_el_objetivo():
+    trozos = planificar_trozos(1500, [], duracion_trozo=600, solape=3, ventana=60)
+
+    assert _cortes(trozos) == [(0, 600), (600, 1200), (1200, 1500)]
+    assert (trozos[0].inicio, trozos[0].fin) == (0, 603)
+    assert (trozos[1].inicio, trozos[1].fin) == (597, 1203)
+    assert (trozos[2].inicio, trozos[2].fin) == (1197, 1500)
+
+
+def test_un_audio_corto_es_un_solo_trozo():
+    # Lo que sobra dentro de la ventana se queda en el último trozo
+    trozos = planificar_trozos(650, [], duracion_trozo=600, solape=3, ventana=60)
+
+    assert _cortes(trozos) == [(0, 650)]
+    assert (trozos[0].inicio, trozos[0].fin) == (0, 650)
+
+
+def test_corta_en_el_silencio_mas_cercano_dentro_de_la_ventana():
+    trozos = planificar_trozos(1500, [300, 570, 640, 1190], duracion_trozo=600, solape=3, ventana=60)
+
+    assert _cortes(trozos) == [(0, 570), (570, 1190), (1190, 1500)]
+
+
+def test_un_silencio_en_el_borde_de_la_ventana_cuenta_y_uno_fuera_no():
+    assert _cortes(planificar_trozos(1000, [540], 600, 3, 60))[0] == (0, 540)
+    assert _cortes(planificar_trozos(1000, [539.9], 600, 3, 60))[0] == (0, 600)
+
+
+def test_un_silencio_pegado_al_corte_anterior_se_ignora():
+    # Con una ventana mayor que el trozo, un silencio dentro del solape del
+    # corte anterior daría un trozo vacío
+    trozos = planificar_trozos(100, [1, 12], duracion_trozo=10, solape=3, ventana=20)
+
+    assert _cortes(trozos)[0] == (0, 12)
+    assert all(fin > ini for ini, fin in _cortes(trozos))
+
+
+# ---------------------------------------------------------------------------
+# UNIÓN
+# ---------------------------------------------------------------------------
+
+def _respuesta(*segmentos):
+    return {"segments": [{"start": s, "end": e, "text": f" {t} "} for s, e, t in segmentos]}
+
+
+def test_los_timestamps_reparten_el_solape_por_el_punto_medio():
+    trozos = planificar_trozos(20, [], duracion_trozo=10, solape=3, ventana=0)
+    # El trozo 1 empieza en 7 s: sus timestamps son relativos a ese inicio
+    respuestas = [
+        _respuesta((0, 4, "uno"), (4, 9, "dos"), (9, 12, "tres")),        # medios 2, 6.5, 10.5
+        _respuesta((0, 2, "dos"), (2, 5, "tres"), (5, 13, "cuatro")),     # medios 8, 10.5, 16
+    ]
+
+    assert unir_transcripciones(trozos, respuestas) == "uno dos tres cuatro"
+
+
+def test_un_segmento_con_el_medio_en_el_corte_va_al_trozo_siguiente():
+    trozos = planificar_trozos(20, [], duracion_trozo=10, solape=3, ventana=0)
+    respuestas = [_respuesta((8, 12, "corte")), _respuesta((1, 5, "corte"))]   # medio 10 en ambos
+
+    assert unir_transcripciones(trozos, respuestas) == "corte"
+
+
+def test_sin_timestamps_se_quita_el_texto_repetido():
+    trozos = planificar_trozos(20, [], duracion_trozo=10, solape=3, ventana=0)
+    respuestas = [{"text": "Hola a todos, hoy hablamos de café."}, "Hablamos de Cafe... y de té."]
+
+    assert unir_transcripciones(trozos, respuestas) == "Hola a todos, hoy hablamos de café. y de té."
+
+
+def test_un_trozo_que_se_solapa_entero_no_repite_nada():
+    assert _unir_por_texto("uno dos tres cuatro", "Tres, cuatro.") == ""
+
+    trozos = planificar_trozos(20, [], duracion_trozo=10, solape=3, ventana=0)
+    assert unir_transcripciones(trozos, [{"text": "uno dos tres"}, {"text": "dos tres"}]) == "uno dos tres"
+
+
+def test_sin_solape_comun_no_se_quita_nada():
+    assert _unir_por_texto("uno dos tres", "cuatro cinco") == "cuatro cinco"
+
+
+def test_el_primer_trozo_no_se_deduplica():
+    trozo = Trozo(0, 0, 10, 0, 13)
+    assert unir_transcripciones([trozo], [{"text": "hola hola"}]) == "hola hola"
+
+
+# ---------------------------------------------------------------------------
+# FFMPEG
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def audio(tmp_path):
+    """3 s de tono, 2 s de silencio y 3 s de tono en mp3."""
+    ruta = str(tmp_path / "audio.mp3")
+    subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+         "-f", "lavfi", "-i", "sine=f=440:d=3", "-f", "lavfi", "-i", "anullsrc=r=16000:cl=mono:d=2",
+         "-f", "lavfi", "-i", "sine=f=440:d=3",
+         "-filter_complex", "[0][1][2]concat=n=3:v=0:a=1", "-ar", "16000", "-ac", "1", ruta],
+        check=True
+    )
+    return ruta
+
+
+@pytest.fixture
+def ejecutor():
+    return EjecutorFfmpeg(max_paralelo=2, max_cola=4, timeout=60)
+
+
+@pytest.mark.skipif(not shutil.which("ffprobe"), reason="ffprobe no está instalado")
+@con_ffmpeg
+def test_la_duracion_pasa_por_el_ejecutor(audio, ejecutor):
+    assert duracion_audio(audio, ejecutor) == pytest.approx(8, abs=0.1)
+    assert duracion_audio(audio + ".no", ejecutor) is None
+    assert ejecutor.estadisticas()["ok"] == 1
+    assert ejecutor.estadisticas()["error"] == 1
+
+
+@con_ffmpeg
+def test_detecta_el_silencio_a_traves_del_ejecutor(audio, ejecutor):
+    silencios = detectar_silencios(audio, ejecutor)
+
+    assert len(silencios) == 1
+    assert silencios[0] == pytest.approx(4, abs=0.2)
+    assert ejecutor.estadisticas()["ok"] == 1
+
+
+@con_ffmpeg
+def test_si_ffmpeg_falla_no_hay_silencios(tmp_path, ejecutor):
+    assert detectar_silencios(str(tmp_path / "no_existe.mp3"), ejecutor) == []
+    assert ejecutor.estadisticas()["error"] == 1
+
+
+@con_ffmpeg
+def test_extraer_un_trozo_que_falla_no_deja_archivos(tmp_path, ejecutor):
+    roto = tmp_path / "roto.mp3"
+    roto.write_bytes(b"esto no es audio")
+
+    with pytest.raises(subprocess.CalledProcessError):
+        extraer_trozo(str(roto), Trozo(0, 0, 5, 0, 5), ejecutor)
+    assert os.listdir(tmp_path) == ["roto.mp3"]
+
+
+@con_ffmpeg
+def test_transcribir_troceado_de_punta_a_punta(audio, ejecutor):
+    recibidos = []
+
+    def transcribir_trozo(ruta_trozo, indice):
+        assert os.path.getsize(ruta_trozo) > 0
+        recibidos.append(indice)
+        return {"text": f"trozo {indice}"}
+
+    texto = transcribir_troceado(audio, transcribir_trozo, 8, ejecutor, duracion_trozo=3, solape=0.5, ventana=2)
+
+    # Se corta en el silencio (4 s) en lugar de a los 3 s
+    assert texto == "trozo 0 trozo 1"
+    assert sorted(recibidos) == [0, 1]
+    assert os.listdir(os.path.dirname(audio)) == ["audio.mp3"]
+    assert ejecutor.estadisticas()["ok"] == 3
+
+
+@con_ffmpeg
+def test_si_un_trozo_no_se_puede_extraer_devuelve_el_error(tmp_path, ejecutor):
+    roto = tmp_path / "roto.mp3"
+    roto.write_bytes(b"esto no es audio")
+
+    texto = transcribir_troceado(str(roto), lambda ruta, indice: {"text": "no"}, 8, ejecutor,
+                                 duracion_trozo=3, solape=0.5, ventana=0)
+    assert texto.startswith("Error extrayendo el trozo")
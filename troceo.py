@@ -0,0 +1,251 @@
+import json
+import logging
+import os
+import re
+import subprocess
+import unicodedata
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from compresion import EjecutorFfmpeg
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# TRANSCRIPCIÓN TROCEADA
+# Divide un audio largo en trozos solapados (cortando preferentemente en
+# silencios), los transcribe en paralelo y une el texto en orden. Con
+# timestamps de Whisper (verbose_json) cada trozo solo aporta los segmentos
+# cuyo punto medio cae en su tramo nominal, lo que elimina el solape sin
+# duplicar ni perder frases. Sin timestamps se deduplica por texto.
+# ffprobe y los ffmpeg de detección de silencios y de extracción ocupan
+# huecos del EjecutorFfmpeg como cualquier otra transcodificación.
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Trozo:
+    indice: int
+    inicio_nominal: float
+    fin_nominal: float
+    inicio: float       # inicio real extraído, incluye el solape
+    fin: float          # fin real extraído, incluye el solape
+
+
+def duracion_audio(ruta: str, ejecutor: EjecutorFfmpeg) -> Optional[float]:
+    """
+    Duración en segundos según ffprobe, o None si no se puede obtener.
+    ffprobe ocupa un hueco del ejecutor; ColaFfmpegLlena se propaga.
+    """
+    lineas: list[str] = []
+    try:
+        ejecutor.ejecutar(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=noprint_wrappers=1:nokey=1", ruta],
+            lineas.append, timeout=60
+        )
+        return float("".join(lineas).strip())
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired,
+            FileNotFoundError, ValueError) as e:
+        log.warning("No se pudo obtener la duración de %s: %s", ruta, e)
+        return None
+
+
+# ametadata saca lavfi.silence_start=... por stdout, que es lo que lee el ejecutor
+_PATRON_SILENCIO_INICIO = re.compile(r"silence_start[:=]\s*(-?[\d.]+)")
+_PATRON_SILENCIO_FIN = re.compile(r"silence_end[:=]\s*([\d.]+)")
+
+
+def detectar_silencios(ruta: str, ejecutor: EjecutorFfmpeg, ruido_db: int = -30,
+                       duracion_min: float = 0.5) -> list[float]:
+    """
+    Devuelve el punto medio de cada silencio detectado por el filtro
+    silencedetect de ffmpeg. Lista vacía si ffmpeg falla; ColaFfmpegLlena
+    se propaga.
+    """
+    lineas: list[str] = []
+    try:
+        ejecutor.ejecutar(
+            ["ffmpeg", "-hide_banner", "-nostats", "-i", ruta,
+             "-af", f"silencedetect=noise={ruido_db}dB:d={duracion_min},ametadata=mode=print:file=-",
+             "-f", "null", "-"],
+            lineas.append, timeout=600
+        )
+    except subprocess.CalledProcessError as e:
+        log.warning("ffmpeg terminó con código %d detectando silencios en %s.", e.returncode, ruta)
+        return []
+    except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+        log.warning("No se pudieron detectar silencios en %s: %s", ruta, e)
+        return []
+
+    puntos = []
+    inicio = None
+    for linea in lineas:
+        if m := _PATRON_SILENCIO_INICIO.search(linea):
+            inicio = max(0.0, float(m.group(1)))
+        elif (m := _PATRON_SILENCIO_FIN.search(linea)) and inicio is not None:
+            puntos.append((inicio + float(m.group(1))) / 2)
+            inicio = None
+    return puntos
+
+
+def planificar_trozos(duracion: float, silencios: list[float], duracion_trozo: float,
+                      solape: float, ventana: float) -> list[Trozo]:
+    """
+    Reparte [0, duracion] en tramos de ~duracion_trozo segundos. Cada corte
+    se desplaza al silencio más cercano dentro de ±ventana si lo hay.
+    """
+    cortes = [0.0]
+    while duracion - cortes[-1] > duracion_trozo + ventana:
+        objetivo = cortes[-1] + duracion_trozo
+        candidatos = [s for s in silencios
+                      if abs(s - objetivo) <= ventana and s > cortes[-1] + solape]
+        cortes.append(min(candidatos, key=lambda s: abs(s - objetivo)) if candidatos else objetivo)
+    cortes.append(duracion)
+
+    return [
+        Trozo(
+            indice=i,
+            inicio_nominal=ini,
+            fin_nominal=fin,
+            inicio=max(0.0, ini - solape),
+            fin=min(duracion, fin + solape),
+        )
+        for i, (ini, fin) in enumerate(zip(cortes, cortes[1:]))
+    ]
+
+
+# Cada trozo se recodifica (mono 16 kHz) en vez de copiar el stream: con
+# -c:a copy el corte cae en el límite de paquete anterior y el trozo ya no
+# empieza en trozo.inicio, que es la base de sus timestamps.
+_CODECS_TROZO = {
+    ".mp3":  ("-c:a", "libmp3lame", "-b:a", "32k"),
+    ".ogg":  ("-c:a", "libopus", "-b:a", "16k", "-application", "voip"),
+    ".webm": ("-c:a", "libopus", "-b:a", "16k", "-application", "voip"),
+    ".flac": ("-c:a", "flac"),
+}
+
+
+def extraer_trozo(ruta: str, trozo: Trozo, ejecutor: EjecutorFfmpeg) -> str:
+    """
+    Recodifica el tramo del trozo a un archivo nuevo. Lanza
+    CalledProcessError si ffmpeg falla y ColaFfmpegLlena si no hay hueco.
+    """
+    base, ext = os.path.splitext(ruta)
+    if ext.lower() not in _CODECS_TROZO:
+        ext = ".mp3"
+    ruta_trozo = f"{base}_trozo{trozo.indice}_{uuid.uuid4().hex[:8]}{ext}"
+    try:
+        ejecutor.ejecutar(
+            ["ffmpeg", "-y", "-nostats", "-ss", f"{trozo.inicio:.3f}", "-t", f"{trozo.fin - trozo.inicio:.3f}",
+             "-i", ruta, "-vn", "-ar", "16000", "-ac", "1", *_CODECS_TROZO[ext.lower()],
+             *ejecutor.argumentos_hilos(), ruta_trozo]
+        )
+    except BaseException:
+        if os.path.exists(ruta_trozo):
+            os.remove(ruta_trozo)
+        raise
+    return ruta_trozo
+
+
+# ---------------------------------------------------------------------------
+# UNIÓN DE RESULTADOS
+# ---------------------------------------------------------------------------
+
+def _a_dict(respuesta: Any) -> dict:
+    if isinstance(respuesta, dict):
+        return respuesta
+    if hasattr(respuesta, "model_dump"):
+        return respuesta.model_dump()
+    if isinstance(respuesta, str):
+        try:
+            datos = json.loads(respuesta)
+            if isinstance(datos, dict):
+                return datos
+        except json.JSONDecodeError:
+            pass
+        return {"text": respuesta}
+    return {"text": str(respuesta)}
+
+
+def _normalizar(palabra: str) -> str:
+    """Minúsculas, sin tildes ni puntuación: Whisper no siempre las repite igual."""
+    sin_tildes = "".join(c for c in unicodedata.normalize("NFKD", palabra) if not unicodedata.combining(c))
+    return re.sub(r"[^\w]", "", sin_tildes.lower())
+
+
+def _unir_por_texto(anterior: str, siguiente: str, max_palabras: int = 40) -> str:
+    """Quita del inicio de `siguiente` las palabras que repiten el final de `anterior`."""
+    a = anterior.split()
+    s = siguiente.split()
+    a_norm = [_normalizar(p) for p in a[-max_palabras:]]
+    s_norm = [_normalizar(p) for p in s[:max_palabras]]
+    for k in range(min(len(a_norm), len(s_norm)), 0, -1):
+        if a_norm[-k:] == s_norm[:k]:
+            return " ".join(s[k:])
+    return siguiente
+
+
+def unir_transcripciones(trozos: list[Trozo], respuestas: list[Any]) -> str:
+    partes: list[str] = []
+    for trozo, respuesta in zip(trozos, respuestas):
+        datos = _a_dict(respuesta)
+        segmentos = datos.get("segments")
+
+        if segmentos:
+            textos = []
+            for seg in segmentos:
+                medio = trozo.inicio + (float(seg["start"]) + float(seg["end"])) / 2
+                if trozo.inicio_nominal <= medio < trozo.fin_nominal:
+                    textos.append(seg["text"].strip())
+            texto = " ".join(t for t in textos if t)
+        else:
+            texto = (datos.get("text") or "").strip()
+            if partes and trozo.inicio < trozo.inicio_nominal:
+                texto = _unir_por_texto(partes[-1], texto)
+
+        if texto:
+            partes.append(texto)
+    return " ".join(partes)
+
+
+# ---------------------------------------------------------------------------
+# ORQUESTACIÓN
+# ---------------------------------------------------------------------------
+
+def transcribir_troceado(ruta: str, transcribir_trozo: Callable[[str, int], Any],
+                         duracion: float, ejecutor: EjecutorFfmpeg, duracion_trozo: float = 600, solape: float = 3,
+                         ventana: float = 60, max_paralelo: int = 4) -> str:
+    """
+    `transcribir_trozo(ruta_trozo, indice)` debe devolver la respuesta de
+    Whisper (idealmente verbose_json) o un str que empiece por "Error".
+    Si algún trozo falla se devuelve ese error; el contrato es el mismo
+    que el de procesar_con_groq. ColaFfmpegLlena se propaga.
+    """
+    silencios = detectar_silencios(ruta, ejecutor)
+    trozos = planificar_trozos(duracion, silencios, duracion_trozo, solape, ventana)
+    log.info("Transcripción troceada: %.0f s en %d trozos (%d silencios detectados).",
+             duracion, len(trozos), len(silencios))
+
+    def procesar(trozo: Trozo) -> Any:
+        ruta_trozo = None
+        try:
+            ruta_trozo = extraer_trozo(ruta, trozo, ejecutor)
+            return transcribir_trozo(ruta_trozo, trozo.indice)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError) as e:
+            log.error("Error extrayendo el trozo %d: %s", trozo.indice, e)
+            return f"Error extrayendo el trozo {trozo.indice} del audio."
+        finally:
+            if ruta_trozo and os.path.exists(ruta_trozo):
+                os.remove(ruta_trozo)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_paralelo, len(trozos))),
+                            thread_name_prefix="trozo") as executor:
+        respuestas = list(executor.map(procesar, trozos))
+
+    for respuesta in respuestas:
+        if isinstance(respuesta, str) and respuesta.startswith("Error"):
+            return respuesta
+
+    return unir_transcripciones(trozos, respuestas)
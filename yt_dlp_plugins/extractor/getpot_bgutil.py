@@ -3,18 +3,123 @@ from __future__ import annotations
 __version__ = '1.2.2'
 
 import abc
+import datetime as dt
 import json
+import os
+import sqlite3
+import time
 
+from yt_dlp.extractor.youtube.pot.cache import (
+    PoTokenCacheProvider,
+    PoTokenCacheProviderError,
+)
+from yt_dlp.extractor.youtube.pot.cache import (
+    register_provider as register_cache_provider,
+)
 from yt_dlp.extractor.youtube.pot.provider import (
     ExternalRequestFeature,
     PoTokenContext,
     PoTokenProvider,
     PoTokenProviderRejectedRequest,
+    PoTokenRequest,
+    PoTokenResponse,
 )
 from yt_dlp.extractor.youtube.pot.utils import WEBPO_CLIENTS
 from yt_dlp.utils import js_to_json
 from yt_dlp.utils.traversal import traverse_obj
 
+# Rutas cuya tabla ya existe en este proceso: el director crea un proveedor
+# de caché por cada YoutubeDL y no hace falta repetir el CREATE TABLE
+_rutas_preparadas: set[str] = set()
+
+
+def _preparar_cache(ruta: str) -> bool:
+    if ruta not in _rutas_preparadas:
+        try:
+            with sqlite3.connect(ruta, timeout=10) as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS po_tokens (
+                        clave      TEXT PRIMARY KEY,
+                        valor      TEXT NOT NULL,
+                        expira     INTEGER NOT NULL
+                    )
+                ''')
+        except sqlite3.Error:
+            return False
+        _rutas_preparadas.add(ruta)
+    return True
+
+
+@register_cache_provider
+class BgUtilSQLitePCP(PoTokenCacheProvider):
+    """
+    Caché de PO tokens en SQLite, compartida por todos los workers de la
+    máquina (la caché en memoria de yt-dlp es por proceso y de 25 entradas).
+    yt-dlp decide la clave, qué se guarda y cuándo se lee (bypass_cache); la
+    consulta después de su caché en memoria y copia en ella lo que encuentra
+    aquí. Cada token caduca cuando dice yt-dlp y como tarde a los
+    POT_CACHE_TTL segundos. POT_CACHE_PATH vacío la desactiva.
+    """
+    PROVIDER_NAME = 'bgutil:sqlite'
+    PROVIDER_VERSION = __version__
+    BUG_REPORT_LOCATION = 'https://github.com/Brainicism/bgutil-ytdlp-pot-provider/issues'
+
+    # Margen para no servir un token que caduque a mitad de la descarga
+    MARGEN_CADUCIDAD = 600
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ruta = os.environ.get('POT_CACHE_PATH', '/tmp/pot_cache.sqlite3')
+        self.ttl = int(os.environ.get('POT_CACHE_TTL', '21600'))
+        self._disponible = bool(self.ruta) and _preparar_cache(self.ruta)
+
+    def is_available(self) -> bool:
+        return self._disponible
+
+    def _conectar(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.ruta, timeout=10)
+
+    def get(self, key: str) -> str | None:
+        try:
+            with self._conectar() as conn:
+                fila = conn.execute(
+                    'SELECT valor FROM po_tokens WHERE clave = ? AND expira > ?',
+                    (key, int(time.time()) + self.MARGEN_CADUCIDAD)).fetchone()
+        except sqlite3.Error as e:
+            raise PoTokenCacheProviderError(f'Unable to read the shared cache ({e!r})', expected=True) from e
+        return fila[0] if fila else None
+
+    def store(self, key: str, value: str, expires_at: int):
+        ahora = int(time.time())
+        try:
+            with self._conectar() as conn:
+                conn.execute('DELETE FROM po_tokens WHERE expira <= ?', (ahora,))
+                conn.execute('INSERT OR REPLACE INTO po_tokens (clave, valor, expira) VALUES (?, ?, ?)',
+                             (key, value, min(expires_at, ahora + self.ttl)))
+        except sqlite3.Error as e:
+            raise PoTokenCacheProviderError(f'Unable to write the shared cache ({e!r})', expected=True) from e
+
+    def delete(self, key: str):
+        try:
+            with self._conectar() as conn:
+                conn.execute('DELETE FROM po_tokens WHERE clave = ?', (key,))
+        except sqlite3.Error as e:
+            raise PoTokenCacheProviderError(f'Unable to write the shared cache ({e!r})', expected=True) from e
+
+
+def parsear_caducidad(valor) -> int | None:
+    """`expiresAt` del generador (ISO 8601 o epoch) a epoch en segundos."""
+    if valor is None:
+        return None
+    if isinstance(valor, (int, float)):
+        # Date.now() de JavaScript va en milisegundos
+        return int(valor / 1000 if valor > 1e11 else valor)
+    try:
+        return int(dt.datetime.fromisoformat(str(valor).replace('Z', '+00:00')).timestamp())
+    except ValueError:
+        return None
+
 
 class BgUtilPTPBase(PoTokenProvider, abc.ABC):
     PROVIDER_VERSION = __version__
@@ -39,6 +144,26 @@ class BgUtilPTPBase(PoTokenProvider, abc.ABC):
     _GET_SERVER_VSN_TIMEOUT = 5.0
     _MIN_NODE_VSN = (18, 0, 0)
 
+    def request_pot(self, request: PoTokenRequest) -> PoTokenResponse:
+        inicio = time.perf_counter()
+        resultado = 'error'
+        try:
+            respuesta = super().request_pot(request)
+            resultado = 'ok'
+        except PoTokenProviderRejectedRequest:
+            resultado = 'rechazada'
+            raise
+        finally:
+            self._observar_latencia(time.perf_counter() - inicio, resultado)
+        return respuesta
+
+    def _observar_latencia(self, segundos: float, resultado: str) -> None:
+        # Quien use el plugin puede medir la generación pasando a YoutubeDL
+        # observar_latencia_pot(segundos, proveedor, resultado); sin él no se mide
+        observar = self.ie.get_param('observar_latencia_pot')
+        if callable(observar):
+            observar(segundos, self.PROVIDER_NAME, resultado)
+
     def _info_and_raise(self, msg, raise_from=None):
         self.logger.info(msg)
         raise PoTokenProviderRejectedRequest(msg) from raise_from
@@ -88,4 +213,4 @@ class BgUtilPTPBase(PoTokenProvider, abc.ABC):
         return att_txt
 
 
-__all__ = ['__version__']
+__all__ = ['BgUtilSQLitePCP', '__version__']
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import atexit
 import functools
 import json
+import random
+import threading
 import time
+import weakref
 
 from yt_dlp.extractor.youtube.pot.provider import (
     PoTokenProviderError,
@@ -14,9 +18,145 @@ from yt_dlp.extractor.youtube.pot.provider import (
 )
 from yt_dlp.extractor.youtube.pot.utils import get_webpo_content_binding
 from yt_dlp.networking.common import Request
-from yt_dlp.networking.exceptions import HTTPError, TransportError
+from yt_dlp.networking.exceptions import HTTPError, RequestError
 
-from yt_dlp_plugins.extractor.getpot_bgutil import BgUtilPTPBase
+from yt_dlp_plugins.extractor.getpot_bgutil import BgUtilPTPBase, parsear_caducidad
+
+# ---------------------------------------------------------------------------
+# DISPONIBILIDAD DEL SERVIDOR BGUTIL, COMPARTIDA POR EL PROCESO
+# Cada YoutubeDL crea proveedores nuevos, así que el estado del servidor no
+# puede vivir en la instancia: se guarda un EstadoServidor por base_url.
+# Mientras el servidor está caído, los reintentos se espacian con backoff
+# exponencial y un hilo en segundo plano hace el ping hasta que vuelve; las
+# peticiones no esperan ningún timeout y pasan directamente al siguiente
+# proveedor.
+#
+# Todas las peticiones van por la red de yt-dlp (urlopen del YoutubeDL): su
+# handler, la verificación TLS, la dirección de origen y los certificados de
+# cliente configurados. Con el handler de requests y el pool de YoutubeDL de
+# la app, las conexiones keep-alive se reutilizan entre peticiones. Como en
+# el plugin original, el servidor de tokens no pasa por el proxy; el proxy
+# de YouTube se le envía en el cuerpo de /get_pot para que lo use él.
+# ---------------------------------------------------------------------------
+
+
+def peticion_servidor(urlopen, url: str, cuerpo: bytes | None = None,
+                      timeout: float = 5.0) -> tuple[int, bytes]:
+    """Devuelve (status, cuerpo). Lanza RequestError si no se llega al servidor."""
+    cabeceras = {'Content-Type': 'application/json'} if cuerpo is not None else {}
+    try:
+        respuesta = urlopen(Request(url, data=cuerpo, headers=cabeceras,
+                                    extensions={'timeout': timeout}, proxies={'all': None}))
+    except HTTPError as e:
+        with e.response as respuesta:
+            return e.status, respuesta.read()
+    with respuesta:
+        return respuesta.status, respuesta.read()
+
+
+class EstadoServidor:
+
+    BACKOFF_INICIAL = 5.0
+    BACKOFF_MAXIMO = 300.0
+    INTERVALO_SANO = 60.0
+
+    def __init__(self, base_url: str, timeout_ping: float):
+        self.base_url = base_url
+        self.timeout_ping = timeout_ping
+        self.disponible: bool | None = None     # None: todavía no se sabe
+        self.version: str | None = None
+        self.ultimo_error: str | None = None
+        self.fallos = 0
+        self.proximo_ping = 0.0
+        self._lock = threading.Lock()
+        self._vigilante: threading.Thread | None = None
+        self._parar = threading.Event()
+        # urlopen del último YoutubeDL que usó el servidor, para el vigilante;
+        # referencia débil para no mantener vivo un YoutubeDL ya descartado
+        self._red: weakref.WeakMethod | None = None
+
+    def usar_red(self, urlopen) -> None:
+        self._red = weakref.WeakMethod(urlopen)
+
+    def peticion(self, urlopen, ruta: str, cuerpo: bytes | None = None,
+                 timeout: float = 5.0) -> tuple[int, bytes]:
+        return peticion_servidor(urlopen, self.base_url.rstrip('/') + ruta, cuerpo, timeout)
+
+    def ping(self, urlopen) -> bool:
+        try:
+            status, datos = self.peticion(urlopen, '/ping', timeout=self.timeout_ping)
+            if status >= 400:
+                # Un servidor antiguo sin /ping sigue sirviendo tokens
+                respuesta = {}
+            else:
+                respuesta = json.loads(datos)
+        except (RequestError, json.JSONDecodeError) as e:
+            self.marcar_caido(f'{e.__class__.__name__}: {e}')
+            return False
+        self.marcar_disponible(respuesta.get('version'))
+        return True
+
+    def marcar_disponible(self, version: str | None = None) -> None:
+        with self._lock:
+            self.disponible = True
+            self.fallos = 0
+            self.version = version or self.version
+            self.ultimo_error = None
+            self.proximo_ping = time.monotonic() + self.INTERVALO_SANO
+
+    def marcar_caido(self, error: str) -> None:
+        with self._lock:
+            self.disponible = False
+            self.fallos += 1
+            self.ultimo_error = error
+            espera = min(self.BACKOFF_MAXIMO, self.BACKOFF_INICIAL * 2 ** (self.fallos - 1))
+            self.proximo_ping = time.monotonic() + espera * random.uniform(0.8, 1.2)
+        self._arrancar_vigilante()
+
+    def _arrancar_vigilante(self) -> None:
+        with self._lock:
+            if self._parar.is_set() or (self._vigilante is not None and self._vigilante.is_alive()):
+                return
+            self._vigilante = threading.Thread(target=self._vigilar, daemon=True, name='bgutil-http-salud')
+            self._vigilante.start()
+
+    def _vigilar(self) -> None:
+        # Solo vive mientras el servidor está caído: termina en cuanto responde
+        # (si vuelve a caer, marcar_caido arranca otro) o con detener()
+        while not self._parar.wait(max(0.0, self.proximo_ping - time.monotonic())):
+            if time.monotonic() < self.proximo_ping:
+                continue
+            urlopen = self._red() if self._red is not None else None
+            if urlopen is None:
+                # Sin un YoutubeDL vivo con el que preguntar: el ping lo hará
+                # la primera petición después del backoff
+                return
+            if self.ping(urlopen):
+                return
+
+    def detener(self, timeout: float | None = None) -> None:
+        self._parar.set()
+        if self._vigilante is not None:
+            self._vigilante.join(timeout)
+
+
+_estados: dict[str, EstadoServidor] = {}
+_estados_lock = threading.Lock()
+
+
+def estado_servidor(base_url: str, timeout_ping: float) -> EstadoServidor:
+    with _estados_lock:
+        if base_url not in _estados:
+            _estados[base_url] = EstadoServidor(base_url, timeout_ping)
+        return _estados[base_url]
+
+
+@atexit.register
+def detener_vigilantes() -> None:
+    with _estados_lock:
+        estados = list(_estados.values())
+    for estado in estados:
+        estado.detener(timeout=1)
 
 
 @register_provider
@@ -24,11 +164,6 @@ class BgUtilHTTPPTP(BgUtilPTPBase):
     PROVIDER_NAME = 'bgutil:http'
     DEFAULT_BASE_URL = 'http://127.0.0.1:4416'
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._last_server_check = 0
-        self._server_available = True
-
     @functools.cached_property
     def _base_url(self):
         base_url = self._configuration_arg('base_url', default=[None])[0]
@@ -48,54 +183,39 @@ class BgUtilHTTPPTP(BgUtilPTPBase):
             f'No base_url provided, defaulting to {self.DEFAULT_BASE_URL}')
         return self.DEFAULT_BASE_URL
 
-    def _check_server_availability(self, ctx: PoTokenRequest):
-        if self._last_server_check + 60 > time.time():
-            return self._server_available
+    @property
+    def _server(self) -> EstadoServidor:
+        return estado_servidor(self._base_url, self._GET_SERVER_VSN_TIMEOUT)
 
-        self._server_available = False
-        try:
+    @property
+    def _urlopen(self):
+        return self.ie._downloader.urlopen
+
+    def _check_server_availability(self, ctx: PoTokenRequest):
+        servidor = self._server
+        servidor.usar_red(self._urlopen)
+        # Caído y en backoff: se rechaza al momento, el hilo de salud ya lo vigila
+        if servidor.disponible is False and time.monotonic() < servidor.proximo_ping:
+            return False
+        if not servidor.disponible:
             self.logger.trace(
                 f'Checking server availability at {self._base_url}/ping')
-            response = json.load(self._request_webpage(Request(
-                f'{self._base_url}/ping', extensions={'timeout': self._GET_SERVER_VSN_TIMEOUT}, proxies={'all': None}),
-                note=False))
-        except TransportError as e:
-            # the server may be down
-            script_path_provided = self.ie._configuration_arg(
-                ie_key='youtubepot-bgutilscript', key='script_path', default=[None])[0] is not None
-
-            warning_base = f'Error reaching GET {self._base_url}/ping (caused by {e.__class__.__name__}). '
-            if script_path_provided:  # server down is expected, log info
-                self._info_and_raise(
-                    warning_base + 'This is expected if you are using the script method.')
-            else:
+            if not servidor.ping(self._urlopen):
+                script_path_provided = self.ie._configuration_arg(
+                    ie_key='youtubepot-bgutilscript', key='script_path', default=[None])[0] is not None
+                warning_base = f'Error reaching GET {self._base_url}/ping (caused by {servidor.ultimo_error}). '
+                if script_path_provided:  # server down is expected, log info
+                    self._info_and_raise(
+                        warning_base + 'This is expected if you are using the script method.')
                 self._warn_and_raise(
                     warning_base + f'Please make sure that the server is reachable at {self._base_url}.')
-
-            return
-        except HTTPError as e:
-            # may be an old server, don't raise
-            self.logger.warning(
-                f'HTTP Error reaching GET /ping (caused by {e!r})', once=True)
-            return
-        except json.JSONDecodeError as e:
-            # invalid server
-            self._warn_and_raise(
-                f'Error parsing ping response JSON (caused by {e!r})')
-            return
-        except Exception as e:
-            self._warn_and_raise(
-                f'Unknown error reaching GET /ping (caused by {e!r})', raise_from=e)
-            return
-        else:
-            self._check_version(response.get('version', ''), name='HTTP server')
-            self._server_available = True
-            return True
-        finally:
-            self._last_server_check = time.time()
+        if servidor.version:
+            self._check_version(servidor.version, name='HTTP server')
+        return True
 
     def is_available(self):
-        return self._server_available or self._last_server_check + 60 < int(time.time())
+        servidor = self._server
+        return servidor.disponible is not False or time.monotonic() >= servidor.proximo_ping
 
     def _real_request_pot(
         self,
@@ -121,42 +241,44 @@ class BgUtilHTTPPTP(BgUtilPTPBase):
                     'Pass disable_innertube=1 to suppress this warning.')
             disable_innertube = True
 
+        self.logger.info(
+            f'Generating a {request.context.value} PO Token for '
+            f'{request.internal_client_name} client via bgutil HTTP server')
         try:
-            response = self._request_webpage(
-                request=Request(
-                    f'{self._base_url}/get_pot', data=json.dumps({
-                        'bypass_cache': request.bypass_cache,
-                        'challenge': challenge,
-                        'content_binding': get_webpo_content_binding(request)[0],
-                        'disable_innertube': disable_innertube,
-                        'disable_tls_verification': not request.request_verify_tls,
-                        'proxy': request.request_proxy,
-                        'innertube_context': request.innertube_context,
-                        'source_address': request.request_source_address,
-                    }).encode(), headers={'Content-Type': 'application/json'},
-                    extensions={'timeout': self._GETPOT_TIMEOUT}, proxies={'all': None}),
-                note=f'Generating a {request.context.value} PO Token for '
-                f'{request.internal_client_name} client via bgutil HTTP server',
-            )
-        except Exception as e:
+            status, datos = self._server.peticion(self._urlopen, '/get_pot', json.dumps({
+                'bypass_cache': request.bypass_cache,
+                'challenge': challenge,
+                'content_binding': get_webpo_content_binding(request)[0],
+                'disable_innertube': disable_innertube,
+                'disable_tls_verification': not request.request_verify_tls,
+                'proxy': request.request_proxy,
+                'innertube_context': request.innertube_context,
+                'source_address': request.request_source_address,
+            }).encode(), timeout=self._GETPOT_TIMEOUT)
+        except RequestError as e:
+            # Las siguientes peticiones pasan directamente al siguiente proveedor
+            self._server.marcar_caido(f'{e.__class__.__name__}: {e}')
             raise PoTokenProviderError(
                 f'Error reaching POST /get_pot (caused by {e!r})') from e
 
         try:
-            response_json = json.load(response)
+            response_json = json.loads(datos)
         except Exception as e:
             raise PoTokenProviderError(
-                f'Error parsing response JSON (caused by {e!r}). response = {response.read().decode()}') from e
+                f'Error parsing response JSON (caused by {e!r}). response = {datos.decode(errors="replace")}') from e
 
+        if status >= 400 and not response_json.get('error'):
+            raise PoTokenProviderError(f'POST /get_pot returned HTTP {status}')
         if error_msg := response_json.get('error'):
             raise PoTokenProviderError(error_msg)
         if 'poToken' not in response_json:
             raise PoTokenProviderError(
-                f'Server did not respond with a poToken. Received response: {response}')
+                f'Server did not respond with a poToken. Received response: {response_json}')
 
         po_token = response_json['poToken']
         self.logger.trace(f'Generated POT: {po_token}')
-        return PoTokenResponse(po_token=po_token)
+        return PoTokenResponse(
+            po_token=po_token, expires_at=parsear_caducidad(response_json.get('expiresAt')))
 
 
 @register_preference(BgUtilHTTPPTP)
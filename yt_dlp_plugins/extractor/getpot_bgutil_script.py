@@ -17,7 +17,7 @@ from yt_dlp.extractor.youtube.pot.provider import (
 from yt_dlp.extractor.youtube.pot.utils import get_webpo_content_binding
 from yt_dlp.utils import Popen
 
-from yt_dlp_plugins.extractor.getpot_bgutil import BgUtilPTPBase
+from yt_dlp_plugins.extractor.getpot_bgutil import BgUtilPTPBase, parsear_caducidad
 
 
 @register_provider
@@ -141,7 +141,9 @@ class BgUtilScriptPTP(BgUtilPTPBase):
         if 'poToken' not in script_data_resp:
             raise PoTokenProviderError(
                 'The script did not respond with a po_token')
-        return PoTokenResponse(po_token=script_data_resp['poToken'])
+        return PoTokenResponse(
+            po_token=script_data_resp['poToken'],
+            expires_at=parsear_caducidad(script_data_resp.get('expiresAt')))
 
 
 @register_preference(BgUtilScriptPTP)
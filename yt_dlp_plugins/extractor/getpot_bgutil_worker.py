@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import atexit
+import functools
+import itertools
+import json
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+from yt_dlp.extractor.youtube.pot.provider import (
+    PoTokenProviderError,
+    PoTokenProviderRejectedRequest,
+    PoTokenRequest,
+    PoTokenResponse,
+    register_preference,
+    register_provider,
+)
+from yt_dlp.extractor.youtube.pot.utils import get_webpo_content_binding
+
+from yt_dlp_plugins.extractor.getpot_bgutil import BgUtilPTPBase, parsear_caducidad
+
+# ---------------------------------------------------------------------------
+# POOL DE WORKERS NODE PERSISTENTES
+# En lugar de arrancar `node generate_once.js` por token, se mantienen
+# POT_WORKERS procesos `node pot_worker.js` (ver pot_worker.ts) que hablan
+# por stdin/stdout en líneas JSON. Cada worker atiende una petición a la vez,
+# así que el tamaño del pool es también el límite de concurrencia. Un hilo
+# de salud hace ping a los workers libres y reinicia los que hayan muerto;
+# un worker que no responde a tiempo se mata y se sustituye.
+# ---------------------------------------------------------------------------
+
+
+class ErrorWorker(Exception):
+    pass
+
+
+class WorkerNode:
+
+    def __init__(self, comando: list[str]):
+        self.comando = comando
+        self.proceso = subprocess.Popen(
+            comando, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, bufsize=1)
+        self.respuestas: queue.Queue[dict | None] = queue.Queue()
+        self.atendidas = 0
+        self._ids = itertools.count(1)
+        threading.Thread(target=self._leer, daemon=True, name='pot-worker-lector').start()
+
+    def _leer(self) -> None:
+        for linea in self.proceso.stdout:
+            try:
+                self.respuestas.put(json.loads(linea))
+            except json.JSONDecodeError:
+                continue
+        # EOF: el proceso ha muerto; se despierta a quien esté esperando
+        self.respuestas.put(None)
+
+    @property
+    def vivo(self) -> bool:
+        return self.proceso.poll() is None
+
+    def llamar(self, peticion: dict, timeout: float) -> dict:
+        id_peticion = next(self._ids)
+        try:
+            self.proceso.stdin.write(json.dumps({**peticion, 'id': id_peticion}) + '\n')
+            self.proceso.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise ErrorWorker(f'worker no disponible ({e!r})') from e
+
+        limite = time.monotonic() + timeout
+        while True:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                raise ErrorWorker(f'sin respuesta en {timeout:.0f} s')
+            try:
+                respuesta = self.respuestas.get(timeout=restante)
+            except queue.Empty as e:
+                raise ErrorWorker(f'sin respuesta en {timeout:.0f} s') from e
+            if respuesta is None:
+                try:
+                    codigo = self.proceso.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    codigo = None
+                raise ErrorWorker(f'el worker terminó con código {codigo}')
+            # Respuestas tardías de una petición anterior que expiró: se descartan
+            if respuesta.get('id') == id_peticion:
+                self.atendidas += 1
+                return respuesta
+
+    def terminar(self) -> None:
+        try:
+            self.proceso.stdin.close()
+            self.proceso.wait(timeout=2)
+        except Exception:
+            self.proceso.kill()
+
+
+class PoolWorkersNode:
+
+    def __init__(self, comando: list[str], tamano: int, timeout: float = 20.0,
+                 intervalo_salud: float = 30.0, max_fallos_arranque: int = 3):
+        self.comando = comando
+        self.tamano = tamano
+        self.timeout = timeout
+        self.intervalo_salud = intervalo_salud
+        self.max_fallos_arranque = max_fallos_arranque
+        self._libres: queue.Queue[WorkerNode | None] = queue.Queue()
+        self._lock = threading.Lock()
+        self._fallos_arranque = 0
+        self._deshabilitado_hasta = 0.0
+        self.reinicios = 0
+        self._cerrado = False
+        for _ in range(tamano):
+            # Los huecos vacíos (None) se rellenan en el primer uso
+            self._libres.put(None)
+        threading.Thread(target=self._vigilar, daemon=True, name='pot-worker-salud').start()
+
+    @property
+    def disponible(self) -> bool:
+        return not self._cerrado and time.monotonic() >= self._deshabilitado_hasta
+
+    def _arrancar(self) -> WorkerNode:
+        worker = None
+        try:
+            worker = WorkerNode(self.comando)
+            respuesta = worker.llamar({'ping': True}, timeout=self.timeout)
+            if not respuesta.get('pong'):
+                raise ErrorWorker(f'respuesta inesperada al ping: {respuesta}')
+        except (OSError, ErrorWorker) as e:
+            if worker is not None:
+                # Quien llama aún no tiene el worker: si no se mata aquí, el
+                # proceso y su hilo lector se quedan huérfanos
+                worker.proceso.kill()
+                worker.proceso.wait()
+            with self._lock:
+                self._fallos_arranque += 1
+                if self._fallos_arranque >= self.max_fallos_arranque:
+                    # Un worker que no arranca no va a arrancar en el siguiente
+                    # token: se deja descansar el pool y se usa el script
+                    self._deshabilitado_hasta = time.monotonic() + 300
+                    self._fallos_arranque = 0
+            raise ErrorWorker(f'no se pudo arrancar el worker ({e})') from e
+        with self._lock:
+            self._fallos_arranque = 0
+        return worker
+
+    def _devolver(self, worker: WorkerNode | None) -> None:
+        self._libres.put(worker if worker is not None and worker.vivo else None)
+
+    def generar(self, peticion: dict) -> dict:
+        try:
+            worker = self._libres.get(timeout=self.timeout)
+        except queue.Empty as e:
+            raise ErrorWorker(f'los {self.tamano} workers están ocupados') from e
+
+        try:
+            if worker is None or not worker.vivo:
+                if worker is not None:
+                    self.reinicios += 1
+                    worker = None
+                worker = self._arrancar()
+            return worker.llamar(peticion, timeout=self.timeout)
+        except ErrorWorker:
+            if worker is not None:
+                worker.proceso.kill()
+                self.reinicios += 1
+            worker = None
+            raise
+        finally:
+            self._devolver(worker)
+
+    def _vigilar(self) -> None:
+        while not self._cerrado:
+            time.sleep(self.intervalo_salud)
+            # Solo se revisan los workers libres en este momento
+            for _ in range(self._libres.qsize()):
+                try:
+                    worker = self._libres.get_nowait()
+                except queue.Empty:
+                    break
+                if worker is not None:
+                    try:
+                        worker.llamar({'ping': True}, timeout=5)
+                    except ErrorWorker:
+                        worker.proceso.kill()
+                        worker = None
+                        self.reinicios += 1
+                self._devolver(worker)
+
+    def cerrar(self) -> None:
+        self._cerrado = True
+        while True:
+            try:
+                worker = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            if worker is not None:
+                worker.terminar()
+
+
+_pool: list[PoolWorkersNode] = []
+_pool_lock = threading.Lock()
+
+
+def pool_workers(node_path: str, script_path: str) -> PoolWorkersNode:
+    """Pool único por proceso: todos los YoutubeDL del worker de gunicorn lo comparten."""
+    with _pool_lock:
+        if not _pool:
+            pool = PoolWorkersNode(
+                [node_path, script_path],
+                tamano=int(os.environ.get('POT_WORKERS', '2')),
+                timeout=float(os.environ.get('POT_WORKER_TIMEOUT', str(BgUtilPTPBase._GETPOT_TIMEOUT))),
+            )
+            atexit.register(pool.cerrar)
+            _pool.append(pool)
+        return _pool[0]
+
+
+@register_provider
+class BgUtilWorkerPTP(BgUtilPTPBase):
+    PROVIDER_NAME = 'bgutil:worker'
+
+    @functools.cached_property
+    def _script_path(self):
+        return os.environ.get('POT_WORKER_SCRIPT', '/app/pot_worker.js')
+
+    @functools.cached_property
+    def _node_path(self):
+        return shutil.which('node')
+
+    def is_available(self):
+        if int(os.environ.get('POT_WORKERS', '2')) <= 0:
+            return False
+        if not self._node_path or not os.path.isfile(self._script_path):
+            return False
+        return not _pool or _pool[0].disponible
+
+    def _real_request_pot(
+        self,
+        request: PoTokenRequest,
+    ) -> PoTokenResponse:
+        pool = pool_workers(self._node_path, self._script_path)
+        if not pool.disponible:
+            raise PoTokenProviderRejectedRequest(f'{self.PROVIDER_NAME} workers are failing to start')
+
+        disable_innertube = bool(self._configuration_arg('disable_innertube', default=[None])[0])
+        challenge = self._get_attestation(None if disable_innertube else request.video_webpage)
+        # Igual que el proveedor HTTP: sin challenge, /att/get falla para web_music
+        if not challenge and request.internal_client_name == 'web_music':
+            disable_innertube = True
+
+        self.logger.info(
+            f'Generating a {request.context.value} PO Token for '
+            f'{request.internal_client_name} client via bgutil worker pool',
+        )
+        try:
+            respuesta = pool.generar({
+                'bypass_cache': request.bypass_cache,
+                'challenge': challenge,
+                'content_binding': get_webpo_content_binding(request)[0],
+                'disable_innertube': disable_innertube,
+                'disable_tls_verification': not request.request_verify_tls,
+                'proxy': request.request_proxy,
+                'innertube_context': request.innertube_context,
+                'source_address': request.request_source_address,
+            })
+        except ErrorWorker as e:
+            raise PoTokenProviderError(f'bgutil worker failed: {e}') from e
+
+        if error_msg := respuesta.get('error'):
+            raise PoTokenProviderError(error_msg)
+        if 'poToken' not in respuesta:
+            raise PoTokenProviderError(f'The worker did not respond with a po_token: {respuesta}')
+        return PoTokenResponse(
+            po_token=respuesta['poToken'],
+            expires_at=parsear_caducidad(respuesta.get('expiresAt')))
+
+
+@register_preference(BgUtilWorkerPTP)
+def bgutil_worker_getpot_preference(provider, request):
+    # Por delante del script (arranque en frío) y del servidor HTTP externo
+    return 200
+
+
+__all__ = ['BgUtilWorkerPTP',
+           'bgutil_worker_getpot_preference']